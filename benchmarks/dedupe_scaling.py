@@ -0,0 +1,71 @@
+"""
+Scaling benchmark for the sharded duplicate check.
+
+Builds a synthetic bank with identical questions, reworded duplicates,
+questions with typos and repeated options, checks it once in a single
+process and then with the sharded checker for each worker count, verifies
+that every report is identical and prints the timings.
+
+Usage:
+    python -m benchmarks.dedupe_scaling [questions] [workers ...]
+"""
+
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+from src.core.duplicate_checker import check_for_duplicates
+from src.core.sharded_checker import check_for_duplicates_sharded
+
+DEFAULT_QUESTIONS = 200_000
+DEFAULT_WORKERS = (1, 2, 4, 8)
+
+
+def synthetic_bank(count: int, seed: int = 1) -> Dict:
+    """Create a bank where about a fifth of the questions are duplicates."""
+    rng = random.Random(seed)
+    questions = []
+    for index in range(count):
+        topic = rng.randrange(int(count * 0.8))
+        variants = [
+            {"id": i + 1, "text": f"Javob {topic} o'zgarishi {i}"} for i in range(4)
+        ]
+        if rng.random() < 0.02:
+            variants[3]["text"] = variants[1]["text"].upper()
+        text = f"{index + 1}. Mavzu {topic} bo'yicha savol?"
+        if rng.random() < 0.02:
+            text = f"{index + 1}. Mavzu {topic} bo'yicha savl?"
+        questions.append(
+            {
+                "id": index + 1,
+                "text": text,
+                "variants": variants,
+                "correct": rng.randint(1, 4),
+            }
+        )
+    return {"questions": questions}
+
+
+def main(argv: List[str]) -> None:
+    count = int(argv[0]) if argv else DEFAULT_QUESTIONS
+    worker_counts = [int(value) for value in argv[1:]] or DEFAULT_WORKERS
+    bank = synthetic_bank(count)
+    print(f"{count} questions, {os.cpu_count()} CPUs")
+
+    started = time.perf_counter()
+    expected = check_for_duplicates(bank)
+    baseline = time.perf_counter() - started
+    print(f"single process  {baseline:7.2f} s")
+
+    for workers in worker_counts:
+        started = time.perf_counter()
+        report = check_for_duplicates_sharded(bank, workers=workers)
+        elapsed = time.perf_counter() - started
+        assert report == expected, f"report differs with {workers} workers"
+        print(f"{workers} worker(s)     {elapsed:7.2f} s  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,337 @@
+"""
+Local stand-in for the Telegram Bot API, for load-testing the bot.
+
+FakeBotApi serves the endpoints the bot uses over plain HTTP on localhost:
+getMe, deleteWebhook/setWebhook, getUpdates (long polling), getFile, file
+downloads, sendMessage, sendDocument, editMessageText and
+answerCallbackQuery. Point main.py at it with
+
+    BOT_API_URL=http://127.0.0.1:PORT/bot
+    BOT_FILE_API_URL=http://127.0.0.1:PORT/file/bot
+
+Tests push updates with push_update() and host files with add_file(); every
+call the bot makes is passed to an observer callback, which is how the load
+generator (benchmarks/load_test.py) sees the bot's replies.
+
+Every response can be delayed by a configurable latency with jitter, and a
+configurable share of calls can be failed with HTTP 500 or 429 (flood
+control) responses to see how the bot behaves when Telegram misbehaves.
+"""
+
+import json
+import random
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_test_bot"}
+
+# Methods whose calls may be failed on purpose; polling is left alone so the
+# bot keeps receiving updates
+DEFAULT_FAILING_METHODS = (
+    "sendMessage",
+    "sendDocument",
+    "editMessageText",
+    "answerCallbackQuery",
+    "getFile",
+)
+
+# Longest time a getUpdates call is held open waiting for updates
+MAX_POLL_SECONDS = 1.0
+
+
+class ApiCall:
+    """One call made by the bot, as seen by the observer."""
+
+    def __init__(self, method: str, params: Dict, files: Dict[str, bytes], result) -> None:
+        self.method = method
+        self.params = params
+        self.files = files
+        self.result = result
+        self.time = time.perf_counter()
+
+
+class FakeBotApi:
+    """
+    In-process fake of the Bot API endpoints used by the bot.
+
+    Attributes:
+        latency: Mean delay added to every response, in seconds
+        jitter: Uniform random delay added on top of latency, in seconds
+        failure_rate: Share of calls to failing_methods answered with an error
+        failing_methods: Methods that failure injection applies to
+        call_counts: Number of calls per method
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failing_methods: Sequence[str] = DEFAULT_FAILING_METHODS,
+        observer: Optional[Callable[[ApiCall], None]] = None,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failing_methods = set(failing_methods)
+        self.observer = observer
+        self.call_counts: Dict[str, int] = {}
+        self.failures = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._updates: List[Dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._files: Dict[str, bytes] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # Test side
+
+    def start(self, port: int = 0) -> int:
+        """
+        Start serving in a background thread.
+
+        Args:
+            port: Port to listen on (0 picks a free port)
+
+        Returns:
+            The port the server listens on
+        """
+        api = self
+
+        class Handler(_RequestHandler):
+            fake = api
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[1]
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def urls(self) -> Dict[str, str]:
+        """Environment variables that point main.py at this server."""
+        host = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return {"BOT_API_URL": f"{host}/bot", "BOT_FILE_API_URL": f"{host}/file/bot"}
+
+    def add_file(self, file_id: str, content: bytes) -> None:
+        """Host a file that the bot can fetch with getFile."""
+        with self._lock:
+            self._files[file_id] = content
+
+    def push_update(self, update: Dict) -> int:
+        """
+        Queue an update for the bot's next getUpdates call.
+
+        Args:
+            update: Update without "update_id"
+
+        Returns:
+            The update id assigned
+        """
+        with self._lock:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(dict(update, update_id=update_id))
+            self._updates_ready.notify_all()
+        return update_id
+
+    def new_message_id(self) -> int:
+        """Allocate a message id for a message sent by a simulated user."""
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return message_id
+
+    # Bot side
+
+    def handle(self, method: str, params: Dict, files: Dict[str, bytes]):
+        """
+        Answer one Bot API call.
+
+        Returns:
+            Tuple of (HTTP status, response dictionary)
+        """
+        with self._lock:
+            self.call_counts[method] = self.call_counts.get(method, 0) + 1
+            fail = (
+                method in self.failing_methods
+                and self._random.random() < self.failure_rate
+            )
+            delay = self.latency + self._random.random() * self.jitter
+
+        if method == "getUpdates":
+            # Latency applies to the answer, not to the time spent waiting
+            result = self._get_updates(params)
+        else:
+            result = None
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            with self._lock:
+                self.failures += 1
+            if self._random.random() < 0.5:
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+
+        if method != "getUpdates":
+            result = self._answer(method, params, files)
+            if result is None:
+                return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+        if self.observer is not None:
+            self.observer(ApiCall(method, params, files, result))
+        return 200, {"ok": True, "result": result}
+
+    def download(self, file_path: str) -> Optional[bytes]:
+        """Content of a file fetched through the file URL."""
+        with self._lock:
+            return self._files.get(file_path.split("/", 1)[-1])
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        """Long-poll for updates newer than the offset."""
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), MAX_POLL_SECONDS)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            # Updates before the offset are confirmed and can be forgotten
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updates_ready.wait(remaining)
+            return self._updates[:limit]
+
+    def _message(self, chat_id, **fields) -> Dict:
+        """Build a message sent by the bot."""
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return dict(
+            message_id=message_id,
+            date=int(time.time()),
+            chat={"id": int(chat_id), "type": "private"},
+            **{"from": BOT_USER},
+            **fields,
+        )
+
+    def _answer(self, method: str, params: Dict, files: Dict[str, bytes]):
+        """Result of a successful call, or None for an unknown method."""
+        if method == "getMe":
+            return BOT_USER
+        if method in ("deleteWebhook", "setWebhook", "answerCallbackQuery", "close", "logOut"):
+            return True
+        if method == "getFile":
+            file_id = params["file_id"]
+            with self._lock:
+                size = len(self._files.get(file_id, b""))
+            return {
+                "file_id": file_id,
+                "file_unique_id": f"u-{file_id}",
+                "file_size": size,
+                "file_path": f"documents/{file_id}",
+            }
+        if method == "sendMessage":
+            fields = {"text": params.get("text", "")}
+            if params.get("reply_markup"):
+                fields["reply_markup"] = json.loads(params["reply_markup"])
+            return self._message(params["chat_id"], **fields)
+        if method == "editMessageText":
+            return self._message(params.get("chat_id") or 0, text=params.get("text", ""))
+        if method == "sendDocument":
+            content = files.get("document", b"")
+            message = self._message(
+                params["chat_id"],
+                document={
+                    "file_id": f"sent-{self.call_counts['sendDocument']}",
+                    "file_unique_id": f"sent-{self.call_counts['sendDocument']}",
+                    "file_name": params.get("document_name", "document"),
+                    "file_size": len(content),
+                },
+            )
+            return message
+        return None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a FakeBotApi."""
+
+    fake: FakeBotApi
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        """Keep the load test output readable."""
+
+    def do_GET(self) -> None:
+        # File download: /file/bot<token>/<file_path>
+        if self.path.startswith("/file/bot"):
+            file_path = self.path.split("/", 3)[-1]
+            content = self.fake.download(file_path)
+            if content is not None:
+                self._send(200, content, "application/octet-stream")
+                return
+        self._send(404, b"Not Found", "text/plain")
+
+    def do_POST(self) -> None:
+        # API call: /bot<token>/<method>
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        params, files = _parse_body(self.headers.get("Content-Type", ""), body)
+        status, response = self.fake.handle(method, params, files)
+        self._send(status, json.dumps(response).encode("utf-8"), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The bot went away during a long poll, e.g. when it is stopped
+            self.close_connection = True
+
+
+def _parse_body(content_type: str, body: bytes):
+    """Decode form, multipart or JSON parameters of an API call."""
+    params: Dict = {}
+    files: Dict[str, bytes] = {}
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            filename = part.get_filename()
+            if filename is not None:
+                files[name] = payload
+                params[f"{name}_name"] = filename
+            else:
+                params[name] = payload.decode("utf-8")
+    elif content_type.startswith("application/json"):
+        params = json.loads(body or b"{}")
+    else:
+        params = dict(parse_qsl(body.decode("utf-8")))
+    return params, files
@@ -0,0 +1,124 @@
+"""
+Scaling benchmark for grading answer sheets.
+
+Builds a synthetic bank and an answer sheet file for students spread over
+shuffled versions, where every student answers a known share of questions
+correctly, then times reading the sheets, grading them, writing the
+results and analysing the questions, and checks every score.
+
+Usage:
+    python -m benchmarks.grading_scale [students] [questions] [versions]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from src.core.grading import build_grading_key, grade, read_answer_sheets, write_results
+from src.core.item_analysis import analyze_items, write_item_analysis_document
+
+DEFAULT_STUDENTS = 100_000
+DEFAULT_QUESTIONS = 500
+DEFAULT_VERSIONS = 4
+
+LETTERS = np.frombuffer(b"abcd", dtype=np.uint8)
+
+
+def synthetic_bank(count: int, seed: int = 1) -> Dict:
+    """Create a bank of questions with four variants each."""
+    rng = random.Random(seed)
+    return {
+        "questions": [
+            {
+                "id": index + 1,
+                "text": f"{index + 1}. Savol {index + 1}?",
+                "variants": [{"id": i + 1, "text": f"Javob {index + 1}-{i + 1}"} for i in range(4)],
+                "correct": rng.randint(1, 4),
+            }
+            for index in range(count)
+        ]
+    }
+
+
+def write_sheets(path: str, key, students: int, seed: int = 1) -> np.ndarray:
+    """
+    Write an answer sheet file and return the expected score of every student.
+
+    Each student answers a random share of the questions with the correct
+    letter of their version and the rest with a wrong one.
+    """
+    rng = np.random.default_rng(seed)
+    version_count, question_count = key.correct.shape
+    versions = np.arange(students) % version_count
+    expected = key.correct[versions]
+    right = rng.random((students, question_count)) < rng.random((students, 1))
+    wrong = (expected + rng.integers(1, 4, expected.shape, dtype=np.uint8) - 1) % 4 + 1
+    chosen = np.where(right, expected, wrong)
+
+    header = "Talaba,Variant," + ",".join(str(i + 1) for i in range(question_count))
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii") + b"\n")
+        cells = np.full((students, question_count * 2), ord(","), dtype=np.uint8)
+        cells[:, 0::2] = LETTERS[chosen - 1]
+        cells[:, -1] = ord("\n")
+        for student in range(students):
+            f.write(f"S{student:06d},{versions[student] + 1},".encode("ascii"))
+            f.write(cells[student].tobytes())
+    return right.sum(axis=1)
+
+
+def main(argv: List[str]) -> None:
+    students = int(argv[0]) if argv else DEFAULT_STUDENTS
+    question_count = int(argv[1]) if len(argv) > 1 else DEFAULT_QUESTIONS
+    version_count = int(argv[2]) if len(argv) > 2 else DEFAULT_VERSIONS
+    bank = synthetic_bank(question_count)
+    seeds = list(range(1, version_count + 1))
+
+    started = time.perf_counter()
+    key = build_grading_key(bank, seeds)
+    print(f"key of {version_count} versions  {time.perf_counter() - started:7.2f} s")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sheets_path = os.path.join(temp_dir, "javoblar.csv")
+        expected = write_sheets(sheets_path, key, students)
+        size = os.path.getsize(sheets_path) / (1024 * 1024)
+        print(f"{students} students x {question_count} questions, {size:.0f} MB")
+
+        started = time.perf_counter()
+        sheets = read_answer_sheets(sheets_path)
+        read_time = time.perf_counter() - started
+        print(f"read                {read_time:7.2f} s")
+
+        started = time.perf_counter()
+        result = grade(sheets, key)
+        grade_time = time.perf_counter() - started
+        print(f"grade               {grade_time:7.2f} s")
+
+        started = time.perf_counter()
+        write_results(result, os.path.join(temp_dir, "natijalar.csv"))
+        write_time = time.perf_counter() - started
+        print(f"write results       {write_time:7.2f} s")
+
+        started = time.perf_counter()
+        analysis = analyze_items(bank, result.responses)
+        analysis_time = time.perf_counter() - started
+        print(f"item analysis       {analysis_time:7.2f} s  (KR-20 {analysis.kr20:.3f})")
+
+        started = time.perf_counter()
+        write_item_analysis_document(bank, analysis, os.path.join(temp_dir, "tahlil.docx"))
+        report_time = time.perf_counter() - started
+        print(f"Word report         {report_time:7.2f} s")
+
+    assert (result.scores == expected).all(), "scores differ from the expected ones"
+    assert (result.correct.sum(axis=1) == expected).all()
+    total = read_time + grade_time + write_time + analysis_time + report_time
+    print(f"total               {total:7.2f} s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,63 @@
+"""
+Memory and speed benchmark for the GIFT, Moodle XML and QTI exporters.
+
+Streams generated questions into each sink, so the bank itself is never in
+memory, and reports the time and the peak memory traced while writing for
+two bank sizes: a sink whose memory does not grow with the bank has the
+same peak for both. Tracing slows Python down, so the times are only good
+for comparing the formats with each other.
+
+Usage:
+    python -m benchmarks.lms_export [questions]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Iterator, List
+
+from src.core.formatters import render_to_sink
+from src.core.registry import get_format
+
+DEFAULT_QUESTIONS = 100_000
+FORMATS = ("hemis", "gift", "moodle", "qti")
+
+
+def synthetic_questions(count: int) -> Iterator[Dict]:
+    """Generate questions with four variants and markup to escape."""
+    for number in range(1, count + 1):
+        yield {
+            "id": number,
+            "text": f"{number}. Savol {number}: qaysi biri <to'g'ri> & {{aniq}}?",
+            "variants": [{"id": i, "text": f"Javob {number}-{i} = ~{i}"} for i in range(1, 5)],
+            "correct": number % 4 + 1,
+        }
+
+
+def measure(key: str, count: int, output_dir: str) -> List[float]:
+    """Time, peak traced memory in MB and file size in MB of one export."""
+    output_format = get_format(key)
+    sink = output_format.sink_factory(os.path.join(output_dir, f"bank{output_format.suffix}"), None)
+    tracemalloc.start()
+    started = time.perf_counter()
+    render_to_sink(sink, synthetic_questions(count))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return [elapsed, peak / 2**20, os.path.getsize(sink.output_path) / 2**20]
+
+
+def main(argv: List[str]) -> None:
+    count = int(argv[0]) if argv else DEFAULT_QUESTIONS
+    print(f"{'':<8}{'questions':>10}{'time':>10}{'peak':>10}{'file':>10}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for key in FORMATS:
+            for questions in (count // 10, count):
+                elapsed, peak, size = measure(key, questions, output_dir)
+                print(f"{key:<8}{questions:>10}{elapsed:>9.2f}s{peak:>8.2f}MB{size:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
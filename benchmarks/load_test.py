@@ -0,0 +1,260 @@
+"""
+Load generator for the bot, run against the fake Bot API server.
+
+Starts benchmarks.fake_bot_api.FakeBotApi, launches the real main.py as a
+subprocess pointed at it, and simulates many concurrent users. Each user
+uploads a synthetic question bank, waits for the format keyboard, presses a
+format button and waits for the files and the final message. The script
+reports p50/p95/p99 latency of each step and the throughput of completed
+conversions.
+
+Usage:
+    python -m benchmarks.load_test --users 200 --questions 50 --format all
+    python -m benchmarks.load_test --latency-ms 40 --jitter-ms 20 --failure-rate 0.01
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.fake_bot_api import ApiCall, FakeBotApi
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default seconds a user waits for one reply before the conversation counts
+# as failed (a call failed on purpose may mean the reply never comes)
+STEP_TIMEOUT = 120.0
+
+
+def synthetic_bank(user: int, questions: int) -> bytes:
+    """A valid question file without duplicates, unique to one user."""
+    blocks = []
+    for number in range(1, questions + 1):
+        correct = number % 4
+        lines = [f"{number}. Foydalanuvchi {user} uchun {number} savol matni?"]
+        for variant in range(4):
+            marker = "*" if variant == correct else ""
+            lines.append(f"{chr(97 + variant)}) {marker}Javob {user}-{number}-{variant}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks).encode("utf-8")
+
+
+def button_data(keyboard_message: Dict, selected_format: str) -> str:
+    """Callback data of the keyboard button of a format."""
+    for row in keyboard_message["reply_markup"]["inline_keyboard"]:
+        for button in row:
+            data = button["callback_data"]
+            if data == selected_format or data.endswith(":" + selected_format):
+                return data
+    raise ValueError(f"no {selected_format} button in the keyboard")
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, round(share * len(ordered) + 0.5)) - 1
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class LoadTest:
+    """Simulated users talking to the bot through the fake server."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.inboxes: Dict[int, asyncio.Queue] = {}
+        self.api = FakeBotApi(
+            latency=args.latency_ms / 1000,
+            jitter=args.jitter_ms / 1000,
+            failure_rate=args.failure_rate,
+            observer=self.observe,
+            seed=args.seed,
+        )
+        self.upload_latencies: List[float] = []
+        self.convert_latencies: List[float] = []
+        self.total_latencies: List[float] = []
+        self.failed = 0
+
+    def observe(self, call: ApiCall) -> None:
+        """Route a bot call to the inbox of the user it was addressed to."""
+        chat_id = call.params.get("chat_id")
+        if chat_id is None:
+            return
+        inbox = self.inboxes.get(int(chat_id))
+        if inbox is not None:
+            self.loop.call_soon_threadsafe(inbox.put_nowait, call)
+
+    async def wait_for(self, inbox: asyncio.Queue, predicate) -> ApiCall:
+        """Wait for the first bot call to this user that matches."""
+        deadline = time.perf_counter() + self.args.step_timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            call = await asyncio.wait_for(inbox.get(), max(remaining, 0.001))
+            if predicate(call):
+                return call
+
+    async def user(self, user_id: int) -> None:
+        """One user uploading a bank and pressing a format button."""
+        inbox = self.inboxes.setdefault(user_id, asyncio.Queue())
+        person = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+        chat = {"id": user_id, "type": "private"}
+
+        for round_number in range(self.args.rounds):
+            file_id = f"bank-{user_id}-{round_number}"
+            content = synthetic_bank(user_id, self.args.questions)
+            self.api.add_file(file_id, content)
+
+            started = time.perf_counter()
+            self.api.push_update(
+                {
+                    "message": {
+                        "message_id": self.api.new_message_id(),
+                        "date": int(time.time()),
+                        "chat": chat,
+                        "from": person,
+                        "document": {
+                            "file_id": file_id,
+                            "file_unique_id": f"u-{file_id}",
+                            "file_name": f"bank_{user_id}.txt",
+                            "file_size": len(content),
+                        },
+                    }
+                }
+            )
+            try:
+                keyboard = await self.wait_for(
+                    inbox,
+                    lambda call: call.method == "sendMessage" and "reply_markup" in call.params,
+                )
+                shown = time.perf_counter()
+
+                self.api.push_update(
+                    {
+                        "callback_query": {
+                            "id": f"cb-{user_id}-{round_number}",
+                            "from": person,
+                            "chat_instance": f"ci-{user_id}",
+                            "data": button_data(keyboard.result, self.args.format),
+                            "message": keyboard.result,
+                        }
+                    }
+                )
+                await self.wait_for(
+                    inbox,
+                    lambda call: call.method == "sendMessage"
+                    and call.params.get("text", "").startswith("✅ Tayyor"),
+                )
+                finished = time.perf_counter()
+            except asyncio.TimeoutError:
+                self.failed += 1
+                continue
+
+            self.upload_latencies.append(shown - started)
+            self.convert_latencies.append(finished - shown)
+            self.total_latencies.append(finished - started)
+
+    async def run(self) -> int:
+        self.loop = asyncio.get_running_loop()
+        port = self.api.start()
+        env = dict(os.environ, BOT_TOKEN="123456:LOADTEST", PYTHONPATH=REPO_ROOT, **self.api.urls())
+        command = [sys.executable, os.path.join(REPO_ROOT, "main.py")]
+        if self.args.queue_workers:
+            command += ["--role", "poller", "--workers", str(self.args.queue_workers)]
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            # main.py writes its log folder and databases into the working
+            # directory
+            bot = subprocess.Popen(
+                command,
+                cwd=work_dir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                await self.wait_until_polling(bot)
+                print(f"Fake Bot API on port {port}; bot started, {self.args.users} users")
+
+                started = time.perf_counter()
+                tasks = []
+                for user_id in range(1, self.args.users + 1):
+                    tasks.append(asyncio.create_task(self.user(1000 + user_id)))
+                    if self.args.ramp_ms:
+                        await asyncio.sleep(self.args.ramp_ms / 1000)
+                await asyncio.gather(*tasks)
+                elapsed = time.perf_counter() - started
+            finally:
+                bot.terminate()
+                bot.wait(timeout=30)
+                self.api.stop()
+
+        self.report(elapsed)
+        return 0 if not self.failed else 1
+
+    async def wait_until_polling(self, bot: subprocess.Popen) -> None:
+        """Wait until the bot has made its first getUpdates call."""
+        deadline = time.perf_counter() + 60
+        while not self.api.call_counts.get("getUpdates"):
+            if bot.poll() is not None:
+                raise RuntimeError(f"main.py exited with status {bot.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("main.py did not start polling within 60 seconds")
+            await asyncio.sleep(0.05)
+
+    def report(self, elapsed: float) -> None:
+        completed = len(self.total_latencies)
+        print(
+            f"\n{completed} conversions completed, {self.failed} failed, "
+            f"in {elapsed:.1f} s ({completed / elapsed:.2f} conversions/s)"
+        )
+        print(f"{'step':<22}{'p50':>9}{'p95':>9}{'p99':>9}  (seconds)")
+        for name, values in (
+            ("upload -> keyboard", self.upload_latencies),
+            ("button -> files", self.convert_latencies),
+            ("total", self.total_latencies),
+        ):
+            print(
+                f"{name:<22}{percentile(values, 0.50):>9.3f}"
+                f"{percentile(values, 0.95):>9.3f}{percentile(values, 0.99):>9.3f}"
+            )
+        calls = ", ".join(f"{method} {count}" for method, count in sorted(self.api.call_counts.items()))
+        print(f"\nBot API calls: {calls}; injected failures: {self.api.failures}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load-test main.py against a fake Bot API")
+    parser.add_argument("--users", type=int, default=200, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=1, help="conversions per user")
+    parser.add_argument("--questions", type=int, default=30, help="questions per uploaded bank")
+    parser.add_argument("--format", default="hemis", help="format button to press (or 'all')")
+    parser.add_argument("--ramp-ms", type=float, default=0, help="delay between user starts")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added Bot API latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra latency")
+    parser.add_argument("--failure-rate", type=float, default=0, help="share of failed calls")
+    parser.add_argument(
+        "--step-timeout", type=float, default=STEP_TIMEOUT, help="seconds to wait for a reply"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed for latency and failures")
+    parser.add_argument(
+        "--queue-workers",
+        type=int,
+        default=0,
+        help="run the bot as a poller with this many queue workers (default: one process)",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return asyncio.run(LoadTest(args).run())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Search latency benchmark for the SQLite question bank.
+
+Fills a temporary database with synthetic banks from many users, then times
+searches for rare words, for words that appear in every question of a user
+and for prefixes, and the time to stream a full export of one user's
+matches.
+
+Usage:
+    python -m benchmarks.question_bank_search [questions] [users]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from src.core.question_bank import QuestionBank
+
+DEFAULT_QUESTIONS = 1_000_000
+DEFAULT_USERS = 500
+BANK_SIZE = 500
+
+WORDS = (
+    "hujayra fotosintez xloroplast yadro mitoxondriya oqsil ferment gen "
+    "atom molekula energiya kuch tezlik massa zaryad maydon to'lqin nur "
+    "tenglama funksiya hosila integral matritsa vektor son kasr daraja"
+).split()
+
+
+def synthetic_questions(rng: random.Random, count: int, start: int) -> List[Dict]:
+    """Questions made of random subject words, with a unique marker word."""
+    questions = []
+    for number in range(1, count + 1):
+        words = " ".join(rng.choice(WORDS) for _ in range(8))
+        questions.append(
+            {
+                "id": number,
+                "text": f"{number}. Savol{start + number} {words}?",
+                "variants": [
+                    {"id": i + 1, "text": f"Javob {rng.choice(WORDS)} {i}"} for i in range(4)
+                ],
+                "correct": rng.randint(1, 4),
+            }
+        )
+    return questions
+
+
+def timed(label: str, function, repeat: int = 20) -> None:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<40}{elapsed * 1000:>9.2f} ms  ({result} results)")
+
+
+def main(argv: List[str]) -> None:
+    count = int(argv[0]) if argv else DEFAULT_QUESTIONS
+    users = int(argv[1]) if len(argv) > 1 else DEFAULT_USERS
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bank = QuestionBank(os.path.join(temp_dir, "bank.db"))
+
+        started = time.perf_counter()
+        for offset in range(0, count, BANK_SIZE):
+            questions = synthetic_questions(rng, min(BANK_SIZE, count - offset), offset)
+            bank.add_bank(questions, f"bank{offset}.txt", rng.randrange(users))
+        print(f"Stored {count} questions of {users} users in {time.perf_counter() - started:.1f} s")
+
+        user = 0
+        timed("three words", lambda: len(bank.search("gen atom massa", user)))
+        timed("common word", lambda: len(bank.search("fotosintez", user)))
+        timed("two common words", lambda: len(bank.search("hujayra energiya", user)))
+        timed("prefix", lambda: len(bank.search("mitox", user)))
+        timed("count of a common word", lambda: bank.count_matches("fotosintez", user))
+        timed(
+            "export of a common word (streamed)",
+            lambda: sum(1 for _ in bank.iter_matches("fotosintez", user)),
+            repeat=3,
+        )
+        bank.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,144 @@
+"""
+Rendering benchmark for the text output templates.
+
+Times the HEMIS and student text formats written by their built-in
+templates against the hand-written formatters they replaced (kept here as
+the baseline), checks that both produce the same text, and times a custom
+template and the HEMIS sink.
+
+Usage:
+    python -m benchmarks.template_render [questions]
+"""
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from src.core.formatters import (
+    HemisSink,
+    render_to_sink,
+    transform_to_program_format,
+    transform_to_student_format,
+)
+from src.core.templates import OutputTemplate, compile_template, render_questions
+
+DEFAULT_QUESTIONS = 200_000
+REPEAT = 10
+
+CUSTOM_TEMPLATE = OutputTemplate(
+    question="{number}) {text}\n{variants}\nJavob: {answer}",
+    variant="  {LETTER}. {text}",
+    separator="\n\n",
+)
+
+
+def synthetic_questions(count: int, seed: int = 1) -> List[Dict]:
+    """Create questions with four variants each."""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": number,
+            "text": f"{number}. Savol {number} matni qanday?",
+            "variants": [{"id": i + 1, "text": f"Javob {number}-{i + 1}"} for i in range(4)],
+            "correct": rng.randint(1, 4),
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+def hand_written_student_format(json_data: Dict, include_variants: bool = True) -> str:
+    """The student formatter before templates."""
+    output = []
+    for question in json_data["questions"]:
+        output.append(f"{question['id']}. {question['text']}")
+        if include_variants:
+            for variant in question["variants"]:
+                letter = chr(96 + variant["id"])
+                output.append(f"{letter}) {variant['text']}")
+        output.append("")
+    return "\n".join(output)
+
+
+def hand_written_program_format(json_data: Dict) -> str:
+    """The HEMIS formatter before templates."""
+    output = []
+    questions = json_data["questions"]
+    for i, question in enumerate(questions):
+        output.extend([question["text"], "===="])
+        for variant in question["variants"]:
+            marker = "#" if variant["id"] == question["correct"] else ""
+            output.append(f"{marker}{variant['text']}")
+            output.append("====")
+        if i < len(questions) - 1:
+            output.append("++++")
+    return "\n".join(output)
+
+
+def timed(*functions) -> List[float]:
+    """
+    Best time of REPEAT runs of every function, in seconds.
+
+    The functions run in turn in every round, so a slow moment of the
+    machine affects them alike, and without garbage collection (as timeit).
+    """
+    best = [float("inf")] * len(functions)
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(REPEAT):
+            for index, function in enumerate(functions):
+                started = time.perf_counter()
+                function()
+                best[index] = min(best[index], time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return best
+
+
+def compare(label: str, hand_written, template) -> None:
+    assert hand_written() == template(), f"{label}: outputs differ"
+    before, after = timed(hand_written, template)
+    print(f"{label:<22}{before * 1000:>9.1f} ms{after * 1000:>10.1f} ms{after / before:>8.2f}x")
+
+
+def main(argv: List[str]) -> None:
+    count = int(argv[0]) if argv else DEFAULT_QUESTIONS
+    json_data = {"questions": synthetic_questions(count)}
+    print(f"{count} questions, best of {REPEAT}")
+    print(f"{'':<22}{'hand-written':>12}{'template':>10}")
+
+    compare(
+        "HEMIS",
+        lambda: hand_written_program_format(json_data),
+        lambda: transform_to_program_format(json_data),
+    )
+    compare(
+        "student",
+        lambda: hand_written_student_format(json_data),
+        lambda: transform_to_student_format(json_data),
+    )
+    compare(
+        "student, no variants",
+        lambda: hand_written_student_format(json_data, False),
+        lambda: transform_to_student_format(json_data, False),
+    )
+
+    started = time.perf_counter()
+    compile_template.cache_clear()
+    compile_template(CUSTOM_TEMPLATE)
+    print(f"compile a template    {(time.perf_counter() - started) * 1000:9.2f} ms")
+    (custom,) = timed(lambda: render_questions(CUSTOM_TEMPLATE, json_data["questions"]))
+    print(f"custom template       {custom * 1000:9.1f} ms")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "bank_Hemis.txt")
+        (sink,) = timed(lambda: render_to_sink(HemisSink(path), json_data["questions"]))
+    print(f"HEMIS sink            {sink * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,92 @@
+"""
+Soak test for the conversion worker pool.
+
+Runs thousands of conversions through a WorkerPool and samples the resident
+memory of this (supervising) process and of the workers as it goes, showing
+that memory stays flat: documents are built in the workers, and a worker is
+replaced after WORKER_MAX_JOBS jobs or when it grows past its RSS ceiling.
+With --in-process the same conversions run in this process instead, for
+comparison.
+
+Usage:
+    python -m benchmarks.worker_soak [--jobs 2000] [--questions 50] [--in-process]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from benchmarks.dedupe_scaling import synthetic_bank
+from src.core.registry import render_formats
+from src.core.worker_pool import WorkerPool, resident_memory
+
+FORMATS = ["word", "student", "hemis"]
+MEGABYTE = 1024 * 1024
+
+
+def process_rss(pid: int) -> int:
+    """Resident memory of another process, in bytes."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=2000, help="conversions to run")
+    parser.add_argument("--questions", type=int, default=50, help="questions per bank")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes")
+    parser.add_argument("--max-jobs", type=int, default=200, help="jobs before a worker is replaced")
+    parser.add_argument("--max-rss-mb", type=int, default=512, help="RSS ceiling of a worker")
+    parser.add_argument("--sample-every", type=int, default=100, help="jobs between samples")
+    parser.add_argument("--in-process", action="store_true", help="convert in this process")
+    args = parser.parse_args(argv)
+
+    questions = synthetic_bank(args.questions)["questions"]
+    pool = None
+    if not args.in_process:
+        pool = WorkerPool(
+            workers=args.workers, max_jobs=args.max_jobs, max_rss=args.max_rss_mb * MEGABYTE
+        )
+
+    print(f"{'jobs':>6}{'seconds':>9}{'main MB':>9}{'workers MB':>12}{'recycled':>10}")
+    started = time.perf_counter()
+    first_rss = None
+    try:
+        for job in range(1, args.jobs + 1):
+            with tempfile.TemporaryDirectory() as output_dir:
+                if pool is None:
+                    results = render_formats(questions, FORMATS, output_dir, "soak")
+                else:
+                    results = pool.render(questions, FORMATS, output_dir, "soak")
+            failed = [result.key for result in results if result.error is not None]
+            if failed:
+                print(f"job {job} failed: {failed}", file=sys.stderr)
+                return 1
+
+            if job % args.sample_every == 0 or job == 1:
+                rss = resident_memory()
+                first_rss = first_rss or rss
+                workers = [process_rss(pid) for pid in pool.worker_pids()] if pool else []
+                worker_text = "/".join(str(size // MEGABYTE) for size in workers) or "-"
+                recycled = pool.recycled if pool else 0
+                print(
+                    f"{job:>6}{time.perf_counter() - started:>9.1f}{rss // MEGABYTE:>9}"
+                    f"{worker_text:>12}{recycled:>10}"
+                )
+    finally:
+        if pool is not None:
+            pool.close()
+
+    growth = (resident_memory() - first_rss) / MEGABYTE
+    print(f"\nMain process grew by {growth:.1f} MB over {args.jobs} conversions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,48 +3,77 @@ Entry point for the test question converter bot application.
 
 This file initializes and runs the Telegram bot, setting up all the
 necessary handlers and configurations.
+
+By default one process receives updates and converts files. For a split
+deployment, `--role poller` only receives updates and queues the
+conversions in a local job queue, and `--role worker` runs conversion
+worker processes that take jobs from it (see src/bot/poller.py and
+src/bot/queue_worker.py); `--role poller --workers N` starts both.
+
+The telegram stack and the handlers (which pull in the core converters) are
+imported inside main() only after BOT_TOKEN has been checked, so a
+misconfigured start fails fast instead of paying for the full import first.
 """
 
+import argparse
 import os
 import logging
-from dotenv import load_dotenv
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    filters,
-)
-
-from src.bot.handlers import (
-    start_command,
-    help_command,
-    receive_file,
-    button_callback,
-    text_message,
-)
-
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
-
-# Configure basic logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(os.path.join("logs", "bot.log")),
-    ],
-)
+import signal
+from typing import List, Optional
+
 logger = logging.getLogger(__name__)
 
 
-def main() -> None:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the command line of the bot.
+    """
+    parser = argparse.ArgumentParser(description="Test question converter bot")
+    parser.add_argument(
+        "--role",
+        choices=["bot", "poller", "worker"],
+        default="bot",
+        help="bot: receive updates and convert (default); poller: receive updates and "
+        "queue conversions; worker: run conversion workers",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="conversion worker processes to run (default: 1 for --role worker, "
+        "none for --role poller)",
+    )
+    return parser.parse_args(argv)
+
+
+def run_workers(count: int) -> None:
+    """
+    Run conversion worker processes until interrupted.
+    """
+    from src.bot.queue_worker import WorkerSupervisor
+
+    # Stop the workers on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    supervisor = WorkerSupervisor(count)
+    logger.info(f"Starting {count} conversion workers")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
     """
     Initialize and run the Telegram bot application.
     """
-    # Create logs directory if it doesn't exist
-    os.makedirs("logs", exist_ok=True)
+    from dotenv import load_dotenv
+
+    from src.utils.logger import setup_logger
+
+    args = parse_args(argv)
+    setup_logger()
 
     # Load environment variables
     load_dotenv()
@@ -54,21 +83,86 @@ def main() -> None:
         logger.error("BOT_TOKEN environment variable not set")
         return
 
-    # Create the application
-    application = Application.builder().token(bot_token).build()
+    if args.role == "worker":
+        run_workers(args.workers or 1)
+        return
+
+    from telegram.ext import (
+        Application,
+        CommandHandler,
+        MessageHandler,
+        CallbackQueryHandler,
+        filters,
+    )
+
+    from src.bot.handlers import (
+        start_command,
+        help_command,
+        receive_file,
+        button_callback,
+        search_command,
+        export_command,
+        export_callback,
+        text_message,
+        EXPORT_PREFIX,
+    )
+
+    # Create the application; BOT_API_URL and BOT_FILE_API_URL point the bot
+    # at a local Bot API server (or the load-test stand-in in benchmarks/)
+    builder = Application.builder().token(bot_token)
+    if os.getenv("BOT_API_URL"):
+        builder = builder.base_url(os.getenv("BOT_API_URL"))
+    if os.getenv("BOT_FILE_API_URL"):
+        builder = builder.base_file_url(os.getenv("BOT_FILE_API_URL"))
+    application = builder.build()
 
     # Setup handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(MessageHandler(filters.Document.ALL, receive_file))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("export", export_command))
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, text_message)
     )
-    application.add_handler(CallbackQueryHandler(button_callback))
+
+    supervisor = None
+    if args.role == "poller":
+        from src.bot.poller import (
+            enqueue_upload,
+            enqueue_conversion,
+            enqueue_export,
+            BANK_PREFIX,
+        )
+
+        # Uploads and format choices are queued for the conversion workers
+        application.add_handler(MessageHandler(filters.Document.ALL, enqueue_upload))
+        application.add_handler(
+            CallbackQueryHandler(enqueue_export, pattern=f"^{EXPORT_PREFIX}")
+        )
+        application.add_handler(
+            CallbackQueryHandler(enqueue_conversion, pattern=f"^{BANK_PREFIX}")
+        )
+        application.add_handler(CallbackQueryHandler(button_callback))
+
+        if args.workers:
+            from src.bot.queue_worker import WorkerSupervisor
+
+            supervisor = WorkerSupervisor(args.workers)
+            supervisor.start()
+    else:
+        application.add_handler(MessageHandler(filters.Document.ALL, receive_file))
+        application.add_handler(
+            CallbackQueryHandler(export_callback, pattern=f"^{EXPORT_PREFIX}")
+        )
+        application.add_handler(CallbackQueryHandler(button_callback))
 
     # Start the bot
-    logger.info("Starting Test Questions Converter Bot")
-    application.run_polling()
+    logger.info(f"Starting Test Questions Converter Bot ({args.role})")
+    try:
+        application.run_polling()
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
 
 
 if __name__ == "__main__":
@@ -14,6 +14,10 @@ setup(
         "python-docx>=0.8.10",
         "python-dotenv>=0.19.0",
     ],
+    extras_require={
+        # Grading answer sheets (src/core/grading.py)
+        "grading": ["numpy>=1.20"],
+    },
     # Metadata
     author="Me-Ilyos",
     author_email="me.ilyos101@gmail.com",
@@ -30,8 +34,10 @@ setup(
         "Development Status :: 4 - Beta",
         "Intended Audience :: Education",
     ],
-    # Requirements
-    python_requires=">=3.7",
+    # Requirements: asyncio.to_thread and Executor.shutdown(cancel_futures=)
+    # need Python 3.9; the job queue and upload cache use UPDATE ... RETURNING,
+    # which needs SQLite 3.35 (sqlite3.sqlite_version)
+    python_requires=">=3.9",
     # Entry points
     entry_points={
         "console_scripts": [
@@ -5,21 +5,71 @@ This file contains handlers for processing user interactions with the bot,
 including commands and file uploads.
 """
 
+import asyncio
+import logging
 import os
 import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from src.core.parser import parse_text_file
-from src.core.formatters import (
-    transform_to_student_format,
-    create_student_word_document,
-    transform_to_program_format,
-    create_word_document,
+from src.core.archives import OutputPacker, check_archive, is_archive
+from src.core.parser import parse_hemis, read_text_file, sniff_input_format
+from src.core.duplicate_checker import check_for_duplicates, split_duplicate_report
+from src.core.docx_reader import read_docx_text
+from src.core.registry import get_default_formats, get_formats, render_formats, RenderResult
+from src.core.incremental import UploadSession
+from src.core.pipeline import format_problems, split_problems
+from src.core.question_bank import DEFAULT_BANK_PATH, QuestionBank
+from src.core.job_queue import JobSteps
+from src.core.upload_cache import DEFAULT_CACHE_PATH, CheckedUpload, UploadCache
+from src.core.worker_pool import WorkerError, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Extensions of the question files the bot accepts; archives of question
+# files (see src.core.archives) are accepted too
+ACCEPTED_EXTENSIONS = (".txt", ".docx")
+
+# Extension of the answer sheet files graded against the user's last bank
+ANSWER_SHEET_EXTENSION = ".csv"
+
+# Validation problems listed in one reply (Telegram messages are limited in size)
+MAX_REPORTED_PROBLEMS = 30
+
+# Characters of warnings shown above the format keyboard; Telegram messages
+# hold at most 4096
+MAX_WARNINGS_LENGTH = 3000
+
+# Largest document the Bot API accepts, and the size outputs are split at;
+# output sizes are estimated while rendering, so parts stay a little below
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+MAX_PART_SIZE = 48 * 1024 * 1024
+
+# Characters of a question shown in a search result
+SEARCH_RESULT_TEXT_LENGTH = 80
+
+# Prefix of the callback data of the export format keyboard
+EXPORT_PREFIX = "export:"
+
+# Sent when an upload has been accepted for checking
+RECEIVED_MESSAGE = "✅ Fayl qabul qilindi! Tekshirilmoqda..."
+
+# Question shown above the format keyboard
+FORMAT_PROMPT = "Qaysi formatga aylantirmoqchi ekanligingizni tanlang:"
+
+# Sent when all requested files have been sent
+READY_MESSAGE = "✅ Tayyor! Natijalarni yuklab oling."
+
+# Sent when an answer sheet file has been accepted for grading
+GRADING_MESSAGE = "✅ Javoblar varaqasi qabul qilindi! Baholanmoqda..."
+
+# Sent when an answer sheet arrives before any question file
+NO_BANK_MESSAGE = (
+    "⚠️ Avval to'g'ri javoblari belgilangan savollar faylini yuboring, "
+    "so'ng talabalarning javoblar varaqasini (.csv) yuboring."
 )
-from src.core.duplicate_checker import check_for_duplicates
 
 
 # Basic welcome message
@@ -30,7 +80,8 @@ Men quyidagi imkoniyatlarga egaman:
 - Savollarni turli formatlarga o'zgartirish
 - Test savollaridagi takrorlanishlarni tekshirish
 
-Ishni boshlash uchun menga .txt formatidagi savollaringizni yuboring.
+Ishni boshlash uchun menga .txt yoki .docx formatidagi savollaringizni yuboring.
+Bir nechta faylni .zip yoki .tar.gz arxivida yuborish mumkin.
 
 Savol formatining namunasi:
 1. Savol matni?
@@ -43,9 +94,22 @@ c) Javob varianti 3
 HELP_MESSAGE = """
 🔍 Botdan foydalanish yo'riqnomasi:
 
-1. Menga .txt faylini yuboring (savollar va javoblar variantlari bilan)
+1. Menga .txt yoki .docx faylini yuboring (savollar va javoblar variantlari bilan)
 2. Kerakli format(lar)ni tanlang
 
+Bir nechta savollar faylini .zip, .tar.gz yoki .gz arxivida yuborsangiz,
+ular bitta to'plam sifatida tekshiriladi (fayllar orasidagi takrorlanishlar
+ham) va natijalar bitta .zip arxivida qaytariladi.
+
+Qabul qilingan savollar saqlanadi:
+/search so'zlar - saqlangan savollaringiz ichidan qidirish
+/export so'zlar - topilgan savollarni tanlangan formatda yuklab olish
+
+Talabalar javoblarini baholash uchun .csv fayl yuboring: birinchi qatorda
+sarlavhalar, keyin har bir talaba uchun bitta qator - ism, so'ng har bir
+savolga tanlangan javob harfi (a, b, c, ...). Javoblar oxirgi yuborgan
+savollar faylingizdagi to'g'ri javoblar bilan solishtiriladi.
+
 Savollar formati quyidagicha bo'lishi kerak:
 
 1. Savol matni?
@@ -55,9 +119,283 @@ c) Javob varianti 3
 d) Javob varianti 4
 
 To'g'ri javob oldiga * belgisini qo'ying.
+
+Word faylida har bir savol alohida jadvalda bo'lishi ham mumkin: birinchi
+qatorda savol, ikkinchi qatorda to'g'ri javob, qolgan qatorlarda boshqa javoblar.
 """
 
 
+class UploadError(Exception):
+    """An uploaded file could not be parsed."""
+
+
+def get_question_bank(context: ContextTypes.DEFAULT_TYPE) -> QuestionBank:
+    """
+    Get the bot's question bank, opening it on first use.
+
+    The database path is taken from QUESTION_BANK_PATH.
+    """
+    bank = context.bot_data.get("question_bank")
+    if bank is None:
+        bank = QuestionBank(os.getenv("QUESTION_BANK_PATH", DEFAULT_BANK_PATH))
+        context.bot_data["question_bank"] = bank
+    return bank
+
+
+def get_upload_cache(context: ContextTypes.DEFAULT_TYPE) -> UploadCache:
+    """
+    Get the cache of checked uploads, opening it on first use.
+
+    The database path is taken from UPLOAD_CACHE_PATH.
+    """
+    cache = context.bot_data.get("upload_cache")
+    if cache is None:
+        cache = UploadCache(os.getenv("UPLOAD_CACHE_PATH", DEFAULT_CACHE_PATH))
+        context.bot_data["upload_cache"] = cache
+    return cache
+
+
+def get_worker_pool(context: ContextTypes.DEFAULT_TYPE) -> Optional[WorkerPool]:
+    """
+    Get the bot's conversion worker pool, creating it on first use.
+
+    The pool is configured from the environment (see
+    WorkerPool.from_environment); None means conversions run in-process.
+    """
+    if "worker_pool" not in context.bot_data:
+        context.bot_data["worker_pool"] = WorkerPool.from_environment()
+    return context.bot_data["worker_pool"]
+
+
+def output_base_name(file_name: str) -> str:
+    """Base name of the outputs of an upload, e.g. "bank" for "bank.tar.gz"."""
+    base_name = os.path.splitext(file_name)[0]
+    if base_name.lower().endswith(".tar"):
+        base_name = base_name[: -len(".tar")]
+    return base_name
+
+
+def check_upload(
+    file_path: str,
+    upload_session: Optional[UploadSession] = None,
+    file_name: Optional[str] = None,
+):
+    """
+    Parse an uploaded question file and check it.
+
+    Args:
+        file_path: Downloaded upload
+        upload_session: The user's session, to reuse the work done for the
+            blocks that did not change since their previous upload
+        file_name: Name the file was uploaded under (default: from
+            file_path); archives are recognized by it
+
+    Returns:
+        Tuple of the parsed data, the duplicate report and the validation
+        problems
+    """
+    file_name = file_name or os.path.basename(file_path)
+    if is_archive(file_name):
+        # The members are checked together as one bank
+        return check_archive(file_path, file_name)
+
+    # Word files are converted to the text format while they are read
+    input_format = sniff_input_format(file_path)
+    if input_format == "hemis":
+        # HEMIS exports come from an already checked bank; they are only
+        # checked for duplicates again
+        json_data = parse_hemis(read_text_file(file_path))
+        return json_data, check_for_duplicates(json_data), []
+
+    if input_format == "docx":
+        content = read_docx_text(file_path)
+    else:
+        content = read_text_file(file_path)
+    if upload_session is None:
+        upload_session = UploadSession()
+    return upload_session.update(content)
+
+
+async def check_document(
+    bot,
+    document,
+    upload_cache: Optional[UploadCache] = None,
+    upload_session: Optional[UploadSession] = None,
+) -> CheckedUpload:
+    """
+    Check an uploaded document, unless the same file was checked before.
+
+    A file found in the upload cache (by its file_unique_id) is neither
+    downloaded nor parsed again.
+
+    Args:
+        bot: Bot to download the file with
+        document: The uploaded Document (or anything with file_id,
+            file_unique_id and file_name)
+        upload_cache: Cache of earlier check results
+        upload_session: The user's session (see check_upload)
+
+    Returns:
+        The check result
+
+    Raises:
+        UploadError: If the file could not be parsed
+    """
+    if upload_cache is not None and document.file_unique_id:
+        checked = upload_cache.get(document.file_unique_id)
+        if checked is not None:
+            return checked
+
+    extension = os.path.splitext(document.file_name)[1].lower()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "upload" + extension)
+        new_file = await bot.get_file(document.file_id)
+        await new_file.download_to_drive(file_path)
+        try:
+            checked = CheckedUpload(
+                *await asyncio.to_thread(
+                    check_upload, file_path, upload_session, document.file_name
+                )
+            )
+        except Exception as e:
+            raise UploadError(str(e)) from e
+
+    if upload_cache is not None and document.file_unique_id:
+        upload_cache.put(document.file_unique_id, checked)
+    return checked
+
+
+def is_answer_sheet(document) -> bool:
+    """Check whether an uploaded document is an answer sheet file to grade."""
+    return os.path.splitext(document.file_name)[1].lower() == ANSWER_SHEET_EXTENSION
+
+
+async def send_grades(
+    bot, chat_id: int, document, bank: QuestionBank, steps: Optional[JobSteps] = None
+) -> None:
+    """
+    Grade an answer sheet file against the user's last bank and send the
+    results with the item analysis of the questions.
+
+    Args:
+        bot: Bot downloading the file and sending the results
+        chat_id: Chat of the user, whose id is also the owner of the bank
+        document: The uploaded Document (or anything with file_id and file_name)
+        bank: Stored question banks
+        steps: Steps of the queued job this is part of (see send_outputs)
+    """
+    from src.core.grading import GradingError, grade_file
+    from src.core.item_analysis import analyze_items, write_item_analysis_document
+
+    latest = await asyncio.to_thread(bank.latest_bank, chat_id)
+    if latest is None:
+        await send_once(
+            steps, "reply", lambda: bot.send_message(chat_id=chat_id, text=NO_BANK_MESSAGE)
+        )
+        return
+
+    bank_name, questions = latest
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sheets_path = os.path.join(temp_dir, "javoblar" + ANSWER_SHEET_EXTENSION)
+        base_name = os.path.splitext(bank_name)[0]
+        results_path = os.path.join(temp_dir, f"{base_name}_Natijalar{ANSWER_SHEET_EXTENSION}")
+        analysis_path = os.path.join(temp_dir, f"{base_name}_Tahlil.docx")
+        new_file = await bot.get_file(document.file_id)
+        await new_file.download_to_drive(sheets_path)
+        json_data = {"questions": questions}
+
+        def grade_and_analyze():
+            result = grade_file(json_data, sheets_path, results_path)
+            analysis = analyze_items(json_data, result.responses)
+            write_item_analysis_document(json_data, analysis, analysis_path)
+            return result
+
+        try:
+            result = await asyncio.to_thread(grade_and_analyze)
+        except (GradingError, ImportError, UnicodeDecodeError) as e:
+            reply = f"❌ Xato! Javoblar varaqasini baholab bo'lmadi: {str(e)}"
+            await send_once(
+                steps, "reply", lambda: bot.send_message(chat_id=chat_id, text=reply)
+            )
+            return
+
+        students = len(result.students)
+        average = float(result.scores.mean()) if students else 0.0
+
+        async def send_document(path: str) -> None:
+            with open(path, "rb") as f:
+                await bot.send_document(
+                    chat_id=chat_id, document=f, filename=os.path.basename(path)
+                )
+
+        for path in (results_path, analysis_path):
+            await send_once(steps, f"file:{os.path.basename(path)}", lambda: send_document(path))
+    await send_once(
+        steps,
+        "reply",
+        lambda: bot.send_message(
+            chat_id=chat_id,
+            text=(
+                f"📊 {bank_name}: {students} ta talaba baholandi. "
+                f"O'rtacha ball: {average:.1f} / {result.max_score}"
+            ),
+        ),
+    )
+
+
+def rejection_message(duplicate_report: str, problems: List) -> Optional[str]:
+    """
+    Get the reply to an upload that cannot be converted.
+
+    Warnings (see split_problems() and split_duplicate_report()) do not
+    block an upload; acceptance_message() shows them instead.
+
+    Returns:
+        Message listing the problems or duplicates, or None if the upload
+        was accepted
+    """
+    problems, _ = split_problems(problems)
+    if problems:
+        # The validation problems with their line numbers
+        return (
+            "⚠️ Faylda quyidagi xatolar aniqlandi:\n\n"
+            + format_problems(problems, limit=MAX_REPORTED_PROBLEMS)
+            + "\n\nIltimos, xatolarni tuzating, so'ng faylni qayta yuboring."
+        )
+    duplicates, _ = split_duplicate_report(duplicate_report)
+    if duplicates:
+        return (
+            "⚠️ Quyidagi xatolar aniqlandi:\n\n"
+            + duplicates
+            + "\n\nIltimos, avval takrorlanishlarni bartaraf qiling, so'ng faylni qayta yuboring."
+        )
+    return None
+
+
+def acceptance_message(duplicate_report: str, problems: List) -> str:
+    """
+    Get the text shown with the format keyboard of an accepted upload.
+
+    Returns:
+        The format prompt, after the warnings found in the file if any
+    """
+    _, warning_problems = split_problems(problems)
+    _, warnings = split_duplicate_report(duplicate_report)
+    if warning_problems:
+        # Warnings found while parsing an archive repeat those of the report
+        warnings = warnings or format_problems(warning_problems, limit=MAX_REPORTED_PROBLEMS)
+    if not warnings:
+        return FORMAT_PROMPT
+    if len(warnings) > MAX_WARNINGS_LENGTH:
+        warnings = warnings[:MAX_WARNINGS_LENGTH].rsplit("\n", 1)[0] + "\n..."
+    return (
+        "⚠️ Fayl qabul qilindi, lekin quyidagilarni tekshirib ko'ring:\n\n"
+        + warnings
+        + "\n\n"
+        + FORMAT_PROMPT
+    )
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle the /start command to begin bot interaction.
@@ -85,97 +423,338 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(HELP_MESSAGE, parse_mode="Markdown")
 
 
-async def receive_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def accept_document(update: Update) -> bool:
     """
-    Process uploaded document files from users.
+    Check that a message carries a question file the bot accepts.
+
+    Tells the user why a file is not accepted.
+
+    Returns:
+        True if the file should be processed
     """
     if not update.message.document:
-        await update.message.reply_text("Iltimos, .txt formatidagi fayl yuboring.")
-        return
-
-    file = update.message.document
-    file_name = file.file_name
+        await update.message.reply_text("Iltimos, .txt yoki .docx formatidagi fayl yuboring.")
+        return False
 
     # Check file extension
-    if not file_name.lower().endswith(".txt"):
+    file_name = update.message.document.file_name
+    extension = os.path.splitext(file_name)[1].lower()
+    if (
+        extension not in ACCEPTED_EXTENSIONS
+        and extension != ANSWER_SHEET_EXTENSION
+        and not is_archive(file_name)
+    ):
         await update.message.reply_text(
-            "Iltimos, faqat .txt formatidagi fayllar qabul qilinadi."
+            "Iltimos, faqat .txt yoki .docx formatidagi savollar fayllari, ularning "
+            ".zip, .tar.gz yoki .gz arxivlari va .csv formatidagi javoblar varaqalari "
+            "qabul qilinadi."
         )
-        return
+        return False
+    return True
+
 
-    await update.message.reply_text("✅ Fayl qabul qilindi! Tekshirilmoqda...")
+async def receive_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Process uploaded document files from users.
+    """
+    if not await accept_document(update):
+        return
 
-    # Download file to a temporary location
-    new_file = await context.bot.get_file(file.file_id)
+    if is_answer_sheet(update.message.document):
+        await update.message.reply_text(GRADING_MESSAGE)
+        await send_grades(
+            context.bot,
+            update.effective_user.id,
+            update.message.document,
+            get_question_bank(context),
+        )
+        return
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as temp_file:
-        file_path = temp_file.name
+    await update.message.reply_text(RECEIVED_MESSAGE)
 
-    await new_file.download_to_drive(file_path)
+    file = update.message.document
+    file_name = file.file_name
 
     try:
-        # Parse the file
-        json_data = parse_text_file(file_path)
-
-        # Check for duplicates
-        duplicate_report = check_for_duplicates(json_data)
-
-        if "No duplicate" not in duplicate_report:
-            # Send report if duplicates found
-            await update.message.reply_text(
-                "⚠️ Quyidagi xatolar aniqlandi:\n\n"
-                + duplicate_report
-                + "\n\nIltimos, avval takrorlanishlarni bartaraf qiling, so'ng faylni qayta yuboring."
-            )
-            os.unlink(file_path)  # Clean up the file
+        # Parse the file and check for duplicates, reusing the work done for
+        # the blocks that did not change since this user's previous upload,
+        # or the whole result if the same file was uploaded before
+        upload_session = context.user_data.setdefault("upload_session", UploadSession())
+        json_data, duplicate_report, problems = await check_document(
+            context.bot, file, get_upload_cache(context), upload_session
+        )
+
+        rejection = rejection_message(duplicate_report, problems)
+        if rejection is not None:
+            await update.message.reply_text(rejection)
             return
 
+        # Keep the accepted bank for /search and /export; the conversion
+        # goes on even if it cannot be stored
+        try:
+            await asyncio.to_thread(
+                get_question_bank(context).add_bank,
+                json_data["questions"],
+                file_name,
+                update.effective_user.id,
+            )
+        except Exception as e:
+            logger.error(f"Error storing {file_name}: {str(e)}")
+
         # Store data in user context
         context.user_data["json_data"] = json_data
-        context.user_data["file_path"] = file_path
-        context.user_data["file_name"] = os.path.splitext(file_name)[0]
+        context.user_data["file_name"] = output_base_name(file_name)
+        context.user_data["archive"] = is_archive(file_name)
 
-        # Show format selection buttons
-        await show_format_selection(update, context)
+        # Show format selection buttons, with any warnings about the file
+        await show_format_selection(
+            update, context, acceptance_message(duplicate_report, problems)
+        )
 
     except Exception as e:
-        # Clean up on error
-        if os.path.exists(file_path):
-            os.unlink(file_path)
         await update.message.reply_text(
             f"❌ Xato! Faylni qayta ishlashda muammo yuzaga keldi: {str(e)}"
         )
 
 
+def format_keyboard(prefix: str = "") -> InlineKeyboardMarkup:
+    """
+    Build the format selection keyboard.
+
+    Args:
+        prefix: Prepended to the callback data of every button
+
+    Returns:
+        Keyboard with two registered formats per row and an "all" button for
+        the default formats
+    """
+    buttons = [
+        InlineKeyboardButton(output_format.label, callback_data=prefix + output_format.key)
+        for output_format in get_formats()
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([InlineKeyboardButton("Asosiy formatlar", callback_data=prefix + "all")])
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def show_format_selection(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
+    update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str = FORMAT_PROMPT
 ) -> None:
     """
     Display format selection buttons to the user.
     """
-    # Create keyboard for format selection
-    keyboard = [
-        [
-            InlineKeyboardButton("Talaba formati", callback_data="student"),
-            InlineKeyboardButton(
-                "Variantsiz talaba formati", callback_data="student_novariant"
-            ),
-        ],
-        [
-            InlineKeyboardButton("HEMIS formati", callback_data="hemis"),
-            InlineKeyboardButton("Jadval (Word) formati", callback_data="word"),
-        ],
-        [InlineKeyboardButton("Barcha formatlar", callback_data="all")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = format_keyboard()
 
     # Ask user to select format
-    await update.message.reply_text(
-        "Qaysi formatga aylantirmoqchi ekanligingizni tanlang:",
-        reply_markup=reply_markup,
+    await update.message.reply_text(prompt, reply_markup=reply_markup)
+
+
+def selected_format_keys(selected_format: str) -> List[str]:
+    """Keys of the formats chosen with a keyboard button."""
+    if selected_format == "all":
+        return [output_format.key for output_format in get_default_formats()]
+    return [selected_format]
+
+
+async def render_and_send(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    questions,
+    selected_format: str,
+    output_dir: str,
+    file_name: str,
+    caches: Optional[Dict[str, Dict]] = None,
+    as_archive: bool = False,
+) -> None:
+    """
+    Render the questions in the selected format(s) and send the files.
+
+    Args:
+        questions: Questions to render (may be a one-shot iterator)
+        selected_format: Format key or "all", from a keyboard button
+        output_dir: Temporary folder for the output files
+        file_name: Base name of the output files
+        caches: Optional fragment caches per format key
+        as_archive: Send the files in one .zip archive
+    """
+    await send_outputs(
+        context.bot,
+        update.effective_user.id,
+        get_worker_pool(context),
+        questions,
+        selected_format,
+        output_dir,
+        file_name,
+        caches=caches,
+        as_archive=as_archive,
     )
 
 
+async def send_once(steps: Optional[JobSteps], step: str, send) -> None:
+    """
+    Send a message unless an earlier attempt of the job already did.
+
+    Args:
+        steps: Steps of the queued job, or None outside the job queue
+        step: Name of the message within the job
+        send: Coroutine function sending the message
+    """
+    if steps is not None and steps.done(step):
+        return
+    await send()
+    if steps is not None:
+        steps.mark(step)
+
+
+async def send_outputs(
+    bot,
+    chat_id: int,
+    pool: Optional[WorkerPool],
+    questions,
+    selected_format: str,
+    output_dir: str,
+    file_name: str,
+    caches: Optional[Dict[str, Dict]] = None,
+    steps: Optional[JobSteps] = None,
+    as_archive: bool = False,
+) -> None:
+    """
+    Render questions in the selected format(s) and send the files to a chat.
+
+    Rendering runs in the worker pool (or a thread when there is no pool)
+    and outputs are split into parts under the upload limit; each part is
+    sent as soon as it is finished, while the next one is still being
+    rendered.
+
+    Args:
+        bot: Bot sending the files
+        chat_id: Chat the files are sent to
+        pool: Conversion worker pool, or None to render in-process
+        questions: Questions to render (may be a one-shot iterator)
+        selected_format: Format key or "all", from a keyboard button
+        output_dir: Temporary folder for the output files
+        file_name: Base name of the output files
+        caches: Optional fragment caches per format key; with a pool they
+            are kept by the worker that renders for the chat, and passing
+            any dictionary turns them on
+        steps: Steps of the queued job this is part of; files and messages
+            sent by an earlier attempt are not sent again, and a failed send
+            is raised so the job can be retried
+        as_archive: Send the files packed into .zip archives under the part
+            size, each as soon as it is full, instead of each part on its own
+
+    Raises:
+        telegram.error.TelegramError: If a send failed within a queued job
+    """
+    loop = asyncio.get_running_loop()
+    # Parts are sent one at a time, in the order they were finished
+    send_lock = asyncio.Lock()
+    uploads = []
+    send_errors = []
+
+    async def send_message(step: str, text: str) -> None:
+        await send_once(steps, step, lambda: bot.send_message(chat_id=chat_id, text=text))
+
+    async def send_document(path: str) -> None:
+        name = os.path.basename(path)
+        with open(path, "rb") as document:
+            await bot.send_document(chat_id=chat_id, document=document, filename=name)
+
+    async def send_part(path: str) -> None:
+        name = os.path.basename(path)
+        async with send_lock:
+            try:
+                if os.path.getsize(path) > MAX_UPLOAD_SIZE:
+                    await send_message(
+                        f"too-large:{name}",
+                        f"❌ Xato! {name} hajmi Telegram chegarasidan (50 MB) katta.",
+                    )
+                    return
+                await send_once(steps, f"file:{name}", lambda: send_document(path))
+            except Exception as e:
+                logger.error(f"Error sending {name}: {str(e)}")
+                if steps is not None:
+                    # The job is retried and sends the file again
+                    send_errors.append(e)
+                    return
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"❌ Xato! {name} faylini yuborishda muammo yuzaga keldi.",
+                )
+            finally:
+                # Parts of a large bank add up; free the disk as they go
+                os.unlink(path)
+
+    def schedule_send(path: str) -> None:
+        # Called in the rendering thread
+        uploads.append(asyncio.run_coroutine_threadsafe(send_part(path), loop))
+
+    packer = None
+    if as_archive:
+        packer = OutputPacker(
+            os.path.join(output_dir, f"{file_name}.zip"), MAX_PART_SIZE, schedule_send
+        )
+
+    def on_part(key: str, path: str) -> None:
+        # Called in the rendering thread
+        if packer is not None:
+            packer.add(path)
+        else:
+            schedule_send(path)
+
+    try:
+        # One pass over the questions renders every requested format
+        if pool is None:
+            results = await asyncio.to_thread(
+                render_formats,
+                questions,
+                selected_format_keys(selected_format),
+                output_dir,
+                file_name,
+                caches=caches,
+                max_part_size=MAX_PART_SIZE,
+                on_part=on_part,
+            )
+        else:
+            # Fragment caches hold document elements, which cannot be sent
+            # to the workers; the chat's worker keeps its own caches instead
+            results = await asyncio.to_thread(
+                pool.render,
+                questions,
+                selected_format_keys(selected_format),
+                output_dir,
+                file_name,
+                max_part_size=MAX_PART_SIZE,
+                on_part=on_part,
+                cache_key=chat_id if caches is not None else None,
+            )
+    except ValueError as e:
+        # Unknown format, e.g. a button from an outdated keyboard
+        results = [RenderResult(selected_format, "", e)]
+    except WorkerError as e:
+        logger.error(f"Conversion of {file_name} failed: {str(e)}")
+        results = []
+        await send_message(
+            "conversion-failed",
+            "❌ Xato! Faylni aylantirish vaqt yoki xotira chegarasidan oshib ketdi. "
+            "Iltimos, savollarni bir necha faylga bo'lib yuboring.",
+        )
+
+    if packer is not None:
+        await asyncio.to_thread(packer.close)
+    for upload in uploads:
+        await asyncio.wrap_future(upload)
+    if send_errors:
+        raise send_errors[0]
+
+    for result in results:
+        if result.error is not None:
+            await send_message(
+                f"format-failed:{result.key}",
+                f"❌ Xato! {result.key} formatini yaratishda muammo yuzaga keldi.",
+            )
+
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle format selection and generate appropriate files."""
     query = update.callback_query
@@ -193,61 +772,94 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Get stored data
     json_data = context.user_data["json_data"]
     file_name = context.user_data["file_name"]
-    file_path = context.user_data["file_path"]
-
-    # Determine formats to generate
-    formats_to_generate = ["student", "student_novariant", "hemis", "word"] if selected_format == "all" else [selected_format]
+    render_cache = context.user_data["upload_session"].render_cache
 
     # Create temporary directory for output files
     with tempfile.TemporaryDirectory() as temp_dir:
-        for format_type in formats_to_generate:
-            try:
-                if format_type == "hemis":
-                    # HEMIS format (text file)
-                    output_path = os.path.join(temp_dir, f"{file_name}_Hemis.txt")
-                    hemis_text = transform_to_program_format(json_data)
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        f.write(hemis_text)
-                    
-                elif format_type == "student":
-                    # Student format with variants (Word)
-                    output_path = os.path.join(temp_dir, f"{file_name}_TalabaVariant.docx")
-                    create_student_word_document(json_data, output_path, include_variants=True)
-                    
-                elif format_type == "student_novariant":
-                    # Student format without variants (Word)
-                    output_path = os.path.join(temp_dir, f"{file_name}_TalabaNovariant.docx")
-                    create_student_word_document(json_data, output_path, include_variants=False)
-                    
-                elif format_type == "word":
-                    # Word table format
-                    output_path = os.path.join(temp_dir, f"{file_name}_Yakuniy.docx")
-                    create_word_document(json_data, output_path)
-                
-                # Send file to user
-                await context.bot.send_document(
-                    chat_id=update.effective_user.id,
-                    document=open(output_path, "rb"),
-                    filename=os.path.basename(output_path)
-                )
-                
-            except Exception as e:
-                # logger.error(f"Error processing {format_type}: {str(e)}")
-                await context.bot.send_message(
-                    chat_id=update.effective_user.id,
-                    text=f"❌ Xato! {format_type} formatini yaratishda muammo yuzaga keldi."
-                )
+        await render_and_send(
+            update, context, json_data["questions"], selected_format, temp_dir, file_name,
+            caches=render_cache,
+            as_archive=context.user_data.get("archive", False),
+        )
+
+    # Clean up, keeping the upload session for the next (corrected) upload
+    for key in ("json_data", "file_name", "archive"):
+        context.user_data.pop(key, None)
+
+    await context.bot.send_message(chat_id=update.effective_user.id, text=READY_MESSAGE)
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handle the /search command: list the user's stored questions that match.
+    """
+    query = " ".join(context.args or [])
+    if not query.strip():
+        await update.message.reply_text("Qidiruv so'zlarini yozing, masalan: /search fotosintez")
+        return
+
+    hits = await asyncio.to_thread(
+        get_question_bank(context).search, query, update.effective_user.id
+    )
+    if not hits:
+        await update.message.reply_text("🔍 Hech narsa topilmadi.")
+        return
+
+    lines = [f"🔍 \"{query}\" bo'yicha topilgan savollar:", ""]
+    for hit in hits:
+        text = hit.question["text"]
+        if len(text) > SEARCH_RESULT_TEXT_LENGTH:
+            text = text[:SEARCH_RESULT_TEXT_LENGTH - 1] + "…"
+        lines.append(f"• {hit.file_name}, {hit.number}-savol: {text}")
+    lines.append("")
+    lines.append(f"Topilgan savollarni yuklab olish: /export {query}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handle the /export command: offer the matching stored questions as files.
+    """
+    query = " ".join(context.args or [])
+    if not query.strip():
+        await update.message.reply_text("Eksport uchun so'zlarni yozing, masalan: /export fotosintez")
+        return
 
-    # Clean up
-    if os.path.exists(file_path):
-        os.unlink(file_path)
-    context.user_data.clear()
+    count = await asyncio.to_thread(
+        get_question_bank(context).count_matches, query, update.effective_user.id
+    )
+    if not count:
+        await update.message.reply_text("🔍 Hech narsa topilmadi.")
+        return
 
-    await context.bot.send_message(
-        chat_id=update.effective_user.id, 
-        text="✅ Tayyor! Natijalarni yuklab oling."
+    context.user_data["export_query"] = query
+    await update.message.reply_text(
+        f"{count} ta savol topildi. Qaysi formatda yuklab olmoqchisiz?",
+        reply_markup=format_keyboard(EXPORT_PREFIX),
     )
 
+
+async def export_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the format selection of an export and send the files."""
+    query = update.callback_query
+    await query.answer()
+
+    selected_format = query.data[len(EXPORT_PREFIX):]
+    search_query = context.user_data.pop("export_query", None)
+    if not search_query:
+        await query.edit_message_text("⚠️ Sessiya vaqti tugadi. Iltimos, /export ni qayta yuboring.")
+        return
+
+    await query.edit_message_text(f"⏳ {selected_format} formatida tayyorlanmoqda...")
+
+    # The matches are read from the database while the files are written,
+    # in the rendering thread
+    questions = get_question_bank(context).iter_matches(search_query, update.effective_user.id)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        await render_and_send(update, context, questions, selected_format, temp_dir, "Eksport")
+
+    await context.bot.send_message(chat_id=update.effective_user.id, text=READY_MESSAGE)
+
+
 async def text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle regular text messages from users.
@@ -256,12 +868,14 @@ async def text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return  # Ignore commands
 
     await update.message.reply_text(
-        "Iltimos, .txt formatidagi fayl yuboring. Fayl quyidagi formatda bo'lishi kerak:\n\n"
+        "Iltimos, .txt yoki .docx formatidagi fayl yuboring. Fayl quyidagi formatda bo'lishi kerak:\n\n"
         "1. Savol matni?\n"
         "a) Javob varianti 1\n"
         "b) *To'g'ri javob varianti\n"
         "c) Javob varianti 3\n\n"
         "Komandalar:\n"
         "/help - Batafsil yo'riqnoma olish\n"
+        "/search - Saqlangan savollardan qidirish\n"
+        "/export - Topilgan savollarni yuklab olish\n"
         "/start - Botni qayta ishga tushirish"
     )
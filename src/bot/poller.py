@@ -0,0 +1,126 @@
+"""
+Handlers of the update poller in the split deployment.
+
+With `main.py --role poller` the process that receives updates does no
+conversion work itself. Commands and searches are answered at once by the
+ordinary handlers; uploads and format choices become jobs in the local job
+queue, which any number of conversion workers (src.bot.queue_worker) take
+from there.
+
+A worker stores an accepted upload in the question bank and puts the id of
+the stored bank into the callback data of the format keyboard, so the
+format choice can be handled by any worker, not only the one that checked
+the upload.
+"""
+
+import logging
+import os
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from src.bot.handlers import (
+    EXPORT_PREFIX,
+    GRADING_MESSAGE,
+    RECEIVED_MESSAGE,
+    accept_document,
+    is_answer_sheet,
+)
+from src.core.job_queue import DEFAULT_QUEUE_PATH, JobQueue
+
+logger = logging.getLogger(__name__)
+
+# Kinds of the queued jobs
+JOB_UPLOAD = "upload"
+JOB_CONVERT = "convert"
+JOB_EXPORT = "export"
+JOB_GRADE = "grade"
+
+# Prefix of the callback data of the format keyboard of a stored bank,
+# followed by "<bank id>:<format key>"
+BANK_PREFIX = "bank:"
+
+
+def get_conversion_queue(context: ContextTypes.DEFAULT_TYPE) -> JobQueue:
+    """
+    Get the job queue shared with the workers, opening it on first use.
+
+    The database path is taken from JOB_QUEUE_PATH.
+    """
+    queue = context.bot_data.get("conversion_queue")
+    if queue is None:
+        queue = JobQueue(os.getenv("JOB_QUEUE_PATH", DEFAULT_QUEUE_PATH))
+        context.bot_data["conversion_queue"] = queue
+    return queue
+
+
+async def enqueue_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Queue an uploaded question file to be checked by a worker, or an
+    answer sheet file to be graded.
+    """
+    if not await accept_document(update):
+        return
+
+    document = update.message.document
+    answer_sheet = is_answer_sheet(document)
+    # Queued before the reply, so a failed reply does not lose the upload.
+    # Telegram may deliver an update again after a restart; the update id
+    # keeps it from being queued twice
+    get_conversion_queue(context).put(
+        JOB_GRADE if answer_sheet else JOB_UPLOAD,
+        {
+            "user_id": update.effective_user.id,
+            "file_id": document.file_id,
+            "file_unique_id": document.file_unique_id,
+            "file_name": document.file_name,
+        },
+        dedupe_key=f"update:{update.update_id}",
+    )
+    await update.message.reply_text(GRADING_MESSAGE if answer_sheet else RECEIVED_MESSAGE)
+
+
+async def enqueue_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Queue the conversion of a stored bank into the chosen format(s).
+    """
+    query = update.callback_query
+    bank_id, selected_format = query.data[len(BANK_PREFIX):].split(":", 1)
+    get_conversion_queue(context).put(
+        JOB_CONVERT,
+        {
+            "user_id": update.effective_user.id,
+            "bank_id": int(bank_id),
+            "format": selected_format,
+        },
+        dedupe_key=f"callback:{query.id}",
+    )
+    # Queued before answering, so a failed reply does not lose the choice
+    await query.answer()
+    await query.edit_message_text(f"⏳ {selected_format} formatida tayyorlanmoqda...")
+
+
+async def enqueue_export(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Queue the export of the questions matching the user's last /export.
+    """
+    query = update.callback_query
+    selected_format = query.data[len(EXPORT_PREFIX):]
+    # The query was kept by export_command in this process
+    search_query = context.user_data.pop("export_query", None)
+    if not search_query:
+        await query.answer()
+        await query.edit_message_text("⚠️ Sessiya vaqti tugadi. Iltimos, /export ni qayta yuboring.")
+        return
+
+    get_conversion_queue(context).put(
+        JOB_EXPORT,
+        {
+            "user_id": update.effective_user.id,
+            "query": search_query,
+            "format": selected_format,
+        },
+        dedupe_key=f"callback:{query.id}",
+    )
+    await query.answer()
+    await query.edit_message_text(f"⏳ {selected_format} formatida tayyorlanmoqda...")
@@ -0,0 +1,340 @@
+"""
+Conversion workers of the split deployment.
+
+Each worker process claims jobs from the local job queue filled by the
+poller (src.bot.poller), runs them one at a time and acknowledges them, so
+conversions scale with the number of worker processes. A job that fails is
+handed back to the queue and retried with a growing delay; a job whose
+worker dies is taken up by another worker once its lease runs out. Files
+and messages record that they were sent (see JobSteps), so a retried job
+continues where the failed attempt stopped instead of sending everything
+again.
+
+A worker renders in its own process and exits after WORKER_MAX_JOBS jobs or
+once it grows past WORKER_MAX_RSS_MB, like the workers of
+src.core.worker_pool; the WorkerSupervisor starts a fresh one in its place.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+from multiprocessing import get_context
+from types import SimpleNamespace
+from typing import List, NamedTuple, Optional
+
+from src.bot.handlers import (
+    READY_MESSAGE,
+    UploadError,
+    acceptance_message,
+    check_document,
+    format_keyboard,
+    output_base_name,
+    rejection_message,
+    send_once,
+    send_grades,
+    send_outputs,
+)
+from src.bot.poller import BANK_PREFIX, JOB_CONVERT, JOB_EXPORT, JOB_GRADE, JOB_UPLOAD
+from src.core.archives import is_archive
+from src.core.job_queue import DEFAULT_QUEUE_PATH, Job, JobQueue, JobSteps
+from src.core.question_bank import DEFAULT_BANK_PATH, QuestionBank
+from src.core.upload_cache import DEFAULT_CACHE_PATH, UploadCache
+from src.core.worker_pool import DEFAULT_MAX_JOBS, DEFAULT_MAX_RSS, resident_memory
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before looking for a job again
+POLL_INTERVAL = 0.1
+
+# Seconds before a worker that exited is started again
+RESTART_DELAY = 1.0
+
+# Sent when a job has used up its attempts
+FAILED_MESSAGE = "❌ Xato! So'rovingizni bajarib bo'lmadi. Iltimos, birozdan so'ng qayta urinib ko'ring."
+
+
+class WorkerStores(NamedTuple):
+    """Databases a worker shares with the other workers."""
+
+    bank: QuestionBank
+    upload_cache: Optional[UploadCache] = None
+
+
+async def run_upload(bot, stores: WorkerStores, payload: dict, steps: JobSteps) -> None:
+    """Check an uploaded file and store it, replying with the format keyboard."""
+    user_id = payload["user_id"]
+    file_name = payload["file_name"]
+    document = SimpleNamespace(
+        file_id=payload["file_id"],
+        file_unique_id=payload.get("file_unique_id"),
+        file_name=file_name,
+    )
+    reply_markup = None
+
+    try:
+        json_data, duplicate_report, problems = await check_document(
+            bot, document, stores.upload_cache
+        )
+    except UploadError as e:
+        # The file itself is broken; another attempt would not help
+        reply = f"❌ Xato! Faylni qayta ishlashda muammo yuzaga keldi: {str(e)}"
+    else:
+        reply = rejection_message(duplicate_report, problems)
+        if reply is None:
+            # A retry after a failed reply keeps the bank stored the first time
+            bank_id = steps.value("bank")
+            if bank_id is None:
+                bank_id = await asyncio.to_thread(
+                    stores.bank.add_bank, json_data["questions"], file_name, user_id
+                )
+                steps.mark_value("bank", bank_id)
+            reply = acceptance_message(duplicate_report, problems)
+            reply_markup = format_keyboard(f"{BANK_PREFIX}{bank_id}:")
+
+    await send_once(
+        steps,
+        "reply",
+        lambda: bot.send_message(chat_id=user_id, text=reply, reply_markup=reply_markup),
+    )
+
+
+async def run_convert(bot, stores: WorkerStores, payload: dict, steps: JobSteps) -> None:
+    """Convert a stored bank and send the files."""
+    user_id = payload["user_id"]
+    loaded = await asyncio.to_thread(stores.bank.load_bank, payload["bank_id"], user_id)
+    if loaded is None:
+        await send_once(
+            steps,
+            "reply",
+            lambda: bot.send_message(
+                chat_id=user_id, text="⚠️ Sessiya vaqti tugadi. Iltimos, faylni qayta yuboring."
+            ),
+        )
+        return
+
+    file_name, questions = loaded
+    with tempfile.TemporaryDirectory() as temp_dir:
+        await send_outputs(
+            bot,
+            user_id,
+            None,
+            questions,
+            payload["format"],
+            temp_dir,
+            output_base_name(file_name),
+            steps=steps,
+            as_archive=is_archive(file_name),
+        )
+    await send_once(steps, "ready", lambda: bot.send_message(chat_id=user_id, text=READY_MESSAGE))
+
+
+async def run_export(bot, stores: WorkerStores, payload: dict, steps: JobSteps) -> None:
+    """Export the stored questions matching a search and send the files."""
+    user_id = payload["user_id"]
+    # The matches are read from the database while the files are written
+    questions = stores.bank.iter_matches(payload["query"], user_id)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        await send_outputs(
+            bot, user_id, None, questions, payload["format"], temp_dir, "Eksport", steps=steps
+        )
+    await send_once(steps, "ready", lambda: bot.send_message(chat_id=user_id, text=READY_MESSAGE))
+
+
+async def run_grade(bot, stores: WorkerStores, payload: dict, steps: JobSteps) -> None:
+    """Grade an uploaded answer sheet file against the user's last bank."""
+    document = SimpleNamespace(file_id=payload["file_id"], file_name=payload["file_name"])
+    await send_grades(bot, payload["user_id"], document, stores.bank, steps=steps)
+
+
+JOB_RUNNERS = {
+    JOB_UPLOAD: run_upload,
+    JOB_CONVERT: run_convert,
+    JOB_EXPORT: run_export,
+    JOB_GRADE: run_grade,
+}
+
+
+async def keep_lease(queue: JobQueue, job: Job) -> None:
+    """Extend the lease of a running job until cancelled."""
+    while True:
+        await asyncio.sleep(queue.lease / 3)
+        if not queue.extend(job):
+            logger.warning(f"Lost the lease of job {job.id}")
+            return
+
+
+async def process_job(bot, queue: JobQueue, stores: WorkerStores, job: Job) -> None:
+    """
+    Run one claimed job and acknowledge it or hand it back for a retry.
+
+    Args:
+        bot: Bot the job replies through
+        queue: Queue the job was claimed from
+        stores: Databases shared with the other workers
+        job: The claimed job
+    """
+    steps = JobSteps(queue, job.id)
+    user_id = job.payload["user_id"]
+
+    async def notify_failure() -> None:
+        try:
+            await send_once(
+                steps, "failed", lambda: bot.send_message(chat_id=user_id, text=FAILED_MESSAGE)
+            )
+        except Exception as e:
+            logger.error(f"Could not report failed job {job.id}: {str(e)}")
+
+    if job.attempt > queue.max_attempts:
+        # Every attempt so far ended with its worker gone
+        queue.fail(job, "worker stopped during every attempt")
+        await notify_failure()
+        return
+
+    lease = asyncio.create_task(keep_lease(queue, job))
+    try:
+        await JOB_RUNNERS[job.kind](bot, stores, job.payload, steps)
+    except Exception as e:
+        logger.error(f"Job {job.id} ({job.kind}) attempt {job.attempt} failed: {str(e)}")
+        if not queue.retry(job, str(e)):
+            await notify_failure()
+        return
+    finally:
+        lease.cancel()
+    queue.ack(job)
+
+
+async def run_worker(
+    bot,
+    queue: JobQueue,
+    stores: WorkerStores,
+    name: str,
+    max_jobs: int = DEFAULT_MAX_JOBS,
+    max_rss: int = DEFAULT_MAX_RSS,
+) -> int:
+    """
+    Take jobs from the queue until it is time for this worker to exit.
+
+    Args:
+        bot: Bot the jobs reply through
+        queue: Queue to take jobs from
+        stores: Databases shared with the other workers
+        name: Name of this worker, recorded with its jobs
+        max_jobs: Jobs after which the worker exits
+        max_rss: Resident memory in bytes after which the worker exits
+
+    Returns:
+        Number of jobs run
+    """
+    processed = 0
+    async with bot:
+        while processed < max_jobs:
+            job = queue.claim(name)
+            if job is None:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            await process_job(bot, queue, stores, job)
+            processed += 1
+            if resident_memory() > max_rss:
+                break
+    return processed
+
+
+def build_bot():
+    """Create a bot from BOT_TOKEN, BOT_API_URL and BOT_FILE_API_URL."""
+    from telegram import Bot
+
+    options = {}
+    if os.getenv("BOT_API_URL"):
+        options["base_url"] = os.getenv("BOT_API_URL")
+    if os.getenv("BOT_FILE_API_URL"):
+        options["base_file_url"] = os.getenv("BOT_FILE_API_URL")
+    return Bot(os.environ["BOT_TOKEN"], **options)
+
+
+def worker_process(index: int) -> None:
+    """Entry point of one worker process."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+    megabyte = 1024 * 1024
+    queue = JobQueue(os.getenv("JOB_QUEUE_PATH", DEFAULT_QUEUE_PATH))
+    stores = WorkerStores(
+        QuestionBank(os.getenv("QUESTION_BANK_PATH", DEFAULT_BANK_PATH)),
+        UploadCache(os.getenv("UPLOAD_CACHE_PATH", DEFAULT_CACHE_PATH)),
+    )
+    queue.purge()
+    try:
+        asyncio.run(
+            run_worker(
+                build_bot(),
+                queue,
+                stores,
+                f"worker-{index}-{os.getpid()}",
+                max_jobs=int(os.getenv("WORKER_MAX_JOBS", DEFAULT_MAX_JOBS)),
+                max_rss=int(os.getenv("WORKER_MAX_RSS_MB", DEFAULT_MAX_RSS // megabyte)) * megabyte,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+        stores.bank.close()
+        stores.upload_cache.close()
+
+
+class WorkerSupervisor:
+    """
+    Keeps a number of worker processes running.
+
+    Attributes:
+        count: Number of worker processes
+        restarts: Number of workers started again after they exited
+    """
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.restarts = 0
+        self._context = get_context("spawn")
+        self._processes: List = [None] * count
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(target=worker_process, args=(index,), daemon=True)
+        process.start()
+        self._processes[index] = process
+
+    def run(self) -> None:
+        """Start the workers and restart any that exit, until stop()."""
+        for index in range(self.count):
+            self._start(index)
+        while not self._stopping.wait(RESTART_DELAY):
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.info(f"Worker {index} exited with status {process.exitcode}; restarting")
+                    self.restarts += 1
+                    self._start(index)
+
+    def start(self) -> None:
+        """Run the supervisor in a background thread."""
+        self._thread = threading.Thread(target=self.run, name="worker-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the workers; a job they were running is retried later."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        deadline = time.monotonic() + 10
+        for process in self._processes:
+            if process is not None:
+                process.join(max(deadline - time.monotonic(), 0))
+                if process.is_alive():
+                    process.kill()
@@ -0,0 +1,327 @@
+"""
+Command line tools for working with question banks outside the bot.
+
+Usage:
+    python -m src.cli convert questions/ -o output --watch
+    python -m src.cli merge a.txt b.docx c_Hemis.txt -o output -n bank
+    python -m src.cli versions bank.txt -c 4 -o output
+    python -m src.cli grade bank.txt answers.csv -o output --key bank_Kalit.csv
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List, Optional
+
+from src.core.merge import DEFAULT_MERGE_FORMATS, format_source_problems, merge_files
+from src.core.parser import parse_input_file
+from src.core.registry import get_formats
+
+# Problems printed by the merge command before the rest are summarized
+MAX_PRINTED_PROBLEMS = 50
+
+# Versions written by the versions command without --seed, and the range of
+# their random seeds
+DEFAULT_VERSION_COUNT = 4
+MAX_RANDOM_SEED = 1_000_000
+
+
+def print_conversion(result) -> None:
+    """Print the outcome of converting one file."""
+    if result.error is not None:
+        print(f"{result.input_path}: failed ({result.error})", file=sys.stderr)
+        return
+    problems = f", {result.problem_count} problem(s)" if result.problem_count else ""
+    print(f"{result.input_path}: {result.question_count} questions{problems}")
+    for key, output_path, error in result.outputs:
+        if error is None:
+            print(f"  {key}: {output_path}")
+        else:
+            print(f"  {key}: failed ({error})", file=sys.stderr)
+
+
+def convert_command(args: argparse.Namespace) -> int:
+    """
+    Convert the question files of a folder, and with --watch keep converting
+    them as they change.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Exit status: 0 if every file was converted, 1 otherwise
+    """
+    from src.core.watcher import DEFAULT_WATCH_FORMATS, FolderWatcher
+
+    failed = []
+
+    def on_result(result) -> None:
+        print_conversion(result)
+        if result.error is not None or any(error for _, _, error in result.outputs):
+            failed.append(result.input_path)
+
+    watcher = FolderWatcher(
+        args.folder,
+        args.output_dir,
+        formats=args.formats or DEFAULT_WATCH_FORMATS,
+        max_workers=args.workers,
+        poll_interval=args.poll,
+        on_result=on_result,
+    )
+    try:
+        watcher.run(until_idle=not args.watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    print(f"{watcher.converted} file(s) converted, {watcher.skipped} unchanged")
+    return 1 if failed and not args.watch else 0
+
+
+def merge_command(args: argparse.Namespace) -> int:
+    """
+    Merge question files into one bank.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Exit status: 0 if the merged bank has no problems, 1 otherwise
+    """
+    result = merge_files(
+        args.inputs,
+        args.output_dir,
+        args.name,
+        formats=args.formats or DEFAULT_MERGE_FORMATS,
+        max_workers=args.workers,
+    )
+
+    print(f"{result.question_count} questions merged from {len(args.inputs)} files")
+    print(f"Sources: {result.sources_path}")
+    for output in result.outputs:
+        if output.error is None:
+            print(f"{output.key}: {output.output_path}")
+        else:
+            print(f"{output.key}: failed ({output.error})", file=sys.stderr)
+
+    if result.problems:
+        print(f"\n{len(result.problems)} problem(s) found:", file=sys.stderr)
+        print(format_source_problems(result.problems, MAX_PRINTED_PROBLEMS), file=sys.stderr)
+
+    failed = any(output.error is not None for output in result.outputs)
+    return 1 if result.problems or failed else 0
+
+
+def versions_command(args: argparse.Namespace) -> int:
+    """
+    Write shuffled versions of a bank and the answer key table of their seeds.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Exit status: 0 if every version was written, 1 otherwise
+    """
+    from src.core.versions import DEFAULT_VERSION_FORMATS, generate_versions
+
+    seeds = args.seeds or [random.randrange(1, MAX_RANDOM_SEED) for _ in range(args.count)]
+    name = args.name or os.path.splitext(os.path.basename(args.bank))[0]
+    json_data = parse_input_file(args.bank)
+    try:
+        result = generate_versions(
+            json_data,
+            seeds,
+            args.output_dir,
+            name,
+            formats=args.formats or DEFAULT_VERSION_FORMATS,
+            max_workers=args.workers,
+        )
+    except OSError as e:
+        print(f"{args.bank}: failed ({e})", file=sys.stderr)
+        return 1
+
+    for version in result["versions"]:
+        print(f"V{version['version']} (seed {version['seed']}):")
+        for path in version["files"]:
+            print(f"  {path}")
+    print(f"Answer key: {result['answer_key_path']}")
+    return 0
+
+
+def grade_command(args: argparse.Namespace) -> int:
+    """
+    Grade an answer sheet file against a question bank.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Exit status: 0 if the sheets were graded, 1 otherwise
+    """
+    from src.core.grading import GradingError, grade_file
+    from src.core.item_analysis import analyze_items, write_item_analysis_document
+    from src.core.versions import read_answer_key_seeds
+
+    json_data = parse_input_file(args.bank)
+    seeds = read_answer_key_seeds(args.key) if args.key else None
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{args.name}_Natijalar.csv")
+
+    started = time.perf_counter()
+    try:
+        result = grade_file(json_data, args.sheets, output_path, seeds)
+    except (GradingError, ImportError) as e:
+        print(f"{args.sheets}: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+
+    students = len(result.students)
+    average = float(result.scores.mean()) if students else 0.0
+    print(f"{students} students graded in {elapsed:.2f} s")
+    print(f"Average score: {average:.1f} of {result.max_score}")
+    print(f"Results: {output_path}")
+
+    if args.analysis:
+        analysis = analyze_items(json_data, result.responses)
+        analysis_path = os.path.join(args.output_dir, f"{args.name}_Tahlil.docx")
+        write_item_analysis_document(json_data, analysis, analysis_path)
+        flagged = sum(1 for flags in analysis.flags if flags)
+        print(f"KR-20: {analysis.kr20:.2f}, {flagged} question(s) flagged")
+        print(f"Item analysis: {analysis_path}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser with one subcommand per tool.
+
+    Returns:
+        Argument parser
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description=__doc__.split("\n\n")[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    convert = subcommands.add_parser(
+        "convert", help="convert every question file of a folder, then optionally watch it"
+    )
+    convert.add_argument("folder", help="folder of .txt, .json and .docx question files")
+    convert.add_argument("-o", "--output-dir", default=".", help="folder for the outputs")
+    convert.add_argument(
+        "-f",
+        "--format",
+        dest="formats",
+        action="append",
+        choices=[output_format.key for output_format in get_formats()],
+        help="output format, may be repeated (default: hemis, word)",
+    )
+    convert.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="keep running and convert files again when they change",
+    )
+    convert.add_argument(
+        "--poll",
+        type=float,
+        metavar="SECONDS",
+        default=None,
+        help="look for changes at this interval instead of using inotify",
+    )
+    convert.add_argument(
+        "-j", "--workers", type=int, default=None, help="conversion processes (default: CPU count)"
+    )
+    convert.set_defaults(handler=convert_command)
+
+    merge = subcommands.add_parser(
+        "merge", help="merge question files into one bank with global numbering"
+    )
+    merge.add_argument("inputs", nargs="+", help="question files, in merge order")
+    merge.add_argument("-o", "--output-dir", default=".", help="folder for the merged files")
+    merge.add_argument("-n", "--name", default="merged", help="base name of the merged files")
+    merge.add_argument(
+        "-f",
+        "--format",
+        dest="formats",
+        action="append",
+        choices=[output_format.key for output_format in get_formats()],
+        help=f"output format, may be repeated (default: {', '.join(DEFAULT_MERGE_FORMATS)})",
+    )
+    merge.add_argument(
+        "-j", "--workers", type=int, default=None, help="parser processes (default: CPU count)"
+    )
+    merge.set_defaults(handler=merge_command)
+
+    versions = subcommands.add_parser(
+        "versions", help="write shuffled versions of a bank and their answer key table"
+    )
+    versions.add_argument("bank", help="question file with the correct answers marked")
+    versions.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        default=DEFAULT_VERSION_COUNT,
+        help=f"number of versions with random seeds (default: {DEFAULT_VERSION_COUNT})",
+    )
+    versions.add_argument(
+        "-s",
+        "--seed",
+        dest="seeds",
+        type=int,
+        action="append",
+        metavar="SEED",
+        help="seed of a version, may be repeated; replaces --count",
+    )
+    versions.add_argument("-o", "--output-dir", default=".", help="folder for the versions")
+    versions.add_argument(
+        "-n", "--name", default=None, help="base name of the files (default: the bank's name)"
+    )
+    versions.add_argument(
+        "-f",
+        "--format",
+        dest="formats",
+        action="append",
+        choices=[output_format.key for output_format in get_formats()],
+        help="output format, may be repeated (default: hemis, student, word)",
+    )
+    versions.add_argument(
+        "-j", "--workers", type=int, default=None, help="rendering processes (default: CPU count)"
+    )
+    versions.set_defaults(handler=versions_command)
+
+    grade = subcommands.add_parser("grade", help="grade students' answer sheets against a bank")
+    grade.add_argument("bank", help="question file with the correct answers marked")
+    grade.add_argument("sheets", help="CSV file with one row of answers per student")
+    grade.add_argument(
+        "-k", "--key", help="answer key table (_Kalit.csv) of the shuffled versions written"
+    )
+    grade.add_argument(
+        "-a",
+        "--analysis",
+        action="store_true",
+        help="also write the item analysis of the questions as a Word document",
+    )
+    grade.add_argument("-o", "--output-dir", default=".", help="folder for the results")
+    grade.add_argument("-n", "--name", default="baholash", help="base name of the results file")
+    grade.set_defaults(handler=grade_command)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run a command line tool.
+
+    Args:
+        argv: Arguments without the program name (default: sys.argv[1:])
+
+    Returns:
+        Exit status
+    """
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
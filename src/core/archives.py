@@ -0,0 +1,352 @@
+"""
+Archives of question files.
+
+Departments send their question files together as a .zip, a .tar.gz or a
+single gzipped file. check_archive() reads such an upload as one bank, like
+the merge command (src.core.merge) reads several files:
+
+- members are decompressed as streams into memory, never extracted to disk,
+  and only question files (.txt, .docx, .json) are read;
+- members are parsed in parallel worker processes while the archive is still
+  being read, with a bounded number of members in flight;
+- the questions are numbered across all members and checked for duplicates
+  both within each member and across members, once, while they are merged
+  (see merge_spools()).
+
+Archives are untrusted: the number of members and the total uncompressed
+size are limited (MAX_ARCHIVE_MEMBERS, MAX_UNCOMPRESSED_SIZE) and the limits
+are enforced on the bytes actually decompressed, not on the sizes an archive
+declares, so a zip bomb is stopped after reading at most the limit.
+
+OutputPacker puts the files rendered from an archive back into .zip
+archives, starting a new one whenever the next file would take the current
+one over a size limit, so every archive can still be sent through the Bot
+API.
+"""
+
+import collections
+import gzip
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.core.merge import SourceProblem, merge_spools, spool_content
+from src.core.parser import ValidationProblem
+from src.core.pipeline import DUPLICATE_CODES, format_duplicate_problems
+from src.core.registry import part_path
+
+# Extensions of the archives accepted, and of the members read from them
+ARCHIVE_EXTENSIONS = (".zip", ".gz", ".tgz")
+MEMBER_EXTENSIONS = (".txt", ".docx", ".json")
+
+# Limits of an archive: entries of any kind, and bytes of all members
+# together once decompressed
+MAX_ARCHIVE_MEMBERS = 200
+MAX_UNCOMPRESSED_SIZE = 200 * 1024 * 1024
+
+# Bytes decompressed at once
+READ_CHUNK_SIZE = 1 << 16
+
+# Members parsed or waiting for a worker at once, per worker
+MEMBERS_IN_FLIGHT_PER_WORKER = 2
+
+# Bytes a file may grow by when it is added to a .zip archive: its local
+# header and directory entry, and deflate's worst-case expansion of
+# already compressed data (5 bytes per 16 KiB block)
+ZIP_ENTRY_OVERHEAD = 1024
+
+
+class ArchiveError(ValueError):
+    """An archive cannot be read or exceeds the limits."""
+
+
+def is_archive(file_name: str) -> bool:
+    """Check whether a file name is that of an accepted archive."""
+    return file_name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _is_member(name: str) -> bool:
+    base_name = os.path.basename(name)
+    return (
+        base_name.lower().endswith(MEMBER_EXTENSIONS)
+        and not base_name.startswith(".")
+        and "__MACOSX/" not in name
+    )
+
+
+class _Budget:
+    """Counts the members and bytes read from an archive against the limits."""
+
+    def __init__(self, max_members: int, max_size: int) -> None:
+        self.max_members = max_members
+        self.max_size = max_size
+        self.members = 0
+        self.size = 0
+
+    def entry(self) -> None:
+        self.members += 1
+        if self.members > self.max_members:
+            raise ArchiveError(f"archive has more than {self.max_members} files")
+
+    def read(self, stream) -> bytes:
+        """Read a member to its end, stopping as soon as the limit is passed."""
+        chunks = []
+        for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                megabytes = self.max_size // (1024 * 1024)
+                raise ArchiveError(f"archive is larger than {megabytes} MB uncompressed")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+def _iter_zip(path: str, budget: _Budget) -> Iterator[Tuple[str, bytes]]:
+    with zipfile.ZipFile(path) as archive:
+        entries = archive.infolist()
+        # Fail early on what the archive declares; the bytes read are
+        # counted as well, as declared sizes can be forged
+        for _ in entries:
+            budget.entry()
+        if sum(entry.file_size for entry in entries) > budget.max_size:
+            raise ArchiveError(
+                f"archive is larger than {budget.max_size // (1024 * 1024)} MB uncompressed"
+            )
+        for entry in entries:
+            if entry.is_dir() or not _is_member(entry.filename):
+                continue
+            with archive.open(entry) as stream:
+                yield entry.filename, budget.read(stream)
+
+
+def _iter_tar(stream, budget: _Budget) -> Iterator[Tuple[str, bytes]]:
+    # Read as a stream ("r|"): members come in archive order, without seeking
+    with tarfile.open(fileobj=stream, mode="r|") as archive:
+        for entry in archive:
+            budget.entry()
+            if not entry.isfile() or not _is_member(entry.name):
+                continue
+            member = archive.extractfile(entry)
+            yield entry.name, budget.read(member)
+
+
+def iter_archive_members(
+    path: str,
+    file_name: Optional[str] = None,
+    max_members: int = MAX_ARCHIVE_MEMBERS,
+    max_size: int = MAX_UNCOMPRESSED_SIZE,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream the question files of an archive.
+
+    Args:
+        path: Path of the .zip, .tar.gz, .tgz or .gz file
+        file_name: Name the archive was uploaded under (default: from path);
+            a gzipped single file is named after it
+        max_members: Most entries the archive may have
+        max_size: Most bytes all members may have together, decompressed
+
+    Yields:
+        (member name, member content) in archive order
+
+    Raises:
+        ArchiveError: If the archive is broken or exceeds a limit
+    """
+    file_name = file_name or os.path.basename(path)
+    budget = _Budget(max_members, max_size)
+    try:
+        if file_name.lower().endswith(".zip"):
+            yield from _iter_zip(path, budget)
+            return
+        with gzip.open(path, "rb") as stream:
+            # A tar header has "ustar" at offset 257
+            tar = stream.read(512)[257:262] == b"ustar"
+        with gzip.open(path, "rb") as stream:
+            if tar:
+                yield from _iter_tar(stream, budget)
+                return
+            budget.entry()
+            name = os.path.basename(file_name)
+            yield (name[:-3] if name.lower().endswith(".gz") else name), budget.read(stream)
+    except (zipfile.BadZipFile, tarfile.TarError, gzip.BadGzipFile, EOFError, zlib.error) as e:
+        raise ArchiveError(f"archive cannot be read: {e}") from None
+
+
+def _spool_members(
+    members: Iterator[Tuple[str, bytes]],
+    spool_dir: str,
+    executor: Optional[ProcessPoolExecutor],
+    in_flight: int,
+) -> Iterator[Tuple[str, str, List[Tuple]]]:
+    """
+    Spool the members, in worker processes if there is an executor.
+
+    Yields:
+        (member name, spool path, problems) in archive order, for
+        merge_spools()
+    """
+    def result(name: str, spooling) -> List[Tuple]:
+        try:
+            return spooling()
+        except ArchiveError:
+            raise
+        except Exception as e:
+            raise ArchiveError(f"{name}: {e}") from e
+
+    pending = collections.deque()
+    for number, (name, content) in enumerate(members):
+        spool_path = os.path.join(spool_dir, f"{number}.jsonl")
+        if executor is None:
+            yield name, spool_path, result(name, lambda: spool_content(content, spool_path))
+            continue
+        pending.append((name, spool_path, executor.submit(spool_content, content, spool_path)))
+        # Only a few members are held in memory at once
+        while len(pending) >= in_flight:
+            name, spool_path, future = pending.popleft()
+            yield name, spool_path, result(name, future.result)
+    while pending:
+        name, spool_path, future = pending.popleft()
+        yield name, spool_path, result(name, future.result)
+
+
+def check_archive(
+    path: str,
+    file_name: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    max_members: int = MAX_ARCHIVE_MEMBERS,
+    max_size: int = MAX_UNCOMPRESSED_SIZE,
+) -> Tuple[Dict, str, List[ValidationProblem]]:
+    """
+    Read the question files of an archive as one bank and check it.
+
+    Args:
+        path: Path of the archive
+        file_name: Name the archive was uploaded under (default: from path)
+        max_workers: Parser processes (default: CPU count; 1, or a daemonic
+            process such as a conversion worker, parses in this process)
+        max_members: Most entries the archive may have
+        max_size: Most bytes all members may have together, decompressed
+
+    Returns:
+        Tuple of the parsed data, the duplicate report and the validation
+        problems, as check_upload() in the bot. Questions are numbered
+        across the members and keep their member in "source_file"; every
+        problem, and every line of the report, starts with the member it
+        was found in.
+
+    Raises:
+        ArchiveError: If the archive is broken, exceeds a limit or holds no
+            question files
+    """
+    members = iter_archive_members(path, file_name, max_members, max_size)
+    workers = max_workers or os.cpu_count() or 1
+    executor = None
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        # Workers are started fresh: the bot process runs threads
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+    names: List[str] = []
+    source_problems: List[SourceProblem] = []
+    try:
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spooled = _spool_members(
+                members, spool_dir, executor, workers * MEMBERS_IN_FLIGHT_PER_WORKER
+            )
+
+            def counted():
+                for item in spooled:
+                    names.append(item[0])
+                    yield item
+
+            questions = list(merge_spools(counted(), source_problems))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if not names:
+        raise ArchiveError("archive holds no .txt, .docx or .json question files")
+
+    problems = [
+        ValidationProblem(
+            problem.line,
+            problem.question_id,
+            problem.code,
+            f"{problem.source_file}: {problem.message}",
+        )
+        for problem in source_problems
+    ]
+    # The duplicates were found while merging; they make up the report
+    duplicates = [problem for problem in problems if problem.code in DUPLICATE_CODES]
+    problems = [problem for problem in problems if problem.code not in DUPLICATE_CODES]
+    return {"questions": questions}, format_duplicate_problems(duplicates), problems
+
+
+class OutputPacker:
+    """
+    Packs output files into .zip archives of at most about max_size bytes.
+
+    Files are added as they are rendered and removed once packed. An archive
+    is finished as soon as the next file would take it over the limit, and
+    handed to on_archive, so it can be sent while later files are still
+    being rendered. A single file larger than the limit gets an archive of
+    its own. One archive keeps the plain archive path; several are numbered
+    like split outputs (see part_path()).
+
+    Attributes:
+        archives: Paths of the finished archives, in order
+    """
+
+    def __init__(
+        self,
+        archive_path: str,
+        max_size: int,
+        on_archive: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.archive_path = archive_path
+        self.max_size = max_size
+        self.on_archive = on_archive
+        self.archives: List[str] = []
+        self._file = None
+        self._zip: Optional[zipfile.ZipFile] = None
+
+    def _finish_archive(self, last: bool) -> None:
+        self._zip.close()
+        self._file.close()
+        path = self._file.name
+        if last and not self.archives:
+            # Everything fit in one archive
+            os.replace(path, self.archive_path)
+            path = self.archive_path
+        self.archives.append(path)
+        self._zip = None
+        if self.on_archive is not None:
+            self.on_archive(path)
+
+    def add(self, path: str) -> None:
+        """
+        Pack a file under its base name and remove it.
+
+        Args:
+            path: File to pack
+        """
+        size = os.path.getsize(path)
+        # An open archive always holds a file already
+        if (
+            self._zip is not None
+            and self._file.tell() + size + size // 3000 + ZIP_ENTRY_OVERHEAD > self.max_size
+        ):
+            self._finish_archive(last=False)
+        if self._zip is None:
+            self._file = open(part_path(self.archive_path, len(self.archives) + 1), "wb")
+            self._zip = zipfile.ZipFile(self._file, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.write(path, os.path.basename(path))
+        os.unlink(path)
+
+    def close(self) -> None:
+        """Finish the last archive, if any file was added."""
+        if self._zip is not None:
+            self._finish_archive(last=True)
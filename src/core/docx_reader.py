@@ -0,0 +1,179 @@
+"""
+Streaming reader for teacher-authored Word (.docx) question files.
+
+A .docx file is a zip archive whose text lives in word/document.xml. The
+document is read with iterparse and every paragraph and table is cleared as
+soon as it has been converted, so memory stays bounded by the largest single
+question rather than the whole document.
+
+Two layouts are recognized, in any mix, in document order:
+
+- Paragraphs in the text input format ("1. Savol", "a) *To'g'ri javob", an
+  empty paragraph between questions), as written by
+  create_student_word_document(). Line breaks inside a paragraph start a new
+  line.
+- One table per question, as written by create_word_document(): the first
+  row holds the question, the second row the correct answer and the
+  remaining rows the other answers. Rows are lettered like text variants,
+  so answers past d) are reported by validation ("too_many_variants")
+  rather than dropped without a word.
+
+Both are converted to lines of the text input format, so a Word file goes
+through the same block parser, validation and duplicate checks as a .txt
+upload and produces the same question dictionaries.
+"""
+
+import zipfile
+from typing import Dict, Iterator, List
+from xml.etree import ElementTree
+
+from src.core.parser import iter_question_blocks, parse_question_block
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_PARAGRAPH = WORD_NAMESPACE + "p"
+_TABLE = WORD_NAMESPACE + "tbl"
+_ROW = WORD_NAMESPACE + "tr"
+_CELL = WORD_NAMESPACE + "tc"
+_TEXT = WORD_NAMESPACE + "t"
+_TAB = WORD_NAMESPACE + "tab"
+_BREAKS = (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr")
+
+
+def _paragraph_text(paragraph: ElementTree.Element) -> str:
+    """Text of a paragraph, with line breaks as newlines."""
+    parts = []
+    for element in paragraph.iter():
+        if element.tag == _TEXT:
+            parts.append(element.text or "")
+        elif element.tag == _TAB:
+            parts.append("\t")
+        elif element.tag in _BREAKS:
+            parts.append("\n")
+    return "".join(parts)
+
+
+def table_lines(rows: List[str]) -> List[str]:
+    """
+    Convert the rows of a question table to lines of the text input format.
+
+    Args:
+        rows: Text of each row; the first is the question, the second the
+            correct answer
+
+    Returns:
+        Lines with their newline characters, ending with an empty line; rows
+        past the fifth get letters from e) on, which the parser reports
+    """
+    rows = [row for row in rows if row]
+    if not rows:
+        return []
+
+    lines = [rows[0] + "\n"]
+    for position, row in enumerate(rows[1:]):
+        marker = "*" if position == 0 else ""
+        lines.append(f"{chr(97 + position)}) {marker}{row}\n")
+    lines.append("\n")
+    return lines
+
+
+def iter_docx_lines(input_path: str) -> Iterator[str]:
+    """
+    Stream a Word question file as lines of the text input format.
+
+    Args:
+        input_path: Path to the .docx file
+
+    Yields:
+        Lines including their trailing newline characters; each paragraph
+        outside a table gives at least one line and each table a question
+        block followed by an empty line
+    """
+    with zipfile.ZipFile(input_path) as archive, archive.open("word/document.xml") as stream:
+        # Open elements, so finished paragraphs and tables can be detached
+        # from their parent and not just emptied
+        open_elements: List[ElementTree.Element] = []
+        table_depth = 0
+        rows: List[str] = []
+        cells: List[str] = []
+        cell_paragraphs: List[str] = []
+        previous_blank = True
+
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                open_elements.append(element)
+                if element.tag == _TABLE:
+                    table_depth += 1
+                continue
+
+            open_elements.pop()
+            tag = element.tag
+
+            if tag == _PARAGRAPH:
+                text = _paragraph_text(element)
+                if table_depth:
+                    cell_paragraphs.append(text)
+                    element.clear()
+                    continue
+                for line in text.split("\n"):
+                    yield line + "\n"
+                    previous_blank = not line.strip()
+            elif tag == _CELL and table_depth == 1:
+                cells.append(" ".join(" ".join(cell_paragraphs).split()))
+                cell_paragraphs = []
+                continue
+            elif tag == _ROW and table_depth == 1:
+                rows.append(" ".join(cell for cell in cells if cell))
+                cells = []
+                continue
+            elif tag == _TABLE:
+                table_depth -= 1
+                if table_depth:
+                    continue
+                lines = table_lines(rows)
+                rows = []
+                if lines:
+                    if not previous_blank:
+                        yield "\n"
+                    yield from lines
+                    previous_blank = True
+            else:
+                continue
+
+            # A finished top-level paragraph or table
+            element.clear()
+            if open_elements:
+                open_elements[-1].remove(element)
+
+
+def read_docx_text(input_path: str) -> str:
+    """
+    Read a Word question file as text in the text input format.
+
+    Args:
+        input_path: Path to the .docx file
+
+    Returns:
+        Text that parse_text_content() parses into the file's questions
+    """
+    return "".join(iter_docx_lines(input_path))
+
+
+def parse_docx_file(input_path: str) -> Dict:
+    """
+    Parse a Word file containing test questions.
+
+    Args:
+        input_path: Path to the .docx file
+
+    Returns:
+        Dictionary with parsed questions data
+    """
+    questions = []
+
+    for index, _, block in iter_question_blocks(iter_docx_lines(input_path)):
+        question = parse_question_block(block, index)
+        if question:
+            questions.append(question)
+
+    return {"questions": questions}
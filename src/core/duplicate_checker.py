@@ -2,57 +2,624 @@
 Simple duplicate question detector.
 
 This file contains functions for identifying duplicate questions and
-duplicate answer options within questions.
+duplicate answer options within questions. It also finds reworded
+duplicates: questions whose variants form the same set as an earlier
+question's. They are reported in two sections of different severity.
+"Possible duplicates" have the same correct answer. "Conflicting answer
+keys" mark a different variant as correct, so one of the two keys is wrong.
+Answer sets made only of numbers or very short texts ({4, 6, 8, 10},
+"Ha / Yo'q") are shared by unrelated questions and are not compared.
+
+Identical questions and identical options block an upload. Reworded
+duplicates are only likely, so the report lists them after a warnings
+header (see split_duplicate_report()) and the file can still be converted.
+
+The check is split in two steps: a per-question signature (the comparison
+key of the question text and the duplicate options inside the question) and
+the report that compares signatures across the bank. Signatures depend only
+on the question itself, so callers that re-check a bank after a small edit
+can reuse the signatures of unchanged questions.
+
+Texts are compared after normalization (see src.core.normalizer) through
+their 64-bit fingerprints, so the indexes hold integers rather than strings.
+Two texts with the same fingerprint are compared again as normalized strings
+before they are reported, so a hash collision never produces a false report.
+
+Options of one question and short question texts are also compared by edit
+distance (see src.core.similarity) to catch typos such as "Procesing";
+these pairs are reported with their distance and similarity. "Amino acid"
+and "Amino acids" are as close as a typo, so they are warnings too.
 """
 
-from typing import Dict, List, Tuple
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
 
+from src.core.normalizer import (
+    QUESTION_NUMBER_PATTERN,
+    combine_fingerprints,
+    fingerprint,
+    normalize_question_text,
+    normalize_text,
+)
+from src.core.similarity import SHORT_QUESTION_LENGTH, SimilarTextIndex
 
-def check_for_duplicates(json_data: Dict) -> str:
+# Fewest distinct variants for an answer set to identify a question; smaller
+# sets such as "Ha / Yo'q" are shared by many unrelated questions
+MIN_ANSWER_SET_SIZE = 3
+
+# Normalized variants shorter than this, or without a letter, say little
+# about the question on their own
+MIN_ANSWER_TEXT_LENGTH = 4
+
+# Separates the findings that block an upload from the warnings
+DUPLICATE_WARNINGS_HEADER = "WARNINGS (the file can still be converted):"
+
+NO_DUPLICATES_REPORT = "No duplicate or similar content found."
+
+
+class QuestionSignature(NamedTuple):
+    """Comparison data of one question used by the duplicate report."""
+
+    text_key: int
+    option_duplicates: List[Tuple[Dict, Dict]]
+    answer_set_key: Optional[int] = None
+    correct_key: Optional[int] = None
+    # (earlier option, option, edit distance, similarity) of options that
+    # differ by a typo
+    similar_options: Sequence[Tuple[Dict, Dict, int, float]] = ()
+
+
+def text_key(text: str) -> int:
     """
-    Check for duplicate questions and duplicate options within questions.
+    Get the key under which two option texts are considered identical.
 
     Args:
-        json_data: Dictionary containing questions data
+        text: Option text
+
+    Returns:
+        Fingerprint of the normalized text
+    """
+    return fingerprint(normalize_text(text))
+
+
+def question_text_key(text: str) -> int:
+    """
+    Get the key under which two question texts are considered identical.
+
+    Args:
+        text: Question text, possibly with its number in front
+
+    Returns:
+        Fingerprint of the normalized text
+    """
+    return fingerprint(normalize_question_text(text))
+
+
+class FingerprintIndex:
+    """
+    Maps text fingerprints to the first item seen with that text.
+
+    Items are dictionaries with a "text" field (questions or options) unless
+    a text_of function is given, e.g. to index questions by their position.
+    """
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str] = normalize_text,
+        text_of: Callable[[Any], str] = itemgetter("text"),
+    ) -> None:
+        self._normalize = normalize
+        self._text_of = text_of
+        # Fingerprint -> first item, or a list of items whose different
+        # normalized texts share the fingerprint
+        self._first: Dict[int, object] = {}
+
+    def add(self, key: int, item: Any) -> Optional[Any]:
+        """
+        Add an item and find the earlier item with the same text.
+
+        Args:
+            key: Fingerprint of the item's normalized text
+            item: Question or option dictionary (or what text_of accepts)
+
+        Returns:
+            The earlier item with the same normalized text, or None
+        """
+        first = self._first.get(key)
+        if first is None:
+            self._first[key] = item
+            return None
+
+        # Same fingerprint: confirm on the normalized texts before reporting
+        candidates = first if isinstance(first, list) else [first]
+        text = self._normalize(self._text_of(item))
+        for candidate in candidates:
+            if self._normalize(self._text_of(candidate)) == text:
+                return candidate
+
+        self._first[key] = candidates + [item]
+        return None
+
+
+def is_generic_answer(normalized_text: str) -> bool:
+    """
+    Check whether a variant is too generic to identify its question.
+
+    Args:
+        normalized_text: Normalized variant text
+
+    Returns:
+        True for numbers, symbols and very short texts
+    """
+    return len(normalized_text) < MIN_ANSWER_TEXT_LENGTH or not any(
+        character.isalpha() for character in normalized_text
+    )
+
+
+def question_signature(question: Dict) -> QuestionSignature:
+    """
+    Compute the comparison data of a single question.
+
+    Args:
+        question: Question dictionary
+
+    Returns:
+        Signature with the text key, the pairs of identical options
+        (first occurrence, repeated option) and the pairs of similar options
+    """
+    option_texts = FingerprintIndex()
+    similar_texts = SimilarTextIndex()
+    option_duplicates = []
+    similar_options = []
+    option_keys = set()
+    generic = True
+    correct_key = None
+    for option in question["variants"]:
+        normalized = normalize_text(option["text"])
+        key = fingerprint(normalized)
+        option_keys.add(key)
+        generic = generic and is_generic_answer(normalized)
+        if option["id"] == question["correct"]:
+            correct_key = key
+        first = option_texts.add(key, option)
+        if first is not None:
+            option_duplicates.append((first, option))
+            continue
+        similar = similar_texts.add(normalized, option)
+        if similar is not None:
+            similar_options.append((similar[0], option) + similar[1:])
+
+    answer_set_key = None
+    if len(option_keys) >= MIN_ANSWER_SET_SIZE and not generic:
+        answer_set_key = combine_fingerprints(option_keys)
+
+    return QuestionSignature(
+        question_text_key(question["text"]),
+        option_duplicates,
+        answer_set_key,
+        correct_key,
+        similar_options,
+    )
+
+
+def _answer_set(question: Dict) -> frozenset:
+    """Normalized variant texts of a question, ignoring their order."""
+    return frozenset(normalize_text(variant["text"]) for variant in question["variants"])
+
+
+def correct_text(question: Dict) -> Optional[str]:
+    """
+    Get the text of the correct variant of a question.
+
+    Args:
+        question: Question dictionary
+
+    Returns:
+        Text of the correct variant, or None if no variant is marked
+    """
+    for variant in question["variants"]:
+        if variant["id"] == question["correct"]:
+            return variant["text"]
+    return None
+
+
+class AnswerSetIndex:
+    """
+    Finds questions whose variants form the same set as an earlier question's.
+
+    Sets are looked up by their order-independent fingerprint, so a whole
+    bank is indexed in linear time; a matching fingerprint is confirmed on
+    the normalized variant texts before a match is returned.
+    """
+
+    def __init__(self) -> None:
+        # Answer-set fingerprint -> (item, question) pairs of the first
+        # question of each distinct set sharing the fingerprint
+        self._first: Dict[int, List[Tuple[Any, Dict]]] = {}
+
+    def add(self, key: Optional[int], item: Any, question: Dict) -> Optional[Any]:
+        """
+        Add a question and find the earlier question with the same answers.
+
+        Args:
+            key: Answer-set fingerprint from the question's signature
+            item: Value returned for later matches (the question or its position)
+            question: Question dictionary
+
+        Returns:
+            The item of the first earlier question with the same answer set,
+            or None
+        """
+        if key is None:
+            return None
+
+        candidates = self._first.get(key)
+        if candidates is None:
+            self._first[key] = [(item, question)]
+            return None
+
+        answers = _answer_set(question)
+        for candidate_item, candidate in candidates:
+            if _answer_set(candidate) == answers:
+                return candidate_item
+
+        candidates.append((item, question))
+        return None
+
+
+def same_correct_answer(first: Dict, question: Dict) -> bool:
+    """
+    Check whether two questions with the same answer set agree on the answer.
+
+    Args:
+        first: Earlier question
+        question: Later question with the same answer set
+
+    Returns:
+        True when both mark the same (normalized) variant text as correct
+    """
+    first_correct = correct_text(first)
+    correct = correct_text(question)
+    if first_correct is None or correct is None:
+        return first_correct is None and correct is None
+    return normalize_text(first_correct) == normalize_text(correct)
+
+
+class DuplicateFindings(NamedTuple):
+    """Duplicates found in a bank, as question positions."""
+
+    # (position, position of the first identical question)
+    identical: List[Tuple[int, int]]
+    # (position, position of the first question with the same answer set,
+    #  whether both mark the same correct answer)
+    answer_sets: List[Tuple[int, int, bool]]
+    # (position, first option, repeated option)
+    options: List[Tuple[int, Dict, Dict]]
+    # (position, position of the closest earlier similar question,
+    #  edit distance, similarity)
+    similar_questions: List[Tuple[int, int, int, float]]
+    # (position, earlier option, option, edit distance, similarity)
+    similar_options: List[Tuple[int, Dict, Dict, int, float]]
+
+
+def find_identical_questions(
+    questions: Sequence[Dict], keyed_positions: Iterable[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    """
+    Find questions identical to an earlier question.
+
+    Args:
+        questions: Questions in bank order
+        keyed_positions: (position, text key) pairs in bank order
+
+    Returns:
+        (position, position of the first identical question) pairs
+    """
+    identical = []
+    question_texts = FingerprintIndex(
+        normalize_question_text, text_of=lambda position: questions[position]["text"]
+    )
+    for position, key in keyed_positions:
+        first = question_texts.add(key, position)
+        if first is not None:
+            identical.append((position, first))
+    return identical
+
+
+def find_same_answer_sets(
+    questions: Sequence[Dict], keyed_positions: Iterable[Tuple[int, Optional[int]]]
+) -> List[Tuple[int, int, bool]]:
+    """
+    Find questions with the same answer set as an earlier question.
+
+    Args:
+        questions: Questions in bank order
+        keyed_positions: (position, answer-set key) pairs in bank order
+
+    Returns:
+        (position, position of the first question with the same answer set,
+        whether both mark the same correct answer) triples
+    """
+    answer_sets = []
+    answer_index = AnswerSetIndex()
+    for position, key in keyed_positions:
+        question = questions[position]
+        first = answer_index.add(key, position, question)
+        if first is not None:
+            answer_sets.append(
+                (position, first, same_correct_answer(questions[first], question))
+            )
+    return answer_sets
+
+
+def find_similar_questions(
+    questions: Sequence[Dict], start: int = 0, end: Optional[int] = None
+) -> List[Tuple[int, int, int, float]]:
+    """
+    Find short questions that differ from an earlier question by a few typos.
+
+    Questions identical to an earlier one are left to the exact check. A
+    range of positions can be searched on its own: the questions before it
+    are only indexed, so the findings of consecutive ranges add up to the
+    findings of the whole bank.
+
+    Args:
+        questions: Questions in bank order
+        start: First position to look up
+        end: Position after the last one to look up (default: the whole bank)
+
+    Returns:
+        (position, position of the closest earlier similar question,
+        edit distance, similarity) tuples
+    """
+    end = len(questions) if end is None else end
+    similar = []
+    question_texts = SimilarTextIndex()
+    for position in range(end):
+        text = normalize_question_text(questions[position]["text"])
+        if len(text) > SHORT_QUESTION_LENGTH:
+            continue
+        if position < start:
+            question_texts.insert(text, position)
+            continue
+        match = question_texts.add(text, position)
+        if match is not None:
+            similar.append((position,) + match)
+    return similar
+
+
+def find_duplicates(
+    questions: Sequence[Dict], signatures: Sequence[QuestionSignature]
+) -> DuplicateFindings:
+    """
+    Find all duplicates of a bank.
+
+    Identical questions only ever match questions with the same text key and
+    answer sets only those with the same answer-set key, so the first two
+    checks can also be run separately on groups of positions that share
+    their keys (see src.core.sharded_checker).
+
+    Args:
+        questions: Questions in bank order
+        signatures: Signature of each question, in the same order
+
+    Returns:
+        Findings of the three checks
+    """
+    text_keys = [(position, sig.text_key) for position, sig in enumerate(signatures)]
+    answer_keys = [(position, sig.answer_set_key) for position, sig in enumerate(signatures)]
+    return DuplicateFindings(
+        find_identical_questions(questions, text_keys),
+        find_same_answer_sets(questions, answer_keys),
+        option_findings(signatures),
+        find_similar_questions(questions),
+        similar_option_findings(signatures),
+    )
+
+
+def option_findings(signatures: Iterable[QuestionSignature]) -> List[Tuple[int, Dict, Dict]]:
+    """
+    List the identical options found inside each question.
+
+    Args:
+        signatures: Signature of each question, in bank order
+
+    Returns:
+        (position, first option, repeated option) triples
+    """
+    return [
+        (position, first, option)
+        for position, signature in enumerate(signatures)
+        for first, option in signature.option_duplicates
+    ]
+
+
+def similar_option_findings(
+    signatures: Iterable[QuestionSignature],
+) -> List[Tuple[int, Dict, Dict, int, float]]:
+    """
+    List the options that differ by a typo inside each question.
+
+    Args:
+        signatures: Signature of each question, in bank order
+
+    Returns:
+        (position, earlier option, option, edit distance, similarity) tuples
+    """
+    return [
+        (position,) + pair
+        for position, signature in enumerate(signatures)
+        for pair in signature.similar_options
+    ]
+
+
+def identical_label(first_text: str, text: str, question: bool = False) -> str:
+    """
+    Describe how two texts that normalize the same are alike.
+
+    Args:
+        first_text: Earlier text
+        text: Later text
+        question: Whether the texts are question texts, whose numbers are ignored
+
+    Returns:
+        "identical" if the texts are the same as written, otherwise a
+        description of the differences normalization ignored
+    """
+    if question:
+        first_text = QUESTION_NUMBER_PATTERN.sub("", first_text, count=1)
+        text = QUESTION_NUMBER_PATTERN.sub("", text, count=1)
+    if " ".join(first_text.split()) == " ".join(text.split()):
+        return "identical"
+    return "identical apart from case, spacing, apostrophes or punctuation"
+
+
+def format_duplicate_report(questions: Sequence[Dict], findings: DuplicateFindings) -> str:
+    """
+    Format duplicate findings as the report shown to the user.
+
+    Findings that block the upload come first; the warnings follow under
+    DUPLICATE_WARNINGS_HEADER.
+
+    Args:
+        questions: Questions in bank order
+        findings: Findings with every list sorted by position
 
     Returns:
         A report string describing any duplicates found
     """
     results = []
-    questions = json_data["questions"]
+    similar = []
+    same_answers = []
+    conflicts = []
+    similar_options = []
 
     # Check for duplicate questions
-    question_texts = {}
-    for i, question in enumerate(questions):
-        text = question["text"].lower()
-        if text in question_texts:
-            results.append(
-                f"IDENTICAL QUESTIONS FOUND:\n"
-                f"Question {question['id']} and Question {question_texts[text]['id']} - 100% identical\n"
-                f"  Q{question_texts[text]['id']}: {question_texts[text]['text']}\n"
+    for position, first_position in findings.identical:
+        question = questions[position]
+        first = questions[first_position]
+        results.append(
+            f"IDENTICAL QUESTIONS FOUND:\n"
+            f"Question {question['id']} and Question {first['id']} - "
+            f"{identical_label(first['text'], question['text'], question=True)}\n"
+            f"  Q{first['id']}: {first['text']}\n"
+            f"  Q{question['id']}: {question['text']}\n"
+        )
+
+    # Check for duplicate options within the same question
+    for position, first, option in findings.options:
+        question = questions[position]
+        results.append(
+            f"IDENTICAL OPTIONS WITHIN THE SAME QUESTION FOUND:\n"
+            f"In Question {question['id']} - Options {chr(96 + first['id'])} "
+            f"and {chr(96 + option['id'])} are {identical_label(first['text'], option['text'])}\n"
+            f"  Q{question['id']}: {question['text']}\n"
+            f"    {chr(96 + first['id'])}) {first['text']}\n"
+            f"    {chr(96 + option['id'])}) {option['text']}\n"
+        )
+
+    # The rest are warnings; check for questions that differ by a typo
+    for position, first_position, distance, score in findings.similar_questions:
+        question = questions[position]
+        first = questions[first_position]
+        similar.append(
+            f"SIMILAR QUESTIONS FOUND:\n"
+            f"Question {question['id']} and Question {first['id']} - "
+            f"edit distance {distance}, {score:.0%} similar\n"
+            f"  Q{first['id']}: {first['text']}\n"
+            f"  Q{question['id']}: {question['text']}\n"
+        )
+
+    # Check for questions with the same answers
+    identical_positions = {position for position, _ in findings.identical}
+    for position, first_position, same_correct in findings.answer_sets:
+        question = questions[position]
+        same_set = questions[first_position]
+        if not same_correct:
+            conflicts.append(
+                f"CONFLICTING ANSWER KEYS FOUND:\n"
+                f"Question {question['id']} and Question {same_set['id']} have the same "
+                f"variants but different correct answers\n"
+                f"  Q{same_set['id']}: {same_set['text']} (correct: {correct_text(same_set)})\n"
+                f"  Q{question['id']}: {question['text']} (correct: {correct_text(question)})\n"
+            )
+        elif position not in identical_positions:
+            # Identical questions are already reported above
+            same_answers.append(
+                f"POSSIBLE DUPLICATE QUESTIONS FOUND (same answers):\n"
+                f"Question {question['id']} and Question {same_set['id']} have the same "
+                f"variants and the same correct answer\n"
+                f"  Q{same_set['id']}: {same_set['text']}\n"
                 f"  Q{question['id']}: {question['text']}\n"
             )
-        else:
-            question_texts[text] = question
 
-    # Check for duplicate options within the same question
-    for question in questions:
-        option_texts = {}
-        for option in question["variants"]:
-            text = option["text"].lower()
-            if text in option_texts:
-                results.append(
-                    f"IDENTICAL OPTIONS WITHIN THE SAME QUESTION FOUND:\n"
-                    f"In Question {question['id']} - Options {chr(96 + option_texts[text]['id'])} "
-                    f"and {chr(96 + option['id'])} are 100% identical\n"
-                    f"  Q{question['id']}: {question['text']}\n"
-                    f"    {chr(96 + option_texts[text]['id'])}) {option_texts[text]['text']}\n"
-                    f"    {chr(96 + option['id'])}) {option['text']}\n"
-                )
-            else:
-                option_texts[text] = option
+    # Check for options that differ by a typo
+    for position, first, option, distance, score in findings.similar_options:
+        question = questions[position]
+        similar_options.append(
+            f"SIMILAR OPTIONS WITHIN THE SAME QUESTION FOUND:\n"
+            f"In Question {question['id']} - Options {chr(96 + first['id'])} "
+            f"and {chr(96 + option['id'])} - edit distance {distance}, {score:.0%} similar\n"
+            f"  Q{question['id']}: {question['text']}\n"
+            f"    {chr(96 + first['id'])}) {first['text']}\n"
+            f"    {chr(96 + option['id'])}) {option['text']}\n"
+        )
+
+    warnings = similar + same_answers + conflicts + similar_options
+    if warnings:
+        results.append(DUPLICATE_WARNINGS_HEADER + "\n")
+        results.extend(warnings)
 
     if not results:
-        return "No duplicate or similar content found."
+        return NO_DUPLICATES_REPORT
 
     return "\n".join(results)
+
+
+def split_duplicate_report(report: str) -> Tuple[str, str]:
+    """
+    Split a duplicate report into the findings that block the upload and
+    the warnings.
+
+    Args:
+        report: Report from format_duplicate_report()
+
+    Returns:
+        Tuple of the blocking findings and the warnings, each an empty
+        string when there are none
+    """
+    if report == NO_DUPLICATES_REPORT:
+        return "", ""
+    blocking, _, warnings = report.partition(DUPLICATE_WARNINGS_HEADER)
+    return blocking.strip(), warnings.strip()
+
+
+def build_duplicate_report(
+    questions: Sequence[Dict], signatures: Sequence[QuestionSignature]
+) -> str:
+    """
+    Build the duplicate report from precomputed question signatures.
+
+    Args:
+        questions: Questions in bank order
+        signatures: Signature of each question, in the same order
+
+    Returns:
+        A report string describing any duplicates found
+    """
+    return format_duplicate_report(questions, find_duplicates(questions, signatures))
+
+
+def check_for_duplicates(json_data: Dict) -> str:
+    """
+    Check for duplicate questions and duplicate options within questions.
+
+    Args:
+        json_data: Dictionary containing questions data
+
+    Returns:
+        A report string describing any duplicates found
+    """
+    questions = json_data["questions"]
+    signatures = [question_signature(question) for question in questions]
+    return build_duplicate_report(questions, signatures)
@@ -3,10 +3,43 @@ Formatters for converting questions to different output formats.
 
 This module contains functions to transform question data into various
 output formats including student format, HEMIS format, and Word documents.
+
+Every output format is also available as a streaming sink (QuestionSink):
+begin() opens the output, question() is called once per question and end()
+finishes it. This lets one pass over the questions feed several formats at
+once (see src.core.registry); the functions below run a single sink.
+
+The Word sinks accept an optional fragment cache: a dictionary kept by the
+caller between calls that maps a question's content to copies of the XML
+elements rendered for it. Questions found in the cache are copied into the
+new document instead of being built again through python-docx, so re-rendering
+a bank after a small edit only builds the questions that changed.
+
+Sinks can also estimate the size of their output while it is being written
+(track_size), which lets the registry split very large outputs into parts
+before they outgrow the Bot API upload limit.
 """
 
-from docx import Document
-from typing import Dict, List, Optional
+import copy
+import csv
+import io
+import re
+import shutil
+import tempfile
+import zipfile
+import zlib
+from xml.sax.saxutils import escape as xml_escape
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from src.core.normalizer import QUESTION_NUMBER_PATTERN
+from src.core.templates import (
+    HEMIS_TEMPLATE,
+    STUDENT_NOVARIANT_TEMPLATE,
+    STUDENT_TEMPLATE,
+    OutputTemplate,
+    compile_template,
+    render_questions,
+)
 
 
 def transform_to_student_format(json_data: Dict, include_variants: bool = True) -> str:
@@ -20,23 +53,21 @@ def transform_to_student_format(json_data: Dict, include_variants: bool = True)
     Returns:
         Formatted text for student use
     """
-    output = []
-    questions = json_data["questions"]
+    template = STUDENT_TEMPLATE if include_variants else STUDENT_NOVARIANT_TEMPLATE
+    return render_questions(template, json_data["questions"])
 
-    for question in questions:
-        # Add question
-        output.append(f"{question['id']}. {question['text']}")
 
-        # Add variants if requested
-        if include_variants:
-            for variant in question["variants"]:
-                letter = chr(96 + variant["id"])  # Convert 1->a, 2->b, etc.
-                output.append(f"{letter}) {variant['text']}")
+def program_question_lines(question: Dict) -> List[str]:
+    """
+    Get the HEMIS lines of one question, without the separator between questions.
 
-        # Add blank line between questions
-        output.append("")
+    Args:
+        question: Question dictionary
 
-    return "\n".join(output)
+    Returns:
+        List of output lines
+    """
+    return compile_template(HEMIS_TEMPLATE).render(question, 1).split("\n")
 
 
 def transform_to_program_format(json_data: Dict) -> str:
@@ -49,87 +80,904 @@ def transform_to_program_format(json_data: Dict) -> str:
     Returns:
         Formatted text in HEMIS format
     """
-    output = []
-    questions = json_data["questions"]
+    return render_questions(HEMIS_TEMPLATE, json_data["questions"])
 
-    for i, question in enumerate(questions):
-        # Add question
-        output.append(question["text"])
-        output.append("====")
 
-        # Add variants
-        for variant in question["variants"]:
-            is_correct = variant["id"] == question["correct"]
-            marker = "#" if is_correct else ""
-            output.append(f"{marker}{variant['text']}")
-            output.append("====")
+class QuestionSink:
+    """
+    Base class for output formats that are written one question at a time.
 
-        # Add separator between questions (except after the last one)
-        if i < len(questions) - 1:
-            output.append("++++")
+    Attributes:
+        output_path: Path of the file the sink writes
+        cache: Optional fragment cache reused between renders (Word sinks only)
+        track_size: Set before begin() to make size() available
+    """
 
-    return "\n".join(output)
+    def __init__(self, output_path: str, cache: Optional[Dict] = None) -> None:
+        self.output_path = output_path
+        self.cache = cache
+        self.track_size = False
 
-def create_word_document(json_data: Dict, output_path: str) -> None:
-    """
-    Create a Word document with questions in tables.
-    First row contains the question, second row contains the correct answer,
-    and remaining rows contain incorrect answers.
+    def begin(self) -> None:
+        """Open the output before the first question."""
+
+    def question(self, question: Dict) -> None:
+        """Add one question to the output."""
+        raise NotImplementedError
+
+    def end(self) -> None:
+        """Finish and save the output after the last question."""
+
+    def size(self) -> int:
+        """
+        Estimate the size of the output file if it were finished now.
+
+        Only available if track_size was set before begin().
+
+        Returns:
+            Estimated size in bytes
+        """
+        raise NotImplementedError
+
+
+def render_to_sink(sink: QuestionSink, questions: Iterable[Dict]) -> None:
     """
-    doc = Document()
-    questions = json_data["questions"]
+    Feed all questions to a single sink.
 
+    Args:
+        sink: Output format to write
+        questions: Questions in output order
+    """
+    sink.begin()
     for question in questions:
-        # Create table for this question
-        table = doc.add_table(rows=len(question["variants"]) + 1, cols=1)
-        table.style = "Table Grid"
+        sink.question(question)
+    sink.end()
+
+
+def table_row(question: Dict) -> List[str]:
+    """
+    Get the cells of a question in the table layout.
+
+    The question comes first, then the correct answer, then the other
+    answers in order. If no correct answer is found, all answers follow the
+    question in order.
+
+    Args:
+        question: Question to lay out
+
+    Returns:
+        Texts of the question and its answers
+    """
+    correct = [variant for variant in question["variants"] if variant["id"] == question["correct"]]
+    others = [variant for variant in question["variants"] if variant["id"] != question["correct"]]
+    return [question["text"]] + [variant["text"] for variant in correct[:1] + others]
+
+
+class TemplateSink(QuestionSink):
+    """Writes questions as text with an output template (see src.core.templates)."""
+
+    def __init__(
+        self, output_path: str, cache: Optional[Dict] = None, template: OutputTemplate = None
+    ) -> None:
+        super().__init__(output_path, cache)
+        self.template = template
+
+    def begin(self) -> None:
+        self._render = compile_template(self.template).render
+        self._file = open(self.output_path, "w", encoding="utf-8")
+        self._number = 0
+        self._size = 0
+
+    def question(self, question: Dict) -> None:
+        self._number += 1
+        text = self._render(question, self._number)
+        if self._number > 1:
+            text = self.template.separator + text
+        self._file.write(text)
+        if self.track_size:
+            self._size += len(text.encode("utf-8"))
+
+    def end(self) -> None:
+        self._file.close()
+
+    def size(self) -> int:
+        return self._size
+
+
+class HemisSink(TemplateSink):
+    """Writes the HEMIS text format, same as transform_to_program_format()."""
+
+    def __init__(self, output_path: str, cache: Optional[Dict] = None) -> None:
+        super().__init__(output_path, cache, HEMIS_TEMPLATE)
+
+
+# Header of the spreadsheet formats; answers past the last named column
+# are written without a header
+TABLE_HEADER = ["Savol", "To'g'ri javob", "Noto'g'ri javob 1", "Noto'g'ri javob 2", "Noto'g'ri javob 3"]
+
+
+class CsvSink(QuestionSink):
+    """
+    Writes one row per question in the table layout (see table_row()) as CSV.
+
+    The file starts with a byte order mark so spreadsheet programs read it
+    as UTF-8.
+    """
+
+    def begin(self) -> None:
+        self._file = open(self.output_path, "wb")
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._size = 0
+        self._write_row(TABLE_HEADER, "utf-8-sig")
+
+    def _write_row(self, row: List[str], encoding: str = "utf-8") -> None:
+        self._writer.writerow(row)
+        data = self._buffer.getvalue().encode(encoding)
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def question(self, question: Dict) -> None:
+        self._write_row(table_row(question))
+
+    def end(self) -> None:
+        self._file.close()
+
+    def size(self) -> int:
+        return self._size
+
+
+# Characters XML 1.0 does not allow, which Excel refuses to open
+_XML_INVALID_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# Characters of rows and shared strings collected before they are written
+STREAM_BUFFER_SIZE = 1 << 16
+
+# Longest text an Excel cell holds
+EXCEL_CELL_LIMIT = 32767
+
+# Shared strings remembered for deduplication; when more are seen the
+# memory is cleared, so a later repeat may be stored again
+SHARED_STRING_MEMORY = 1 << 16
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Savollar" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+        '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        "</styleSheet>"
+    ),
+}
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    "<sheetViews><sheetView workbookViewId=\"0\">"
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    "</sheetView></sheetViews>"
+    "<sheetData>"
+)
+
+
+class _CompressedSize:
+    """
+    Follows the deflated size of a stream of bytes, like the size estimate of
+    the Word sinks: exact at every sync flush, and the bytes added since
+    counted at the ratio measured so far.
+    """
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._raw_size = 0
+        self._size = 0
+        self._flushed_raw_size = 0
+        self._flushed_size = 0
+
+    def add(self, data: bytes) -> None:
+        self._raw_size += len(data)
+        self._size += len(self._compressor.compress(data))
+        if self._raw_size - self._flushed_raw_size >= SIZE_FLUSH_INTERVAL:
+            self._size += len(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._flushed_raw_size = self._raw_size
+            self._flushed_size = self._size
+
+    def size(self, buffered: int = 0) -> int:
+        """
+        Estimate the deflated size of the stream.
+
+        Args:
+            buffered: Bytes not added yet but counted as if they were
+
+        Returns:
+            Estimated size in bytes
+        """
+        if self._flushed_raw_size:
+            ratio = self._flushed_size / self._flushed_raw_size
+        else:
+            ratio = INITIAL_COMPRESSION_RATIO
+        pending = self._raw_size - self._flushed_raw_size + buffered
+        return self._flushed_size + int(pending * ratio)
+
+
+class XlsxSink(QuestionSink):
+    """
+    Writes one row per question in the table layout (see table_row()) as an
+    Excel workbook.
+
+    The sheet XML is compressed into the archive as rows are written, and
+    the shared strings (every distinct text is stored once and cells refer
+    to it by number) are spooled to a temporary file and added to the
+    archive at the end, so memory does not grow with the size of the bank.
+
+    For the size estimate the sheet and the shared strings are also run
+    through deflate streams of their own (see _CompressedSize); the rows and
+    strings still buffered are counted at the ratio measured so far, so
+    asking for the size does not flush the buffer.
+    """
+
+    def begin(self) -> None:
+        self._file = open(self.output_path, "wb")
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+        for name, xml in _XLSX_PARTS.items():
+            self._zip.writestr(name, xml)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w")
+        self._strings = tempfile.TemporaryFile()
+        self._string_numbers: Dict[str, int] = {}
+        self._string_count = 0
+        self._reference_count = 0
+        self._rows: List[str] = []
+        self._new_strings: List[str] = []
+        self._pending_rows = self._pending_strings = 0
+        self._sheet_size = self._strings_size = None
+        if self.track_size:
+            # The fixed parts are already in the file
+            self._fixed_size = self._file.tell()
+            self._sheet_size = _CompressedSize()
+            self._strings_size = _CompressedSize()
+        self._write_sheet(_SHEET_START.encode("utf-8"))
+        self._add_row(TABLE_HEADER, ' s="1"')
+
+    def _string_number(self, text: str) -> int:
+        """Number of a text among the shared strings, adding it if new."""
+        self._reference_count += 1
+        number = self._string_numbers.get(text)
+        if number is None:
+            if len(self._string_numbers) >= SHARED_STRING_MEMORY:
+                self._string_numbers.clear()
+            number = self._string_count
+            self._string_count += 1
+            self._string_numbers[text] = number
+            escaped = xml_escape(_XML_INVALID_CHARACTERS.sub("", text)[:EXCEL_CELL_LIMIT])
+            self._new_strings.append(f'<si><t xml:space="preserve">{escaped}</t></si>')
+            self._pending_strings += len(escaped)
+        return number
+
+    def _add_row(self, texts: List[str], style: str = "") -> None:
+        cells = "".join(f'<c t="s"{style}><v>{self._string_number(text)}</v></c>' for text in texts)
+        row = f"<row>{cells}</row>"
+        self._rows.append(row)
+        self._pending_rows += len(row)
+        if self._pending_rows + self._pending_strings >= STREAM_BUFFER_SIZE:
+            self._flush()
+
+    def _write_sheet(self, data: bytes) -> None:
+        self._sheet.write(data)
+        if self._sheet_size is not None:
+            self._sheet_size.add(data)
+
+    def _flush(self) -> None:
+        """Write the buffered rows and shared strings."""
+        self._write_sheet("".join(self._rows).encode("utf-8"))
+        strings = "".join(self._new_strings).encode("utf-8")
+        self._strings.write(strings)
+        if self._strings_size is not None:
+            self._strings_size.add(strings)
+        self._rows.clear()
+        self._new_strings.clear()
+        self._pending_rows = self._pending_strings = 0
+
+    def question(self, question: Dict) -> None:
+        self._add_row(table_row(question))
+
+    def size(self) -> int:
+        # The archive's central directory adds little
+        return (
+            self._fixed_size
+            + self._sheet_size.size(self._pending_rows)
+            + self._strings_size.size(self._pending_strings)
+        )
+
+    def end(self) -> None:
+        self._flush()
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        with self._zip.open("xl/sharedStrings.xml", "w") as shared:
+            shared.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+                f' count="{self._reference_count}" uniqueCount="{self._string_count}">'.encode("utf-8")
+            )
+            self._strings.seek(0)
+            shutil.copyfileobj(self._strings, shared)
+            shared.write(b"</sst>")
+        self._strings.close()
+        self._zip.close()
+        self._file.close()
+
+
+# Longest part of a question's text used in its name in the LMS formats
+QUESTION_NAME_LENGTH = 60
+
+# Whether the LMS formats ask the importing system to shuffle the answers;
+# off, so answers such as "All of the above" stay where they were written
+SHUFFLE_ANSWERS = False
+
+
+def question_stem(question: Dict) -> str:
+    """
+    Get the text of a question without its number ("3. What ..." -> "What ...").
+
+    Learning management systems number the questions themselves.
+
+    Args:
+        question: Question dictionary
+
+    Returns:
+        Question text
+    """
+    return QUESTION_NUMBER_PATTERN.sub("", question["text"], count=1) or question["text"]
+
+
+def question_name(number: int, stem: str) -> str:
+    """Short name of a question in a learning management system's bank."""
+    name = " ".join(stem.split())
+    if len(name) > QUESTION_NAME_LENGTH:
+        name = name[: QUESTION_NAME_LENGTH - 1] + "…"
+    return f"{number}. {name}"
+
+
+def _xml_text(text: str, quote: bool = False) -> str:
+    """Escape text for XML content (or a double-quoted attribute)."""
+    text = _XML_INVALID_CHARACTERS.sub("", text)
+    return xml_escape(text, {'"': "&quot;"}) if quote else xml_escape(text)
+
+
+class _StreamSink(QuestionSink):
+    """
+    Text output written question by question between a fixed header and
+    footer; render() gives the text of one question.
+    """
 
-        # Add question to first row
-        table.cell(0, 0).text = question["text"]
+    header = ""
+    footer = ""
 
-        # Find the correct answer
-        correct_variant = None
-        incorrect_variants = []
-        
+    def begin(self) -> None:
+        self._file = open(self.output_path, "w", encoding="utf-8", newline="\n")
+        self._number = 0
+        self._size = 0
+        self._write(self.header)
+
+    def _write(self, text: str) -> None:
+        self._file.write(text)
+        if self.track_size:
+            self._size += len(text.encode("utf-8"))
+
+    def render(self, question: Dict, number: int) -> str:
+        raise NotImplementedError
+
+    def question(self, question: Dict) -> None:
+        self._number += 1
+        self._write(self.render(question, self._number))
+
+    def end(self) -> None:
+        self._write(self.footer)
+        self._file.close()
+
+    def size(self) -> int:
+        return self._size + len(self.footer)
+
+
+# GIFT's special characters are escaped with a backslash (the backslash
+# first); line breaks are written as \n so every answer stays on its own line
+_GIFT_ESCAPES = (
+    ("\\", "\\\\"),
+    ("~", "\\~"),
+    ("=", "\\="),
+    ("#", "\\#"),
+    ("{", "\\{"),
+    ("}", "\\}"),
+    (":", "\\:"),
+    ("\n", "\\n"),
+    ("\r", ""),
+)
+
+
+def gift_escape(text: str) -> str:
+    """Escape text for the GIFT format."""
+    # Most texts have none of the characters; replacing only those found
+    # is faster than str.translate()
+    for character, escaped in _GIFT_ESCAPES:
+        if character in text:
+            text = text.replace(character, escaped)
+    return text
+
+
+class GiftSink(_StreamSink):
+    """
+    Writes the GIFT text format Moodle imports, one multiple choice question
+    per block. The answer marked correct as in the HEMIS format (the variant
+    whose id is the question's "correct") is written with "=", the others
+    with "~". Texts are plain text ("[plain]"), so markup in a question is
+    shown as written.
+    """
+
+    def render(self, question: Dict, number: int) -> str:
+        stem = question_stem(question)
+        lines = [f"::{gift_escape(question_name(number, stem))}::[plain]{gift_escape(stem)} {{"]
         for variant in question["variants"]:
-            if variant["id"] == question["correct"]:
-                correct_variant = variant
+            marker = "=" if variant["id"] == question["correct"] else "~"
+            lines.append(f"\t{marker}{gift_escape(variant['text'])}")
+        lines.append("}\n\n")
+        return "\n".join(lines)
+
+
+class MoodleXmlSink(_StreamSink):
+    """
+    Writes Moodle XML, one single-answer multichoice question per question.
+    The answer marked correct as in the HEMIS format gets the full grade,
+    the others none.
+    """
+
+    header = '<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n'
+    footer = "</quiz>\n"
+
+    def render(self, question: Dict, number: int) -> str:
+        stem = question_stem(question)
+        parts = [
+            '<question type="multichoice">\n'
+            f"<name><text>{_xml_text(question_name(number, stem))}</text></name>\n"
+            f'<questiontext format="plain_text"><text>{_xml_text(stem)}</text></questiontext>\n'
+            "<defaultgrade>1</defaultgrade>\n"
+            "<single>true</single>\n"
+            f"<shuffleanswers>{int(SHUFFLE_ANSWERS)}</shuffleanswers>\n"
+            "<answernumbering>abc</answernumbering>\n"
+        ]
+        for variant in question["variants"]:
+            fraction = 100 if variant["id"] == question["correct"] else 0
+            parts.append(
+                f'<answer fraction="{fraction}" format="plain_text">'
+                f"<text>{_xml_text(variant['text'])}</text></answer>\n"
+            )
+        parts.append("</question>\n")
+        return "".join(parts)
+
+
+_QTI_ITEM_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<assessmentItem xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xsi:schemaLocation="http://www.imsglobal.org/xsd/imsqti_v2p1'
+    ' http://www.imsglobal.org/xsd/qti/qtiv2p1/imsqti_v2p1.xsd"'
+)
+
+_QTI_ITEM_END = (
+    '<responseProcessing template="http://www.imsglobal.org/question/qti_v2p1/rptemplates/match_correct"/>'
+    "</assessmentItem>\n"
+)
+
+_QTI_MANIFEST_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<manifest xmlns="http://www.imsglobal.org/xsd/imscp_v1p1" identifier="MANIFEST">'
+    "<metadata><schema>QTIv2.1 Package</schema><schemaversion>1.0.0</schemaversion></metadata>"
+    "<organizations/><resources>"
+)
+
+_QTI_MANIFEST_END = "</resources></manifest>\n"
+
+def qti_item(question: Dict, identifier: str, number: int) -> str:
+    """
+    Get a question as a QTI 2.1 assessment item with a single choice.
+
+    The first answer marked correct as in the HEMIS format is the correct
+    response; a question without one has no correct response.
+
+    Args:
+        question: Question dictionary
+        identifier: Identifier of the item in its package
+        number: Position of the question, for its title
+
+    Returns:
+        XML document of the item
+    """
+    stem = question_stem(question)
+    correct = None
+    choices = []
+    for position, variant in enumerate(question["variants"], 1):
+        choice = f"choice{position}"
+        if correct is None and variant["id"] == question["correct"]:
+            correct = choice
+        choices.append(f'<simpleChoice identifier="{choice}">{_xml_text(variant["text"])}</simpleChoice>')
+    correct_response = (
+        f"<correctResponse><value>{correct}</value></correctResponse>" if correct else ""
+    )
+    return (
+        f'{_QTI_ITEM_START} identifier="{identifier}"'
+        f' title="{_xml_text(question_name(number, stem), quote=True)}"'
+        ' adaptive="false" timeDependent="false">'
+        '<responseDeclaration identifier="RESPONSE" cardinality="single" baseType="identifier">'
+        f"{correct_response}</responseDeclaration>"
+        '<outcomeDeclaration identifier="SCORE" cardinality="single" baseType="float">'
+        "<defaultValue><value>0</value></defaultValue></outcomeDeclaration>"
+        "<itemBody>"
+        f'<choiceInteraction responseIdentifier="RESPONSE" shuffle="{str(SHUFFLE_ANSWERS).lower()}"'
+        ' maxChoices="1">'
+        f"<prompt>{_xml_text(stem)}</prompt>{''.join(choices)}</choiceInteraction>"
+        f"</itemBody>{_QTI_ITEM_END}"
+    )
+
+
+# Bytes the package's directory adds per member besides the member's name
+# (a central directory record), and once at the end (the end record and, for
+# more than 65535 members, the ZIP64 end records)
+_ZIP_DIRECTORY_RECORD_SIZE = 46
+_ZIP_END_RECORDS_SIZE = 22 + 56 + 20
+
+
+class QtiSink(QuestionSink):
+    """
+    Writes an IMS QTI 2.1 content package: a .zip with one assessment item
+    per question (see qti_item()) and the imsmanifest.xml listing them.
+
+    Items are compressed into the package as they come and the manifest's
+    resources are spooled to a temporary file until the end; only zipfile's
+    small directory entry per item stays in memory.
+    """
+
+    def begin(self) -> None:
+        self._file = open(self.output_path, "wb")
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+        self._resources = tempfile.TemporaryFile()
+        self._resources_size = _CompressedSize() if self.track_size else None
+        self._directory_size = _ZIP_END_RECORDS_SIZE
+        self._number = 0
+
+    def question(self, question: Dict) -> None:
+        self._number += 1
+        identifier = f"item{self._number}"
+        href = f"items/{identifier}.xml"
+        self._zip.writestr(href, qti_item(question, identifier, self._number))
+        self._directory_size += _ZIP_DIRECTORY_RECORD_SIZE + len(href.encode("utf-8"))
+        resource = (
+            f'<resource identifier="{identifier}" type="imsqti_item_xmlv2p1" href="{href}">'
+            f'<file href="{href}"/></resource>'
+        ).encode("utf-8")
+        self._resources.write(resource)
+        if self._resources_size is not None:
+            self._resources_size.add(resource)
+
+    def size(self) -> int:
+        # Items are written already; their directory records and the
+        # manifest are added at the end
+        return self._file.tell() + self._directory_size + self._resources_size.size()
+
+    def end(self) -> None:
+        self._resources.seek(0)
+        # The manifest's size is not known before it is written, so it gets
+        # ZIP64 sizes in case it is large
+        with self._zip.open("imsmanifest.xml", "w", force_zip64=True) as manifest:
+            manifest.write(_QTI_MANIFEST_START.encode("utf-8"))
+            shutil.copyfileobj(self._resources, manifest, STREAM_BUFFER_SIZE)
+            manifest.write(_QTI_MANIFEST_END.encode("utf-8"))
+        self._resources.close()
+        self._zip.close()
+        self._file.close()
+
+
+def _question_cache_key(question: Dict, *extra) -> tuple:
+    """Key identifying everything a rendered question fragment depends on."""
+    return (
+        question["text"],
+        tuple((variant["id"], variant["text"]) for variant in question["variants"]),
+        question["correct"],
+    ) + extra
+
+
+# Size of a saved document without any questions, measured on first use
+_empty_document_size: Optional[int] = None
+
+# Namespace declarations lxml repeats on every element serialized on its own;
+# in the saved document they appear once, on the root
+_NAMESPACE_DECLARATION = re.compile(rb' xmlns(?::\w+)?="[^"]*"')
+
+# Bytes of question XML between two exact measurements of the compressed
+# size, and the compression ratio assumed before the first one (question XML
+# is repetitive and compresses to a tenth or less)
+SIZE_FLUSH_INTERVAL = 1 << 18
+INITIAL_COMPRESSION_RATIO = 0.25
+
+
+def _empty_word_document_size() -> int:
+    """Size in bytes of a saved empty Word document."""
+    global _empty_document_size
+    if _empty_document_size is None:
+        from docx import Document
+
+        buffer = io.BytesIO()
+        Document().save(buffer)
+        _empty_document_size = buffer.tell()
+    return _empty_document_size
+
+
+class _WordSink(QuestionSink):
+    """
+    Common Word document handling, including the fragment cache.
+
+    The size estimate feeds the XML of every added question through the same
+    deflate compression the saved .docx archive uses and adds it to the size
+    of an empty document.
+    """
+
+    def begin(self) -> None:
+        # python-docx (and lxml under it) is slow to import, so load it on first use
+        from docx import Document
+
+        self.doc = Document()
+        self._used_fragments = {}
+        self._compressor = None
+        if self.track_size:
+            from lxml import etree
+
+            self._tostring = etree.tostring
+            self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            self._empty_size = _empty_word_document_size()
+            self._xml_size = 0
+            self._compressed_size = 0
+            self._flushed_xml_size = 0
+            self._flushed_size = 0
+
+    def cache_key(self, question: Dict) -> tuple:
+        """Key of the cached fragment for a question."""
+        return _question_cache_key(question)
+
+    def add_question(self, question: Dict) -> None:
+        """Build the document content of one question through python-docx."""
+        raise NotImplementedError
+
+    def question(self, question: Dict) -> None:
+        body = self.doc.element.body
+        body_length = len(body)
+
+        if self.cache is None:
+            self.add_question(question)
+        else:
+            key = self.cache_key(question)
+            fragment = self.cache.get(key)
+            if fragment is not None:
+                # Insert copies of the cached elements before the section properties
+                for element in fragment:
+                    body.insert_element_before(copy.deepcopy(element), "w:sectPr")
             else:
-                incorrect_variants.append(variant)
-        
-        # Add correct answer to second row
-        if correct_variant:
-            table.cell(1, 0).text = correct_variant["text"]
-            
-            # Add incorrect answers to remaining rows
-            for i, variant in enumerate(incorrect_variants):
-                table.cell(i + 2, 0).text = variant["text"]
+                self.add_question(question)
+                # The last child of the body is always the section properties
+                fragment = [copy.deepcopy(element) for element in body[body_length - 1:-1]]
+            self._used_fragments[key] = fragment
+
+        if self._compressor is not None:
+            for element in body[body_length - 1:-1]:
+                xml = self._tostring(element)
+                start_tag_end = xml.index(b">")
+                xml = _NAMESPACE_DECLARATION.sub(b"", xml[:start_tag_end]) + xml[start_tag_end:]
+                self._xml_size += len(xml)
+                self._compressed_size += len(self._compressor.compress(xml))
+            if self._xml_size - self._flushed_xml_size >= SIZE_FLUSH_INTERVAL:
+                # Deflate holds back its output; a sync flush now and then
+                # gives the exact compressed size of everything so far
+                self._compressed_size += len(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+                self._flushed_xml_size = self._xml_size
+                self._flushed_size = self._compressed_size
+
+    def size(self) -> int:
+        # XML added since the last flush counts at the ratio measured so far
+        if self._flushed_xml_size:
+            ratio = self._flushed_size / self._flushed_xml_size
         else:
-            # If no correct answer is found, just add all variants in order
-            for i, variant in enumerate(question["variants"]):
-                table.cell(i + 1, 0).text = variant["text"]
+            ratio = INITIAL_COMPRESSION_RATIO
+        pending = self._xml_size - self._flushed_xml_size
+        return self._empty_size + self._flushed_size + int(pending * ratio)
+
+    def end(self) -> None:
+        if self.cache is not None:
+            # Keep only the fragments of this bank so the cache does not grow
+            self.cache.clear()
+            self.cache.update(self._used_fragments)
+
+        # Save the document
+        self.doc.save(self.output_path)
+
+
+class WordTableSink(_WordSink):
+    """
+    Word document with questions in tables.
+    First row contains the question, second row contains the correct answer,
+    and remaining rows contain incorrect answers.
+    """
+
+    def begin(self) -> None:
+        super().begin()
+        # Resolving a style by name scans every style in the document, so look
+        # the style up once and assign the object to each table
+        self._table_style = self.doc.styles["Table Grid"]
+
+    def add_question(self, question: Dict) -> None:
+        # Create table for this question
+        table = self.doc.add_table(rows=len(question["variants"]) + 1, cols=1)
+        table.style = self._table_style
+        cells = table.column_cells(0)
+
+        # Question in the first row, then the answers in table order
+        for cell, text in zip(cells, table_row(question)):
+            cell.text = text
 
         # Add space between questions
-        doc.add_paragraph()
+        self.doc.add_paragraph()
 
-    # Save the document
-    doc.save(output_path)
 
+class StudentWordSink(_WordSink):
+    """Word document with questions in student format."""
 
+    def __init__(
+        self,
+        output_path: str,
+        cache: Optional[Dict] = None,
+        include_variants: bool = True,
+    ) -> None:
+        super().__init__(output_path, cache)
+        self.include_variants = include_variants
 
-def create_student_word_document(json_data: Dict, output_path: str, include_variants: bool = True) -> None:
-    """Create a Word document with questions in student format."""
-    doc = Document()
-    questions = json_data["questions"]
+    def cache_key(self, question: Dict) -> tuple:
+        return _question_cache_key(question, question["id"], self.include_variants)
 
-    for question in questions:
-        doc.add_paragraph(f"{question['id']}. {question['text']}")
+    def add_question(self, question: Dict) -> None:
+        self.doc.add_paragraph(f"{question['id']}. {question['text']}")
 
-        if include_variants:
+        if self.include_variants:
             for variant in question["variants"]:
                 letter = chr(96 + variant["id"])
-                doc.add_paragraph(f"{letter}) {variant['text']}")
+                self.doc.add_paragraph(f"{letter}) {variant['text']}")
+
+        self.doc.add_paragraph()  # Space between questions
+
+
+def _statistic(value: float, form: str) -> str:
+    """Format a statistic, showing a dash for one that is undefined."""
+    return "—" if value != value else format(value, form)
+
+
+class ItemAnalysisWordSink(_WordSink):
+    """
+    Word report of an item analysis (see src.core.item_analysis).
+
+    Every question gets a table with the share of students that chose each
+    variant (the correct one marked with *), followed by its difficulty,
+    discrimination and distractor efficiency and the problems found with it.
+    Questions carry their statistics under "analysis".
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        cache: Optional[Dict] = None,
+        summary: Sequence[str] = (),
+    ) -> None:
+        super().__init__(output_path, cache)
+        self.summary = list(summary)
+
+    def cache_key(self, question: Dict) -> tuple:
+        analysis = question["analysis"]
+        return _question_cache_key(
+            question,
+            question["id"],
+            tuple(analysis["variant_rates"]),
+            analysis["omitted"],
+            analysis["discrimination"],
+            tuple(analysis["flags"]),
+        )
+
+    def begin(self) -> None:
+        super().begin()
+        self._table_style = self.doc.styles["Table Grid"]
+        self.doc.add_heading("Savollar tahlili", level=1)
+        for line in self.summary:
+            self.doc.add_paragraph(line)
+        self.doc.add_paragraph()
+
+    def add_question(self, question: Dict) -> None:
+        analysis = question["analysis"]
+        table = self.doc.add_table(rows=len(question["variants"]) + 1, cols=2)
+        table.style = self._table_style
+        rows = table.rows
+        rows[0].cells[0].text = question["text"]
+        rows[0].cells[1].text = "Tanlaganlar"
+        for row, variant, rate in zip(rows[1:], question["variants"], analysis["variant_rates"]):
+            mark = "*" if variant["id"] == question["correct"] else ""
+            row.cells[0].text = f"{chr(96 + variant['id'])}) {mark}{variant['text']}"
+            row.cells[1].text = f"{rate:.1%}"
 
-        doc.add_paragraph()  # Space between questions
+        self.doc.add_paragraph(
+            f"Qiyinlik (p): {_statistic(analysis['difficulty'], '.2f')}; "
+            f"ajratish (r): {_statistic(analysis['discrimination'], '.2f')}; "
+            f"distraktorlar samaradorligi: {_statistic(analysis['distractor_efficiency'], '.0%')}; "
+            f"javob bermaganlar: {analysis['omitted']:.1%}"
+        )
+        for flag in analysis["flags"]:
+            self.doc.add_paragraph(f"⚠️ {flag}")
 
-    doc.save(output_path)
+        self.doc.add_paragraph()  # Space between questions
+
+
+def create_word_document(
+    json_data: Dict, output_path: str, cache: Optional[Dict] = None
+) -> None:
+    """
+    Create a Word document with questions in tables.
+    First row contains the question, second row contains the correct answer,
+    and remaining rows contain incorrect answers.
+
+    Args:
+        json_data: Dictionary containing questions data
+        output_path: Path of the .docx file to write
+        cache: Optional fragment cache reused between calls (see module docs)
+    """
+    render_to_sink(WordTableSink(output_path, cache), json_data["questions"])
+
+
+def create_student_word_document(
+    json_data: Dict,
+    output_path: str,
+    include_variants: bool = True,
+    cache: Optional[Dict] = None,
+) -> None:
+    """Create a Word document with questions in student format."""
+    render_to_sink(
+        StudentWordSink(output_path, cache, include_variants), json_data["questions"]
+    )
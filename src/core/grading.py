@@ -0,0 +1,440 @@
+"""
+Vectorized grading of student answer sheets against a bank's answer key.
+
+Answer sheets come as a CSV file: a header row, then one row per student
+with the student's name or id in the first column, optionally the version
+of the test they wrote (a "Variant" column, for versions made by
+src.core.versions), and one column per question holding the chosen letter
+(a, b, ...) or number (1, 2, ...). An empty cell is an unanswered question.
+
+The sheets are read into one students x questions matrix of chosen
+variants and scored against the key in a few NumPy operations. Shuffled
+versions are graded through permutation arrays: the key holds one row of
+correct variants per version, and every version's question and variant
+orders map its answers back to the original questions, so results are
+reported per original question whichever version a student wrote.
+
+Plain CSV blocks (no quotes, one character per answer cell) are split into
+cells with NumPy as well; anything else is read with the csv module.
+
+NumPy is imported only when grading starts (pip install numpy), so the rest
+of the bot runs without it.
+"""
+
+import csv
+import io
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from src.core.versions import shuffle_bank
+
+# Names of the optional version column (compared in lower case)
+VERSION_COLUMNS = ("variant", "versiya", "version")
+
+# Bytes of the answer sheet file split into cells at once
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Largest variant number an answer cell may hold
+MAX_VARIANT = 255
+
+_BLANK_LINES = re.compile(rb"\n{2,}")
+
+
+class GradingError(ValueError):
+    """The answer sheets do not fit the answer key."""
+
+
+class GradingKey(NamedTuple):
+    """
+    Answer key of every version of a test, as NumPy arrays.
+
+    Attributes:
+        correct: versions x questions array of the correct variant number at
+            every position of every version (0 where none is marked)
+        original_correct: Correct variant number of every original question
+        positions: versions x questions array of the position at which every
+            original question appears in every version
+        variant_maps: versions x questions x (variants + 1) array mapping the
+            variant number chosen on a version to the original variant id,
+            by original question (0 for no or an impossible choice)
+    """
+
+    correct: "numpy.ndarray"
+    original_correct: "numpy.ndarray"
+    positions: "numpy.ndarray"
+    variant_maps: "numpy.ndarray"
+
+
+class AnswerSheets(NamedTuple):
+    """
+    Answers read from an answer sheet file.
+
+    Attributes:
+        students: Name or id of every student, in file order
+        versions: Version number (from 1) written by every student
+        answers: students x questions array of chosen variant numbers in
+            the order the student's version showed them (0 for no answer)
+    """
+
+    students: List[str]
+    versions: "numpy.ndarray"
+    answers: "numpy.ndarray"
+
+
+class GradeResult(NamedTuple):
+    """
+    Grades of all students.
+
+    Attributes:
+        students: Name or id of every student
+        versions: Version number written by every student
+        scores: Number of correct answers of every student
+        max_score: Number of questions with a marked correct answer
+        correct: students x questions boolean array, in original question
+            order, of the questions every student answered correctly
+        responses: students x questions array, in original question order,
+            of the original id of the variant every student chose (0 for none)
+    """
+
+    students: List[str]
+    versions: "numpy.ndarray"
+    scores: "numpy.ndarray"
+    max_score: int
+    correct: "numpy.ndarray"
+    responses: "numpy.ndarray"
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Grading needs NumPy: pip install numpy") from None
+    return numpy
+
+
+def build_grading_key(json_data: Dict, seeds: Optional[Sequence[int]] = None) -> GradingKey:
+    """
+    Build the answer key of a bank and its shuffled versions.
+
+    Args:
+        json_data: Dictionary containing the original questions
+        seeds: Seeds of the versions made by src.core.versions, version 1
+            first; without seeds the bank itself is the only version
+
+    Returns:
+        The answer key
+    """
+    np = _import_numpy()
+    questions = json_data["questions"]
+    question_count = len(questions)
+    variant_limit = max((len(question["variants"]) for question in questions), default=0) + 1
+
+    if seeds:
+        versions = [shuffle_bank(json_data, seed)["questions"] for seed in seeds]
+    else:
+        versions = [
+            [
+                dict(
+                    question,
+                    source_id=index + 1,
+                    variant_order=[variant["id"] for variant in question["variants"]],
+                )
+                for index, question in enumerate(questions)
+            ]
+        ]
+
+    # Original ids may be any numbers; the arrays use positions from 1
+    original_numbers = [
+        {variant["id"]: number for number, variant in enumerate(question["variants"], start=1)}
+        for question in questions
+    ]
+
+    correct = np.zeros((len(versions), question_count), dtype=np.uint8)
+    original_correct = np.array(
+        [
+            numbers.get(question["correct"], 0)
+            for numbers, question in zip(original_numbers, questions)
+        ],
+        dtype=np.uint8,
+    )
+    positions = np.zeros((len(versions), question_count), dtype=np.intp)
+    variant_maps = np.zeros((len(versions), question_count, variant_limit), dtype=np.uint8)
+    for version, version_questions in enumerate(versions):
+        for position, question in enumerate(version_questions):
+            original = question["source_id"] - 1
+            correct[version, position] = question["correct"] or 0
+            positions[version, original] = position
+            for choice, variant_id in enumerate(question["variant_order"], start=1):
+                variant_maps[version, original, choice] = original_numbers[original][variant_id]
+    return GradingKey(correct, original_correct, positions, variant_maps)
+
+
+def _cell_value(cell: str) -> int:
+    """Variant number written in an answer cell (0 for none)."""
+    value = cell.strip().lower()
+    if value.isdigit():
+        return min(int(value), MAX_VARIANT)
+    if len(value) == 1 and "a" <= value <= "z":
+        return ord(value) - ord("a") + 1
+    return 0
+
+
+def _answer_table(np):
+    """Lookup table from the byte of a one-character cell to its variant number."""
+    table = np.zeros(256, dtype=np.uint8)
+    for number in range(1, 27):
+        table[ord("a") + number - 1] = number
+        table[ord("A") + number - 1] = number
+    for number in range(1, 10):
+        table[ord("0") + number] = number
+    return table
+
+
+def _split_block(np, block: bytes, columns: int, first_answer: int):
+    """
+    Split a block of whole CSV lines into cells with NumPy.
+
+    The answer cells are the last cells of every line, so they are found
+    from the line ends; only the first cells (name and version), which may
+    be quoted, are split line by line.
+
+    Returns:
+        Tuple of the names, the version cells (or None) and the answer
+        bytes, or None if the block needs the csv module
+    """
+    buffer = np.frombuffer(block, dtype=np.uint8)
+    separators = np.flatnonzero((buffer == ord(",")) | (buffer == ord("\n")))
+    line_ends = np.flatnonzero(buffer == ord("\n"))
+    # Index of every line's newline among the separators
+    line_separators = np.searchsorted(separators, line_ends)
+    if (np.diff(line_separators, prepend=-1) < columns).any():
+        return None
+
+    answer_count = columns - first_answer
+    # The separator before the first answer cell, then those after each
+    bounds = separators[line_separators[:, None] + np.arange(-answer_count, 1)]
+    if (np.diff(bounds, axis=1) > 2).any():
+        return None
+    quotes = np.flatnonzero(buffer == ord('"'))
+    if quotes.size and (quotes > bounds[np.searchsorted(line_ends, quotes), 0]).any():
+        return None
+    # The byte before an answer cell's separator is its letter, or the
+    # previous separator if the cell is empty
+    answers = buffer[bounds[:, 1:] - 1]
+
+    line_starts = np.empty_like(line_ends)
+    line_starts[0] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    names, version_cells = [], []
+    for start, end in zip(line_starts.tolist(), bounds[:, 0].tolist()):
+        head = block[start:end].decode("utf-8")
+        cells = next(csv.reader([head])) if '"' in head else head.split(",")
+        if len(cells) != first_answer:
+            return None
+        names.append(cells[0].strip())
+        if first_answer == 2:
+            version_cells.append(cells[1])
+    return names, version_cells if first_answer == 2 else None, answers
+
+
+def _parse_block(np, block: bytes, columns: int, first_answer: int, table):
+    """Read a block of whole CSV lines into names, version cells and answers."""
+    block = block.replace(b"\r", b"")
+    if b"\n\n" in block:
+        block = _BLANK_LINES.sub(b"\n", block)
+    block = block.lstrip(b"\n")
+    if not block:
+        return [], [], np.zeros((0, columns - first_answer), dtype=np.uint8)
+
+    split = _split_block(np, block, columns, first_answer)
+    if split is not None:
+        names, version_cells, answer_bytes = split
+        return names, version_cells, table[answer_bytes]
+
+    names, version_cells, rows = [], [], []
+    for row in csv.reader(io.StringIO(block.decode("utf-8"))):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > columns:
+            raise GradingError(f"{row[0]}: {len(row)} ustun bor, sarlavhada esa {columns} ta")
+        row = row + [""] * (columns - len(row))
+        names.append(row[0].strip())
+        if first_answer == 2:
+            version_cells.append(row[1])
+        rows.append([_cell_value(cell) for cell in row[first_answer:]])
+    answers = np.array(rows, dtype=np.uint8).reshape(len(rows), columns - first_answer)
+    return names, version_cells if first_answer == 2 else None, answers
+
+
+def read_answer_sheets(input_path: str) -> AnswerSheets:
+    """
+    Read an answer sheet CSV file.
+
+    Args:
+        input_path: Path of the CSV file (UTF-8, comma separated)
+
+    Returns:
+        The students' answers
+
+    Raises:
+        GradingError: If a row is malformed
+    """
+    np = _import_numpy()
+    table = _answer_table(np)
+
+    with open(input_path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        if len(header) < 2:
+            raise GradingError("Sarlavha qatorida talaba va savol ustunlari bo'lishi kerak")
+        has_version = header[1].strip().lower() in VERSION_COLUMNS
+        first_answer = 2 if has_version else 1
+        columns = len(header)
+
+        students, version_cells, answer_blocks = [], [], []
+        remainder = b""
+        while True:
+            chunk = f.read(READ_BLOCK_SIZE)
+            if not chunk:
+                block, remainder = remainder, b""
+            else:
+                chunk = remainder + chunk
+                cut = chunk.rfind(b"\n") + 1
+                block, remainder = chunk[:cut], chunk[cut:]
+            if block:
+                if not block.endswith(b"\n"):
+                    block += b"\n"
+                names, versions, answers = _parse_block(np, block, columns, first_answer, table)
+                students.extend(names)
+                if has_version:
+                    version_cells.extend(versions)
+                answer_blocks.append(answers)
+            if not chunk:
+                break
+
+    if has_version:
+        try:
+            versions = np.array([int(cell) for cell in version_cells], dtype=np.intp)
+        except ValueError:
+            bad = next(i for i, cell in enumerate(version_cells) if not cell.strip().isdigit())
+            raise GradingError(f"{students[bad]}: variant raqami noto'g'ri") from None
+    else:
+        versions = np.ones(len(students), dtype=np.intp)
+
+    if answer_blocks:
+        answers = np.concatenate(answer_blocks)
+    else:
+        answers = np.zeros((0, columns - first_answer), dtype=np.uint8)
+    return AnswerSheets(students, versions, answers)
+
+
+def grade(sheets: AnswerSheets, key: GradingKey) -> GradeResult:
+    """
+    Score every student's answers against the answer key.
+
+    Args:
+        sheets: The students' answers
+        key: Answer key of the test and its versions
+
+    Returns:
+        Scores and per-question results of every student
+
+    Raises:
+        GradingError: If the sheets have more questions than the key or
+            name a version the key does not have
+    """
+    np = _import_numpy()
+    version_count, question_count = key.correct.shape
+    answers = sheets.answers
+    if answers.shape[1] > question_count:
+        raise GradingError(
+            f"Javoblar varaqasida {answers.shape[1]} ta savol bor, testda esa {question_count} ta"
+        )
+    if answers.shape[1] < question_count:
+        # Missing columns are unanswered questions
+        answers = np.pad(answers, ((0, 0), (0, question_count - answers.shape[1])))
+
+    version_index = sheets.versions - 1
+    unknown = np.flatnonzero((version_index < 0) | (version_index >= version_count))
+    if unknown.size:
+        student = sheets.students[unknown[0]]
+        raise GradingError(f"{student}: {sheets.versions[unknown[0]]}-variant kaliti yo'q")
+
+    # One gather builds every student's key; one comparison grades them all
+    expected = key.correct[version_index]
+    correct_positions = (answers == expected) & (expected > 0)
+    scores = correct_positions.sum(axis=1, dtype=np.int32)
+
+    # Permute every version's positions back to the original questions and
+    # its variant numbers back to the original variant ids
+    variant_limit = key.variant_maps.shape[2]
+    answers = np.where(answers < variant_limit, answers, 0)
+    responses = np.empty_like(answers)
+    question_numbers = np.arange(question_count)
+    for version in range(version_count):
+        rows = np.flatnonzero(version_index == version)
+        if not rows.size:
+            continue
+        permutation = np.ix_(rows, key.positions[version])
+        responses[rows] = key.variant_maps[version][question_numbers, answers[permutation]]
+
+    correct = (responses == key.original_correct) & (key.original_correct > 0)
+
+    return GradeResult(
+        sheets.students,
+        sheets.versions,
+        scores,
+        int((key.original_correct > 0).sum()),
+        correct,
+        responses,
+    )
+
+
+def write_results(result: GradeResult, output_path: str) -> None:
+    """
+    Write every student's score as a CSV table.
+
+    Args:
+        result: Grades returned by grade()
+        output_path: Path of the CSV file to write
+    """
+    np = _import_numpy()
+    if result.max_score:
+        percents = np.round(result.scores * 100.0 / result.max_score, 1).tolist()
+    else:
+        percents = [0.0] * len(result.students)
+
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Talaba", "Variant", "To'g'ri", "Jami", "Foiz"])
+        writer.writerows(
+            zip(
+                result.students,
+                result.versions.tolist(),
+                result.scores.tolist(),
+                [result.max_score] * len(result.students),
+                percents,
+            )
+        )
+
+
+def grade_file(
+    json_data: Dict,
+    sheets_path: str,
+    output_path: str,
+    seeds: Optional[Sequence[int]] = None,
+) -> GradeResult:
+    """
+    Grade an answer sheet file and write the results table.
+
+    Args:
+        json_data: Dictionary containing the original questions
+        sheets_path: Path of the answer sheet CSV file
+        output_path: Path of the results CSV file to write
+        seeds: Seeds of the shuffled versions, if the test had versions
+
+    Returns:
+        The grades
+    """
+    result = grade(read_answer_sheets(sheets_path), build_grading_key(json_data, seeds))
+    write_results(result, output_path)
+    return result
@@ -0,0 +1,117 @@
+"""
+Incremental re-processing of re-uploaded question files.
+
+The usual workflow is to upload a file, read the duplicate report, fix a few
+lines and upload the file again. An UploadSession keeps a fingerprint of every
+question block of the last upload together with its parsed question, its
+validation problems and its duplicate-check signature. On the next upload
+only the blocks whose content changed are parsed and analysed again; the
+duplicate report is then assembled from the cached signatures and the Word
+fragment caches let the formatters rebuild only the questions that changed.
+The output is identical to a full run.
+"""
+
+import hashlib
+import io
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.core.parser import ValidationProblem, iter_question_blocks
+from src.core.duplicate_checker import QuestionSignature, build_duplicate_report
+from src.core.pipeline import analyse_block
+
+
+class BlockDiff(NamedTuple):
+    """Summary of how an upload differs from the previous one."""
+
+    added: int
+    removed: int
+    unchanged: int
+
+
+def block_fingerprint(block: str) -> str:
+    """
+    Get the fingerprint of a question block.
+
+    Args:
+        block: Raw text of the block
+
+    Returns:
+        Hex digest identifying the block content
+    """
+    return hashlib.blake2b(block.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class UploadSession:
+    """
+    Per-user state of the last uploaded question file.
+
+    Attributes:
+        block_hashes: Fingerprints of the blocks of the last upload, in order
+        last_diff: Block diff between the last two uploads
+        render_cache: Fragment cache per output format for the Word builders
+    """
+
+    def __init__(self) -> None:
+        self.block_hashes: List[str] = []
+        self.last_diff = BlockDiff(0, 0, 0)
+        self.render_cache: Dict[str, Dict] = {}
+        # Block fingerprint -> (parsed question or None, its signature or None,
+        # its validation problems numbered as if the block started on line 1)
+        self._blocks: Dict[
+            str,
+            Tuple[Optional[Dict], Optional[QuestionSignature], List[ValidationProblem]],
+        ] = {}
+
+    def update(self, content: str) -> Tuple[Dict, str, List[ValidationProblem]]:
+        """
+        Process a new upload, reusing everything cached for unchanged blocks.
+
+        Args:
+            content: Decoded content of the uploaded text file
+
+        Returns:
+            Tuple of the parsed questions data, the duplicate report and the
+            validation problems, equal to parse_text_content(content),
+            check_for_duplicates() on it and the block validation problems
+        """
+        blocks = {}
+        block_hashes = []
+        questions = []
+        signatures = []
+        problems = []
+
+        for index, start_line, block in iter_question_blocks(io.StringIO(content)):
+            fingerprint = block_fingerprint(block)
+            entry = blocks.get(fingerprint) or self._blocks.get(fingerprint)
+            if entry is None:
+                # Question ids and line numbers depend on the block position,
+                # so the cached block is analysed as the first block of a file
+                # and renumbered below
+                entry = analyse_block(block, 0, 1)
+
+            blocks[fingerprint] = entry
+            block_hashes.append(fingerprint)
+
+            question, signature, block_problems = entry
+            if question is not None:
+                questions.append(dict(question, id=index + 1))
+                signatures.append(signature)
+            problems.extend(
+                problem._replace(line=problem.line + start_line - 1, question_id=index + 1)
+                for problem in block_problems
+            )
+
+        unchanged = len(blocks.keys() & self._blocks.keys())
+        self.last_diff = BlockDiff(
+            added=len(blocks) - unchanged,
+            removed=len(self._blocks) - unchanged,
+            unchanged=unchanged,
+        )
+        self.block_hashes = block_hashes
+        self._blocks = blocks
+
+        return (
+            {"questions": questions},
+            build_duplicate_report(questions, signatures),
+            problems,
+        )
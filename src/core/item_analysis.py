@@ -0,0 +1,260 @@
+"""
+Item analysis of graded answer sheets (classical test theory).
+
+For every question of a bank, computed from the students x questions matrix
+of chosen variants (see src.core.grading):
+
+- difficulty: the share of students answering correctly (the p-value)
+- discrimination: the point-biserial correlation between answering the
+  question correctly and the score on the other questions (corrected
+  item-total correlation)
+- variant rates: the share of students choosing every variant, and the
+  share leaving the question unanswered
+- distractor efficiency: the share of wrong variants chosen by at least
+  FUNCTIONAL_DISTRACTOR_RATE of the students
+
+and for the whole test the KR-20 reliability coefficient. Questions outside
+the usual limits are flagged, and the report can be written as a Word
+document through the Word formatter (ItemAnalysisWordSink).
+
+Everything is computed with NumPy over blocks of students, so the response
+matrix is read once and the memory used does not grow with the number of
+students beyond the matrix itself.
+"""
+
+import math
+from typing import Dict, List, NamedTuple
+
+from src.core.formatters import ItemAnalysisWordSink, render_to_sink
+
+# Students whose answers are processed at once
+BLOCK_STUDENTS = 8192
+
+# Questions answered correctly by fewer (more) students are flagged as too
+# hard (too easy)
+MIN_DIFFICULTY = 0.2
+MAX_DIFFICULTY = 0.9
+
+# Questions with a weaker discrimination are flagged
+MIN_DISCRIMINATION = 0.2
+
+# A wrong variant chosen by fewer students does not work as a distractor
+FUNCTIONAL_DISTRACTOR_RATE = 0.05
+
+
+class ItemAnalysis(NamedTuple):
+    """
+    Item statistics of a test.
+
+    Attributes:
+        student_count: Number of students analysed
+        difficulty: Share of students answering every question correctly
+        discrimination: Corrected point-biserial correlation of every
+            question (NaN if everyone or no one answered it correctly)
+        variant_rates: questions x (variants + 1) array of the share of
+            students choosing every variant, by original variant number;
+            column 0 is the share that left the question unanswered
+        distractor_efficiency: Share of the wrong variants of every question
+            that work as distractors (NaN for questions without a key)
+        kr20: KR-20 reliability of the test (NaN if it cannot be computed)
+        flags: Descriptions of the problems found with every question
+    """
+
+    student_count: int
+    difficulty: "numpy.ndarray"
+    discrimination: "numpy.ndarray"
+    variant_rates: "numpy.ndarray"
+    distractor_efficiency: "numpy.ndarray"
+    kr20: float
+    flags: List[List[str]]
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Item analysis needs NumPy: pip install numpy") from None
+    return numpy
+
+
+def _variant_letter(number: int) -> str:
+    return f"{chr(ord('a') + number - 1)})"
+
+
+def analyze_items(json_data: Dict, responses) -> ItemAnalysis:
+    """
+    Compute the item statistics of a test.
+
+    Args:
+        json_data: Dictionary containing the original questions
+        responses: students x questions array of the original variant number
+            every student chose, in original question order (0 for none),
+            such as GradeResult.responses
+
+    Returns:
+        The item statistics
+    """
+    np = _import_numpy()
+    questions = json_data["questions"]
+    question_count = len(questions)
+    student_count = responses.shape[0]
+    variant_counts = np.array([len(question["variants"]) for question in questions], dtype=np.intp)
+    variant_limit = int(variant_counts.max(initial=0)) + 1
+    key = np.array(
+        [
+            next(
+                (
+                    number
+                    for number, variant in enumerate(question["variants"], start=1)
+                    if variant["id"] == question["correct"]
+                ),
+                0,
+            )
+            for question in questions
+        ],
+        dtype=np.uint8,
+    )
+    keyed = key > 0
+
+    # Sums over all students, gathered block by block
+    correct_counts = np.zeros(question_count, dtype=np.int64)
+    choice_counts = np.zeros((question_count, variant_limit), dtype=np.int64)
+    score_correct = np.zeros(question_count, dtype=np.float64)
+    scores = np.empty(student_count, dtype=np.float64)
+    for start in range(0, student_count, BLOCK_STUDENTS):
+        block = responses[start : start + BLOCK_STUDENTS]
+        correct = (block == key) & keyed
+        block_scores = correct.sum(axis=1, dtype=np.float64)
+        scores[start : start + len(block)] = block_scores
+        correct_counts += correct.sum(axis=0)
+        # Sum of the scores of the students answering every question correctly
+        score_correct += block_scores @ correct
+        for number in range(variant_limit):
+            choice_counts[:, number] += (block == number).sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        students = max(student_count, 1)
+        difficulty = correct_counts / students
+        item_variance = difficulty * (1 - difficulty)
+        score_mean = scores.mean() if student_count else 0.0
+        score_variance = scores.var() if student_count else 0.0
+        covariance = score_correct / students - difficulty * score_mean
+        # Correlate with the rest of the test, so the question's own score
+        # does not inflate its discrimination
+        rest_covariance = covariance - item_variance
+        rest_variance = score_variance - 2 * covariance + item_variance
+        discrimination = rest_covariance / np.sqrt(item_variance * rest_variance)
+        discrimination[~np.isfinite(discrimination) | ~keyed] = np.nan
+
+        variant_rates = choice_counts / students
+        numbers = np.arange(variant_limit)
+        distractors = (numbers >= 1) & (numbers <= variant_counts[:, None]) & (
+            numbers != key[:, None]
+        )
+        functional = distractors & (variant_rates >= FUNCTIONAL_DISTRACTOR_RATE)
+        distractor_efficiency = functional.sum(axis=1) / distractors.sum(axis=1)
+        distractor_efficiency[~keyed] = np.nan
+
+        keyed_count = int(keyed.sum())
+        if keyed_count > 1 and score_variance > 0:
+            kr20 = (keyed_count / (keyed_count - 1)) * (
+                1 - item_variance[keyed].sum() / score_variance
+            )
+        else:
+            kr20 = math.nan
+
+    # Questions whose most popular distractor is chosen more often than the key
+    distractor_rates = np.where(distractors, variant_rates, -1.0)
+    popular = distractor_rates.argmax(axis=1)
+    beaten = keyed & (distractor_rates.max(axis=1, initial=-1.0) > difficulty)
+
+    flags: List[List[str]] = [[] for _ in range(question_count)]
+    for index in np.flatnonzero(~keyed).tolist():
+        flags[index].append("To'g'ri javob belgilanmagan")
+    for index in np.flatnonzero(keyed & (difficulty < MIN_DIFFICULTY)).tolist():
+        flags[index].append(f"Juda qiyin: p < {MIN_DIFFICULTY:.2f}")
+    for index in np.flatnonzero(keyed & (difficulty > MAX_DIFFICULTY)).tolist():
+        flags[index].append(f"Juda oson: p > {MAX_DIFFICULTY:.2f}")
+    for index in np.flatnonzero(discrimination < 0).tolist():
+        flags[index].append("Ajratish manfiy: to'g'ri javob xato belgilangan bo'lishi mumkin")
+    weak = (discrimination >= 0) & (discrimination < MIN_DISCRIMINATION)
+    for index in np.flatnonzero(weak).tolist():
+        flags[index].append(f"Ajratish kuchsiz: r < {MIN_DISCRIMINATION:.2f}")
+    for index in np.flatnonzero(beaten).tolist():
+        flags[index].append(
+            f"{_variant_letter(int(popular[index]))} to'g'ri javobdan ko'p tanlangan"
+        )
+    for index in np.flatnonzero(keyed & (functional.sum(axis=1) < distractors.sum(axis=1))):
+        unused = np.flatnonzero(distractors[index] & ~functional[index]).tolist()
+        flags[index].append(
+            f"{FUNCTIONAL_DISTRACTOR_RATE:.0%} dan kam tanlangan: "
+            + ", ".join(_variant_letter(number) for number in unused)
+        )
+
+    return ItemAnalysis(
+        student_count,
+        difficulty,
+        discrimination,
+        variant_rates,
+        distractor_efficiency,
+        float(kr20),
+        flags,
+    )
+
+
+def annotated_questions(json_data: Dict, analysis: ItemAnalysis) -> List[Dict]:
+    """
+    Attach every question's statistics to a copy of it under "analysis".
+
+    Args:
+        json_data: Dictionary containing the original questions
+        analysis: Statistics returned by analyze_items()
+
+    Returns:
+        Questions in the form ItemAnalysisWordSink renders
+    """
+    difficulty = analysis.difficulty.tolist()
+    discrimination = analysis.discrimination.tolist()
+    efficiency = analysis.distractor_efficiency.tolist()
+    rates = analysis.variant_rates.tolist()
+    return [
+        dict(
+            question,
+            analysis={
+                "difficulty": difficulty[index],
+                "discrimination": discrimination[index],
+                "distractor_efficiency": efficiency[index],
+                "omitted": rates[index][0],
+                "variant_rates": rates[index][1 : len(question["variants"]) + 1],
+                "flags": analysis.flags[index],
+            },
+        )
+        for index, question in enumerate(json_data["questions"])
+    ]
+
+
+def summary_lines(analysis: ItemAnalysis) -> List[str]:
+    """Lines describing the whole test, shown above the questions."""
+    flagged = sum(1 for flags in analysis.flags if flags)
+    kr20 = "—" if math.isnan(analysis.kr20) else f"{analysis.kr20:.2f}"
+    return [
+        f"Talabalar soni: {analysis.student_count}",
+        f"Savollar soni: {len(analysis.flags)}",
+        f"Ishonchlilik (KR-20): {kr20}",
+        f"E'tibor talab qiladigan savollar: {flagged}",
+    ]
+
+
+def write_item_analysis_document(json_data: Dict, analysis: ItemAnalysis, output_path: str) -> None:
+    """
+    Write the item analysis as a Word document.
+
+    Args:
+        json_data: Dictionary containing the original questions
+        analysis: Statistics returned by analyze_items()
+        output_path: Path of the .docx file to write
+    """
+    render_to_sink(
+        ItemAnalysisWordSink(output_path, summary=summary_lines(analysis)),
+        annotated_questions(json_data, analysis),
+    )
@@ -0,0 +1,340 @@
+"""
+Durable local job queue on SQLite, shared by the update poller and the
+conversion workers.
+
+The poller only receives updates and puts the work they ask for into the
+queue; any number of worker processes on the same machine claim jobs from
+it. The database runs in WAL mode, so claiming, acknowledging and the
+poller's inserts do not block each other for long.
+
+Delivery is at least once:
+
+- a claimed job is leased to its worker for a while, and the worker
+  extends the lease while it is busy; a job whose worker died becomes
+  available again once the lease runs out;
+- a worker acknowledges a job when it is finished, or hands it back for a
+  retry with a growing delay; after too many attempts the job fails;
+- every attempt has its own number, and only the attempt that currently
+  holds a job can acknowledge it or extend its lease.
+
+A job may therefore run more than once, so jobs record the messages they
+have already sent (see JobSteps) and skip them on a later attempt.
+
+Jobs are claimed with UPDATE ... RETURNING, which needs SQLite 3.35 or newer.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Dict, NamedTuple, Optional
+
+DEFAULT_QUEUE_PATH = "jobs.db"
+
+# Seconds a claimed job stays with its worker unless the lease is extended
+DEFAULT_LEASE = 60.0
+
+# Attempts of a job before it fails for good
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Delay before the first retry of a job, doubled for every further attempt
+RETRY_DELAY = 2.0
+MAX_RETRY_DELAY = 300.0
+
+# Finished jobs are kept this long, so an update delivered again by
+# Telegram is still recognised as a duplicate
+DEFAULT_RETENTION = 24 * 60 * 60
+
+# Jobs that can be claimed: waiting ones, and running ones whose lease ran
+# out; available_at holds the end of the lease of a running job
+_CLAIMABLE = "state IN ('queued', 'running')"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT UNIQUE,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    worker TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (available_at) WHERE {_CLAIMABLE};
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS job_steps (
+    job_id INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    PRIMARY KEY (job_id, step)
+) WITHOUT ROWID;
+"""
+
+
+class Job(NamedTuple):
+    """One claimed attempt of a queued job."""
+
+    id: int
+    kind: str
+    payload: Dict
+    attempt: int
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of jobs.
+
+    Every process opens its own JobQueue on the same database file.
+
+    Attributes:
+        path: Path of the database file
+        lease: Seconds a claimed job stays with its worker
+        max_attempts: Attempts of a job before it fails
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_QUEUE_PATH,
+        lease: float = DEFAULT_LEASE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # Workers touch the queue from their event loop and the rendering
+        # thread; every statement is short and commits at once
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def put(self, kind: str, payload: Dict, dedupe_key: Optional[str] = None) -> Optional[int]:
+        """
+        Add a job to the queue.
+
+        Args:
+            kind: Kind of the job, telling workers how to run it
+            payload: JSON-serialisable arguments of the job
+            dedupe_key: Optional unique key (such as the id of the update
+                that asked for the job); a job with a key already in the
+                queue is not added again
+
+        Returns:
+            Id of the new job, or None if it was a duplicate
+        """
+        now = time.time()
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (kind, payload, dedupe_key, state, available_at, created_at)"
+                " VALUES (?, ?, ?, 'queued', ?, ?) ON CONFLICT (dedupe_key) DO NOTHING",
+                (kind, json.dumps(payload, ensure_ascii=False), dedupe_key, now, now),
+            )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Take the oldest available job.
+
+        Args:
+            worker: Name of the claiming worker, for monitoring
+
+        Returns:
+            The claimed job, or None if no job is available
+        """
+        while True:
+            now = time.time()
+            # A plain read first, so idle workers never take the write lock
+            row = self._connection.execute(
+                f"SELECT id FROM jobs WHERE {_CLAIMABLE} AND available_at <= ?"
+                " ORDER BY available_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            with self._connection:
+                claimed = self._connection.execute(
+                    "UPDATE jobs SET state = 'running', attempts = attempts + 1,"
+                    " available_at = ?, worker = ?"
+                    f" WHERE id = ? AND {_CLAIMABLE} AND available_at <= ?"
+                    " RETURNING id, kind, payload, attempts",
+                    (now + self.lease, worker, row[0], now),
+                ).fetchone()
+            # None if another worker was faster; look for the next job
+            if claimed is not None:
+                job_id, kind, payload, attempt = claimed
+                return Job(job_id, kind, json.loads(payload), attempt)
+
+    def extend(self, job: Job) -> bool:
+        """
+        Renew the lease of a running job.
+
+        Args:
+            job: Job claimed by this worker
+
+        Returns:
+            False if the lease had already run out and the job was taken by
+            another attempt
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET available_at = ?"
+                " WHERE id = ? AND attempts = ? AND state = 'running'",
+                (time.time() + self.lease, job.id, job.attempt),
+            )
+        return cursor.rowcount == 1
+
+    def ack(self, job: Job) -> bool:
+        """
+        Mark a job as finished.
+
+        Args:
+            job: Job claimed by this worker
+
+        Returns:
+            False if the job had meanwhile been taken by another attempt
+        """
+        return self._finish(job, "done", None)
+
+    def retry(self, job: Job, error: str, delay: Optional[float] = None) -> bool:
+        """
+        Hand a job back to be tried again later.
+
+        Args:
+            job: Job claimed by this worker
+            error: Why this attempt failed
+            delay: Seconds before the next attempt (by default growing with
+                the number of attempts)
+
+        Returns:
+            True if the job will be retried, False if it has used up its
+            attempts and failed
+        """
+        if job.attempt >= self.max_attempts:
+            self._finish(job, "failed", error)
+            return False
+        if delay is None:
+            delay = min(RETRY_DELAY * 2 ** (job.attempt - 1), MAX_RETRY_DELAY)
+        with self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET state = 'queued', available_at = ?, error = ?"
+                " WHERE id = ? AND attempts = ? AND state = 'running'",
+                (time.time() + delay, error, job.id, job.attempt),
+            )
+        return True
+
+    def fail(self, job: Job, error: str) -> bool:
+        """
+        Mark a job as failed without further attempts.
+
+        Args:
+            job: Job claimed by this worker
+            error: Why the job failed
+
+        Returns:
+            False if the job had meanwhile been taken by another attempt
+        """
+        return self._finish(job, "failed", error)
+
+    def _finish(self, job: Job, state: str, error: Optional[str]) -> bool:
+        with self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished_at = ?"
+                " WHERE id = ? AND attempts = ? AND state = 'running'",
+                (state, error, time.time(), job.id, job.attempt),
+            )
+        return cursor.rowcount == 1
+
+    def step_done(self, job_id: int, step: str) -> bool:
+        """Whether an attempt of the job has already carried out a step."""
+        return self._connection.execute(
+            "SELECT 1 FROM job_steps WHERE job_id = ? AND step = ?", (job_id, step)
+        ).fetchone() is not None
+
+    def mark_step(self, job_id: int, step: str) -> None:
+        """Record that a step of the job has been carried out."""
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO job_steps (job_id, step) VALUES (?, ?)", (job_id, step)
+            )
+
+    def step_value(self, job_id: int, step: str) -> Optional[str]:
+        """
+        Get the value an attempt of the job recorded with a step.
+
+        Values are stored as steps named "<step>:<value>".
+
+        Args:
+            job_id: Job the step belongs to
+            step: Name of the step
+
+        Returns:
+            The recorded value, or None if the step was not carried out
+        """
+        prefix = f"{step}:"
+        row = self._connection.execute(
+            "SELECT step FROM job_steps WHERE job_id = ? AND substr(step, 1, ?) = ?",
+            (job_id, len(prefix), prefix),
+        ).fetchone()
+        return None if row is None else row[0][len(prefix):]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the jobs in every state.
+
+        Returns:
+            Mapping of state ("queued", "running", "done", "failed") to count
+        """
+        return dict(self._connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def purge(self, retention: float = DEFAULT_RETENTION) -> int:
+        """
+        Delete jobs that finished long enough ago, with their steps.
+
+        Args:
+            retention: Seconds finished jobs are kept
+
+        Returns:
+            Number of deleted jobs
+        """
+        cutoff = time.time() - retention
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM job_steps WHERE job_id IN"
+                " (SELECT id FROM jobs WHERE finished_at < ?)",
+                (cutoff,),
+            )
+            cursor = self._connection.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        return cursor.rowcount
+
+
+class JobSteps:
+    """
+    The steps of one job that earlier attempts have already carried out.
+
+    Sending code checks done() before it sends a message and calls mark()
+    right after, so a retried job does not send the same message twice.
+    Steps that create something record its identifier with mark_value(), so
+    a retry reuses it instead of creating it again.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: int) -> None:
+        self.queue = queue
+        self.job_id = job_id
+
+    def done(self, step: str) -> bool:
+        return self.queue.step_done(self.job_id, step)
+
+    def mark(self, step: str) -> None:
+        self.queue.mark_step(self.job_id, step)
+
+    def value(self, step: str) -> Optional[str]:
+        return self.queue.step_value(self.job_id, step)
+
+    def mark_value(self, step: str, value) -> None:
+        self.queue.mark_step(self.job_id, f"{step}:{value}")
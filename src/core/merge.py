@@ -0,0 +1,385 @@
+"""
+Merging many question files into one bank.
+
+Departments keep their questions in separate files, in any of the input
+formats. merge_files() parses the files concurrently in worker processes;
+each worker streams its file into a temporary spool of JSON lines, so no
+process holds a whole file's questions. The spools are then read back in
+the order the files were given, the questions are renumbered globally,
+checked for duplicates across the whole merged set and streamed straight
+into the output sinks. The duplicate check does not keep the questions: it
+holds a (file, line, id) reference and fingerprints per question, plus the
+normalized text of short questions for the similarity check (see
+DuplicateTracker).
+
+Every merged question keeps the file and line it came from in
+"source_file" and "source_line", and a table of the sources is written next
+to the outputs so problems found in the merged bank can be fixed in the
+original files.
+"""
+
+import codecs
+import csv
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.core.duplicate_checker import question_signature
+from src.core.parser import (
+    SNIFF_SIZE,
+    ValidationProblem,
+    detect_input_format,
+    iter_hemis_entries,
+    iter_question_blocks,
+    parse_json_file,
+    parse_question_block,
+    sniff_input_format,
+)
+from src.core.pipeline import DuplicateTracker, question_line
+from src.core.registry import RenderResult, get_format, render_formats
+
+DEFAULT_MERGE_FORMATS = ("hemis",)
+
+
+class SourceProblem(NamedTuple):
+    """A problem found while merging, located in its source file."""
+
+    source_file: str
+    line: Optional[int]
+    question_id: Optional[int]
+    code: str
+    message: str
+
+
+class MergeResult(NamedTuple):
+    """Outcome of merging files into one bank."""
+
+    question_count: int
+    problems: List[SourceProblem]
+    outputs: List[RenderResult]
+    sources_path: str
+
+
+def text_file_encoding(input_path: str) -> str:
+    """
+    Find the encoding of a question text file without loading it whole.
+
+    Args:
+        input_path: Path to the text file
+
+    Returns:
+        "utf-8", or "cp1251" (the fallback of read_text_file) if the file is
+        not valid UTF-8
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(input_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "cp1251"
+    return "utf-8"
+
+
+def _iter_block_questions(
+    lines, problems: List[ValidationProblem]
+) -> Iterator[Tuple[Optional[int], Optional[Dict]]]:
+    """Parse and validate question blocks, one (line, question) per block."""
+    for index, start_line, block in iter_question_blocks(lines):
+        question = parse_question_block(block, index, start_line, problems)
+        yield question_line(block, start_line), question
+
+
+def iter_source_questions(
+    input_path: str, problems: List[ValidationProblem]
+) -> Iterator[Tuple[Optional[int], Optional[Dict]]]:
+    """
+    Stream the questions of one input file of any format.
+
+    Args:
+        input_path: Path to a text, HEMIS, Word or JSON question file
+        problems: List that receives the validation problems of text and
+            Word files, numbered by file block
+
+    Yields:
+        Tuples of (line of the question, question dictionary) in file order;
+        blocks without a question give a None question so that problems can
+        be matched to the block that caused them. JSON files have no lines.
+    """
+    input_format = sniff_input_format(input_path)
+
+    if input_format == "json":
+        for question in parse_json_file(input_path)["questions"]:
+            yield None, question
+    elif input_format == "docx":
+        from src.core.docx_reader import iter_docx_lines
+
+        yield from _iter_block_questions(iter_docx_lines(input_path), problems)
+    elif input_format == "hemis":
+        with open(input_path, "r", encoding=text_file_encoding(input_path), newline="") as file:
+            yield from iter_hemis_entries(file)
+    else:
+        with open(input_path, "r", encoding=text_file_encoding(input_path)) as file:
+            yield from _iter_block_questions(file, problems)
+
+
+def iter_content_questions(
+    content: bytes, problems: List[ValidationProblem]
+) -> Iterator[Tuple[Optional[int], Optional[Dict]]]:
+    """
+    Stream the questions of a question file held in memory.
+
+    Args:
+        content: Bytes of a text, HEMIS, Word or JSON question file
+        problems: List that receives the validation problems of text and
+            Word files, numbered by file block
+
+    Yields:
+        Tuples of (line of the question, question dictionary), as
+        iter_source_questions()
+    """
+    input_format = detect_input_format(content[:SNIFF_SIZE])
+
+    if input_format == "json":
+        for question in json.loads(content)["questions"]:
+            yield None, question
+        return
+    if input_format == "docx":
+        from src.core.docx_reader import iter_docx_lines
+
+        yield from _iter_block_questions(iter_docx_lines(io.BytesIO(content)), problems)
+        return
+
+    try:
+        text = content.decode("utf-8")
+    except UnicodeDecodeError:
+        text = content.decode("cp1251")
+    if input_format == "hemis":
+        yield from iter_hemis_entries(io.StringIO(text, newline=""))
+    else:
+        yield from _iter_block_questions(io.StringIO(text, newline=None), problems)
+
+
+def _spool_questions(source, problems: List[ValidationProblem], spool_path: str) -> List[Tuple]:
+    """
+    Write the (line, question) pairs of one file into a spool of JSON lines.
+
+    Returns the file's validation problems as (line, position of the
+    block's question in the file or None, code, message) tuples.
+    """
+    spooled: List[Tuple] = []
+    position = 0
+
+    with open(spool_path, "w", encoding="utf-8") as spool:
+        for line, question in source:
+            block_position = None
+            if question is not None:
+                spool.write(json.dumps([line, question], ensure_ascii=False) + "\n")
+                block_position = position
+                position += 1
+            # Problems reported for this block are tagged with its question
+            spooled.extend(
+                (problem.line, block_position, problem.code, problem.message)
+                for problem in problems
+            )
+            problems.clear()
+
+    return spooled
+
+
+def _spool_file(input_path: str, spool_path: str) -> List[Tuple]:
+    """Parse one file into a spool of JSON lines (see _spool_questions())."""
+    problems: List[ValidationProblem] = []
+    return _spool_questions(iter_source_questions(input_path, problems), problems, spool_path)
+
+
+def spool_content(content: bytes, spool_path: str) -> List[Tuple]:
+    """
+    Parse a question file held in memory into a spool for merge_spools().
+
+    Args:
+        content: Bytes of the question file
+        spool_path: Path of the spool to write
+
+    Returns:
+        The file's validation problems as (line, position of the block's
+        question in the file or None, code, message) tuples
+    """
+    problems: List[ValidationProblem] = []
+    return _spool_questions(iter_content_questions(content, problems), problems, spool_path)
+
+
+def merge_questions(
+    input_paths: Sequence[str],
+    spool_dir: str,
+    problems: List[SourceProblem],
+    max_workers: Optional[int] = None,
+) -> Iterator[Dict]:
+    """
+    Stream the questions of several files as one globally numbered bank.
+
+    Args:
+        input_paths: Files to merge, in the order their questions should appear
+        spool_dir: Folder for the temporary spool files
+        problems: List that receives validation and duplicate problems
+        max_workers: Number of worker processes (1 parses in this process)
+
+    Yields:
+        Questions numbered from 1 across all files, with "source_file" and
+        "source_line" set
+    """
+    spool_paths = [
+        os.path.join(spool_dir, f"{number}.jsonl") for number in range(len(input_paths))
+    ]
+
+    if max_workers == 1 or len(input_paths) <= 1:
+        results = map(_spool_file, input_paths, spool_paths)
+        executor = None
+    else:
+        # Files are parsed ahead into their spools while earlier files are
+        # being merged; results come back in the order of the files
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(_spool_file, input_paths, spool_paths)
+
+    try:
+        yield from merge_spools(zip(input_paths, spool_paths, results), problems)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def merge_spools(
+    spooled: Iterable[Tuple[str, str, List[Tuple]]], problems: List[SourceProblem]
+) -> Iterator[Dict]:
+    """
+    Read spooled files back as one globally numbered, duplicate-checked bank.
+
+    Args:
+        spooled: (name of the file, path of its spool, problems returned by
+            spool_content()) of every file in merge order; the name is used
+            in "source_file" and in the problems
+        problems: List that receives validation and duplicate problems
+
+    Yields:
+        Questions numbered from 1 across all files, with "source_file" and
+        "source_line" set; every spool is removed once it has been read
+    """
+    duplicates = DuplicateTracker()
+    question_id = 0
+    for input_path, spool_path, file_problems in spooled:
+        first_id = question_id + 1
+        problems.extend(
+            SourceProblem(
+                input_path,
+                line,
+                None if position is None else first_id + position,
+                code,
+                message,
+            )
+            for line, position, code, message in file_problems
+        )
+
+        with open(spool_path, "r", encoding="utf-8") as spool:
+            for record in spool:
+                line, question = json.loads(record)
+                question_id += 1
+                question["id"] = question_id
+                question["source_file"] = input_path
+                question["source_line"] = line
+                found = duplicates.add(question, question_signature(question), line)
+                problems.extend(
+                    SourceProblem(input_path, line, question_id, problem.code, problem.message)
+                    for problem in found
+                )
+                yield question
+        os.unlink(spool_path)
+
+
+def _write_sources(
+    questions: Iterator[Dict], output_path: str, counter: List[int]
+) -> Iterator[Dict]:
+    """Pass questions through, writing where each came from and counting them."""
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Savol", "Fayl", "Qator"])
+        for question in questions:
+            writer.writerow(
+                [question["id"], question["source_file"], question["source_line"] or ""]
+            )
+            counter[0] += 1
+            yield question
+
+
+def merge_files(
+    input_paths: Sequence[str],
+    output_dir: str,
+    file_name: str,
+    formats: Sequence[str] = DEFAULT_MERGE_FORMATS,
+    max_workers: Optional[int] = None,
+) -> MergeResult:
+    """
+    Merge question files into one bank and render it.
+
+    Args:
+        input_paths: Files to merge, in the order their questions should appear
+        output_dir: Folder where the merged outputs are written
+        file_name: Base name for the output files
+        formats: Registered output formats to render the merged bank in
+        max_workers: Number of worker processes (1 parses in this process)
+
+    Returns:
+        Merge result with the number of questions, the problems found in
+        the files and across them, the rendered outputs and the path of the
+        sources table ("{file_name}_Manba.csv")
+    """
+    for format_type in formats:
+        get_format(format_type)  # Fail early on unknown formats
+
+    os.makedirs(output_dir, exist_ok=True)
+    sources_path = os.path.join(output_dir, f"{file_name}_Manba.csv")
+    problems: List[SourceProblem] = []
+    counter = [0]
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        questions = merge_questions(input_paths, spool_dir, problems, max_workers)
+        try:
+            outputs = render_formats(
+                _write_sources(questions, sources_path, counter),
+                formats,
+                output_dir,
+                file_name,
+            )
+        finally:
+            # Stop the workers before their spool folder is removed
+            questions.close()
+
+    return MergeResult(counter[0], problems, outputs, sources_path)
+
+
+def format_source_problems(problems: List[SourceProblem], limit: Optional[int] = None) -> str:
+    """
+    Format merge problems as a report, one problem per line.
+
+    Args:
+        problems: Problems to report
+        limit: Show at most this many problems
+
+    Returns:
+        Report text with "file:line" locations
+    """
+    shown = problems if limit is None else problems[:limit]
+    lines = []
+    for problem in shown:
+        location = problem.source_file
+        if problem.line is not None:
+            location += f":{problem.line}"
+        if problem.question_id is not None:
+            location += f" (Question {problem.question_id})"
+        lines.append(f"{location}: {problem.message}")
+    if len(problems) > len(shown):
+        lines.append(f"... and {len(problems) - len(shown)} more")
+    return "\n".join(lines)
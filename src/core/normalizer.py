@@ -0,0 +1,150 @@
+"""
+Text normalization and fingerprints for duplicate detection.
+
+Questions typed by different teachers differ in ways that do not change their
+meaning: the several apostrophes used in Uzbek Latin (o', o‘, oʻ), Cyrillic
+letters that look exactly like Latin ones, letter case, punctuation and
+spacing, and the question number in front of the text. normalize_text()
+removes these differences with Unicode NFKC, casefolding and a single
+str.translate() call over a precomputed table.
+
+Punctuation that changes what a text says is kept: "#", "%" and "/" (C and
+C#, 50% and 50, 1/2), a minus sign in front of a number (-1 and 1) and the
+decimal separator between digits (1.2 and 12). fingerprint() reduces the
+normalized text to a 64-bit integer so that indexes over large banks store
+integers instead of full strings.
+"""
+
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional
+
+# Characters used in place of the Uzbek apostrophe (o', g')
+APOSTROPHES = "ʻʼʽʹ‘’‛′`´"
+
+# Lowercase Cyrillic and Greek letters that look like Latin letters
+HOMOGLYPHS = {
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i",
+    "ј": "j", "ѕ": "s", "һ": "h", "ԛ": "q", "ԝ": "w", "ӏ": "l",
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p",
+    "τ": "t", "υ": "u", "χ": "x",
+}
+
+QUESTION_NUMBER_PATTERN = re.compile(r"^\s*\d+\s*[.)]\s*")
+
+# Punctuation kept wherever it appears
+MEANINGFUL_PUNCTUATION = "#%/"
+
+# Candidates for a minus sign in front of a number or a decimal separator
+# between digits; _protect_number_punctuation() checks the decimal separator
+# (a pattern starting with one character class is the fastest to scan)
+_NUMBER_PUNCTUATION = re.compile(r"[-\u2212.,](?=\s*\d)")
+
+# Private use characters the number punctuation is swapped for, so that the
+# translate table does not turn it into spaces; the table swaps them back
+_PROTECTED = {"-": "\ue000", "\u2212": "\ue000", ".": "\ue001", ",": "\ue002"}
+_UNPROTECTED = {"\ue000": "-", "\ue001": ".", "\ue002": ","}
+
+_translate_table: Optional[Dict[int, str]] = None
+
+
+def _build_translate_table() -> Dict[int, str]:
+    """Build the table mapping apostrophes, homoglyphs and punctuation."""
+    table = {}
+    # Punctuation outside the Basic Multilingual Plane is too rare in question
+    # banks to be worth a slower start
+    for codepoint in range(0x10000):
+        category = unicodedata.category(chr(codepoint))
+        if category.startswith("P") or category.startswith("Z") or category == "Cc":
+            # Punctuation, separators and control characters become spaces
+            # and are collapsed afterwards
+            table[codepoint] = " "
+    for char in MEANINGFUL_PUNCTUATION:
+        del table[ord(char)]
+    for char, original in _UNPROTECTED.items():
+        table[ord(char)] = original
+    for char in APOSTROPHES + "'":
+        table[ord(char)] = "'"
+    for char, latin in HOMOGLYPHS.items():
+        table[ord(char)] = latin
+    return table
+
+
+def _protect_number_punctuation(match: "re.Match") -> str:
+    char = match.group()
+    start = match.start()
+    text = match.string
+    if char in ".," and not (start and text[start - 1].isdigit() and text[start + 1].isdigit()):
+        return char
+    return _PROTECTED[char]
+
+
+def _get_translate_table() -> Dict[int, str]:
+    """Return the translate table, building it on first use."""
+    global _translate_table
+    if _translate_table is None:
+        _translate_table = _build_translate_table()
+    return _translate_table
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a text for duplicate comparison.
+
+    Args:
+        text: Question or option text
+
+    Returns:
+        Text after NFKC, casefolding, apostrophe unification, homoglyph
+        folding, removal of punctuation that does not change the meaning and
+        whitespace collapsing
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _NUMBER_PUNCTUATION.sub(_protect_number_punctuation, text)
+    return " ".join(text.translate(_get_translate_table()).split())
+
+
+def normalize_question_text(text: str) -> str:
+    """
+    Normalize a question text, ignoring the question number in front of it.
+
+    Args:
+        text: Question text, possibly starting with "12." or "12)"
+
+    Returns:
+        Normalized question text
+    """
+    return normalize_text(QUESTION_NUMBER_PATTERN.sub("", text, count=1))
+
+
+def fingerprint(normalized_text: str) -> int:
+    """
+    Get the 64-bit fingerprint of a normalized text.
+
+    The fingerprint is stable across processes and runs, unlike hash().
+
+    Args:
+        normalized_text: Text returned by one of the normalize functions
+
+    Returns:
+        Unsigned 64-bit integer
+    """
+    digest = hashlib.blake2b(normalized_text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def combine_fingerprints(fingerprints: Iterable[int]) -> int:
+    """
+    Get one order-independent fingerprint for a set of fingerprints.
+
+    Args:
+        fingerprints: Fingerprints of the members; order and repeats are ignored
+
+    Returns:
+        Unsigned 64-bit integer
+    """
+    packed = b"".join(value.to_bytes(8, "big") for value in sorted(set(fingerprints)))
+    digest = hashlib.blake2b(packed, digest_size=8).digest()
+    return int.from_bytes(digest, "big")
@@ -1,77 +1,369 @@
 """
 Question parser module for test question format converter.
 
-This file contains functions for parsing test questions from text and JSON files.
-It extracts question text, answer variants, and correct answer markers.
+This file contains functions for parsing test questions from text, JSON and
+HEMIS files. It extracts question text, answer variants, and correct answer
+markers. The input format is detected from the file content, not its name.
 """
 
+import io
 import json
 import re
-import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
+from src.core.normalizer import QUESTION_NUMBER_PATTERN
 
-def parse_text_file(input_path: str) -> Dict:
-    """Parse a text file containing test questions and answer variants."""
+
+VARIANT_PATTERN = re.compile(r"^([a-d])\)\s*(\*?)(.+)$")
+# A variant line past d), which VARIANT_PATTERN does not read
+EXTRA_VARIANT_PATTERN = re.compile(r"^([e-z])\)\s*\S")
+
+
+def read_text_file(input_path: str) -> str:
+    """
+    Read a question text file, falling back to cp1251 for non-UTF-8 files.
+
+    Args:
+        input_path: Path to the text file
+
+    Returns:
+        Decoded file content
+    """
     try:
         with open(input_path, "r", encoding="utf-8") as file:
-            content = file.read()
+            return file.read()
     except UnicodeDecodeError:
         with open(input_path, "r", encoding="cp1251") as file:
-            content = file.read()
+            return file.read()
 
-    # Split by double newlines to separate questions
-    question_blocks = content.split("\n\n")
-    questions = []
-    
-    for i, block in enumerate(question_blocks):
-        if not block.strip():
-            continue  # Skip empty blocks
-            
-        lines = [line.strip() for line in block.split("\n") if line.strip()]
-        if not lines:
+
+def iter_question_blocks(lines: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """
+    Split input lines into question blocks separated by an empty line.
+
+    Produces exactly the blocks of content.split("\n\n") without holding
+    the whole content, together with the line number each block starts on.
+
+    Args:
+        lines: Input lines including their trailing newline characters
+
+    Yields:
+        Tuples of (block index, starting line number, block text)
+    """
+    block_lines: List[str] = []
+    index = 0
+    start_line = 1
+
+    for line_number, line in enumerate(lines, start=1):
+        if line == "\n" and block_lines:
+            # Drop the newline that belongs to the separator
+            yield index, start_line, "".join(block_lines)[:-1]
+            index += 1
+            block_lines = []
+            start_line = line_number + 1
             continue
-            
-        # First line is the question
-        question_text = lines[0]
-        
-        # Initialize question object
-        question = {
-            "id": i + 1,
-            "text": question_text,
-            "variants": [],
-            "correct": None,
-        }
-        
-        # Process answer options
-        variant_pattern = re.compile(r"^([a-d])\)\s*(\*?)(.+)$")
-        for line in lines[1:]:
-            variant_match = variant_pattern.match(line)
-            if variant_match:
-                variant_letter = variant_match.group(1)
-                is_correct = bool(variant_match.group(2))
-                variant_text = variant_match.group(3).strip()
-                
-                # Convert letter to number (a->1, b->2, etc.)
-                variant_id = ord(variant_letter) - ord('a') + 1
-                
-                # Add variant
-                question["variants"].append({
-                    "id": variant_id, 
-                    "text": variant_text
-                })
-                
-                # Mark as correct if it has an asterisk
-                if is_correct:
-                    question["correct"] = variant_id
-        
-        # Only add if we have both a question and variants
-        if question["text"] and question["variants"]:
+        block_lines.append(line)
+
+    yield index, start_line, "".join(block_lines)
+
+
+class ValidationProblem(NamedTuple):
+    """A problem found in the input, with the line it was found on."""
+
+    line: int
+    question_id: int
+    code: str
+    message: str
+
+
+# Fewest and most variants a question may have
+MIN_VARIANTS = 2
+MAX_VARIANTS = 4
+
+
+def parse_question_block(
+    block: str,
+    index: int,
+    start_line: int = 1,
+    problems: Optional[List[ValidationProblem]] = None,
+) -> Optional[Dict]:
+    """
+    Parse a single question block.
+
+    When a problems list is given the block is also validated while it is
+    parsed: missing or repeated correct-answer markers, variant letters out of
+    order, too few or too many variants and empty texts are appended to it.
+
+    Args:
+        block: Text of the block (question line followed by variant lines)
+        index: Position of the block in the file, used for the question id
+        start_line: Line number of the first line of the block
+        problems: Optional list that receives validation problems
+
+    Returns:
+        Question dictionary, or None if the block holds no question
+    """
+    if not block.strip():
+        return None  # Skip empty blocks
+
+    lines = [
+        (start_line + offset, line.strip())
+        for offset, line in enumerate(block.split("\n"))
+        if line.strip()
+    ]
+    if not lines:
+        return None
+
+    # First line is the question
+    question_line, question_text = lines[0]
+
+    # Initialize question object
+    question = {
+        "id": index + 1,
+        "text": question_text,
+        "variants": [],
+        "correct": None,
+    }
+
+    def report(line: int, code: str, message: str) -> None:
+        problems.append(ValidationProblem(line, index + 1, code, message))
+
+    if problems is not None and not QUESTION_NUMBER_PATTERN.sub("", question_text):
+        report(question_line, "empty_text", "question text is empty")
+
+    # Process answer options
+    variant_lines = []
+    correct_lines = []
+    for line_number, line in lines[1:]:
+        variant_match = VARIANT_PATTERN.match(line)
+        if variant_match:
+            variant_letter = variant_match.group(1)
+            is_correct = bool(variant_match.group(2))
+            variant_text = variant_match.group(3).strip()
+
+            # Convert letter to number (a->1, b->2, etc.)
+            variant_id = ord(variant_letter) - ord('a') + 1
+
+            # Add variant
+            question["variants"].append({
+                "id": variant_id,
+                "text": variant_text
+            })
+
+            # Mark as correct if it has an asterisk
+            if is_correct:
+                question["correct"] = variant_id
+                correct_lines.append(line_number)
+
+            if problems is not None:
+                variant_lines.append((line_number, variant_letter))
+                if not variant_text.strip("*").strip():
+                    report(line_number, "empty_text", f"variant {variant_letter}) is empty")
+        elif problems is not None:
+            extra_match = EXTRA_VARIANT_PATTERN.match(line)
+            if extra_match:
+                report(
+                    line_number,
+                    "too_many_variants",
+                    f"variant {extra_match.group(1)}) is ignored, at most {MAX_VARIANTS} "
+                    f"variants (a-d) are read",
+                )
+
+    if problems is not None:
+        letters = [letter for _, letter in variant_lines]
+        for position, (line_number, letter) in enumerate(variant_lines):
+            if letter != chr(97 + position):
+                report(
+                    line_number,
+                    "variant_order",
+                    f"variant letters are out of order ({', '.join(letters)})",
+                )
+                break
+        if len(question["variants"]) < MIN_VARIANTS:
+            report(
+                question_line,
+                "too_few_variants",
+                f"{len(question['variants'])} variant(s) found, at least {MIN_VARIANTS} required",
+            )
+        if not correct_lines and question["variants"]:
+            report(question_line, "missing_correct", "no variant is marked with *")
+        for line_number in correct_lines[1:]:
+            report(line_number, "multiple_correct", "more than one variant is marked with *")
+
+    # Only add if we have both a question and variants
+    if question["text"] and question["variants"]:
+        return question
+    return None
+
+
+def parse_text_content(content: str) -> Dict:
+    """
+    Parse the content of a question text file.
+
+    Args:
+        content: Decoded text with questions separated by empty lines
+
+    Returns:
+        Dictionary with parsed questions data
+    """
+    questions = []
+
+    for index, _, block in iter_question_blocks(io.StringIO(content)):
+        question = parse_question_block(block, index)
+        if question:
             questions.append(question)
-    
+
     return {"questions": questions}
 
 
+def parse_text_file(input_path: str) -> Dict:
+    """Parse a text file containing test questions and answer variants."""
+    return parse_text_content(read_text_file(input_path))
+
+
+HEMIS_SEPARATOR = "===="
+HEMIS_QUESTION_SEPARATOR = "++++"
+HEMIS_CORRECT_MARKER = "#"
+
+
+def iter_hemis_entries(lines: Iterable[str]) -> Iterator[Tuple[int, Dict]]:
+    """
+    Parse HEMIS export lines one question at a time, with their line numbers.
+
+    A question is its text, a "====" line, then each variant followed by a
+    "====" line; questions are separated by a "++++" line and the correct
+    variant starts with "#". Separator lines may carry surrounding
+    whitespace, as in detect_input_format(). Texts may span several lines.
+    Only the current question is held in memory.
+
+    Args:
+        lines: Input lines, with or without their trailing newline characters
+
+    Yields:
+        Tuples of (line number the question starts on, question dictionary),
+        with questions numbered from 1 in file order
+    """
+    index = 0
+    start_line = 1
+    chunks: List[str] = []
+    chunk_lines: Optional[List[str]] = None
+
+    def build_question() -> Dict:
+        text, *variant_texts = chunks
+        question = {"id": index + 1, "text": text, "variants": [], "correct": None}
+        for variant_id, variant_text in enumerate(variant_texts, start=1):
+            if variant_text.startswith(HEMIS_CORRECT_MARKER) and question["correct"] is None:
+                variant_text = variant_text[len(HEMIS_CORRECT_MARKER):]
+                question["correct"] = variant_id
+            question["variants"].append({"id": variant_id, "text": variant_text})
+        return question
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip("\r\n")
+        separator = line.strip()
+        if separator == HEMIS_QUESTION_SEPARATOR:
+            if chunk_lines is not None and any(chunk_lines):
+                # Text after the last "====" of a question; keep it as a variant
+                chunks.append("\n".join(chunk_lines))
+            if chunks:
+                yield start_line, build_question()
+                index += 1
+            chunks, chunk_lines = [], None
+            start_line = line_number + 1
+        elif separator == HEMIS_SEPARATOR:
+            chunks.append("\n".join(chunk_lines or []))
+            chunk_lines = None
+        elif chunk_lines is None:
+            chunk_lines = [line]
+        else:
+            chunk_lines.append(line)
+
+    if chunk_lines is not None and any(chunk_lines):
+        chunks.append("\n".join(chunk_lines))
+    if chunks:
+        yield start_line, build_question()
+
+
+def iter_hemis_questions(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Parse HEMIS export lines one question at a time.
+
+    Args:
+        lines: Input lines, with or without their trailing newline characters
+
+    Yields:
+        Question dictionaries numbered from 1 in file order
+    """
+    for _, question in iter_hemis_entries(lines):
+        yield question
+
+
+def parse_hemis(content: str) -> Dict:
+    """
+    Parse the content of a HEMIS export.
+
+    Args:
+        content: Text written by transform_to_program_format() or HemisSink
+
+    Returns:
+        Dictionary with parsed questions data
+    """
+    return {"questions": list(iter_hemis_questions(io.StringIO(content)))}
+
+
+def parse_hemis_file(input_path: str) -> Dict:
+    """Parse a HEMIS export file, streaming it line by line."""
+    try:
+        with open(input_path, "r", encoding="utf-8", newline="") as file:
+            return {"questions": list(iter_hemis_questions(file))}
+    except UnicodeDecodeError:
+        return parse_hemis(read_text_file(input_path))
+
+
+# Bytes read from the start of a file to detect its format
+SNIFF_SIZE = 8192
+
+
+def detect_input_format(head: bytes) -> str:
+    """
+    Detect the format of an input file from its first bytes.
+
+    Args:
+        head: Start of the file content
+
+    Returns:
+        One of "docx", "json", "hemis" or "text"
+    """
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"  # Zip archive
+
+    text = head.decode("utf-8", errors="ignore").lstrip("\ufeff \t\r\n")
+    if text.startswith("{") or text.startswith("["):
+        return "json"
+
+    # Drop the last line, which may have been cut in the middle
+    lines = text.splitlines()[:-1] if len(head) >= SNIFF_SIZE else text.splitlines()
+    if any(
+        line.strip() in (HEMIS_SEPARATOR, HEMIS_QUESTION_SEPARATOR) for line in lines
+    ):
+        return "hemis"
+    return "text"
+
+
+def sniff_input_format(input_path: str) -> str:
+    """
+    Detect the format of an input file from its content.
+
+    Args:
+        input_path: Path to the input file
+
+    Returns:
+        One of "docx", "json", "hemis" or "text"
+    """
+    with open(input_path, "rb") as file:
+        return detect_input_format(file.read(SNIFF_SIZE))
+
+
 def parse_json_file(input_path: str) -> Dict:
     """
     Parse a JSON file containing test questions data.
@@ -88,7 +380,7 @@ def parse_json_file(input_path: str) -> Dict:
 
 def parse_input_file(input_path: str) -> Dict:
     """
-    Parse an input file based on its file extension.
+    Parse an input file based on its content.
 
     Args:
         input_path: Path to the input file
@@ -96,9 +388,15 @@ def parse_input_file(input_path: str) -> Dict:
     Returns:
         Dictionary with parsed questions data
     """
-    _, file_extension = os.path.splitext(input_path)
+    input_format = sniff_input_format(input_path)
 
-    if file_extension.lower() == ".json":
+    if input_format == "json":
         return parse_json_file(input_path)
+    elif input_format == "docx":
+        from src.core.docx_reader import parse_docx_file
+
+        return parse_docx_file(input_path)
+    elif input_format == "hemis":
+        return parse_hemis_file(input_path)
     else:
         return parse_text_file(input_path)
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Fused parse, validate and duplicate-check pipeline.
+
+Instead of parsing the whole file, then validating it and then checking it
+for duplicates in separate passes, the pipeline reads the input once and
+handles each question block completely before moving to the next one: the
+block is parsed and validated, and its question is checked for exact
+duplicates against the questions seen so far. Every problem carries the line
+it was found on, and processing can stop as soon as a given number of
+problems has been found, without reading the rest of the input.
+
+Problems with a code in WARNING_CODES are likely rather than certain
+(reworded duplicates and texts a few characters apart); they are reported
+but do not block an upload.
+"""
+
+import io
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.core.parser import (
+    ValidationProblem,
+    iter_question_blocks,
+    parse_question_block,
+    read_text_file,
+)
+from src.core.duplicate_checker import (
+    DUPLICATE_WARNINGS_HEADER,
+    NO_DUPLICATES_REPORT,
+    QuestionSignature,
+    question_signature,
+)
+from src.core.normalizer import normalize_question_text
+from src.core.similarity import SHORT_QUESTION_LENGTH, SimilarTextIndex
+
+
+# Codes of the problems DuplicateTracker reports
+DUPLICATE_CODES = frozenset(
+    {
+        "duplicate_question",
+        "similar_question",
+        "conflicting_answers",
+        "same_answers",
+        "duplicate_option",
+        "similar_option",
+    }
+)
+
+# Codes of the problems that are reported as warnings only
+WARNING_CODES = frozenset(
+    {"same_answers", "conflicting_answers", "similar_question", "similar_option"}
+)
+
+
+class PipelineResult(NamedTuple):
+    """Outcome of running the pipeline over an input."""
+
+    json_data: Dict
+    problems: List[ValidationProblem]
+    stopped_early: bool
+
+
+def question_line(block: str, start_line: int) -> int:
+    """
+    Get the line number of the question line of a block.
+
+    Args:
+        block: Text of the block
+        start_line: Line number of the first line of the block
+
+    Returns:
+        Line number of the first non-empty line of the block
+    """
+    for offset, line in enumerate(block.split("\n")):
+        if line.strip():
+            return start_line + offset
+    return start_line
+
+
+def analyse_block(
+    block: str, index: int, start_line: int
+) -> Tuple[Optional[Dict], Optional[QuestionSignature], List[ValidationProblem]]:
+    """
+    Parse, validate and sign a single question block.
+
+    Args:
+        block: Text of the block
+        index: Position of the block in the file
+        start_line: Line number of the first line of the block
+
+    Returns:
+        Tuple of the question (or None), its duplicate-check signature
+        (or None) and the validation problems of the block
+    """
+    problems: List[ValidationProblem] = []
+    question = parse_question_block(block, index, start_line, problems)
+    signature = question_signature(question) if question else None
+    return question, signature, problems
+
+
+class QuestionRef(NamedTuple):
+    """Where a question was seen, as kept by DuplicateTracker."""
+
+    id: int
+    source_file: Optional[str]
+    line: int
+
+
+class DuplicateTracker:
+    """
+    Finds duplicates as questions arrive one at a time.
+
+    The questions themselves are not kept. For every question the tracker
+    holds a QuestionRef under the fingerprint of its text and of its answer
+    set (with the fingerprint of its correct answer), and the normalized
+    text of questions of at most SHORT_QUESTION_LENGTH characters for the
+    edit-distance check. Exact matches are found by their 64-bit
+    fingerprints alone, without confirming them on the texts as
+    check_for_duplicates() does.
+    """
+
+    def __init__(self) -> None:
+        self._questions: Dict[int, QuestionRef] = {}
+        self._answer_sets: Dict[int, Tuple[QuestionRef, Optional[int]]] = {}
+        self._similar_questions = SimilarTextIndex()
+
+    def add(
+        self, question: Dict, signature: QuestionSignature, line: int
+    ) -> List[ValidationProblem]:
+        """
+        Check a question against the questions added before it.
+
+        Args:
+            question: Question dictionary
+            signature: Signature of the question
+            line: Line number of the question line
+
+        Returns:
+            Duplicate problems found for this question
+        """
+        ref = QuestionRef(question["id"], question.get("source_file"), line)
+        problems = []
+
+        first = self._questions.setdefault(signature.text_key, ref)
+        if first is not ref:
+            problems.append(
+                ValidationProblem(
+                    line,
+                    question["id"],
+                    "duplicate_question",
+                    f"identical to Question {first.id}",
+                )
+            )
+
+        text = normalize_question_text(question["text"])
+        if len(text) <= SHORT_QUESTION_LENGTH:
+            similar = self._similar_questions.add(text, ref)
+            if similar is not None:
+                other, distance, score = similar
+                problems.append(
+                    ValidationProblem(
+                        line,
+                        question["id"],
+                        "similar_question",
+                        f"differs from Question {other.id} by {distance} "
+                        f"character(s), {score:.0%} similar",
+                    )
+                )
+
+        if signature.answer_set_key is not None:
+            same_set, correct_key = self._answer_sets.setdefault(
+                signature.answer_set_key, (ref, signature.correct_key)
+            )
+            if same_set is not ref and correct_key != signature.correct_key:
+                problems.append(
+                    ValidationProblem(
+                        line,
+                        question["id"],
+                        "conflicting_answers",
+                        f"same variants as Question {same_set.id} but a different correct answer",
+                    )
+                )
+            elif same_set is not ref and first is ref:
+                problems.append(
+                    ValidationProblem(
+                        line,
+                        question["id"],
+                        "same_answers",
+                        f"same variants and correct answer as Question {same_set.id}",
+                    )
+                )
+
+        for first_option, option in signature.option_duplicates:
+            problems.append(
+                ValidationProblem(
+                    line,
+                    question["id"],
+                    "duplicate_option",
+                    f"options {chr(96 + first_option['id'])} and "
+                    f"{chr(96 + option['id'])} are identical",
+                )
+            )
+
+        for first_option, option, distance, score in signature.similar_options:
+            problems.append(
+                ValidationProblem(
+                    line,
+                    question["id"],
+                    "similar_option",
+                    f"options {chr(96 + first_option['id'])} and "
+                    f"{chr(96 + option['id'])} differ by {distance} "
+                    f"character(s), {score:.0%} similar",
+                )
+            )
+
+        return problems
+
+
+def run_pipeline(lines: Iterable[str], max_errors: Optional[int] = None) -> PipelineResult:
+    """
+    Parse, validate and duplicate-check questions in one pass over the input.
+
+    Args:
+        lines: Input lines including their trailing newline characters
+        max_errors: Stop after this many problems (None checks everything)
+
+    Returns:
+        Pipeline result with the questions parsed so far and the problems
+    """
+    questions = []
+    problems: List[ValidationProblem] = []
+    duplicates = DuplicateTracker()
+
+    for index, start_line, block in iter_question_blocks(lines):
+        question, signature, block_problems = analyse_block(block, index, start_line)
+        problems.extend(block_problems)
+
+        if question is not None:
+            questions.append(question)
+            problems.extend(
+                duplicates.add(question, signature, question_line(block, start_line))
+            )
+
+        if max_errors is not None and len(problems) >= max_errors:
+            return PipelineResult({"questions": questions}, problems[:max_errors], True)
+
+    return PipelineResult({"questions": questions}, problems, False)
+
+
+def run_pipeline_on_file(input_path: str, max_errors: Optional[int] = None) -> PipelineResult:
+    """
+    Run the pipeline over a question text file.
+
+    Args:
+        input_path: Path to the text file
+        max_errors: Stop after this many problems (None checks everything)
+
+    Returns:
+        Pipeline result with the questions parsed so far and the problems
+    """
+    try:
+        with open(input_path, "r", encoding="utf-8") as file:
+            return run_pipeline(file, max_errors)
+    except UnicodeDecodeError:
+        return run_pipeline(io.StringIO(read_text_file(input_path)), max_errors)
+
+
+def split_problems(
+    problems: List[ValidationProblem],
+) -> Tuple[List[ValidationProblem], List[ValidationProblem]]:
+    """
+    Split problems into those that block an upload and the warnings.
+
+    Args:
+        problems: Problems in input order
+
+    Returns:
+        Tuple of the blocking problems and the warnings, in input order
+    """
+    blocking = [problem for problem in problems if problem.code not in WARNING_CODES]
+    warnings = [problem for problem in problems if problem.code in WARNING_CODES]
+    return blocking, warnings
+
+
+def format_problems(problems: List[ValidationProblem], limit: Optional[int] = None) -> str:
+    """
+    Format problems as a report, one problem per line.
+
+    Args:
+        problems: Problems to report
+        limit: Show at most this many problems
+
+    Returns:
+        Report text
+    """
+    shown = problems if limit is None else problems[:limit]
+    lines = [
+        f"Line {problem.line} (Question {problem.question_id}): {problem.message}"
+        for problem in shown
+    ]
+    if len(problems) > len(shown):
+        lines.append(f"... and {len(problems) - len(shown)} more")
+    return "\n".join(lines)
+
+
+def format_duplicate_problems(problems: List[ValidationProblem]) -> str:
+    """
+    Format the problems found by DuplicateTracker as a duplicate report.
+
+    Args:
+        problems: Duplicate problems in input order
+
+    Returns:
+        Report with the blocking duplicates first and the warnings after
+        DUPLICATE_WARNINGS_HEADER, readable by split_duplicate_report()
+    """
+    if not problems:
+        return NO_DUPLICATES_REPORT
+    blocking, warnings = split_problems(problems)
+    sections = []
+    if blocking:
+        sections.append(format_problems(blocking))
+    if warnings:
+        sections.append(DUPLICATE_WARNINGS_HEADER + "\n" + format_problems(warnings))
+    return "\n\n".join(sections)
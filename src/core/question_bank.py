@@ -0,0 +1,339 @@
+"""
+Local SQLite store of every accepted question bank, with full-text search.
+
+Each accepted upload is saved as a bank row and one row per question. An
+FTS5 index over the question text and the variant texts answers searches
+without scanning the stored questions.
+
+Searches are always limited to one teacher's own banks, so every indexed
+word is stored with its owner as a prefix ("u42_fotosintez"). A query then
+reads only the posting lists of that owner's words, and its cost depends on
+the size of the owner's banks, not on how many questions of other users the
+database holds: a common word costs the same with a thousand stored
+questions or millions.
+
+Exports read the matching questions through a cursor, one row at a time, so
+they can be streamed into the output sinks of the registry.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+DEFAULT_BANK_PATH = "question_bank.db"
+
+# Hits listed by one search
+DEFAULT_SEARCH_LIMIT = 10
+
+# Words of indexed texts and search queries; everything else (FTS5
+# operators, quotes, punctuation) is ignored so user input can never be a
+# malformed query
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    question_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (owner, content_hash)
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    bank_id INTEGER NOT NULL REFERENCES banks (id),
+    number INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_bank ON questions (bank_id, number);
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5 (
+    terms,
+    content = '',
+    tokenize = "unicode61 remove_diacritics 2 tokenchars '_'"
+);
+"""
+
+
+class SearchHit(NamedTuple):
+    """One question found by a search."""
+
+    bank_id: int
+    file_name: str
+    number: int
+    question: Dict
+
+
+def owner_prefix(user_id) -> str:
+    """
+    Get the prefix of the indexed words of one user.
+
+    Args:
+        user_id: Telegram user id
+
+    Returns:
+        Prefix put in front of every word the user's questions are indexed by
+    """
+    return f"u{user_id}_"
+
+
+def index_terms(question: Dict, user_id) -> str:
+    """
+    Get the text a question is indexed by.
+
+    Args:
+        question: Question dictionary
+        user_id: Owner of the question
+
+    Returns:
+        The words of the question and its variants, each prefixed with the
+        owner; case and diacritics are folded by the index tokenizer
+    """
+    prefix = owner_prefix(user_id)
+    texts = [question["text"]] + [variant["text"] for variant in question["variants"]]
+    return " ".join(prefix + word for text in texts for word in WORD_PATTERN.findall(text))
+
+
+def build_match_query(query: str, user_id) -> Optional[str]:
+    """
+    Convert free text typed by a user into an FTS5 MATCH expression.
+
+    Every word must appear in the question or its variants; the last word
+    also matches as a prefix, so "fotosin" finds "fotosintez".
+
+    Args:
+        query: Text typed by the user
+        user_id: Owner whose questions are searched
+
+    Returns:
+        MATCH expression, or None if the query has no words
+    """
+    prefix = owner_prefix(user_id)
+    terms = [f'"{prefix}{word}"' for word in WORD_PATTERN.findall(query)]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def bank_hash(questions: Iterable[Dict]) -> str:
+    """
+    Get the fingerprint of a bank's questions, to store each bank only once.
+
+    Args:
+        questions: Questions of the bank
+
+    Returns:
+        Hex digest of the questions' content
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for question in questions:
+        digest.update(json.dumps(question, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QuestionBank:
+    """
+    SQLite database of accepted question banks.
+
+    Attributes:
+        path: Path of the database file (":memory:" for a temporary one)
+    """
+
+    def __init__(self, path: str = DEFAULT_BANK_PATH) -> None:
+        self.path = path
+        # Exports are read from the thread that renders them; the bot uses the
+        # bank from one update at a time. Queue workers share the file, so a
+        # writer waits for the others rather than failing
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def add_bank(self, questions: List[Dict], file_name: str, user_id) -> int:
+        """
+        Store an accepted bank and index its questions.
+
+        A bank the same user has already stored with identical questions is
+        not stored again.
+
+        Args:
+            questions: Parsed questions of the bank
+            file_name: Name the bank was uploaded under
+            user_id: Owner of the bank
+
+        Returns:
+            Id of the stored bank
+        """
+        owner = str(user_id)
+        content_hash = bank_hash(questions)
+
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT id FROM banks WHERE owner = ? AND content_hash = ?",
+                (owner, content_hash),
+            ).fetchone()
+            if row is not None:
+                return row[0]
+
+            bank_id = self._connection.execute(
+                "INSERT INTO banks (owner, file_name, content_hash, question_count, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (owner, file_name, content_hash, len(questions), time.time()),
+            ).lastrowid
+
+            first_id = self._connection.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM questions"
+            ).fetchone()[0]
+            self._connection.executemany(
+                "INSERT INTO questions (id, bank_id, number, data) VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        first_id + offset,
+                        bank_id,
+                        question["id"],
+                        json.dumps(question, ensure_ascii=False),
+                    )
+                    for offset, question in enumerate(questions)
+                ),
+            )
+            # The index keeps no copy of the text (content=''), only the
+            # owner-prefixed words, under the id of the question row
+            self._connection.executemany(
+                "INSERT INTO questions_fts (rowid, terms) VALUES (?, ?)",
+                (
+                    (first_id + offset, index_terms(question, user_id))
+                    for offset, question in enumerate(questions)
+                ),
+            )
+        return bank_id
+
+    def load_bank(self, bank_id: int, user_id) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Read back a stored bank.
+
+        Args:
+            bank_id: Id returned by add_bank()
+            user_id: User asking for the bank; other users' banks are not
+                returned
+
+        Returns:
+            The file name the bank was uploaded under and its questions in
+            order, or None if the user has no such bank
+        """
+        row = self._connection.execute(
+            "SELECT file_name FROM banks WHERE id = ? AND owner = ?", (bank_id, str(user_id))
+        ).fetchone()
+        if row is None:
+            return None
+        rows = self._connection.execute(
+            "SELECT data FROM questions WHERE bank_id = ? ORDER BY number", (bank_id,)
+        )
+        return row[0], [json.loads(data) for (data,) in rows]
+
+    def latest_bank(self, user_id) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Read back the bank a user stored last.
+
+        Args:
+            user_id: Owner of the bank
+
+        Returns:
+            The file name and questions of the bank (see load_bank()), or
+            None if the user has stored no bank
+        """
+        row = self._connection.execute(
+            "SELECT id FROM banks WHERE owner = ? ORDER BY id DESC LIMIT 1", (str(user_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        return self.load_bank(row[0], user_id)
+
+    def search(self, query: str, user_id, limit: int = DEFAULT_SEARCH_LIMIT) -> List[SearchHit]:
+        """
+        Find the stored questions of a user that best match a query.
+
+        Args:
+            query: Words to look for in questions and variants
+            user_id: Owner whose banks are searched
+            limit: Maximum number of hits
+
+        Returns:
+            Hits ordered by relevance, best first
+        """
+        expression = build_match_query(query, user_id)
+        if expression is None:
+            return []
+
+        rows = self._connection.execute(
+            "SELECT q.bank_id, b.file_name, q.number, q.data"
+            " FROM questions_fts"
+            " JOIN questions q ON q.id = questions_fts.rowid"
+            " JOIN banks b ON b.id = q.bank_id"
+            " WHERE questions_fts MATCH ?"
+            " ORDER BY rank LIMIT ?",
+            (expression, limit),
+        )
+        return [
+            SearchHit(bank_id, file_name, number, json.loads(data))
+            for bank_id, file_name, number, data in rows
+        ]
+
+    def count_matches(self, query: str, user_id) -> int:
+        """
+        Count the stored questions of a user that match a query.
+
+        Args:
+            query: Words to look for in questions and variants
+            user_id: Owner whose banks are searched
+
+        Returns:
+            Number of matching questions
+        """
+        expression = build_match_query(query, user_id)
+        if expression is None:
+            return 0
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM questions_fts WHERE questions_fts MATCH ?", (expression,)
+        ).fetchone()[0]
+
+    def iter_matches(self, query: str, user_id) -> Iterator[Dict]:
+        """
+        Stream every stored question of a user that matches a query.
+
+        Questions come in the order they were stored and are renumbered
+        from 1, ready to be fed to the output sinks.
+
+        Args:
+            query: Words to look for in questions and variants
+            user_id: Owner whose banks are searched
+
+        Yields:
+            Question dictionaries
+        """
+        expression = build_match_query(query, user_id)
+        if expression is None:
+            return
+
+        # A separate cursor, so a running export does not block searches
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT q.data FROM questions_fts"
+                " JOIN questions q ON q.id = questions_fts.rowid"
+                " WHERE questions_fts MATCH ? ORDER BY questions_fts.rowid",
+                (expression,),
+            )
+            for number, (data,) in enumerate(cursor, start=1):
+                question = json.loads(data)
+                question["id"] = number
+                yield question
+        finally:
+            cursor.close()
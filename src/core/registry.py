@@ -0,0 +1,351 @@
+"""
+Registry of output formats and single-pass rendering.
+
+Every output format the bot offers is registered here with its button label,
+file name suffix and sink factory. render_formats() walks the question list
+once and feeds every requested sink, so generating several formats costs
+one traversal instead of one per format. New formats are added with
+register_format() and show up in the bot's format keyboard automatically;
+the bot's "all" button only renders the formats registered as default (the
+two student formats, HEMIS and Word), so new formats are opt-in.
+
+With a maximum part size, every format is written through a SplitSink: the
+output is cut into numbered parts at question boundaries whenever the
+estimated size of the current part would exceed the limit, and each part is
+handed to a callback as soon as it is finished.
+
+Text formats described by templates (see src.core.templates) are registered
+with register_templates(); the file named by the OUTPUT_TEMPLATES
+environment variable is loaded when this module is imported.
+"""
+
+import functools
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from src.core.formatters import (
+    QuestionSink,
+    CsvSink,
+    GiftSink,
+    HemisSink,
+    MoodleXmlSink,
+    QtiSink,
+    StudentWordSink,
+    TemplateSink,
+    WordTableSink,
+    XlsxSink,
+)
+from src.core.templates import load_templates
+
+logger = logging.getLogger(__name__)
+
+
+class OutputFormat(NamedTuple):
+    """A registered output format."""
+
+    key: str
+    label: str
+    suffix: str
+    sink_factory: Callable[[str, Optional[Dict]], QuestionSink]
+    default: bool = False
+
+
+class RenderResult(NamedTuple):
+    """Outcome of rendering one format."""
+
+    key: str
+    output_path: str
+    error: Optional[Exception]
+    parts: Tuple[str, ...] = ()
+
+
+def part_path(output_path: str, number: int) -> str:
+    """
+    Get the path of a numbered part of an output file.
+
+    Args:
+        output_path: Path of the whole output, e.g. "out/bank_Hemis.txt"
+        number: Part number, from 1
+
+    Returns:
+        Path with the number before the extension, e.g. "out/bank_Hemis_2.txt"
+    """
+    root, extension = os.path.splitext(output_path)
+    return f"{root}_{number}{extension}"
+
+
+class SplitSink(QuestionSink):
+    """
+    Writes a format in parts that each stay under a size limit.
+
+    A new part is started before a question when the size of the current
+    part plus the largest question seen so far would exceed the limit, so
+    parts only break between questions. A part that holds a single question
+    may still exceed the limit. An output that fits in one part keeps the
+    plain output path; otherwise the parts are numbered (see part_path()).
+
+    Attributes:
+        parts: Paths of the finished parts, in order
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        cache: Optional[Dict],
+        sink_factory: Callable[[str, Optional[Dict]], QuestionSink],
+        max_size: int,
+        on_part: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        super().__init__(output_path, cache)
+        self.sink_factory = sink_factory
+        self.max_size = max_size
+        self.on_part = on_part
+        self.parts: List[str] = []
+
+    def begin(self) -> None:
+        self._largest_question = 0
+        # Fragments used by every part, kept in the cache once all are done
+        self._used_fragments: Dict = {}
+        self._start_part()
+
+    def _start_part(self) -> None:
+        # Each part starts from the cache as it was before the render
+        self._part_cache = dict(self.cache) if self.cache is not None else None
+        self._part_path = part_path(self.output_path, len(self.parts) + 1)
+        self._part = self.sink_factory(self._part_path, self._part_cache)
+        self._part.track_size = True
+        self._part.begin()
+        self._part_questions = 0
+
+    def _finish_part(self, last: bool) -> None:
+        self._part.end()
+        if self._part_cache is not None:
+            self._used_fragments.update(self._part_cache)
+        path = self._part_path
+        if last and not self.parts:
+            # Everything fit in one part
+            os.replace(path, self.output_path)
+            path = self.output_path
+        self.parts.append(path)
+        if self.on_part is not None:
+            self.on_part(path)
+
+    def question(self, question: Dict) -> None:
+        size = self._part.size()
+        if self._part_questions and size + self._largest_question > self.max_size:
+            self._finish_part(last=False)
+            self._start_part()
+            size = self._part.size()
+
+        self._part.question(question)
+        self._part_questions += 1
+        self._largest_question = max(self._largest_question, self._part.size() - size)
+
+    def end(self) -> None:
+        self._finish_part(last=True)
+        if self.cache is not None:
+            self.cache.clear()
+            self.cache.update(self._used_fragments)
+
+
+# Formats in registration order, which is also the keyboard order
+_FORMATS: Dict[str, OutputFormat] = {}
+
+
+def register_format(
+    key: str,
+    label: str,
+    suffix: str,
+    sink_factory: Callable[[str, Optional[Dict]], QuestionSink],
+    default: bool = False,
+) -> None:
+    """
+    Register an output format.
+
+    Args:
+        key: Identifier of the format (also the bot's callback data)
+        label: Button text shown to the user
+        suffix: Appended to the base file name, including the extension
+        sink_factory: Called with (output_path, cache) to create the sink
+        default: Whether the format is rendered when "all" is chosen
+    """
+    if key == "all":
+        raise ValueError('"all" is reserved for selecting the default formats')
+    _FORMATS[key] = OutputFormat(key, label, suffix, sink_factory, default)
+
+
+def register_templates(path: str) -> List[str]:
+    """
+    Register the text formats described in a template file.
+
+    Args:
+        path: Path of the JSON file (see load_templates())
+
+    Returns:
+        Keys of the registered formats
+
+    Raises:
+        TemplateError: If a template in the file is broken
+    """
+    keys = []
+    for template_format in load_templates(path):
+        register_format(
+            template_format.key,
+            template_format.label,
+            template_format.suffix,
+            functools.partial(TemplateSink, template=template_format.template),
+        )
+        keys.append(template_format.key)
+    return keys
+
+
+def get_formats() -> List[OutputFormat]:
+    """
+    Get all registered output formats.
+
+    Returns:
+        List of formats in registration order
+    """
+    return list(_FORMATS.values())
+
+
+def get_default_formats() -> List[OutputFormat]:
+    """
+    Get the output formats rendered when "all" is chosen.
+
+    Returns:
+        List of default formats in registration order
+    """
+    return [output_format for output_format in _FORMATS.values() if output_format.default]
+
+
+def get_format(key: str) -> OutputFormat:
+    """
+    Look up a registered output format.
+
+    Args:
+        key: Identifier of the format
+
+    Returns:
+        The registered format
+
+    Raises:
+        ValueError: If no format is registered under the key
+    """
+    try:
+        return _FORMATS[key]
+    except KeyError:
+        raise ValueError(f"Unknown format: {key}") from None
+
+
+def render_formats(
+    questions: Iterable[Dict],
+    format_keys: Sequence[str],
+    output_dir: str,
+    file_name: str,
+    caches: Optional[Dict[str, Dict]] = None,
+    max_part_size: Optional[int] = None,
+    on_part: Optional[Callable[[str, str], None]] = None,
+) -> List[RenderResult]:
+    """
+    Render several formats in a single pass over the questions.
+
+    A failure in one format does not stop the others; it is returned in the
+    result of that format instead.
+
+    Args:
+        questions: Questions in output order (may be a one-shot iterator)
+        format_keys: Keys of the formats to render
+        output_dir: Folder where the output files are written
+        file_name: Base name of the output files
+        caches: Optional fragment caches per format key, created on demand
+        max_part_size: Split every output into parts of at most about this
+            many bytes (see SplitSink)
+        on_part: Called with (format key, part path) as soon as a part of a
+            split output is finished
+
+    Returns:
+        One result per requested format, in the order requested; split
+        outputs list their parts in "parts"
+    """
+    results = {}
+    sinks = []
+
+    for key in format_keys:
+        output_format = get_format(key)
+        output_path = os.path.join(output_dir, f"{file_name}{output_format.suffix}")
+        cache = caches.setdefault(key, {}) if caches is not None else None
+        try:
+            if max_part_size is None:
+                sink = output_format.sink_factory(output_path, cache)
+            else:
+                sink = SplitSink(
+                    output_path,
+                    cache,
+                    output_format.sink_factory,
+                    max_part_size,
+                    functools.partial(on_part, key) if on_part is not None else None,
+                )
+            sink.begin()
+        except Exception as e:
+            logger.error(f"Error starting {key}: {str(e)}")
+            results[key] = RenderResult(key, output_path, e)
+            continue
+        results[key] = RenderResult(key, output_path, None)
+        sinks.append((key, sink))
+
+    for question in questions:
+        for key, sink in sinks:
+            if results[key].error is not None:
+                continue
+            try:
+                sink.question(question)
+            except Exception as e:
+                logger.error(f"Error processing {key}: {str(e)}")
+                results[key] = results[key]._replace(error=e)
+
+    for key, sink in sinks:
+        if results[key].error is not None:
+            continue
+        try:
+            sink.end()
+        except Exception as e:
+            logger.error(f"Error saving {key}: {str(e)}")
+            results[key] = results[key]._replace(error=e)
+
+    for key, sink in sinks:
+        if isinstance(sink, SplitSink):
+            results[key] = results[key]._replace(parts=tuple(sink.parts))
+
+    return [results[key] for key in format_keys]
+
+
+# Built-in formats
+register_format(
+    "student",
+    "Talaba formati",
+    "_TalabaVariant.docx",
+    functools.partial(StudentWordSink, include_variants=True),
+    default=True,
+)
+register_format(
+    "student_novariant",
+    "Variantsiz talaba formati",
+    "_TalabaNovariant.docx",
+    functools.partial(StudentWordSink, include_variants=False),
+    default=True,
+)
+register_format("hemis", "HEMIS formati", "_Hemis.txt", HemisSink, default=True)
+register_format("word", "Jadval (Word) formati", "_Yakuniy.docx", WordTableSink, default=True)
+# Opt-in formats, chosen with their own buttons
+register_format("xlsx", "Excel jadvali", "_Jadval.xlsx", XlsxSink)
+register_format("csv", "CSV jadvali", "_Jadval.csv", CsvSink)
+register_format("gift", "Moodle GIFT formati", "_GIFT.txt", GiftSink)
+register_format("moodle", "Moodle XML formati", "_Moodle.xml", MoodleXmlSink)
+register_format("qti", "QTI 2.1 paketi", "_QTI.zip", QtiSink)
+
+# Institution formats; workers are spawned with the same environment, so
+# they register the same formats
+if os.getenv("OUTPUT_TEMPLATES"):
+    register_templates(os.getenv("OUTPUT_TEMPLATES"))
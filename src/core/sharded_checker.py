@@ -0,0 +1,183 @@
+"""
+Sharded multi-process duplicate detection for very large banks.
+
+For a whole bank held in memory, a single process spends most of the
+duplicate check computing signatures (normalizing every question and option
+text), replaying the fingerprint indexes and searching for similar texts.
+This module spreads these steps over worker processes. Merging and archive
+uploads stream their questions through DuplicateTracker instead and do not
+use it.
+
+1. Signatures are computed for contiguous chunks of the bank in parallel.
+2. Questions are partitioned into shards by the top bits of their text key
+   and, separately, of their answer-set key. Two questions can only match
+   when their keys are equal, so every possible match lies inside one shard
+   and the shards are checked independently in parallel.
+3. The findings of all shards are merged in bank order and formatted by the
+   same code as the single-process check.
+
+Similar (typo) questions are found by edit distance rather than by key, so
+they cannot be partitioned by key. That check is split by position instead:
+each task looks up one range of the bank and only indexes the questions
+before it, so later ranges redo some indexing but none of the searching.
+
+Inside a shard positions are replayed in bank order, so each question is
+matched with the same earlier question as in the single-process run and the
+report is identical to check_for_duplicates().
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.core.duplicate_checker import (
+    DuplicateFindings,
+    QuestionSignature,
+    find_identical_questions,
+    find_same_answer_sets,
+    find_similar_questions,
+    format_duplicate_report,
+    option_findings,
+    question_signature,
+    similar_option_findings,
+)
+
+# Shards per worker; more shards than workers evens out uneven shard sizes
+SHARDS_PER_WORKER = 4
+
+# Questions shared by every task running in a worker process
+_worker_questions: Optional[Sequence[Dict]] = None
+
+
+def _init_worker(questions: Sequence[Dict]) -> None:
+    """Store the shared questions once per worker process."""
+    global _worker_questions
+    _worker_questions = questions
+
+
+def _chunk_signatures(start: int, end: int) -> List[QuestionSignature]:
+    """Compute the signatures of one contiguous chunk of the shared bank."""
+    return [question_signature(question) for question in _worker_questions[start:end]]
+
+
+def _check_shard(
+    text_keys: List[Tuple[int, int]], answer_keys: List[Tuple[int, int]]
+) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int, bool]]]:
+    """Find identical questions and same answer sets inside one shard."""
+    return (
+        find_identical_questions(_worker_questions, text_keys),
+        find_same_answer_sets(_worker_questions, answer_keys),
+    )
+
+
+def _similar_questions(start: int, end: int) -> List[Tuple[int, int, int, float]]:
+    """Find similar questions in one range of the shared bank."""
+    return find_similar_questions(_worker_questions, start, end)
+
+
+def shard_positions(
+    signatures: Sequence[QuestionSignature], shard_count: int
+) -> List[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]]:
+    """
+    Partition question positions into shards by fingerprint prefix.
+
+    Args:
+        signatures: Signature of each question, in bank order
+        shard_count: Number of shards (rounded up to a power of two)
+
+    Returns:
+        One (text keys, answer-set keys) pair per shard, each a list of
+        (position, key) pairs in bank order. Questions without an answer-set
+        key take no part in that check and are left out.
+    """
+    bits = max(0, (shard_count - 1).bit_length())
+    shift = 64 - bits
+    shards = [([], []) for _ in range(1 << bits)]
+
+    for position, signature in enumerate(signatures):
+        shards[signature.text_key >> shift][0].append((position, signature.text_key))
+        if signature.answer_set_key is not None:
+            key = signature.answer_set_key
+            shards[key >> shift][1].append((position, key))
+
+    return shards
+
+
+def find_duplicates_sharded(
+    questions: Sequence[Dict], workers: Optional[int] = None
+) -> DuplicateFindings:
+    """
+    Find all duplicates of a bank using several worker processes.
+
+    Args:
+        questions: Questions in bank order
+        workers: Number of worker processes (1 checks the shards in this process)
+
+    Returns:
+        Findings equal to find_duplicates() over the same questions
+    """
+    workers = workers or os.cpu_count() or 1
+    shard_count = workers * SHARDS_PER_WORKER
+
+    if workers == 1:
+        _init_worker(questions)
+        try:
+            signatures = _chunk_signatures(0, len(questions))
+            results = [
+                _check_shard(*shard) for shard in shard_positions(signatures, shard_count)
+            ]
+            similar_questions = _similar_questions(0, len(questions))
+        finally:
+            _init_worker(None)
+    else:
+        # The questions go to each worker once through the initializer; only
+        # positions, keys and findings travel with the tasks
+        chunk_size = max(1, -(-len(questions) // shard_count))
+        starts = range(0, len(questions), chunk_size)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(questions,)
+        ) as executor:
+            signatures = []
+            for chunk in executor.map(
+                _chunk_signatures, starts, [start + chunk_size for start in starts]
+            ):
+                signatures.extend(chunk)
+
+            # Ranges of the similarity check start out with equal lengths;
+            # the later ones also index everything before them
+            similar_size = max(1, -(-len(questions) // workers))
+            similar_starts = range(0, len(questions), similar_size)
+            similar_futures = [
+                executor.submit(_similar_questions, start, start + similar_size)
+                for start in similar_starts
+            ]
+            shards = shard_positions(signatures, shard_count)
+            results = list(executor.map(_check_shard, *zip(*shards)))
+            similar_questions = [
+                finding for future in similar_futures for finding in future.result()
+            ]
+
+    identical = sorted(finding for result in results for finding in result[0])
+    answer_sets = sorted(finding for result in results for finding in result[1])
+    return DuplicateFindings(
+        identical,
+        answer_sets,
+        option_findings(signatures),
+        similar_questions,
+        similar_option_findings(signatures),
+    )
+
+
+def check_for_duplicates_sharded(json_data: Dict, workers: Optional[int] = None) -> str:
+    """
+    Check for duplicates like check_for_duplicates(), in parallel.
+
+    Args:
+        json_data: Dictionary containing questions data
+        workers: Number of worker processes (None uses every CPU)
+
+    Returns:
+        A report string identical to check_for_duplicates(json_data)
+    """
+    questions = json_data["questions"]
+    return format_duplicate_report(questions, find_duplicates_sharded(questions, workers))
@@ -0,0 +1,274 @@
+"""
+Typo-tolerant text comparison for duplicate detection.
+
+Exact fingerprints miss copy-paste errors such as "Central Processing Unit"
+and "Central Procesing Unit". This module finds such near-duplicates by edit
+distance. The distance is computed inside a band around the diagonal and
+stops as soon as it exceeds the largest distance that could still be
+reported, so unrelated texts are rejected after a few rows.
+
+Larger sets of texts are indexed by segments: a text within distance k of
+another text split into k + 1 segments must contain one of those segments
+unchanged, near its original position. Only texts sharing such a segment
+are compared. A BK-tree does not help here: similarity is relative to the
+text length, so the search radius of a question (a tenth of its length) is
+too large for the triangle inequality to prune much.
+
+Texts that differ in their numbers ("1990" and "1991", "2 + 2" and "2 + 3")
+are never reported: a changed number changes the meaning, it is not a typo.
+
+Texts are expected to be normalized already (see src.core.normalizer).
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Smallest normalized similarity (1 - distance / longer length) reported
+SIMILARITY_THRESHOLD = 0.9
+
+# Question texts longer than this many normalized characters are not
+# compared by edit distance; long texts differing in 10% of their characters
+# are usually different questions
+SHORT_QUESTION_LENGTH = 100
+
+# Sets with more texts than this are searched through the segment index
+# instead of comparing every pair
+SEGMENT_INDEX_MIN_SIZE = 16
+
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def edit_distance(first: str, second: str, max_distance: Optional[int] = None) -> Optional[int]:
+    """
+    Compute the Levenshtein distance of two texts, up to a limit.
+
+    Only the cells within max_distance of the diagonal are computed, and the
+    computation stops as soon as a whole row exceeds max_distance.
+
+    Args:
+        first: First text
+        second: Second text
+        max_distance: Largest distance of interest (None computes it exactly)
+
+    Returns:
+        The distance, or None if it is larger than max_distance
+    """
+    if first == second:
+        return 0
+    if len(first) > len(second):
+        first, second = second, first
+    if max_distance is None:
+        max_distance = len(second)
+    if len(second) - len(first) > max_distance:
+        return None
+
+    # A common prefix and suffix do not change the distance
+    start = 0
+    while start < len(first) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < len(first) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+
+    columns = len(second)
+    if not first:
+        return columns if columns <= max_distance else None
+
+    too_far = max_distance + 1
+    previous = [column if column <= max_distance else too_far for column in range(columns + 1)]
+    for row, char in enumerate(first, start=1):
+        current = [too_far] * (columns + 1)
+        if row <= max_distance:
+            current[0] = row
+        row_min = current[0]
+        for column in range(max(1, row - max_distance), min(columns, row + max_distance) + 1):
+            value = min(
+                previous[column - 1] + (char != second[column - 1]),
+                previous[column] + 1,
+                current[column - 1] + 1,
+            )
+            current[column] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return None
+        previous = current
+
+    distance = previous[columns]
+    return distance if distance <= max_distance else None
+
+
+def similarity(first: str, second: str, distance: int) -> float:
+    """
+    Get the normalized similarity of two texts from their edit distance.
+
+    Args:
+        first: First text
+        second: Second text
+        distance: Edit distance of the two texts
+
+    Returns:
+        1 - distance / length of the longer text, between 0 and 1
+    """
+    longest = max(len(first), len(second))
+    return 1.0 - distance / longest if longest else 1.0
+
+
+def search_radius(text: str, threshold: float = SIMILARITY_THRESHOLD) -> int:
+    """
+    Get the largest distance at which another text can still be similar.
+
+    The other text may be longer than this one by up to the distance itself,
+    so the radius allows for that.
+
+    Args:
+        text: Text being looked up
+        threshold: Smallest similarity of interest
+
+    Returns:
+        Largest distance worth computing
+    """
+    return int((1.0 - threshold) / threshold * len(text) + 1e-9)
+
+
+def number_key(text: str) -> Tuple[str, ...]:
+    """
+    Get the numbers of a text in order; only texts with equal keys can match.
+
+    Args:
+        text: Normalized text
+
+    Returns:
+        Tuple of the digit runs of the text
+    """
+    return tuple(NUMBER_PATTERN.findall(text))
+
+
+def text_segments(text: str, count: int) -> List[Tuple[int, str]]:
+    """
+    Split a text into consecutive segments of nearly equal length.
+
+    Args:
+        text: Text to split
+        count: Number of segments
+
+    Returns:
+        (start, segment) pairs; the longer segments come last
+    """
+    base, longer = divmod(len(text), count)
+    segments = []
+    start = 0
+    for number in range(count):
+        length = base + (1 if number >= count - longer else 0)
+        segments.append((start, text[start:start + length]))
+        start += length
+    return segments
+
+
+class SimilarTextIndex:
+    """
+    Finds earlier texts that are similar, but not identical, to a new text.
+
+    Small sets are compared pair by pair; once the set grows past
+    SEGMENT_INDEX_MIN_SIZE texts only the texts sharing a segment with the
+    new text are compared. Both ways find the same match.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD) -> None:
+        self._threshold = threshold
+        # (text, item, number key) in the order the texts were added
+        self._texts: List[Tuple[str, Any, Tuple[str, ...]]] = []
+        self._seen = set()
+        # (number key, segment) -> (text order, segment start) of the
+        # indexed texts
+        self._segments: Optional[Dict[Tuple, List[Tuple[int, int]]]] = None
+        self._segment_lengths: Set[int] = set()
+
+    def add(self, text: str, item: Any) -> Optional[Tuple[Any, int, float]]:
+        """
+        Add a text and find the most similar earlier text.
+
+        Args:
+            text: Normalized text
+            item: Value returned when a later text matches this one
+
+        Returns:
+            (item, distance, similarity) of the closest earlier similar text
+            with the same numbers, the earliest one on ties, or None. Texts
+            identical to an earlier text are left to the exact check and
+            return None.
+        """
+        if text in self._seen:
+            return None
+        best = self._closest(text)
+        self._insert(text, item)
+        return best
+
+    def insert(self, text: str, item: Any) -> None:
+        """
+        Add a text without looking for similar earlier texts.
+
+        Used to index the texts before a range of positions that is searched
+        on its own (see src.core.sharded_checker).
+
+        Args:
+            text: Normalized text
+            item: Value returned when a later text matches this one
+        """
+        if text not in self._seen:
+            self._insert(text, item)
+
+    def _closest(self, text: str) -> Optional[Tuple[Any, int, float]]:
+        """Find the closest similar text among the texts added so far."""
+        # Any similar pair is within the search radius of both texts, so
+        # the radius of the new text bounds every comparison
+        radius = search_radius(text, self._threshold)
+        numbers = number_key(text)
+        if self._segments is None:
+            orders = range(len(self._texts))
+        else:
+            orders = sorted(self._candidates(text, numbers, radius))
+
+        best = None
+        for order in orders:
+            other, other_item, other_numbers = self._texts[order]
+            if other_numbers != numbers:
+                continue
+            distance = edit_distance(text, other, radius)
+            if distance is None or (best is not None and distance >= best[1]):
+                continue
+            score = similarity(text, other, distance)
+            if score >= self._threshold:
+                best = (other_item, distance, score)
+        return best
+
+    def _insert(self, text: str, item: Any) -> None:
+        """Store a new text and index its segments."""
+        self._seen.add(text)
+        self._texts.append((text, item, number_key(text)))
+        if self._segments is not None:
+            self._index(len(self._texts) - 1)
+        elif len(self._texts) > SEGMENT_INDEX_MIN_SIZE:
+            self._segments = {}
+            for order in range(len(self._texts)):
+                self._index(order)
+
+    def _index(self, order: int) -> None:
+        """Add the segments of one text to the segment index."""
+        text, _, numbers = self._texts[order]
+        for start, segment in text_segments(text, search_radius(text, self._threshold) + 1):
+            self._segments.setdefault((numbers, segment), []).append((order, start))
+            self._segment_lengths.add(len(segment))
+
+    def _candidates(self, text: str, numbers: Tuple[str, ...], radius: int) -> Set[int]:
+        """Orders of the indexed texts sharing numbers and a segment with a text."""
+        candidates = set()
+        for length in self._segment_lengths:
+            for position in range(len(text) - length + 1):
+                key = (numbers, text[position:position + length])
+                for order, start in self._segments.get(key, ()):
+                    if abs(start - position) <= radius:
+                        candidates.add(order)
+        return candidates
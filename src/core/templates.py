@@ -0,0 +1,338 @@
+"""
+Text output templates.
+
+A template describes a text format by how one question and one variant are
+written, in Python's format syntax:
+
+    OutputTemplate(
+        question="{id}. {text}\n{variants}\n",
+        variant="{letter}) {text}",
+    )
+
+Question fields: id, number (position in the output, from 1), text,
+variants (every variant written with the variant template, joined by
+variant_separator) and answer (letter of the correct variant).
+Variant fields: id, letter (a, b, ...), LETTER (A, B, ...), text and mark
+(correct_mark for the correct variant, nothing for the others). Questions
+are joined by separator. Format specifications such as {text:.80} work as
+in str.format().
+
+compile_template() turns a template into Python functions built from
+f-strings, so a template renders as fast as a formatter written by hand.
+Compiled functions are kept in an LRU cache keyed by the template (its
+hash), so every template is compiled once per process. The
+HEMIS and student text formats are built-in templates.
+
+Institutions can add their own text formats: a JSON file named by the
+OUTPUT_TEMPLATES environment variable lists them, each with a key, a button
+label, a file name suffix and the template fields (see load_templates()).
+"""
+
+import functools
+import json
+import string
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+# Compiled templates kept in the cache
+TEMPLATE_CACHE_SIZE = 128
+
+
+class TemplateError(ValueError):
+    """A template cannot be compiled."""
+
+
+class OutputTemplate(NamedTuple):
+    """
+    Text format of questions.
+
+    Attributes:
+        question: Template of one question
+        variant: Template of one variant, used for the {variants} field
+        variant_separator: Written between two variants
+        separator: Written between two questions
+        correct_mark: Value of the {mark} field for the correct variant
+    """
+
+    question: str
+    variant: str = ""
+    variant_separator: str = "\n"
+    separator: str = "\n"
+    correct_mark: str = ""
+
+
+# Expressions of the fields, inside the compiled f-strings
+_QUESTION_FIELDS = {
+    "id": "question['id']",
+    "number": "number",
+    "text": "question['text']",
+    "variants": "variants",
+    "answer": "(chr(96 + question['correct']) if question['correct'] else '')",
+}
+_VARIANT_FIELDS = {
+    "id": "variant['id']",
+    "letter": "chr(96 + variant['id'])",
+    "LETTER": "chr(64 + variant['id'])",
+    "text": "variant['text']",
+    "mark": "(MARK if variant['id'] == correct else '')",
+}
+
+# Variants start with their own line break, so a question without variants
+# is written without an empty line
+HEMIS_TEMPLATE = OutputTemplate(
+    question="{text}\n===={variants}",
+    variant="\n{mark}{text}\n====",
+    variant_separator="",
+    separator="\n++++\n",
+    correct_mark="#",
+)
+STUDENT_TEMPLATE = OutputTemplate(
+    question="{id}. {text}{variants}\n",
+    variant="\n{letter}) {text}",
+    variant_separator="",
+)
+STUDENT_NOVARIANT_TEMPLATE = OutputTemplate(question="{id}. {text}\n")
+
+
+def _literal(text: str) -> str:
+    """Escape text for the literal part of a double-quoted f-string."""
+    escaped = text.encode("unicode_escape").decode("ascii").replace('"', '\\"')
+    return escaped.replace("{", "{{").replace("}", "}}")
+
+
+def _parse(template: str, fields: Dict[str, str], part: str) -> List[Tuple]:
+    """
+    Parse one template string into (literal, field, format_spec, conversion)
+    tuples, as string.Formatter().parse() does.
+
+    Raises:
+        TemplateError: If the template is malformed or uses an unknown field
+    """
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise TemplateError(f"{part} template: {e}") from None
+    for _, field, format_spec, _ in parsed:
+        if field is None:
+            continue
+        if field not in fields:
+            known = ", ".join(sorted(fields))
+            raise TemplateError(f"{part} template: unknown field {{{field}}} (known: {known})")
+        if "{" in (format_spec or ""):
+            raise TemplateError(f"{part} template: nested fields are not supported")
+    return parsed
+
+
+def _fstring(parsed: List[Tuple], fields: Dict[str, str], prefix: str = "") -> str:
+    """
+    Get the source of an f-string writing a parsed template.
+
+    Args:
+        parsed: Template parsed by _parse()
+        fields: Expressions of the fields
+        prefix: Source of an expression written first, e.g. a separator
+    """
+    pieces = ["{" + prefix + "}"] if prefix else []
+    for literal, field, format_spec, conversion in parsed:
+        pieces.append(_literal(literal))
+        if field is None:
+            continue
+        piece = fields[field]
+        if conversion:
+            piece += f"!{conversion}"
+        if format_spec:
+            piece += f":{_literal(format_spec)}"
+        pieces.append("{" + piece + "}")
+    return 'f"' + "".join(pieces) + '"'
+
+
+class CompiledTemplate(NamedTuple):
+    """
+    Functions generated from a template.
+
+    Attributes:
+        render: Called with a question and its number in the output (from
+            1), returns the text of the question
+        render_all: Called with a list of questions, returns the whole
+            output with the separators
+    """
+
+    render: Callable[[Dict, int], str]
+    render_all: Callable[[List[Dict]], str]
+
+
+def _source(template: OutputTemplate) -> Tuple[str, Dict[str, str]]:
+    """
+    Generate the source of the render() and render_all() functions.
+
+    render_all() appends the pieces of every question to one list and joins
+    it once, as a formatter written by hand does. When the question template
+    uses {variants} once, without a format specification, the variants are
+    appended one by one between the text before and after the field instead
+    of being joined per question; plain text after the field is written
+    together with the separator before the next question.
+
+    Returns:
+        The source and the constants it uses
+
+    Raises:
+        TemplateError: If the template is malformed or uses an unknown field
+    """
+    question = _parse(template.question, _QUESTION_FIELDS, "Question")
+    variant = _parse(template.variant, _VARIANT_FIELDS, "Variant")
+    variant_fields = [index for index, item in enumerate(question) if item[1] == "variants"]
+    joined_variants = (
+        f"VARIANT_SEPARATOR.join([{_fstring(variant, _VARIANT_FIELDS)}"
+        " for variant in question['variants']])"
+    )
+    variant_separator = "variant_separator" if template.variant_separator else ""
+    uses_mark = any(field == "mark" for _, field, _, _ in variant)
+    uses_number = any(field == "number" for _, field, _, _ in question)
+
+    lines = ["def render(question, number):"]
+    if variant_fields and uses_mark:
+        lines.append("    correct = question['correct']")
+    if variant_fields:
+        lines.append(f"    variants = {joined_variants}")
+    lines += [f"    return {_fstring(question, _QUESTION_FIELDS)}", ""]
+
+    lines += [
+        "def render_all(questions):",
+        "    out = []",
+        "    append = out.append",
+        "    separator = ''",
+        "    for number, question in enumerate(questions, 1):"
+        if uses_number
+        else "    for question in questions:",
+    ]
+    tail = ""
+    split = len(variant_fields) == 1 and not any(question[variant_fields[0]][2:])
+    if split:
+        index = variant_fields[0]
+        before = question[:index] + [(question[index][0], None, None, None)]
+        after = question[index + 1 :]
+        if all(field is None for _, field, _, _ in after):
+            tail = "".join(literal for literal, _, _, _ in after)
+            after = []
+    question_separator = "separator" if tail + template.separator else ""
+    if split:
+        lines += [
+            f"        append({_fstring(before, _QUESTION_FIELDS, question_separator)})",
+        ]
+        if uses_mark:
+            lines.append("        correct = question['correct']")
+        if variant_separator:
+            lines.append("        variant_separator = ''")
+        lines += [
+            "        for variant in question['variants']:",
+            f"            append({_fstring(variant, _VARIANT_FIELDS, variant_separator)})",
+        ]
+        if variant_separator:
+            lines.append("            variant_separator = VARIANT_SEPARATOR")
+        if after:
+            lines.append(f"        append({_fstring(after, _QUESTION_FIELDS)})")
+    else:
+        if variant_fields and uses_mark:
+            lines.append("        correct = question['correct']")
+        if variant_fields:
+            lines.append(f"        variants = {joined_variants}")
+        lines.append(f"        append({_fstring(question, _QUESTION_FIELDS, question_separator)})")
+    if question_separator:
+        lines.append("        separator = SEPARATOR")
+    if tail:
+        lines += ["    if out:", "        append(TAIL)"]
+    lines.append("    return ''.join(out)")
+
+    constants = {
+        "MARK": template.correct_mark,
+        "SEPARATOR": tail + template.separator,
+        "TAIL": tail,
+        "VARIANT_SEPARATOR": template.variant_separator,
+    }
+    return "\n".join(lines), constants
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template: OutputTemplate) -> CompiledTemplate:
+    """
+    Compile a template into Python functions.
+
+    Args:
+        template: The template
+
+    Returns:
+        The compiled functions
+
+    Raises:
+        TemplateError: If the template is malformed or uses an unknown field
+    """
+    source, namespace = _source(template)
+    try:
+        code = compile(source, "<output template>", "exec")
+    except SyntaxError as e:
+        raise TemplateError(f"Template cannot be compiled: {e.msg}") from None
+    exec(code, namespace)
+    return CompiledTemplate(namespace["render"], namespace["render_all"])
+
+
+def render_questions(template: OutputTemplate, questions: List[Dict]) -> str:
+    """
+    Render questions with a template.
+
+    Args:
+        template: The template
+        questions: Questions in output order
+
+    Returns:
+        The whole output
+    """
+    return compile_template(template).render_all(questions)
+
+
+class TemplateFormat(NamedTuple):
+    """An output format described by a template file."""
+
+    key: str
+    label: str
+    suffix: str
+    template: OutputTemplate
+
+
+def load_templates(path: str) -> List[TemplateFormat]:
+    """
+    Read user-defined text formats from a JSON file.
+
+    The file holds a list of objects with "key", "label" and "suffix" (as
+    in register_format()) and the fields of OutputTemplate, e.g.
+
+        [{"key": "tatu", "label": "TATU formati", "suffix": "_TATU.txt",
+          "question": "{number}) {text}\\n{variants}", "variant": "{LETTER}. {text}"}]
+
+    Every template is compiled, so a broken one is reported here rather
+    than when it is first used.
+
+    Args:
+        path: Path of the JSON file
+
+    Returns:
+        The formats, in file order
+
+    Raises:
+        TemplateError: If an entry is incomplete or its template is broken
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    formats = []
+    for entry in entries:
+        entry = dict(entry)
+        try:
+            key, label, suffix = entry.pop("key"), entry.pop("label"), entry.pop("suffix")
+            template = OutputTemplate(**entry)
+        except (KeyError, TypeError) as e:
+            raise TemplateError(f"{path}: incomplete template entry ({e})") from None
+        try:
+            compile_template(template)
+        except TemplateError as e:
+            raise TemplateError(f"{path}: {key}: {e}") from None
+        formats.append(TemplateFormat(key, label, suffix, template))
+    return formats
@@ -0,0 +1,173 @@
+"""
+Cache of checked uploads, keyed by Telegram's file_unique_id.
+
+The same question file is often forwarded from teacher to teacher, and
+every copy arrives with the same file_unique_id. The result of checking
+such a file (the parsed bank, its duplicate report and its validation
+problems) depends only on its content, so it is kept and a repeat upload
+skips the download, the parsing and the duplicate check.
+
+Results are kept in two least-recently-used layers: a small one in memory
+and a larger one in a SQLite database, which survives restarts and is
+shared by the queue workers. Entries are compressed on disk. Lookups use
+UPDATE ... RETURNING, which needs SQLite 3.35 or newer.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from src.core.parser import ValidationProblem
+from src.utils import metrics
+
+DEFAULT_CACHE_PATH = "upload_cache.db"
+
+# Questions held by the memory layer in all its entries together
+DEFAULT_MEMORY_QUESTIONS = 50_000
+
+# Entries kept on disk
+DEFAULT_DISK_ENTRIES = 5_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    file_unique_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads (last_used);
+"""
+
+
+class CheckedUpload(NamedTuple):
+    """Result of checking an uploaded question file."""
+
+    json_data: Dict
+    duplicate_report: str
+    problems: List[ValidationProblem]
+
+
+def encode_checked(checked: CheckedUpload) -> bytes:
+    """Serialise a check result for the disk layer."""
+    data = json.dumps(
+        [checked.json_data, checked.duplicate_report, [list(problem) for problem in checked.problems]],
+        ensure_ascii=False,
+    )
+    return zlib.compress(data.encode("utf-8"))
+
+
+def decode_checked(data: bytes) -> CheckedUpload:
+    """Read back a check result stored by encode_checked()."""
+    json_data, duplicate_report, problems = json.loads(zlib.decompress(data).decode("utf-8"))
+    return CheckedUpload(
+        json_data, duplicate_report, [ValidationProblem(*problem) for problem in problems]
+    )
+
+
+class UploadCache:
+    """
+    Two-level LRU cache from file_unique_id to the check result of the file.
+
+    Lookups are counted in the metrics as upload_cache.memory_hits,
+    upload_cache.disk_hits and upload_cache.misses.
+
+    Attributes:
+        path: Path of the database file (":memory:" for no disk layer)
+        memory_questions: Questions the memory layer holds at most
+        disk_entries: Entries the disk layer holds at most
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        memory_questions: int = DEFAULT_MEMORY_QUESTIONS,
+        disk_entries: int = DEFAULT_DISK_ENTRIES,
+    ) -> None:
+        self.path = path
+        self.memory_questions = memory_questions
+        self.disk_entries = disk_entries
+        self._memory: "OrderedDict[str, CheckedUpload]" = OrderedDict()
+        self._memory_size = 0
+        # Lookups come from the event loop and from rendering threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def get(self, file_unique_id: str) -> Optional[CheckedUpload]:
+        """
+        Look up the check result of a file.
+
+        Args:
+            file_unique_id: Telegram's id of the file's content
+
+        Returns:
+            The cached result, or None if the file has not been checked
+        """
+        with self._lock:
+            checked = self._memory.get(file_unique_id)
+            if checked is not None:
+                self._memory.move_to_end(file_unique_id)
+                metrics.increment("upload_cache.memory_hits")
+                return checked
+
+            with self._connection:
+                row = self._connection.execute(
+                    "UPDATE uploads SET last_used = ? WHERE file_unique_id = ? RETURNING data",
+                    (time.time(), file_unique_id),
+                ).fetchone()
+            if row is None:
+                metrics.increment("upload_cache.misses")
+                return None
+
+            checked = decode_checked(row[0])
+            self._remember(file_unique_id, checked)
+            metrics.increment("upload_cache.disk_hits")
+            return checked
+
+    def put(self, file_unique_id: str, checked: CheckedUpload) -> None:
+        """
+        Store the check result of a file, evicting the least recently used.
+
+        Args:
+            file_unique_id: Telegram's id of the file's content
+            checked: Result of checking the file
+        """
+        data = encode_checked(checked)
+        with self._lock:
+            self._remember(file_unique_id, checked)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO uploads (file_unique_id, data, last_used)"
+                    " VALUES (?, ?, ?)",
+                    (file_unique_id, data, time.time()),
+                )
+                self._connection.execute(
+                    "DELETE FROM uploads WHERE file_unique_id IN ("
+                    " SELECT file_unique_id FROM uploads ORDER BY last_used DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.disk_entries,),
+                )
+
+    def _remember(self, file_unique_id: str, checked: CheckedUpload) -> None:
+        """Add an entry to the memory layer, evicting the oldest ones."""
+        size = len(checked.json_data["questions"])
+        if size > self.memory_questions:
+            # Would push out everything else; the disk layer still has it
+            return
+        previous = self._memory.pop(file_unique_id, None)
+        if previous is not None:
+            self._memory_size -= len(previous.json_data["questions"])
+        self._memory[file_unique_id] = checked
+        self._memory_size += size
+        while self._memory_size > self.memory_questions:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted.json_data["questions"])
@@ -0,0 +1,224 @@
+"""
+Shuffled exam version generator.
+
+This module produces randomized versions of one parsed question bank: the
+order of questions and the order of variants inside each question are
+shuffled per seed, and the correct answer is remapped accordingly. Versions
+are rendered in parallel worker processes which all share the single parse
+passed in by the caller, and a consolidated answer-key table is written
+alongside the rendered files.
+"""
+
+import csv
+import os
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from src.core.registry import get_format, render_formats
+
+DEFAULT_VERSION_FORMATS = ("hemis", "student", "word")
+
+# Parsed bank shared by every task running in a worker process
+_worker_bank: Optional[Dict] = None
+
+
+def shuffle_bank(json_data: Dict, seed: int) -> Dict:
+    """
+    Create one shuffled version of a question bank.
+
+    Questions and their variants are renumbered from 1 in the new order.
+    Each question keeps the id of the question it came from in "source_id"
+    and the original ids of its variants, in the new order, in "variant_order".
+
+    Args:
+        json_data: Dictionary containing questions data
+        seed: Seed for the random generator of this version
+
+    Returns:
+        Dictionary with the shuffled questions data
+    """
+    rng = random.Random(seed)
+    questions = json_data["questions"]
+
+    order = list(range(len(questions)))
+    rng.shuffle(order)
+
+    shuffled = []
+    for position, original_index in enumerate(order, start=1):
+        question = questions[original_index]
+        variants = list(question["variants"])
+        rng.shuffle(variants)
+
+        correct = None
+        for new_id, variant in enumerate(variants, start=1):
+            if variant["id"] == question["correct"]:
+                correct = new_id
+
+        shuffled.append(
+            {
+                "id": position,
+                "text": question["text"],
+                "variants": [
+                    {"id": new_id, "text": variant["text"]}
+                    for new_id, variant in enumerate(variants, start=1)
+                ],
+                "correct": correct,
+                "source_id": question["id"],
+                "variant_order": [variant["id"] for variant in variants],
+            }
+        )
+
+    return {"questions": shuffled}
+
+
+def answer_key(json_data: Dict) -> List[str]:
+    """
+    Get the correct answer letters of a bank in question order.
+
+    Args:
+        json_data: Dictionary containing questions data
+
+    Returns:
+        List of answer letters ("a", "b", ...), "" where no answer is marked
+    """
+    return [
+        chr(96 + question["correct"]) if question["correct"] else ""
+        for question in json_data["questions"]
+    ]
+
+
+def _init_worker(json_data: Dict) -> None:
+    """Store the shared bank once per worker process."""
+    global _worker_bank
+    _worker_bank = json_data
+
+
+def _render_version(
+    json_data: Dict,
+    version: int,
+    seed: int,
+    output_dir: str,
+    file_name: str,
+    formats: Sequence[str],
+) -> Dict:
+    """Shuffle and render one version, returning its files and answer key."""
+    shuffled = shuffle_bank(json_data, seed)
+    results = render_formats(
+        shuffled["questions"], formats, output_dir, f"{file_name}_V{version}"
+    )
+    for result in results:
+        if result.error is not None:
+            raise result.error
+    files = [result.output_path for result in results]
+
+    return {
+        "version": version,
+        "seed": seed,
+        "files": files,
+        "answer_key": answer_key(shuffled),
+        "source_ids": [question["source_id"] for question in shuffled["questions"]],
+    }
+
+
+def _render_version_in_worker(*args) -> Dict:
+    """Render a version using the bank shared with this worker."""
+    return _render_version(_worker_bank, *args)
+
+
+def write_answer_key_table(versions: List[Dict], output_path: str) -> None:
+    """
+    Write the consolidated answer key of all versions as a CSV table.
+
+    Each row is a question position and each column a version.
+
+    Args:
+        versions: Version results returned by generate_versions
+        output_path: Path of the CSV file to write
+    """
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["Savol"] + [f"V{v['version']} ({v['seed']})" for v in versions]
+        )
+        question_count = len(versions[0]["answer_key"]) if versions else 0
+        for position in range(question_count):
+            writer.writerow(
+                [position + 1] + [v["answer_key"][position] for v in versions]
+            )
+
+
+def read_answer_key_seeds(input_path: str) -> List[int]:
+    """
+    Read the version seeds back from an answer key table.
+
+    Args:
+        input_path: Path of a table written by write_answer_key_table
+
+    Returns:
+        Seed of every version, version 1 first
+    """
+    with open(input_path, encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f), [])
+    seeds = []
+    for column in header[1:]:
+        match = re.fullmatch(r"V\d+ \((-?\d+)\)", column.strip())
+        if match is None:
+            raise ValueError(f"Not a version column of an answer key table: {column!r}")
+        seeds.append(int(match.group(1)))
+    return seeds
+
+
+def generate_versions(
+    json_data: Dict,
+    seeds: Sequence[int],
+    output_dir: str,
+    file_name: str,
+    formats: Sequence[str] = DEFAULT_VERSION_FORMATS,
+    max_workers: Optional[int] = None,
+) -> Dict:
+    """
+    Generate shuffled versions of a bank and render them in parallel.
+
+    Args:
+        json_data: Dictionary containing questions data (parsed once)
+        seeds: One seed per version; version numbers follow the seed order
+        output_dir: Folder where the rendered files are written
+        file_name: Base name for the output files
+        formats: Formats to render for each version
+        max_workers: Number of worker processes (1 renders in this process)
+
+    Returns:
+        Dictionary with the per-version results under "versions" and the
+        path of the consolidated answer-key table under "answer_key_path"
+    """
+    for format_type in formats:
+        get_format(format_type)  # Fail early on unknown formats
+
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [
+        (version, seed, output_dir, file_name, tuple(formats))
+        for version, seed in enumerate(seeds, start=1)
+    ]
+
+    if max_workers == 1 or len(tasks) <= 1:
+        versions = [_render_version(json_data, *task) for task in tasks]
+    else:
+        # The bank goes to each worker once through the initializer instead
+        # of being pickled again for every version
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(json_data,)
+        ) as executor:
+            versions = list(
+                executor.map(
+                    _render_version_in_worker, *zip(*tasks), chunksize=chunksize
+                )
+            )
+
+    answer_key_path = os.path.join(output_dir, f"{file_name}_Kalit.csv")
+    write_answer_key_table(versions, answer_key_path)
+
+    return {"versions": versions, "answer_key_path": answer_key_path}
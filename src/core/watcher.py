@@ -0,0 +1,456 @@
+"""
+Keeping the outputs of a folder of question files up to date.
+
+A FolderWatcher converts every question file of a folder and then converts
+again each file that changes:
+
+- changes are noticed with inotify where the system has it (Linux, through
+  ctypes) and by scanning the folder every POLL_INTERVAL seconds otherwise;
+- a file is converted once it has not changed for DEBOUNCE_SECONDS, so an
+  editor writing a file in several steps causes one conversion;
+- only the files that changed are parsed and rendered again, and a file
+  whose content digest matches its last conversion is skipped, so saving
+  without edits or touching a file costs nothing. The digests are kept in
+  STATE_FILE in the output folder, so a restarted watcher skips files whose
+  outputs are already up to date;
+- conversions run in a pool of worker processes. A file changed again while
+  it is being converted is converted once more afterwards, however many
+  times it changed, so a burst of edits does not pile up.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+from src.core.parser import parse_input_file, sniff_input_format
+from src.core.pipeline import run_pipeline_on_file
+from src.core.registry import get_format, render_formats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCH_FORMATS = ("hemis", "word")
+WATCHED_EXTENSIONS = (".txt", ".json", ".docx")
+
+# A file is converted once it has not changed for this long
+DEBOUNCE_SECONDS = 0.5
+
+# Seconds between two scans of the folder when inotify is not available
+POLL_INTERVAL = 1.0
+
+# Digests of the converted files, kept in the output folder
+STATE_FILE = ".watch_state.json"
+
+# Seconds between checks of the running conversions
+RUNNING_CHECK_INTERVAL = 0.05
+
+# Bytes hashed at once
+DIGEST_CHUNK_SIZE = 1 << 20
+
+
+class ConversionResult(NamedTuple):
+    """
+    Outcome of converting one file.
+
+    Attributes:
+        input_path: The converted file
+        digest: Content digest of the file that was converted
+        question_count: Number of questions written
+        problem_count: Validation and duplicate problems found in the file
+        outputs: (format key, output path, error message or None) per format
+        error: Why the file could not be converted, or None
+    """
+
+    input_path: str
+    digest: str
+    question_count: int = 0
+    problem_count: int = 0
+    outputs: tuple = ()
+    error: Optional[str] = None
+
+
+def file_digest(path: str) -> str:
+    """
+    Get the content digest of a file.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        Hex digest of the file's bytes
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def convert_file(
+    input_path: str, digest: str, output_dir: str, formats: Sequence[str]
+) -> ConversionResult:
+    """
+    Convert one question file into the given formats.
+
+    Output files are named after the input file, e.g. "bank.txt" gives
+    "bank_Hemis.txt". Runs in a worker process of the watcher.
+
+    Args:
+        input_path: Question file
+        digest: Content digest of the file, returned in the result
+        output_dir: Folder for the output files
+        formats: Keys of the formats to render
+
+    Returns:
+        The outcome; errors are returned in it rather than raised
+    """
+    try:
+        problem_count = 0
+        if sniff_input_format(input_path) == "text":
+            result = run_pipeline_on_file(input_path)
+            json_data, problem_count = result.json_data, len(result.problems)
+        else:
+            json_data = parse_input_file(input_path)
+        questions = json_data["questions"]
+        file_name = os.path.splitext(os.path.basename(input_path))[0]
+        rendered = render_formats(questions, formats, output_dir, file_name)
+    except Exception as e:
+        return ConversionResult(input_path, digest, error=str(e) or type(e).__name__)
+
+    outputs = tuple(
+        (output.key, output.output_path, None if output.error is None else str(output.error))
+        for output in rendered
+    )
+    return ConversionResult(input_path, digest, len(questions), problem_count, outputs)
+
+
+class PollingWatcher:
+    """Notices changed files by comparing scans of a folder."""
+
+    def __init__(self, folder: str, interval: float = POLL_INTERVAL) -> None:
+        self.folder = folder
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, tuple]:
+        snapshot = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            Names of the files created, changed or removed since the last call
+        """
+        remaining = self._next_scan - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(remaining, 0))
+        self._next_scan = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        changed = {name for name, state in snapshot.items() if self._snapshot.get(name) != state}
+        changed.update(name for name in self._snapshot if name not in snapshot)
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Notices changed files through Linux inotify, called through ctypes."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, folder: str) -> None:
+        """
+        Raises:
+            OSError: If inotify is not available
+        """
+        library = ctypes.util.find_library("c")
+        if library is None:
+            raise OSError("C library not found")
+        libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.folder = folder
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (
+            self.IN_MODIFY
+            | self.IN_CLOSE_WRITE
+            | self.IN_MOVED_FROM
+            | self.IN_MOVED_TO
+            | self.IN_DELETE
+        )
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, f"cannot watch {folder}")
+
+    def wait(self, timeout: float) -> Set[str]:
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            Names of the files created, changed or removed since the last call
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost; treat every file as changed
+                changed.update(os.listdir(self.folder))
+            elif length:
+                name = data[offset : offset + length].rstrip(b"\0")
+                changed.add(os.fsdecode(name))
+            offset += length
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def open_watcher(folder: str, poll_interval: Optional[float] = None):
+    """
+    Get the best available way of noticing changes in a folder.
+
+    Args:
+        folder: The folder
+        poll_interval: Always poll, at this interval in seconds
+
+    Returns:
+        An InotifyWatcher, or a PollingWatcher if inotify is not available
+        or polling was asked for
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify not available ({e}), polling {folder}")
+            poll_interval = POLL_INTERVAL
+    return PollingWatcher(folder, poll_interval)
+
+
+class FolderWatcher:
+    """
+    Converts the question files of a folder whenever they change.
+
+    Attributes:
+        folder: The watched folder (not its subfolders)
+        output_dir: Folder for the output files
+        formats: Keys of the formats written for every file
+        converted: Number of conversions finished
+        skipped: Number of changes skipped because the content was the same
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        output_dir: str,
+        formats: Sequence[str] = DEFAULT_WATCH_FORMATS,
+        max_workers: Optional[int] = None,
+        debounce: float = DEBOUNCE_SECONDS,
+        poll_interval: Optional[float] = None,
+        on_result: Optional[Callable[[ConversionResult], None]] = None,
+    ) -> None:
+        """
+        Args:
+            folder: Folder to watch
+            output_dir: Folder for the output files (may be the watched one)
+            formats: Keys of the formats to write
+            max_workers: Conversion processes (default: CPU count; 1
+                converts in this process)
+            debounce: Seconds a file must stay unchanged before conversion
+            poll_interval: Poll at this interval instead of using inotify
+            on_result: Called with the result of every finished conversion
+        """
+        suffixes = [get_format(key).suffix for key in formats]  # Fail early on unknown formats
+        self.folder = folder
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.debounce = debounce
+        self.on_result = on_result
+        self.converted = 0
+        self.skipped = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        # Outputs written next to the inputs must not be converted themselves
+        same_folder = os.path.realpath(folder) == os.path.realpath(output_dir)
+        self._output_suffixes = tuple(suffixes) if same_folder else ()
+        self._state_path = os.path.join(output_dir, STATE_FILE)
+        self._digests: Dict[str, str] = self._load_state()
+        # Name -> time of its last change, for files waiting for conversion
+        self._pending: Dict[str, float] = {}
+        # Name -> running conversion, and names changed while converting
+        self._running: Dict[str, Future] = {}
+        self._changed_while_running: Set[str] = set()
+        self._finished: List[ConversionResult] = []
+
+        self._watcher = open_watcher(folder, poll_interval)
+        self._executor = None if max_workers == 1 else ProcessPoolExecutor(max_workers)
+
+        started = time.monotonic() - debounce
+        for name in sorted(os.listdir(folder)):
+            if self._is_input(name):
+                self._pending[name] = started
+
+    def _is_input(self, name: str) -> bool:
+        if name.startswith(".") or not name.lower().endswith(WATCHED_EXTENSIONS):
+            return False
+        return not (self._output_suffixes and name.endswith(self._output_suffixes))
+
+    def _load_state(self) -> Dict[str, str]:
+        try:
+            with open(self._state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get("formats") != self.formats:
+            return {}
+        return state.get("digests", {})
+
+    def _save_state(self) -> None:
+        temporary_path = self._state_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"formats": self.formats, "digests": self._digests}, f)
+        os.replace(temporary_path, self._state_path)
+
+    def _outputs_exist(self, name: str) -> bool:
+        file_name = os.path.splitext(name)[0]
+        return all(
+            os.path.exists(os.path.join(self.output_dir, file_name + get_format(key).suffix))
+            for key in self.formats
+        )
+
+    def _start(self, name: str) -> None:
+        path = os.path.join(self.folder, name)
+        try:
+            digest = file_digest(path)
+        except FileNotFoundError:
+            # Removed; its outputs are kept
+            self._digests.pop(name, None)
+            return
+        if self._digests.get(name) == digest and self._outputs_exist(name):
+            self.skipped += 1
+            return
+
+        if self._executor is None:
+            self._finish(name, convert_file(path, digest, self.output_dir, self.formats))
+        else:
+            future = self._executor.submit(
+                convert_file, path, digest, self.output_dir, self.formats
+            )
+            self._running[name] = future
+
+    def _finish(self, name: str, result: ConversionResult) -> None:
+        self.converted += 1
+        if result.error is None and all(error is None for _, _, error in result.outputs):
+            self._digests[name] = result.digest
+        else:
+            self._digests.pop(name, None)
+        self._save_state()
+        self._finished.append(result)
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def step(self, timeout: float = 0.1) -> List[ConversionResult]:
+        """
+        Wait up to timeout seconds for changes and start the conversions due.
+
+        Args:
+            timeout: Longest wait for a change
+
+        Returns:
+            Results of the conversions finished since the last call
+        """
+        now = time.monotonic()
+        if self._running:
+            # Check the running conversions often
+            timeout = min(timeout, RUNNING_CHECK_INTERVAL)
+        if self._pending:
+            timeout = min(timeout, max(min(self._pending.values()) + self.debounce - now, 0))
+        for name in self._watcher.wait(timeout):
+            if self._is_input(name):
+                self._pending[name] = time.monotonic()
+
+        for name, future in list(self._running.items()):
+            if future.done():
+                del self._running[name]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = ConversionResult(os.path.join(self.folder, name), "", error=str(e))
+                self._finish(name, result)
+                if name in self._changed_while_running:
+                    self._changed_while_running.discard(name)
+                    self._pending.setdefault(name, time.monotonic() - self.debounce)
+
+        now = time.monotonic()
+        for name, changed_at in list(self._pending.items()):
+            if now - changed_at < self.debounce:
+                continue
+            del self._pending[name]
+            if name in self._running:
+                self._changed_while_running.add(name)
+            else:
+                self._start(name)
+
+        finished, self._finished = self._finished, []
+        return finished
+
+    def idle(self) -> bool:
+        """Whether no conversion is waiting or running."""
+        return not self._pending and not self._running and not self._changed_while_running
+
+    def run(self, until_idle: bool = False) -> None:
+        """
+        Convert files as they change, until interrupted.
+
+        Args:
+            until_idle: Return once every file has been converted instead
+        """
+        while not (until_idle and self.idle()):
+            self.step(timeout=POLL_INTERVAL)
+
+    def close(self) -> None:
+        """Stop watching and wait for the running conversions."""
+        self._watcher.close()
+        if self._executor is not None:
+            self._executor.shutdown()
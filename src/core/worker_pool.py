@@ -0,0 +1,489 @@
+"""
+Supervised worker processes for conversions.
+
+Word documents built through python-docx and lxml leave a lot of memory
+behind in the process that built them. A WorkerPool runs conversions in
+separate worker processes instead, so the bot process itself stays small:
+
+- a worker is replaced after a configurable number of jobs, or as soon as
+  its resident memory passes a threshold after a job;
+- every worker runs under an address-space limit (RLIMIT_AS) and every job
+  under a CPU-time limit (RLIMIT_CPU), plus a wall-clock timeout enforced by
+  the pool;
+- a job that crashes its worker or runs over a limit raises WorkerError in
+  the caller and the worker is replaced; the pool keeps serving.
+
+Questions are streamed to the worker in chunks over the job's pipe, so a
+large export never has to be held in memory on either side, and a running
+job can report progress (such as finished output parts) back to the caller
+while it continues.
+
+Fragment caches (see src.core.formatters) hold document elements, which
+cannot be sent between processes, so they are kept by the workers: a render
+with a cache key always runs on the worker assigned to that key, which keeps
+the caches of its recently used keys. A re-render for the same user then
+only rebuilds the questions that changed, as it does in-process; the caches
+are lost when the worker is replaced.
+"""
+
+import logging
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence
+
+from src.core.registry import RenderResult, render_formats
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits are then not applied
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_JOBS = 200
+DEFAULT_MAX_RSS = 512 * 1024 * 1024
+DEFAULT_MEMORY_LIMIT = 2048 * 1024 * 1024
+DEFAULT_CPU_SECONDS = 300
+DEFAULT_TIMEOUT = 600.0
+
+# Questions sent to a worker per message
+QUESTION_CHUNK_SIZE = 500
+
+# Seconds a stopping worker is given to exit before it is killed
+STOP_TIMEOUT = 5.0
+
+# Cache keys whose fragment caches a worker keeps; the least recently used
+# are dropped first
+WORKER_CACHE_KEYS = 32
+
+# Connection of a worker process to the pool, used by the job helpers below,
+# and whether questions sent with the current job are still unread
+_connection: Optional[Connection] = None
+_questions_pending = False
+
+# Fragment caches per format key of the recent cache keys (inside a worker)
+_render_caches: "OrderedDict[Hashable, Dict[str, Dict]]" = OrderedDict()
+
+
+class WorkerError(RuntimeError):
+    """A job crashed its worker or exceeded a limit."""
+
+
+def resident_memory() -> int:
+    """
+    Get the resident memory of the current process.
+
+    Returns:
+        Resident set size in bytes (the peak size where the current one is
+        not available)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def job_questions() -> Iterator[Dict]:
+    """
+    Stream the questions sent with the current job (inside a worker).
+
+    Yields:
+        Questions in the order the caller passed them
+    """
+    global _questions_pending
+    while _questions_pending:
+        message = _connection.recv()
+        if message[0] == "end":
+            _questions_pending = False
+            return
+        yield from message[1]
+
+
+def report_progress(*progress) -> None:
+    """
+    Send progress of the current job to the caller (inside a worker).
+
+    Args:
+        progress: Values passed to the caller's on_progress callback
+    """
+    _connection.send(("progress", progress))
+
+
+def _set_cpu_limit(seconds: Optional[int]) -> None:
+    """Allow this process at most the given CPU seconds more."""
+    if resource is None or seconds is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    # Past the soft limit the kernel sends SIGXCPU, which ends the worker
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(connection: Connection, memory_limit: Optional[int]) -> None:
+    """Run jobs sent by the pool until told to stop."""
+    global _connection, _questions_pending
+    _connection = connection
+
+    if resource is not None and memory_limit is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == "stop":
+            return
+
+        _, function, args, kwargs, streamed, cpu_seconds = message
+        _questions_pending = streamed
+        _set_cpu_limit(cpu_seconds)
+        try:
+            reply = ("done", function(*args, **kwargs))
+        except MemoryError:
+            # The heap may be in any state now; report and let the pool
+            # replace this worker
+            connection.send(("failed", "memory limit exceeded", resident_memory()))
+            return
+        except Exception as e:
+            reply = ("error", e)
+
+        # Questions the job did not read must not be taken for the next job's
+        for _ in job_questions():
+            pass
+        connection.send(reply + (resident_memory(),))
+
+
+class _Worker:
+    """One worker process and its pipe."""
+
+    def __init__(self, pool: "WorkerPool") -> None:
+        self.pool = pool
+        self.process = None
+        self.connection: Optional[Connection] = None
+        self.jobs = 0
+
+    def start(self) -> None:
+        parent, child = self.pool._context.Pipe()
+        self.process = self.pool._context.Process(
+            target=_worker_main, args=(child, self.pool.memory_limit), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.connection = parent
+        self.jobs = 0
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self) -> None:
+        """Ask the worker to exit, killing it if it does not."""
+        if self.process is None:
+            return
+        try:
+            self.connection.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        self.process = None
+
+    def describe_exit(self) -> str:
+        """Reason a worker that stopped answering is gone."""
+        self.process.join(STOP_TIMEOUT)
+        code = self.process.exitcode
+        if code is None:
+            return "did not exit"
+        if code == -signal.SIGXCPU:
+            return "ran out of CPU time"
+        if code < 0:
+            return f"was killed by signal {-code}"
+        return f"exited with status {code}"
+
+
+class WorkerPool:
+    """
+    Pool of supervised worker processes.
+
+    Attributes:
+        workers: Number of worker processes
+        max_jobs: Jobs a worker runs before it is replaced
+        max_rss: Resident memory in bytes above which a worker is replaced
+            after its job
+        memory_limit: Address-space limit of each worker in bytes (None for
+            no limit)
+        cpu_seconds: CPU time limit of each job (None for no limit)
+        timeout: Wall-clock limit of each job in seconds
+        recycled: Number of workers replaced so far, for monitoring
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+        max_rss: int = DEFAULT_MAX_RSS,
+        memory_limit: Optional[int] = DEFAULT_MEMORY_LIMIT,
+        cpu_seconds: Optional[int] = DEFAULT_CPU_SECONDS,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.memory_limit = memory_limit
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.recycled = 0
+
+        # Workers are started fresh rather than forked from a process that
+        # runs an event loop and threads
+        self._context = get_context("spawn")
+        self._all: List[_Worker] = [_Worker(self) for _ in range(workers)]
+        self._idle: List[_Worker] = list(self._all)
+        self._available = threading.Condition()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> Optional["WorkerPool"]:
+        """
+        Create a pool configured by environment variables.
+
+        CONVERSION_WORKERS (0 disables the pool), WORKER_MAX_JOBS,
+        WORKER_MAX_RSS_MB, WORKER_MEMORY_LIMIT_MB, JOB_CPU_SECONDS and
+        JOB_TIMEOUT_SECONDS override the defaults.
+
+        Returns:
+            The pool, or None if conversions should run in-process
+        """
+        workers = int(os.getenv("CONVERSION_WORKERS", DEFAULT_WORKERS))
+        if workers <= 0:
+            return None
+        megabyte = 1024 * 1024
+        return cls(
+            workers=workers,
+            max_jobs=int(os.getenv("WORKER_MAX_JOBS", DEFAULT_MAX_JOBS)),
+            max_rss=int(os.getenv("WORKER_MAX_RSS_MB", DEFAULT_MAX_RSS // megabyte)) * megabyte,
+            memory_limit=int(
+                os.getenv("WORKER_MEMORY_LIMIT_MB", DEFAULT_MEMORY_LIMIT // megabyte)
+            ) * megabyte,
+            cpu_seconds=int(os.getenv("JOB_CPU_SECONDS", DEFAULT_CPU_SECONDS)),
+            timeout=float(os.getenv("JOB_TIMEOUT_SECONDS", DEFAULT_TIMEOUT)),
+        )
+
+    def worker_pids(self) -> List[int]:
+        """Process ids of the running workers."""
+        return [worker.process.pid for worker in self._all if worker.alive()]
+
+    def close(self) -> None:
+        """Stop every worker."""
+        for worker in self._all:
+            worker.stop()
+
+    def run(
+        self,
+        function: Callable,
+        *args,
+        questions: Optional[Iterable[Dict]] = None,
+        on_progress: Optional[Callable] = None,
+        affinity: Optional[Hashable] = None,
+        **kwargs,
+    ):
+        """
+        Run a function in a worker process and wait for its result.
+
+        Args:
+            function: Module-level function to call in the worker
+            args: Positional arguments of the function
+            questions: Questions streamed to the job; the function reads them
+                with job_questions()
+            on_progress: Called in this thread with the values the job passes
+                to report_progress()
+            affinity: Run on the worker assigned to this key, waiting for it
+                if it is busy, so that state the worker keeps for the key is
+                found again (default: any idle worker)
+            kwargs: Keyword arguments of the function
+
+        Returns:
+            The function's return value
+
+        Raises:
+            WorkerError: If the worker crashed, ran out of memory or time
+            Exception: Any exception raised by the function itself
+        """
+        worker = self._acquire(affinity)
+        try:
+            with self._lock:
+                if not worker.alive():
+                    if worker.process is not None:
+                        worker.stop()
+                    worker.start()
+            return self._run_on(worker, function, args, kwargs, questions, on_progress)
+        finally:
+            with self._available:
+                self._idle.append(worker)
+                self._available.notify_all()
+
+    def _acquire(self, affinity: Optional[Hashable]) -> _Worker:
+        """Wait until a worker, or the worker assigned to affinity, is idle."""
+        with self._available:
+            if affinity is None:
+                self._available.wait_for(lambda: self._idle)
+                return self._idle.pop()
+            worker = self._all[hash(affinity) % len(self._all)]
+            self._available.wait_for(lambda: worker in self._idle)
+            self._idle.remove(worker)
+            return worker
+
+    def _run_on(self, worker: _Worker, function, args, kwargs, questions, on_progress):
+        deadline = time.monotonic() + self.timeout
+        connection = worker.connection
+        worker.jobs += 1
+
+        def dispatch(message) -> Optional[tuple]:
+            # Progress goes to the caller; anything else ends the job
+            if message[0] == "progress":
+                if on_progress is not None:
+                    on_progress(*message[1])
+                return None
+            return message
+
+        try:
+            connection.send(
+                ("job", function, args, kwargs, questions is not None, self.cpu_seconds)
+            )
+            reply = None
+            if questions is not None:
+                iterator = iter(questions)
+                while reply is None:
+                    chunk = list(islice(iterator, QUESTION_CHUNK_SIZE))
+                    if not chunk:
+                        connection.send(("end",))
+                        break
+                    connection.send(("questions", chunk))
+                    # Handle progress reported while questions are still coming
+                    while reply is None and connection.poll():
+                        reply = dispatch(connection.recv())
+
+            while reply is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not connection.poll(remaining):
+                    self._replace(worker)
+                    raise WorkerError(f"conversion took longer than {self.timeout:.0f} seconds")
+                reply = dispatch(connection.recv())
+        except (EOFError, OSError):
+            reason = worker.describe_exit()
+            self._replace(worker)
+            raise WorkerError(f"conversion worker {reason}") from None
+
+        status, value, rss = reply
+        if status == "failed":
+            self._replace(worker)
+            raise WorkerError(value)
+        if worker.jobs >= self.max_jobs or rss > self.max_rss:
+            logger.info(f"Recycling worker after {worker.jobs} jobs at {rss // 1024 // 1024} MB")
+            self._replace(worker)
+        if status == "error":
+            raise value
+        return value
+
+    def _replace(self, worker: _Worker) -> None:
+        """Stop a worker and start its replacement right away."""
+        with self._lock:
+            worker.stop()
+            worker.start()
+            self.recycled += 1
+
+    def render(
+        self,
+        questions: Iterable[Dict],
+        format_keys: Sequence[str],
+        output_dir: str,
+        file_name: str,
+        max_part_size: Optional[int] = None,
+        on_part: Optional[Callable[[str, str], None]] = None,
+        cache_key: Optional[Hashable] = None,
+    ) -> List[RenderResult]:
+        """
+        Render formats in a worker process, like render_formats().
+
+        With a cache key (such as the user's id) the render runs on the
+        worker assigned to the key and uses the fragment caches that worker
+        keeps for it, like the caches render_formats() takes in-process.
+
+        Args:
+            questions: Questions in output order (may be a one-shot iterator)
+            format_keys: Keys of the formats to render
+            output_dir: Folder where the output files are written
+            file_name: Base name of the output files
+            max_part_size: Split outputs into parts of about this many bytes
+            on_part: Called here with (format key, part path) for every part
+                as soon as the worker has finished it
+            cache_key: Key of the fragment caches to use (default: none)
+
+        Returns:
+            One result per requested format
+
+        Raises:
+            WorkerError: If the worker crashed or exceeded a limit
+        """
+        return self.run(
+            _render_job,
+            list(format_keys),
+            output_dir,
+            file_name,
+            max_part_size,
+            cache_key,
+            questions=questions,
+            on_progress=on_part,
+            affinity=cache_key,
+        )
+
+
+def _job_caches(cache_key: Optional[Hashable]) -> Optional[Dict[str, Dict]]:
+    """Get the fragment caches this worker keeps for a key (inside a worker)."""
+    if cache_key is None:
+        return None
+    caches = _render_caches.pop(cache_key, None)
+    if caches is None:
+        caches = {}
+        while len(_render_caches) >= WORKER_CACHE_KEYS:
+            _render_caches.popitem(last=False)
+    _render_caches[cache_key] = caches
+    return caches
+
+
+def _render_job(
+    format_keys: List[str],
+    output_dir: str,
+    file_name: str,
+    max_part_size: Optional[int],
+    cache_key: Optional[Hashable] = None,
+) -> List[RenderResult]:
+    """Render the streamed questions, reporting every finished part."""
+    return render_formats(
+        job_questions(),
+        format_keys,
+        output_dir,
+        file_name,
+        caches=_job_caches(cache_key),
+        max_part_size=max_part_size,
+        on_part=report_progress,
+    )
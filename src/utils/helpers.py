@@ -6,7 +6,6 @@ tasks like loading environment variables and handling file paths.
 """
 
 import os
-from dotenv import load_dotenv
 from typing import Dict
 
 
@@ -17,6 +16,8 @@ def load_environment_variables() -> Dict[str, str]:
     Returns:
         Dictionary containing environment variables
     """
+    from dotenv import load_dotenv
+
     # Load variables from .env file if it exists
     load_dotenv()
 
@@ -0,0 +1,205 @@
+"""
+Startup import-time measurement for the test question converter bot.
+
+This module runs a fresh interpreter with ``-X importtime``, parses the
+per-module timings it prints to stderr and compares the cold-start cost of
+the entry modules against a budget. It also reports heavy dependencies
+(python-docx, lxml, telegram) that were pulled in at import time.
+
+Usage:
+    python -m src.utils.importtime [--budget-ms 150] [module ...]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# Modules imported on every start of the bot or a CLI run
+STARTUP_MODULES = [
+    "main",
+    "src.core.parser",
+    "src.core.formatters",
+    "src.core.duplicate_checker",
+]
+
+# Packages that must only be imported by the code that actually needs them
+HEAVY_MODULES = ["docx", "lxml", "telegram"]
+
+# Cold-start budget per module in milliseconds, overridable from the environment
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "150"))
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+class ImportTiming(NamedTuple):
+    """Timing of a single import as reported by ``-X importtime``."""
+
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """
+    Parse the stderr output of ``python -X importtime``.
+
+    Args:
+        output: Text printed by the interpreter to stderr
+
+    Returns:
+        List of import timings in the order they were reported
+    """
+    timings = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue  # Header line or unrelated stderr output
+        self_us, cumulative_us, indent, module = match.groups()
+        timings.append(
+            ImportTiming(
+                module=module,
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+                depth=(len(indent) - 1) // 2,
+            )
+        )
+    return timings
+
+
+def measure_import_time(module: str, cwd: Optional[str] = None) -> List[ImportTiming]:
+    """
+    Import a module in a fresh interpreter and collect its import timings.
+
+    Args:
+        module: Dotted module name to import
+        cwd: Working directory for the interpreter (defaults to the repo root)
+
+    Returns:
+        List of import timings for everything the import pulled in
+    """
+    if cwd is None:
+        cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    return parse_importtime(result.stderr)
+
+
+def module_import_ms(timings: List[ImportTiming], module: str) -> float:
+    """
+    Get the cumulative import time of a top-level module in milliseconds.
+
+    Args:
+        timings: Timings returned by measure_import_time
+        module: Module whose cumulative time is wanted
+
+    Returns:
+        Cumulative import time in milliseconds (0 if the module was not found)
+    """
+    for timing in timings:
+        if timing.module == module and timing.depth == 0:
+            return timing.cumulative_us / 1000
+    return 0.0
+
+
+def loaded_heavy_modules(timings: List[ImportTiming]) -> List[str]:
+    """
+    List the heavy packages that appear in a set of import timings.
+
+    Args:
+        timings: Timings returned by measure_import_time
+
+    Returns:
+        Sorted list of heavy top-level package names that were imported
+    """
+    loaded = {timing.module.split(".")[0] for timing in timings}
+    return sorted(loaded.intersection(HEAVY_MODULES))
+
+
+def check_startup_budget(
+    modules: Sequence[str] = STARTUP_MODULES,
+    budget_ms: float = DEFAULT_BUDGET_MS,
+    repeat: int = 3,
+) -> Dict[str, float]:
+    """
+    Measure the cold import time of each module and compare it to the budget.
+
+    The best of several runs is used so that a busy machine does not cause
+    spurious failures.
+
+    Args:
+        modules: Modules to measure
+        budget_ms: Maximum allowed import time per module in milliseconds
+        repeat: Number of fresh interpreters to run per module
+
+    Returns:
+        Dictionary mapping each module to its best import time in milliseconds
+
+    Raises:
+        AssertionError: If any module exceeds the budget or loads a heavy package
+    """
+    results = {}
+    problems = []
+
+    for module in modules:
+        best_ms = None
+        heavy = []
+        for _ in range(max(1, repeat)):
+            timings = measure_import_time(module)
+            elapsed_ms = module_import_ms(timings, module)
+            heavy = loaded_heavy_modules(timings)
+            if best_ms is None or elapsed_ms < best_ms:
+                best_ms = elapsed_ms
+        results[module] = best_ms
+
+        if best_ms > budget_ms:
+            problems.append(f"{module}: {best_ms:.1f} ms > {budget_ms:.1f} ms budget")
+        if heavy:
+            problems.append(f"{module}: imports {', '.join(heavy)} at startup")
+
+    if problems:
+        raise AssertionError("Startup budget exceeded:\n" + "\n".join(problems))
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for the startup budget check.
+
+    Args:
+        argv: Command line arguments (defaults to sys.argv[1:])
+
+    Returns:
+        Process exit code (0 when within budget, 1 otherwise)
+    """
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("modules", nargs="*", default=STARTUP_MODULES)
+    arg_parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    try:
+        results = check_startup_budget(args.modules, args.budget_ms, args.repeat)
+    except AssertionError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    for module, elapsed_ms in results.items():
+        print(f"{module:40s} {elapsed_ms:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,9 @@
 Logging configuration for the test question converter bot.
 
 This module configures logging to track bot operations in both console and file.
+Nothing is opened at import time: main.py calls setup_logger() once when the
+bot starts, so importing this module (e.g. from a short CLI run or a test)
+stays cheap.
 """
 
 import logging
@@ -58,8 +61,8 @@ def setup_logger() -> logging.Logger:
     return logger
 
 
-# Create the logger on module import
-logger = setup_logger()
+# Module logger; handlers are attached when main.py calls setup_logger()
+logger = logging.getLogger(__name__)
 
 
 # Helper functions for standardized log messages
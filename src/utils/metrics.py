@@ -0,0 +1,56 @@
+"""
+In-process counters for monitoring the bot.
+
+Code records events by name, such as increment("upload_cache.hits"), and
+snapshot() returns every counter, e.g. to log them. Counters live in the
+process that records them (every queue worker has its own) and start at zero.
+"""
+
+import threading
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """
+    Add to a counter.
+
+    Args:
+        name: Dotted name of the counter
+        amount: Value added to the counter
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def get(name: str) -> int:
+    """
+    Read a counter.
+
+    Args:
+        name: Dotted name of the counter
+
+    Returns:
+        Current value (0 for a counter never incremented)
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, int]:
+    """
+    Read every counter.
+
+    Returns:
+        Copy of all counters by name
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    """Set every counter back to zero."""
+    with _lock:
+        _counters.clear()
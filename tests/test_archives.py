@@ -0,0 +1,206 @@
+import gzip
+import io
+import os
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from src.core.archives import (
+    ArchiveError,
+    OutputPacker,
+    check_archive,
+    is_archive,
+    iter_archive_members,
+)
+from src.core.duplicate_checker import split_duplicate_report
+
+BANK = """1. What is 2 + 2?
+a) 3
+b) *4
+c) 5
+
+2. What is the capital of France?
+a) *Paris
+b) London
+"""
+
+OTHER_BANK = """1. What is the capital of France?
+a) *Paris
+b) London
+
+2. Which planet is the largest?
+a) Mars
+b) *Jupiter
+"""
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+def write_tgz(path, members):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, content in members.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_is_archive():
+    """Test that archives are recognized by their names."""
+    assert is_archive("bank.zip")
+    assert is_archive("Bank.TAR.GZ")
+    assert is_archive("bank.tgz")
+    assert is_archive("bank.txt.gz")
+    assert not is_archive("bank.txt")
+
+
+@pytest.mark.parametrize("writer,name", [(write_zip, "banks.zip"), (write_tgz, "banks.tar.gz")])
+def test_check_archive_merges_members(tmp_path, writer, name):
+    """Test that members are numbered as one bank and checked across files."""
+    path = writer(
+        tmp_path / name,
+        {
+            "math/a.txt": BANK,
+            "b.txt": OTHER_BANK,
+            "notes.md": "not a question file",
+            "__MACOSX/._a.txt": "resource fork",
+        },
+    )
+    json_data, duplicate_report, problems = check_archive(path, max_workers=1)
+
+    questions = json_data["questions"]
+    assert [question["id"] for question in questions] == [1, 2, 3, 4]
+    assert [question["source_file"] for question in questions] == [
+        "math/a.txt",
+        "math/a.txt",
+        "b.txt",
+        "b.txt",
+    ]
+    assert questions[3]["correct"] == 2
+    # The same question in two members is a duplicate, reported once
+    assert duplicate_report == "Line 1 (Question 3): b.txt: identical to Question 2"
+    assert problems == []
+
+
+def test_check_archive_warnings_follow_blocking_duplicates(tmp_path):
+    """Test that the report of an archive keeps warnings apart from duplicates."""
+    reworded = """1. Capital of France?
+a) *Paris
+b) Rome
+c) Berlin
+
+2. France's capital city is
+a) Berlin
+b) *Paris
+c) Rome
+"""
+    path = write_zip(tmp_path / "banks.zip", {"a.txt": BANK, "b.txt": OTHER_BANK, "c.txt": reworded})
+    _, duplicate_report, problems = check_archive(path, max_workers=1)
+
+    blocking, warnings = split_duplicate_report(duplicate_report)
+    assert blocking == "Line 1 (Question 3): b.txt: identical to Question 2"
+    assert warnings == (
+        "Line 6 (Question 6): c.txt: same variants and correct answer as Question 5"
+    )
+    assert problems == []
+
+
+def test_check_archive_single_gzip_file(tmp_path):
+    """Test that a gzipped question file is read under its own name."""
+    path = tmp_path / "bank.txt.gz"
+    path.write_bytes(gzip.compress(BANK.encode("utf-8")))
+    assert [name for name, _ in iter_archive_members(str(path))] == ["bank.txt"]
+    json_data, _, _ = check_archive(str(path), max_workers=1)
+    assert len(json_data["questions"]) == 2
+
+
+def test_check_archive_reports_member_of_problem(tmp_path):
+    """Test that problems name the member they were found in."""
+    path = write_zip(tmp_path / "banks.zip", {"a.txt": BANK, "b.txt": "1. No variants?\n"})
+    _, _, problems = check_archive(str(path), max_workers=1)
+    assert problems
+    assert all(problem.message.startswith("b.txt: ") for problem in problems)
+    assert all(problem.question_id > 2 for problem in problems if problem.question_id)
+
+
+def test_check_archive_limits(tmp_path):
+    """Test the limits on members and on decompressed bytes."""
+    path = write_zip(tmp_path / "banks.zip", {f"{n}.txt": BANK for n in range(3)})
+    with pytest.raises(ArchiveError, match="more than 2 files"):
+        check_archive(path, max_workers=1, max_members=2)
+
+    # A tar stream declares no total size: the bytes read are counted
+    path = write_tgz(tmp_path / "banks.tgz", {f"{n}.txt": BANK for n in range(3)})
+    with pytest.raises(ArchiveError, match="larger than"):
+        check_archive(path, max_workers=1, max_size=len(BANK) * 2)
+
+    # A highly compressed member stops at the limit
+    bomb = tmp_path / "bomb.txt.gz"
+    bomb.write_bytes(gzip.compress(b"a" * (8 * 1024 * 1024)))
+    with pytest.raises(ArchiveError, match="larger than"):
+        check_archive(str(bomb), max_workers=1, max_size=1024 * 1024)
+
+
+def test_check_archive_rejects_broken_and_empty_archives(tmp_path):
+    """Test that unreadable archives and archives without questions fail."""
+    broken = tmp_path / "broken.zip"
+    broken.write_bytes(b"PK not really a zip")
+    with pytest.raises(ArchiveError, match="cannot be read"):
+        check_archive(str(broken), max_workers=1)
+
+    empty = write_zip(tmp_path / "empty.zip", {"readme.md": "nothing here"})
+    with pytest.raises(ArchiveError, match="no .txt"):
+        check_archive(empty, max_workers=1)
+
+
+def test_output_packer_single_archive(tmp_path):
+    """Test that outputs that fit in one archive keep the plain name."""
+    for name in ("bank_Hemis.txt", "bank.docx"):
+        (tmp_path / name).write_text(name)
+    packer = OutputPacker(str(tmp_path / "bank.zip"), 1024 * 1024)
+    packer.add(str(tmp_path / "bank_Hemis.txt"))
+    packer.add(str(tmp_path / "bank.docx"))
+    packer.close()
+
+    assert packer.archives == [str(tmp_path / "bank.zip")]
+    with zipfile.ZipFile(packer.archives[0]) as archive:
+        assert archive.namelist() == ["bank_Hemis.txt", "bank.docx"]
+        assert archive.read("bank.docx") == b"bank.docx"
+    # Packed files are removed
+    assert sorted(os.listdir(tmp_path)) == ["bank.zip"]
+
+
+def test_output_packer_splits_archives_under_limit(tmp_path):
+    """Test that archives are finished, and handed on, before they pass the limit."""
+    rng = random.Random(49)
+    parts = []
+    for number in range(1, 6):
+        path = tmp_path / f"bank_Hemis_{number}.txt"
+        # Incompressible, like the .docx and .zip outputs
+        path.write_bytes(rng.randbytes(40_000))
+        parts.append(str(path))
+    finished = []
+    packer = OutputPacker(str(tmp_path / "bank.zip"), 100_000, finished.append)
+    for path in parts:
+        packer.add(path)
+        # Full archives are handed on before the last file is added
+        assert all(os.path.getsize(archive) <= 100_000 for archive in finished)
+    packer.close()
+
+    assert finished == packer.archives == [
+        str(tmp_path / f"bank_{number}.zip") for number in range(1, 4)
+    ]
+    names = []
+    for archive_path in finished:
+        assert os.path.getsize(archive_path) <= 100_000
+        with zipfile.ZipFile(archive_path) as archive:
+            names.extend(archive.namelist())
+    assert names == [os.path.basename(path) for path in parts]
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import pytest
+from docx import Document
+from src.core.docx_reader import iter_docx_lines, parse_docx_file
+from src.core.formatters import create_student_word_document, create_word_document
+from src.core.parser import parse_input_file, parse_text_content
+from src.core.pipeline import run_pipeline
+
+SAMPLE_TEXT = """1. What is Python?
+a) A snake
+b) *A programming language
+c) A game
+
+2. What does CPU stand for?
+a) *Central Processing Unit
+b) Computer Processing Unit
+"""
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory() as directory:
+        yield directory
+
+
+def test_paragraph_layout_parses_like_text(temp_dir):
+    """Test that paragraphs in the text format give the same questions as a .txt file."""
+    path = os.path.join(temp_dir, "savollar.docx")
+    doc = Document()
+    for line in SAMPLE_TEXT.rstrip("\n").split("\n"):
+        doc.add_paragraph(line)
+    doc.save(path)
+
+    assert parse_docx_file(path) == parse_text_content(SAMPLE_TEXT)
+    assert parse_input_file(path) == parse_text_content(SAMPLE_TEXT)
+
+
+def test_line_breaks_start_new_lines(temp_dir):
+    """Test that soft line breaks inside one paragraph separate the lines."""
+    path = os.path.join(temp_dir, "breaks.docx")
+    doc = Document()
+    paragraph = doc.add_paragraph("1. What is Python?")
+    for line in ["a) A snake", "b) *A programming language"]:
+        run = paragraph.add_run()
+        run.add_break()
+        run.add_text(line)
+    doc.save(path)
+
+    question = parse_docx_file(path)["questions"][0]
+    assert question["text"] == "1. What is Python?"
+    assert question["correct"] == 2
+
+
+def test_student_document_round_trip(temp_dir):
+    """Test that a document written by create_student_word_document is read back."""
+    questions = parse_text_content(SAMPLE_TEXT)
+    for question in questions["questions"]:
+        question["text"] = question["text"].split(". ", 1)[1]
+    path = os.path.join(temp_dir, "student.docx")
+    create_student_word_document(questions, path)
+
+    parsed = parse_docx_file(path)["questions"]
+    assert [q["text"] for q in parsed] == ["1. What is Python?", "2. What does CPU stand for?"]
+    assert [q["variants"] for q in parsed] == [q["variants"] for q in questions["questions"]]
+
+
+def test_table_layout_round_trip(temp_dir):
+    """Test that a document written by create_word_document is read back."""
+    questions = parse_text_content(SAMPLE_TEXT)
+    path = os.path.join(temp_dir, "tables.docx")
+    create_word_document(questions, path)
+
+    parsed = parse_docx_file(path)["questions"]
+    assert len(parsed) == 2
+    for original, question in zip(questions["questions"], parsed):
+        assert question["text"] == original["text"]
+        assert question["correct"] == 1  # The second row holds the correct answer
+        correct = [v["text"] for v in original["variants"] if v["id"] == original["correct"]]
+        assert question["variants"][0]["text"] == correct[0]
+        assert sorted(v["text"] for v in question["variants"]) == sorted(
+            v["text"] for v in original["variants"]
+        )
+
+
+def test_mixed_layout_is_read_in_document_order(temp_dir):
+    """Test that tables and paragraphs can follow each other without blank lines."""
+    path = os.path.join(temp_dir, "mixed.docx")
+    doc = Document()
+    doc.add_paragraph("1. First?")
+    doc.add_paragraph("a) *Yes")
+    doc.add_paragraph("b) No")
+    table = doc.add_table(rows=3, cols=1)
+    for cell, text in zip(table.column_cells(0), ["2. Second?", "Right", "Wrong"]):
+        cell.text = text
+    doc.add_paragraph("3. Third?")
+    doc.add_paragraph("a) One")
+    doc.add_paragraph("b) *Two")
+    doc.save(path)
+
+    lines = list(iter_docx_lines(path))
+    assert lines[3:8] == ["\n", "2. Second?\n", "a) *Right\n", "b) Wrong\n", "\n"]
+    parsed = parse_docx_file(path)["questions"]
+    assert [(q["text"], q["correct"]) for q in parsed] == [
+        ("1. First?", 1), ("2. Second?", 1), ("3. Third?", 2),
+    ]
+
+
+def test_table_with_more_than_four_answers_is_reported(temp_dir):
+    """Test that answers past d) in a table are reported, not silently dropped."""
+    path = os.path.join(temp_dir, "five.docx")
+    doc = Document()
+    table = doc.add_table(rows=6, cols=1)
+    rows = ["1. Which is prime?", "Seven", "Four", "Six", "Eight", "Nine"]
+    for cell, text in zip(table.column_cells(0), rows):
+        cell.text = text
+    doc.save(path)
+
+    lines = list(iter_docx_lines(path))
+    assert lines[-2:] == ["e) Nine\n", "\n"]
+    result = run_pipeline(lines)
+    assert [v["text"] for v in result.json_data["questions"][0]["variants"]] == rows[1:5]
+    assert [(p.line, p.question_id, p.code) for p in result.problems] == [
+        (6, 1, "too_many_variants")
+    ]
+    assert result.problems[0].message == "variant e) is ignored, at most 4 variants (a-d) are read"
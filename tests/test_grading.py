@@ -0,0 +1,157 @@
+import os
+import tempfile
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.core import grading
+from src.core.grading import (
+    GradingError,
+    build_grading_key,
+    grade,
+    grade_file,
+    read_answer_sheets,
+)
+from src.core.versions import answer_key, generate_versions, read_answer_key_seeds, shuffle_bank
+
+
+@pytest.fixture
+def sample_questions():
+    """Create a sample bank whose correct answers are known."""
+    return {
+        "questions": [
+            {
+                "id": i,
+                "text": f"{i}. Question {i}?",
+                "variants": [{"id": j, "text": f"Answer {i}-{j}"} for j in range(1, 5)],
+                "correct": (i % 4) + 1,
+            }
+            for i in range(1, 11)
+        ]
+    }
+
+
+def write_sheets(temp_dir: str, lines) -> str:
+    path = os.path.join(temp_dir, "javoblar.csv")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def test_scores_against_key(sample_questions):
+    """Test that answers are scored without versions, blanks counting as wrong."""
+    letters = answer_key(sample_questions)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_sheets(
+            temp_dir,
+            [
+                "Talaba," + ",".join(str(i) for i in range(1, 11)),
+                "Ali," + ",".join(letters),
+                "Vali," + ",".join(letters[:5]) + ",,,,,",
+                "Soli," + ",".join(letter.upper() for letter in letters[:3]),
+            ],
+        )
+        result = grade(read_answer_sheets(path), build_grading_key(sample_questions))
+
+    assert result.students == ["Ali", "Vali", "Soli"]
+    assert result.scores.tolist() == [10, 5, 3]
+    assert result.max_score == 10
+    assert result.correct.sum(axis=1).tolist() == [10, 5, 3]
+
+
+def test_shuffled_versions_map_back_to_original_questions(sample_questions):
+    """Test that every version is graded with its own key and reported in original order."""
+    seeds = [3, 17]
+    rows = ["Talaba,Variant," + ",".join(str(i) for i in range(1, 11))]
+    for version, seed in enumerate(seeds, start=1):
+        letters = answer_key(shuffle_bank(sample_questions, seed))
+        rows.append(f"S{version},{version}," + ",".join(letters))
+    # Answering "a" everywhere on version 2 picks different original variants
+    rows.append("S3,2," + ",".join("a" * 10))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sheets = read_answer_sheets(write_sheets(temp_dir, rows))
+    result = grade(sheets, build_grading_key(sample_questions, seeds))
+
+    assert result.scores[:2].tolist() == [10, 10]
+    assert result.correct[:2].all()
+    original_correct = [q["correct"] for q in sample_questions["questions"]]
+    assert result.responses[0].tolist() == original_correct
+
+    shuffled = shuffle_bank(sample_questions, seeds[1])
+    first_variants = {q["source_id"]: q["variant_order"][0] for q in shuffled["questions"]}
+    assert result.responses[2].tolist() == [first_variants[i] for i in range(1, 11)]
+    assert result.scores[2] == sum(
+        first_variants[i] == original_correct[i - 1] for i in range(1, 11)
+    )
+
+
+def test_quoted_names_and_padded_cells(sample_questions):
+    """Test that quoted names and answers with spaces around them are read."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_sheets(
+            temp_dir,
+            [
+                "Talaba," + ",".join(str(i) for i in range(1, 11)),
+                '"Karimov, Ali",2 ,3,4,1,2,3,4,1,2,3',
+                "",
+                "Vali, b ,c,d,a,b,c,d,a,b,c",
+            ],
+        )
+        sheets = read_answer_sheets(path)
+
+    assert sheets.students == ["Karimov, Ali", "Vali"]
+    assert sheets.answers.tolist() == [[2, 3, 4, 1, 2, 3, 4, 1, 2, 3]] * 2
+
+
+def test_blocks_split_anywhere(monkeypatch, sample_questions):
+    """Test that reading in small blocks gives the same answers."""
+    letters = answer_key(sample_questions)
+    lines = ["Talaba," + ",".join(str(i) for i in range(1, 11))]
+    lines += [f"S{i}," + ",".join(letters[i % 10 :] + letters[: i % 10]) for i in range(50)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_sheets(temp_dir, lines)
+        whole = read_answer_sheets(path)
+        monkeypatch.setattr(grading, "READ_BLOCK_SIZE", 37)
+        blocks = read_answer_sheets(path)
+
+    assert blocks.students == whole.students
+    assert (blocks.answers == whole.answers).all()
+
+
+def test_extra_cells_are_rejected():
+    """Test that a line with more cells than the header is reported."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_sheets(temp_dir, ["Talaba,1,2", "Ali,a,b,c"])
+        with pytest.raises(GradingError, match="Ali"):
+            read_answer_sheets(path)
+
+
+def test_unknown_version_is_rejected(sample_questions):
+    """Test that a version the key does not have is reported by student."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_sheets(temp_dir, ["Talaba,Variant,1,2", "Ali,3,a,b"])
+        sheets = read_answer_sheets(path)
+    with pytest.raises(GradingError, match="Ali"):
+        grade(sheets, build_grading_key(sample_questions, [1, 2]))
+
+
+def test_grade_file_with_answer_key_table(sample_questions):
+    """Test grading with the seeds read back from a version answer key table."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result = generate_versions(
+            sample_questions, [5, 9], temp_dir, "test", formats=["hemis"], max_workers=1
+        )
+        seeds = read_answer_key_seeds(result["answer_key_path"])
+        assert seeds == [5, 9]
+
+        letters = answer_key(shuffle_bank(sample_questions, 9))
+        header = "Talaba,Variant," + ",".join(str(i) for i in range(1, 11))
+        sheets_path = write_sheets(temp_dir, [header, "Ali,2," + ",".join(letters)])
+        output_path = os.path.join(temp_dir, "natijalar.csv")
+        grade_file(sample_questions, sheets_path, output_path, seeds)
+        with open(output_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    assert lines == ["Talaba,Variant,To'g'ri,Jami,Foiz", "Ali,2,10,10,100.0"]
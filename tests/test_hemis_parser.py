@@ -0,0 +1,110 @@
+import io
+import json
+import os
+import random
+import tempfile
+import pytest
+from src.core.formatters import create_word_document, transform_to_program_format
+from src.core.parser import (
+    detect_input_format,
+    iter_hemis_questions,
+    parse_hemis,
+    parse_input_file,
+    parse_text_content,
+)
+
+WORDS = ["savol", "javob", "Oʻzbekiston", "#teg", "====x", "++", "CPU", "a)", "*", "ёж", ""]
+
+
+def random_question(rng, question_id):
+    """Create a question whose texts may be empty or span several lines."""
+
+    def text():
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 6)))
+                 for _ in range(rng.choice([1, 1, 1, 2, 3]))]
+        return "\n".join(lines)
+
+    variants = []
+    for variant_id in range(1, rng.randint(0, 6) + 1):
+        variant_text = text()
+        while variant_text.startswith("#"):  # A leading "#" marks the correct variant
+            variant_text = variant_text[1:]
+        variants.append({"id": variant_id, "text": variant_text})
+    correct = rng.randint(1, len(variants)) if variants and rng.random() < 0.9 else None
+    return {"id": question_id, "text": text(), "variants": variants, "correct": correct}
+
+
+def test_round_trip_on_large_corpus():
+    """Test that parsing a HEMIS export and writing it again gives the same text."""
+    rng = random.Random(36)
+    for _ in range(20):
+        bank = {"questions": [random_question(rng, i) for i in range(1, rng.randint(1, 300))]}
+        exported = transform_to_program_format(bank)
+        assert transform_to_program_format(parse_hemis(exported)) == exported
+        assert parse_hemis(exported) == bank
+
+
+def test_parse_hemis_restores_questions():
+    """Test that a HEMIS export of parsed text gives back the same questions."""
+    bank = parse_text_content(
+        "1. What is Python?\na) A snake\nb) *A language\n\n2. CPU?\na) *Central\nb) Computer\n"
+    )
+    assert parse_hemis(transform_to_program_format(bank)) == bank
+
+
+def test_iter_hemis_questions_streams_crlf_lines():
+    """Test that questions are produced one at a time from Windows line endings."""
+    lines = io.StringIO("Q1\r\n====\r\n#Yes\r\n====\r\nNo\r\n====\r\n++++\r\nQ2\r\n====\r\n", newline="")
+    questions = iter_hemis_questions(lines)
+    assert next(questions) == {
+        "id": 1,
+        "text": "Q1",
+        "variants": [{"id": 1, "text": "Yes"}, {"id": 2, "text": "No"}],
+        "correct": 1,
+    }
+    assert next(questions)["text"] == "Q2"
+
+
+def test_separators_with_trailing_whitespace():
+    """Test that separators detected as HEMIS are also parsed as separators."""
+    content = "Q1\n==== \n#Yes\n====\t\nNo\n ====\n++++  \nQ2\n====\n#Ok\n====\n"
+    assert detect_input_format(content.encode()) == "hemis"
+    assert parse_hemis(content) == {
+        "questions": [
+            {
+                "id": 1,
+                "text": "Q1",
+                "variants": [{"id": 1, "text": "Yes"}, {"id": 2, "text": "No"}],
+                "correct": 1,
+            },
+            {"id": 2, "text": "Q2", "variants": [{"id": 1, "text": "Ok"}], "correct": 1},
+        ]
+    }
+
+
+def test_detect_input_format():
+    """Test that formats are told apart by content alone."""
+    assert detect_input_format(b"PK\x03\x04rest") == "docx"
+    assert detect_input_format(b'\xef\xbb\xbf  {"questions": []}') == "json"
+    assert detect_input_format("Savol?\n====\n#Ha\n====".encode()) == "hemis"
+    assert detect_input_format(b"1. Savol?\na) *Ha\nb) Yo'q\n") == "text"
+
+
+def test_parse_input_file_sniffs_content():
+    """Test that files are parsed by content whatever their extension."""
+    bank = parse_text_content("1. Savol?\na) *Ha\nb) Yo'q\n")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = {
+            "hemis": os.path.join(temp_dir, "export.txt"),
+            "json": os.path.join(temp_dir, "bank.txt"),
+            "docx": os.path.join(temp_dir, "bank.bin"),
+        }
+        with open(paths["hemis"], "w", encoding="utf-8") as f:
+            f.write(transform_to_program_format(bank))
+        with open(paths["json"], "w", encoding="utf-8") as f:
+            json.dump(bank, f)
+        create_word_document(bank, paths["docx"])
+
+        assert parse_input_file(paths["hemis"]) == bank
+        assert parse_input_file(paths["json"]) == bank
+        assert parse_input_file(paths["docx"])["questions"][0]["correct"] == 1
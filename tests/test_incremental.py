@@ -0,0 +1,99 @@
+import io
+import os
+import tempfile
+import zipfile
+import pytest
+from src.core.parser import iter_question_blocks, parse_text_content
+from src.core.duplicate_checker import check_for_duplicates
+from src.core.formatters import create_word_document, create_student_word_document
+from src.core.incremental import UploadSession
+from src.core.pipeline import run_pipeline
+
+
+def _block_problems(content):
+    """Validation problems of a full pipeline run, without duplicate checks."""
+    problems = run_pipeline(io.StringIO(content)).problems
+    return [problem for problem in problems if not problem.code.startswith("duplicate")]
+
+
+@pytest.fixture
+def sample_content():
+    """Create question file content with a duplicate question."""
+    blocks = []
+    for i in range(1, 21):
+        blocks.append(
+            f"{i}. Question number {i}?\n"
+            f"a) First {i}\n"
+            f"b) *Second {i}\n"
+            f"c) Third {i}\n"
+        )
+    blocks.append("3. Question number 3?\na) *Yes\nb) No\n")
+    return "\n".join(blocks)
+
+
+def test_iter_question_blocks_matches_split():
+    """Test that streaming block splitting matches splitting on empty lines."""
+    samples = ["", "a", "a\n", "a\n\n", "a\n\nb", "a\n\n\nb", "\n\na\n\n\n\nb\n", " \n\na"]
+    for content in samples:
+        blocks = [block for _, _, block in iter_question_blocks(io.StringIO(content))]
+        assert blocks == content.split("\n\n"), repr(content)
+
+    starts = [start for _, start, _ in iter_question_blocks(io.StringIO("a\nb\n\nc\n\n\nd"))]
+    assert starts == [1, 4, 6]
+
+
+def test_reupload_matches_full_run(sample_content):
+    """Test that an incremental re-upload gives the same result as a full run."""
+    session = UploadSession()
+    json_data, report, problems = session.update(sample_content)
+    assert json_data == parse_text_content(sample_content)
+    assert report == check_for_duplicates(json_data)
+    assert problems == _block_problems(sample_content)
+    assert "IDENTICAL QUESTIONS FOUND" in report
+
+    # Fix the duplicate, edit one option and insert a new question
+    corrected = sample_content.replace("3. Question number 3?\na) *Yes", "21. Question number 21?\na) *Yes")
+    corrected = corrected.replace("a) First 5\n", "a) First 5\nd) Fourth 5\n")
+    corrected = "0. New first question?\na) *A\nb) B\n\n" + corrected
+
+    json_data, report, problems = session.update(corrected)
+    assert json_data == parse_text_content(corrected)
+    assert report == check_for_duplicates(json_data)
+    assert report == "No duplicate or similar content found."
+    assert problems == _block_problems(corrected)
+    assert [problem.code for problem in problems] == ["variant_order"]
+    assert session.last_diff.added == 3
+    assert session.last_diff.removed == 2
+    assert session.last_diff.unchanged == 19
+
+
+def _document_xml(path):
+    with zipfile.ZipFile(path) as docx_file:
+        return docx_file.read("word/document.xml")
+
+
+def test_cached_word_rendering_matches_full_render(sample_content):
+    """Test that Word documents rebuilt from the fragment cache are identical."""
+    session = UploadSession()
+    json_data, _, _ = session.update(sample_content)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        full_path = os.path.join(temp_dir, "full.docx")
+        cached_path = os.path.join(temp_dir, "cached.docx")
+        cache = {}
+        student_cache = {}
+
+        create_word_document(json_data, cached_path, cache=cache)
+        create_student_word_document(json_data, cached_path + "s", cache=student_cache)
+        assert len(cache) == 21
+
+        edited = sample_content.replace("b) *Second 7", "b) Second 7\nc) *Seventh")
+        json_data, _, _ = session.update(edited)
+
+        create_word_document(json_data, full_path)
+        create_word_document(json_data, cached_path, cache=cache)
+        assert _document_xml(full_path) == _document_xml(cached_path)
+
+        create_student_word_document(json_data, full_path)
+        create_student_word_document(json_data, cached_path, cache=student_cache)
+        assert _document_xml(full_path) == _document_xml(cached_path)
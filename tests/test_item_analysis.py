@@ -0,0 +1,114 @@
+import math
+import os
+import tempfile
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.core import item_analysis
+from src.core.item_analysis import analyze_items, write_item_analysis_document
+
+
+@pytest.fixture
+def sample_questions():
+    """Create a bank of four-variant questions, the first variant correct."""
+    return {
+        "questions": [
+            {
+                "id": i,
+                "text": f"{i}. Question {i}?",
+                "variants": [{"id": j, "text": f"Answer {i}-{j}"} for j in range(1, 5)],
+                "correct": 1,
+            }
+            for i in range(1, 7)
+        ]
+    }
+
+
+@pytest.fixture
+def responses():
+    """Random answers where stronger students answer correctly more often."""
+    rng = np.random.default_rng(5)
+    ability = rng.random((400, 1))
+    chosen = np.where(rng.random((400, 6)) < ability, 1, rng.integers(2, 5, (400, 6)))
+    # Nobody picks variant d) of question 6, a few leave question 5 blank
+    chosen[:, 5] = np.where(chosen[:, 5] == 4, 2, chosen[:, 5])
+    chosen[:7, 4] = 0
+    return chosen.astype(np.uint8)
+
+
+def test_statistics_match_textbook_formulas(sample_questions, responses):
+    """Test the vectorized statistics against direct per-question formulas."""
+    analysis = analyze_items(sample_questions, responses)
+    correct = (responses == 1).astype(float)
+    scores = correct.sum(axis=1)
+
+    assert analysis.student_count == 400
+    assert np.allclose(analysis.difficulty, correct.mean(axis=0))
+    for question in range(6):
+        rest = scores - correct[:, question]
+        expected = np.corrcoef(correct[:, question], rest)[0, 1]
+        assert analysis.discrimination[question] == pytest.approx(expected)
+
+    p = correct.mean(axis=0)
+    expected_kr20 = 6 / 5 * (1 - (p * (1 - p)).sum() / scores.var())
+    assert analysis.kr20 == pytest.approx(expected_kr20)
+
+    assert analysis.variant_rates[4, 0] == pytest.approx(7 / 400)
+    assert np.allclose(analysis.variant_rates.sum(axis=1), 1)
+    assert analysis.variant_rates[5, 4] == 0
+    assert analysis.distractor_efficiency[5] == pytest.approx(2 / 3)
+    assert any("d)" in flag for flag in analysis.flags[5])
+
+
+def test_blocks_give_the_same_statistics(monkeypatch, sample_questions, responses):
+    """Test that the block size does not change the results."""
+    whole = analyze_items(sample_questions, responses)
+    monkeypatch.setattr(item_analysis, "BLOCK_STUDENTS", 33)
+    blocks = analyze_items(sample_questions, responses)
+    assert np.allclose(blocks.difficulty, whole.difficulty)
+    assert np.allclose(blocks.discrimination, whole.discrimination)
+    assert blocks.kr20 == pytest.approx(whole.kr20)
+
+
+def test_miskeyed_question_is_flagged(sample_questions, responses):
+    """Test that a question whose key is wrong shows a negative discrimination."""
+    sample_questions["questions"][2]["correct"] = 3
+    analysis = analyze_items(sample_questions, responses)
+
+    assert analysis.discrimination[2] < 0
+    flags = " ".join(analysis.flags[2])
+    assert "manfiy" in flags
+    assert "a) to'g'ri javobdan ko'p tanlangan" in flags
+
+
+def test_unkeyed_and_unanimous_questions(sample_questions):
+    """Test that undefined statistics are NaN instead of errors."""
+    sample_questions["questions"][0]["correct"] = None
+    responses = np.ones((10, 6), dtype=np.uint8)
+    analysis = analyze_items(sample_questions, responses)
+
+    assert math.isnan(analysis.discrimination[1])
+    assert math.isnan(analysis.distractor_efficiency[0])
+    assert math.isnan(analysis.kr20)
+    assert analysis.flags[0] == ["To'g'ri javob belgilanmagan"]
+
+
+def test_word_report(sample_questions, responses):
+    """Test that the report lists every question with its statistics and flags."""
+    from docx import Document
+
+    analysis = analyze_items(sample_questions, responses)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, "tahlil.docx")
+        write_item_analysis_document(sample_questions, analysis, output_path)
+        document = Document(output_path)
+
+    assert len(document.tables) == 6
+    assert document.tables[0].cell(0, 0).text == "1. Question 1?"
+    assert document.tables[0].cell(1, 0).text == "a) *Answer 1-1"
+    text = "\n".join(paragraph.text for paragraph in document.paragraphs)
+    assert f"KR-20): {analysis.kr20:.2f}" in text
+    assert text.count("Qiyinlik (p)") == 6
+    assert analysis.flags[5][0] in text
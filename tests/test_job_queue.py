@@ -0,0 +1,125 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from src.core.job_queue import JobQueue, JobSteps
+
+
+@pytest.fixture
+def queue_path():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "jobs.db")
+
+
+@pytest.fixture
+def queue(queue_path):
+    queue = JobQueue(queue_path, lease=60, max_attempts=3)
+    yield queue
+    queue.close()
+
+
+def test_jobs_are_claimed_once_in_order(queue_path, queue):
+    """Test that every job goes to exactly one worker, oldest first."""
+    for number in range(3):
+        queue.put("upload", {"number": number})
+    other = JobQueue(queue_path)
+
+    first = queue.claim("a")
+    second = other.claim("b")
+    third = queue.claim("a")
+    assert [job.payload["number"] for job in (first, second, third)] == [0, 1, 2]
+    assert queue.claim("a") is None
+    assert first.attempt == 1
+
+    assert queue.ack(first)
+    assert queue.counts() == {"done": 1, "running": 2}
+    other.close()
+
+
+def test_duplicate_keys_are_queued_once(queue):
+    """Test that a job with a key already in the queue is not added again."""
+    assert queue.put("upload", {}, dedupe_key="update:1") is not None
+    assert queue.put("upload", {}, dedupe_key="update:1") is None
+    assert queue.put("upload", {}) is not None
+    assert queue.counts() == {"queued": 2}
+
+
+def test_retry_delays_and_then_fails(queue):
+    """Test that failed attempts are retried later until attempts run out."""
+    queue.put("convert", {})
+    job = queue.claim("a")
+    assert queue.retry(job, "network", delay=0.05)
+    assert queue.claim("a") is None
+
+    time.sleep(0.06)
+    job = queue.claim("a")
+    assert job.attempt == 2
+    assert queue.retry(job, "network", delay=0)
+    job = queue.claim("a")
+    assert not queue.retry(job, "network")
+    assert queue.counts() == {"failed": 1}
+
+
+def test_expired_lease_hands_job_to_another_worker(queue_path):
+    """Test that a job of a worker that died is claimed again."""
+    queue = JobQueue(queue_path, lease=0.05)
+    queue.put("convert", {})
+    stale = queue.claim("dead")
+    assert queue.claim("b") is None
+
+    time.sleep(0.06)
+    job = queue.claim("b")
+    assert job.id == stale.id and job.attempt == 2
+    # The first attempt no longer holds the job
+    assert not queue.extend(stale)
+    assert not queue.ack(stale)
+    assert queue.extend(job)
+    assert queue.ack(job)
+    queue.close()
+
+
+def test_steps_survive_retries(queue):
+    """Test that steps recorded by one attempt are seen by the next."""
+    queue.put("convert", {})
+    job = queue.claim("a")
+    steps = JobSteps(queue, job.id)
+    steps.mark("file:Test.docx")
+    queue.retry(job, "network", delay=0)
+
+    retried = JobSteps(queue, queue.claim("a").id)
+    assert retried.done("file:Test.docx")
+    assert not retried.done("ready")
+
+
+def test_step_values_survive_retries(queue):
+    """Test that a value recorded with a step is returned to the next attempt."""
+    queue.put("upload", {})
+    job = queue.claim("a")
+    steps = JobSteps(queue, job.id)
+    assert steps.value("bank") is None
+    steps.mark_value("bank", 42)
+    steps.mark("reply")
+    queue.retry(job, "network", delay=0)
+
+    retried = JobSteps(queue, queue.claim("a").id)
+    assert retried.value("bank") == "42"
+    assert retried.value("reply") is None
+
+
+def test_purge_keeps_recent_and_unfinished_jobs(queue):
+    """Test that only jobs finished before the retention period are deleted."""
+    queue.put("upload", {}, dedupe_key="update:1")
+    queue.put("upload", {})
+    job = queue.claim("a")
+    JobSteps(queue, job.id).mark("reply")
+    queue.ack(job)
+
+    assert queue.purge(retention=60) == 0
+    time.sleep(0.01)
+    assert queue.purge(retention=0) == 1
+    assert queue.counts() == {"queued": 1}
+    assert not queue.step_done(job.id, "reply")
+    # The key can be used again once its job is gone
+    assert queue.put("upload", {}, dedupe_key="update:1") is not None
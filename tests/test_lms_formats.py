@@ -0,0 +1,162 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.core.formatters import gift_escape, question_stem
+from src.core.registry import get_format, render_formats
+
+QTI = {"q": "http://www.imsglobal.org/xsd/imsqti_v2p1"}
+MANIFEST = {"m": "http://www.imsglobal.org/xsd/imscp_v1p1"}
+
+
+@pytest.fixture
+def sample_questions():
+    """Create questions with GIFT and XML special characters and a missing key."""
+    questions = [
+        {
+            "id": number,
+            "text": f"{number}. Which is <larger> & why: {{a}} = ~b #{number}?\x0b",
+            "variants": [
+                {"id": 1, "text": f"Answer {number}"},
+                {"id": 2, "text": "C:\\temp\nnext line"},
+                {"id": 3, "text": "None of the above"},
+            ],
+            "correct": 2 if number % 2 else 1,
+        }
+        for number in range(1, 6)
+    ]
+    questions[-1]["correct"] = None
+    return questions
+
+
+def gift_unescape(text):
+    return re.sub(r"\\(.)", lambda match: "\n" if match.group(1) == "n" else match.group(1), text)
+
+
+def test_question_stem_drops_number():
+    """Test that the LMS formats leave numbering to the importing system."""
+    assert question_stem({"text": "12) What is 2 + 2?"}) == "What is 2 + 2?"
+    assert question_stem({"text": "What is 2 + 2?"}) == "What is 2 + 2?"
+    assert question_stem({"text": "7."}) == "7."
+
+
+def test_gift_questions(tmp_path, sample_questions):
+    """Test that GIFT marks the same answers as HEMIS and escapes its syntax."""
+    results = render_formats(sample_questions, ["gift"], str(tmp_path), "bank")
+    assert os.path.basename(results[0].output_path) == "bank_GIFT.txt"
+    with open(results[0].output_path, encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n")
+
+    assert len(blocks) == len(sample_questions)
+    for block, question in zip(blocks, sample_questions):
+        head, *answers, close = block.split("\n")
+        assert close == "}"
+        # Special characters only appear escaped
+        title, stem = re.fullmatch(r"::((?:\\.|[^\\:])*)::\[plain\]((?:\\.|[^\\{])*) \{", head).groups()
+        assert title.startswith(f"{question['id']}. Which")
+        assert gift_unescape(stem) == question_stem(question)
+        markers = [answer[1] for answer in answers]
+        assert markers == [
+            "=" if variant["id"] == question["correct"] else "~" for variant in question["variants"]
+        ]
+        assert [gift_unescape(answer[2:]) for answer in answers] == [
+            variant["text"] for variant in question["variants"]
+        ]
+    assert gift_escape("a\\b") == "a\\\\b"
+
+
+def test_moodle_xml_questions(tmp_path, sample_questions):
+    """Test that Moodle XML is well-formed and grades the HEMIS correct answer."""
+    results = render_formats(sample_questions, ["moodle"], str(tmp_path), "bank")
+    quiz = ET.parse(results[0].output_path).getroot()
+
+    assert quiz.tag == "quiz"
+    assert len(quiz) == len(sample_questions)
+    for element, question in zip(quiz, sample_questions):
+        assert element.get("type") == "multichoice"
+        # Characters XML cannot hold are dropped
+        assert element.find("questiontext/text").text == question_stem(question).replace("\x0b", "")
+        answers = element.findall("answer")
+        assert [answer.find("text").text for answer in answers] == [
+            variant["text"] for variant in question["variants"]
+        ]
+        assert [answer.get("fraction") for answer in answers] == [
+            "100" if variant["id"] == question["correct"] else "0"
+            for variant in question["variants"]
+        ]
+
+
+def test_qti_package(tmp_path, sample_questions):
+    """Test that the QTI package lists one well-formed item per question."""
+    results = render_formats(sample_questions, ["qti"], str(tmp_path), "bank")
+    with zipfile.ZipFile(results[0].output_path) as package:
+        assert package.testzip() is None
+        manifest = ET.fromstring(package.read("imsmanifest.xml"))
+        resources = manifest.findall("m:resources/m:resource", MANIFEST)
+        assert [resource.get("href") for resource in resources] == [
+            f"items/item{number}.xml" for number in range(1, 6)
+        ]
+        items = [ET.fromstring(package.read(resource.get("href"))) for resource in resources]
+
+    for item, question in zip(items, sample_questions):
+        choices = item.findall(".//q:simpleChoice", QTI)
+        assert [choice.text for choice in choices] == [
+            variant["text"] for variant in question["variants"]
+        ]
+        correct = item.find(".//q:correctResponse/q:value", QTI)
+        if question["correct"] is None:
+            assert correct is None
+        else:
+            assert correct.text == f"choice{question['correct']}"
+        assert item.find(".//q:prompt", QTI).text == question_stem(question).replace("\x0b", "")
+
+
+def test_qti_package_with_many_items(tmp_path):
+    """Test that a package of more than 65535 items is a valid ZIP64 archive."""
+    sink = get_format("qti").sink_factory(str(tmp_path / "many.zip"), None)
+    sink.track_size = True
+    sink.begin()
+    question = {"id": 1, "text": "1. Savol?", "variants": [{"id": 1, "text": "Javob"}], "correct": 1}
+    for _ in range(0x10001):
+        sink.question(question)
+    estimate = sink.size()
+    sink.end()
+
+    assert abs(estimate - (tmp_path / "many.zip").stat().st_size) < 1024
+    with zipfile.ZipFile(tmp_path / "many.zip") as package:
+        assert len(package.namelist()) == 0x10002
+        assert package.testzip() is None
+        manifest = ET.fromstring(package.read("imsmanifest.xml"))
+        assert len(manifest.findall(".//m:resource", MANIFEST)) == 0x10001
+
+
+@pytest.mark.parametrize("key", ["gift", "moodle", "qti"])
+def test_size_estimate_and_parts(tmp_path, key):
+    """Test that the size estimate is close and split parts stay under the limit."""
+    questions = [
+        {
+            "id": number,
+            "text": f"{number}. Question {number} about topic {number * 7919 % 1000}?",
+            "variants": [{"id": i, "text": f"Answer {number}-{i}"} for i in range(1, 5)],
+            "correct": 1,
+        }
+        for number in range(1, 2001)
+    ]
+    output_format = get_format(key)
+    sink = output_format.sink_factory(str(tmp_path / f"estimate{output_format.suffix}"), None)
+    sink.track_size = True
+    sink.begin()
+    for question in questions:
+        sink.question(question)
+    estimate = sink.size()
+    sink.end()
+    assert abs(estimate - os.path.getsize(sink.output_path)) < 0.05 * estimate
+
+    limit = estimate // 3
+    results = render_formats(questions, [key], str(tmp_path), "bank", max_part_size=limit)
+    parts = results[0].parts
+    assert len(parts) > 2
+    assert all(os.path.getsize(path) <= limit for path in parts)
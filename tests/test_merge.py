@@ -0,0 +1,105 @@
+import csv
+import json
+import os
+import tempfile
+import pytest
+from src import cli
+from src.core.formatters import create_word_document, transform_to_program_format
+from src.core.merge import format_source_problems, merge_files
+from src.core.parser import parse_hemis, parse_text_content
+
+DEPARTMENT_A = """1. What is Python?
+a) A snake
+b) *A programming language
+
+2. What does CPU stand for?
+a) *Central Processing Unit
+b) Computer Processing Unit
+"""
+
+DEPARTMENT_B = """1. What is RAM?
+a) *Memory
+b) Disk
+
+
+2. What does CPU stand for?
+a) *Central Processing Unit
+b) Computer Processing Unit
+
+3. Missing answer?
+a) One
+b) Two
+"""
+
+
+@pytest.fixture
+def department_files():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = [os.path.join(temp_dir, name) for name in ("a.txt", "b.txt", "c.json", "d.docx")]
+        with open(paths[0], "w", encoding="utf-8") as f:
+            f.write(DEPARTMENT_A)
+        with open(paths[1], "w", encoding="cp1251") as f:
+            f.write(DEPARTMENT_B)
+        with open(paths[2], "w", encoding="utf-8") as f:
+            json.dump(parse_text_content("1. JSON question?\na) *Yes\nb) No\n"), f)
+        create_word_document(parse_text_content("1. Word question?\na) *Yes\nb) No\n"), paths[3])
+        yield temp_dir, paths
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_merge_renumbers_and_tracks_sources(department_files, workers):
+    """Test that files are merged in order with global ids and source lines."""
+    temp_dir, paths = department_files
+    output_dir = os.path.join(temp_dir, "out")
+    result = merge_files(paths, output_dir, "bank", formats=["hemis"], max_workers=workers)
+
+    assert result.question_count == 7
+    with open(result.outputs[0].output_path, encoding="utf-8") as f:
+        questions = parse_hemis(f.read())["questions"]
+    assert [q["text"] for q in questions] == [
+        "1. What is Python?",
+        "2. What does CPU stand for?",
+        "1. What is RAM?",
+        "2. What does CPU stand for?",
+        "3. Missing answer?",
+        "1. JSON question?",
+        "1. Word question?",
+    ]
+
+    with open(result.sources_path, encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["Savol", "Fayl", "Qator"]
+    assert rows[1:6] == [
+        ["1", paths[0], "1"],
+        ["2", paths[0], "5"],
+        ["3", paths[1], "1"],
+        ["4", paths[1], "6"],
+        ["5", paths[1], "10"],
+    ]
+    assert rows[6] == ["6", paths[2], ""]
+
+
+def test_merge_reports_problems_across_files(department_files):
+    """Test that duplicates across files and per-file problems carry their source."""
+    _, paths = department_files
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = merge_files(paths, output_dir, "bank", formats=[], max_workers=1)
+
+    problems = [(p.source_file, p.line, p.question_id, p.code) for p in result.problems]
+    assert (paths[1], 10, 5, "missing_correct") in problems
+    assert (paths[1], 6, 4, "duplicate_question") in problems
+    report = format_source_problems(result.problems)
+    assert f"{paths[1]}:6 (Question 4): identical to Question 2" in report
+
+
+def test_cli_merge(department_files, capsys):
+    """Test the merge command of the command line tool."""
+    temp_dir, paths = department_files
+    output_dir = os.path.join(temp_dir, "cli")
+    status = cli.main(["merge", paths[0], paths[2], "-o", output_dir, "-n", "bank", "-j", "1"])
+
+    assert status == 0
+    assert "2 files" in capsys.readouterr().out
+    assert os.path.exists(os.path.join(output_dir, "bank_Hemis.txt"))
+    assert cli.main(["merge", *paths, "-o", output_dir, "-f", "word", "-f", "hemis"]) == 1
+    assert os.path.exists(os.path.join(output_dir, "merged_Yakuniy.docx"))
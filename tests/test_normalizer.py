@@ -0,0 +1,205 @@
+import pytest
+from src.core import duplicate_checker
+from src.core.duplicate_checker import check_for_duplicates, split_duplicate_report
+from src.core.normalizer import normalize_text, normalize_question_text, fingerprint
+
+
+def test_normalize_text_unifies_apostrophes_and_case():
+    """Test that Uzbek apostrophe variants and case do not matter."""
+    variants = ["O'zbekiston", "O‘zbekiston", "Oʻzbekiston", "oʼzbekiston", "O`ZBEKISTON"]
+    assert {normalize_text(text) for text in variants} == {"o'zbekiston"}
+
+
+def test_normalize_text_folds_homoglyphs_punctuation_and_spaces():
+    """Test that Cyrillic look-alikes, punctuation and spacing are ignored."""
+    # "Сomputer" starts with a Cyrillic С, "рrocessor" with a Cyrillic р
+    assert normalize_text("Сomputer  рrocessor?") == normalize_text("computer processor")
+    assert normalize_text("Central\tProcessing - Unit.") == "central processing unit"
+    assert normalize_text("ﬁle") == "file"  # NFKC ligature
+
+
+@pytest.mark.parametrize(
+    "first,second",
+    [
+        ("-1", "1"),
+        ("2 - 3", "2 3"),
+        ("1/2", "1.2"),
+        ("1.2", "12"),
+        ("1,5", "15"),
+        ("C", "C#"),
+        ("50%", "50"),
+        ("все", "всё"),
+    ],
+)
+def test_normalize_text_keeps_meaningful_punctuation(first, second):
+    """Test that signs, #, %, /, decimal separators and ё are not folded away."""
+    assert normalize_text(first) != normalize_text(second)
+
+
+def test_normalize_text_folds_sentence_punctuation_around_numbers():
+    """Test that punctuation next to numbers that does not change them is folded."""
+    assert normalize_text("Answer: 12.") == normalize_text("answer 12")
+    assert normalize_text("1, 2, 3") == normalize_text("1 2 3")
+    assert normalize_text("x −5") == normalize_text("x -5")
+
+
+def test_check_for_duplicates_keeps_distinct_short_options():
+    """Test that options differing in meaningful punctuation are not duplicates."""
+    bank = {
+        "questions": [
+            {
+                "id": 1,
+                "text": "Which language targets .NET?",
+                "variants": [{"id": 1, "text": "C"}, {"id": 2, "text": "C#"}, {"id": 3, "text": "Java"}],
+                "correct": 2,
+            },
+            {
+                "id": 2,
+                "text": "2 - 3 = ?",
+                "variants": [{"id": 1, "text": "-1"}, {"id": 2, "text": "1"}, {"id": 3, "text": "5"}],
+                "correct": 1,
+            },
+            {
+                "id": 3,
+                "text": "Half of 2.4?",
+                "variants": [{"id": 1, "text": "1/2"}, {"id": 2, "text": "1.2"}, {"id": 3, "text": "50%"}],
+                "correct": 2,
+            },
+        ]
+    }
+    assert check_for_duplicates(bank) == "No duplicate or similar content found."
+
+
+def test_normalize_question_text_ignores_number():
+    """Test that the question number in front of the text is ignored."""
+    assert normalize_question_text("12. What is Python?") == normalize_question_text("3) what is python")
+
+
+def test_fingerprint_is_stable_64_bit():
+    """Test that fingerprints are 64-bit and depend only on the text."""
+    value = fingerprint("central processing unit")
+    assert 0 <= value < 2 ** 64
+    assert value == fingerprint("central processing unit")
+    assert value != fingerprint("central processing units")
+
+
+def _bank(texts, options=("Yes", "No")):
+    return {
+        "questions": [
+            {
+                "id": i,
+                "text": text,
+                "variants": [{"id": j, "text": option} for j, option in enumerate(options, 1)],
+                "correct": 1,
+            }
+            for i, text in enumerate(texts, 1)
+        ]
+    }
+
+
+def test_check_for_duplicates_uses_normalized_texts():
+    """Test that questions differing only in spelling details are duplicates."""
+    report = check_for_duplicates(_bank(["1. Oʻzbekiston poytaxti?", "2. O'zbekiston  poytaxti"]))
+    assert (
+        "Question 2 and Question 1 - identical apart from case, spacing, apostrophes "
+        "or punctuation" in report
+    )
+
+    report = check_for_duplicates(_bank(["Q?"], options=("Central Unit", "central unit.")))
+    assert "Options a and b are identical apart from" in report
+
+    report = check_for_duplicates(_bank(["1. Poytaxt?", "2.  Poytaxt?"]))
+    assert "Question 2 and Question 1 - identical\n" in report
+
+
+def test_fingerprint_collisions_are_verified(monkeypatch):
+    """Test that texts sharing a fingerprint are not reported as duplicates."""
+    monkeypatch.setattr(duplicate_checker, "fingerprint", lambda text: 42)
+
+    report = check_for_duplicates(_bank(["First?", "Second?", "first"], options=("A", "B")))
+    assert report.count("IDENTICAL QUESTIONS FOUND") == 1
+    assert "Question 3 and Question 1 - identical apart from" in report
+    assert "IDENTICAL OPTIONS" not in report
+
+
+def test_reworded_questions_with_same_answers():
+    """Test that the same answer set is found regardless of variant order."""
+    bank = {
+        "questions": [
+            {
+                "id": 1,
+                "text": "What does CPU stand for?",
+                "variants": [
+                    {"id": 1, "text": "Central Processing Unit"},
+                    {"id": 2, "text": "Computer Processing Unit"},
+                    {"id": 3, "text": "Central Program Utility"},
+                ],
+                "correct": 1,
+            },
+            {
+                "id": 2,
+                "text": "Expand the abbreviation CPU",
+                "variants": [
+                    {"id": 1, "text": "Central program utility"},
+                    {"id": 2, "text": "Central Processing Unit."},
+                    {"id": 3, "text": "Computer Processing Unit"},
+                ],
+                "correct": 2,
+            },
+            {
+                "id": 3,
+                "text": "CPU means",
+                "variants": [
+                    {"id": 1, "text": "Computer Processing Unit"},
+                    {"id": 2, "text": "Central Processing Unit"},
+                    {"id": 3, "text": "Central Program Utility"},
+                ],
+                "correct": 1,
+            },
+            {
+                "id": 4,
+                "text": "Is Python a language?",
+                "variants": [{"id": 1, "text": "Ha"}, {"id": 2, "text": "Yo'q"}],
+                "correct": 1,
+            },
+            {
+                "id": 5,
+                "text": "Is Java a language?",
+                "variants": [{"id": 1, "text": "Ha"}, {"id": 2, "text": "Yo'q"}],
+                "correct": 1,
+            },
+        ]
+    }
+
+    report = check_for_duplicates(bank)
+    assert "POSSIBLE DUPLICATE QUESTIONS FOUND (same answers):\nQuestion 2 and Question 1" in report
+    assert "CONFLICTING ANSWER KEYS FOUND:\nQuestion 3 and Question 1" in report
+    # Two-variant answer sets are too common to identify a question
+    assert "Question 5 and Question 4" not in report
+    assert report.index("POSSIBLE DUPLICATE") < report.index("CONFLICTING")
+
+    # Reworded duplicates are warnings and do not block the upload
+    blocking, warnings = split_duplicate_report(report)
+    assert blocking == ""
+    assert warnings.startswith("POSSIBLE DUPLICATE QUESTIONS FOUND")
+
+
+def test_numeric_and_short_answer_sets_are_not_compared():
+    """Test that unrelated questions sharing generic answers are not reported."""
+    def question(number, text, variants, correct):
+        return {
+            "id": number,
+            "text": text,
+            "variants": [{"id": i, "text": t} for i, t in enumerate(variants, start=1)],
+            "correct": correct,
+        }
+
+    bank = {
+        "questions": [
+            question(1, "2 + 2 * 2 = ?", ["4", "6", "8", "10"], 2),
+            question(2, "Juft sonlar yig'indisi 3 + 5 = ?", ["10", "8", "6", "4"], 2),
+            question(3, "Qaysi biri to'g'ri?", ["A", "B", "C", "D"], 1),
+            question(4, "Qaysi javob mos?", ["D", "C", "B", "A"], 1),
+        ]
+    }
+    assert check_for_duplicates(bank) == "No duplicate or similar content found."
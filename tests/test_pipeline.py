@@ -0,0 +1,81 @@
+import io
+import pytest
+from src.core.parser import parse_text_content
+from src.core.pipeline import run_pipeline, format_problems
+
+
+@pytest.fixture
+def problem_content():
+    """Create question file content with one problem of each kind."""
+    return (
+        "1. What is Python?\n"
+        "a) A snake\n"
+        "b) A programming language\n"
+        "\n"
+        "2. What does CPU stand for?\n"
+        "a) *Central Processing Unit\n"
+        "b) *Computer Processing Unit\n"
+        "\n"
+        "3. Which one is a vowel?\n"
+        "a) *A\n"
+        "\n"
+        "4.\n"
+        "a) *Yes\n"
+        "c) No\n"
+        "\n"
+        "5. What is  python\n"
+        "a) *Language\n"
+        "b) language.\n"
+    )
+
+
+def test_pipeline_reports_problems_with_lines(problem_content):
+    """Test that every kind of problem is found on the right line."""
+    result = run_pipeline(io.StringIO(problem_content))
+
+    assert result.json_data == parse_text_content(problem_content)
+    assert not result.stopped_early
+    assert [(p.line, p.question_id, p.code) for p in result.problems] == [
+        (1, 1, "missing_correct"),
+        (7, 2, "multiple_correct"),
+        (9, 3, "too_few_variants"),
+        (12, 4, "empty_text"),
+        (14, 4, "variant_order"),
+        (16, 5, "duplicate_question"),
+        (16, 5, "duplicate_option"),
+    ]
+
+    report = format_problems(result.problems, limit=2)
+    assert report.splitlines()[0] == "Line 1 (Question 1): no variant is marked with *"
+    assert report.splitlines()[-1] == "... and 5 more"
+
+
+def test_pipeline_stops_early(problem_content):
+    """Test that processing stops after the first N problems."""
+    result = run_pipeline(io.StringIO(problem_content), max_errors=2)
+
+    assert result.stopped_early
+    assert len(result.problems) == 2
+    assert len(result.json_data["questions"]) == 2
+
+
+def test_pipeline_accepts_valid_file():
+    """Test that a valid file produces no problems."""
+    content = "1. Q?\na) *Yes\nb) No\n\n2. R?\na) One\nb) *Two\n"
+    result = run_pipeline(io.StringIO(content))
+    assert result.problems == []
+    assert len(result.json_data["questions"]) == 2
+
+
+def test_pipeline_reports_same_answer_sets():
+    """Test that reworded questions with the same variants are reported."""
+    content = (
+        "1. Capital of France?\na) *Paris\nb) Rome\nc) Berlin\n\n"
+        "2. France's capital city is\na) Berlin\nb) *Paris\nc) Rome\n\n"
+        "3. Which city is the capital of France?\na) Rome\nb) Paris\nc) *Berlin\n"
+    )
+    result = run_pipeline(io.StringIO(content))
+    assert [(p.question_id, p.code) for p in result.problems] == [
+        (2, "same_answers"),
+        (3, "conflicting_answers"),
+    ]
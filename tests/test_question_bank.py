@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+import pytest
+
+from src.core.parser import parse_hemis, parse_text_content
+from src.core.question_bank import QuestionBank, build_match_query
+from src.core.registry import render_formats
+
+BIOLOGY = """1. Fotosintez qayerda boradi?
+a) *Xloroplastda
+b) Yadroda
+
+2. Hujayraning energiya markazi?
+a) *Mitoxondriya
+b) Ribosoma
+"""
+
+PHYSICS = """1. Tezlikning o'lchov birligi?
+a) *m/s
+b) kg
+
+2. Quyosh energiyasi qanday hosil bo'ladi?
+a) *Termoyadro sintezi
+b) Yonish
+"""
+
+
+@pytest.fixture
+def bank():
+    bank = QuestionBank(":memory:")
+    bank.add_bank(parse_text_content(BIOLOGY)["questions"], "biologiya.txt", 1)
+    bank.add_bank(parse_text_content(PHYSICS)["questions"], "fizika.docx", 1)
+    bank.add_bank(parse_text_content(BIOLOGY)["questions"], "boshqa.txt", 2)
+    yield bank
+    bank.close()
+
+
+def test_search_finds_question_and_variant_words(bank):
+    """Test that searches look at question texts and variant texts."""
+    hits = bank.search("fotosintez", 1)
+    assert [(hit.file_name, hit.number) for hit in hits] == [("biologiya.txt", 1)]
+    assert hits[0].question["variants"][0]["text"] == "Xloroplastda"
+
+    hits = bank.search("MITOXONDRIYA", 1)
+    assert [(hit.file_name, hit.number) for hit in hits] == [("biologiya.txt", 2)]
+
+
+def test_search_matches_prefix_of_last_word_and_all_words(bank):
+    """Test that every word must match and the last one may be a prefix."""
+    assert {hit.file_name for hit in bank.search("energiya", 1)} == {"biologiya.txt", "fizika.docx"}
+    assert [hit.file_name for hit in bank.search("quyosh termo", 1)] == ["fizika.docx"]
+    assert bank.search("quyosh termo", 2) == []
+
+
+def test_search_is_limited_to_the_owner(bank):
+    """Test that users only find questions from their own banks."""
+    assert [hit.file_name for hit in bank.search("fotosintez", 2)] == ["boshqa.txt"]
+    assert bank.search("fotosintez", 3) == []
+
+
+def test_query_syntax_from_users_is_ignored(bank):
+    """Test that FTS5 operators and quotes typed by users cannot break a query."""
+    assert build_match_query('" ( * :', 1) is None
+    assert bank.search('fotosintez" (', 1)[0].number == 1
+    assert bank.search("NOT AND", 1) == []
+    assert bank.count_matches("", 1) == 0
+
+
+def test_identical_bank_is_stored_once(bank):
+    """Test that uploading the same questions again does not duplicate them."""
+    questions = parse_text_content(BIOLOGY)["questions"]
+    assert bank.add_bank(questions, "biologiya.txt", 1) == 1
+    assert bank.count_matches("fotosintez", 1) == 1
+
+
+def test_bank_persists_across_connections():
+    """Test that stored banks are found after reopening the database."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "bank.db")
+        bank = QuestionBank(path)
+        bank.add_bank(parse_text_content(PHYSICS)["questions"], "fizika.txt", 7)
+        bank.close()
+
+        bank = QuestionBank(path)
+        assert bank.count_matches("tezlik", 7) == 1
+        bank.close()
+
+
+def test_export_streams_matches_through_sinks(bank):
+    """Test that matching questions are renumbered and rendered by the registry."""
+    questions = bank.iter_matches("energiya", 1)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = render_formats(questions, ["hemis"], temp_dir, "Eksport")
+        assert results[0].error is None
+        with open(results[0].output_path, encoding="utf-8") as f:
+            exported = parse_hemis(f.read())["questions"]
+
+    assert [question["text"] for question in exported] == [
+        "2. Hujayraning energiya markazi?",
+        "2. Quyosh energiyasi qanday hosil bo'ladi?",
+    ]
+    assert [question["id"] for question in bank.iter_matches("energiya", 1)] == [1, 2]
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.bot.poller import BANK_PREFIX, JOB_CONVERT, JOB_GRADE, JOB_UPLOAD
+from src.bot import handlers
+from src.bot.handlers import FORMAT_PROMPT, NO_BANK_MESSAGE, READY_MESSAGE
+from src.bot.queue_worker import FAILED_MESSAGE, WorkerStores, process_job
+from src.core import job_queue
+from src.core.job_queue import JobQueue
+from src.core.parser import parse_text_content
+from src.core.question_bank import QuestionBank
+from src.core.upload_cache import UploadCache
+
+QUESTIONS = """1. Fotosintez qayerda boradi?
+a) *Xloroplastda
+b) Yadroda
+
+2. Hujayraning energiya markazi?
+a) *Mitoxondriya
+b) Ribosoma
+"""
+
+
+def parse_questions():
+    return parse_text_content(QUESTIONS)["questions"]
+
+
+class FakeFile:
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    async def download_to_drive(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.content)
+
+
+class FakeBot:
+    """Records what the worker sends; can fail chosen documents and messages once."""
+
+    def __init__(self, files=None, fail_documents=(), fail_messages=0) -> None:
+        self.files = files or {}
+        self.fail_documents = set(fail_documents)
+        self.fail_messages = fail_messages
+        self.messages = []
+        self.documents = []
+        self.downloads = []
+
+    async def get_file(self, file_id: str) -> FakeFile:
+        self.downloads.append(file_id)
+        return FakeFile(self.files[file_id])
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.fail_messages:
+            self.fail_messages -= 1
+            raise ConnectionError("network down")
+        self.messages.append((text, reply_markup))
+
+    async def send_document(self, chat_id, document, filename):
+        if filename in self.fail_documents:
+            self.fail_documents.discard(filename)
+            raise ConnectionError("network down")
+        self.documents.append(filename)
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    monkeypatch.setattr(job_queue, "RETRY_DELAY", 0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        queue = JobQueue(os.path.join(temp_dir, "jobs.db"), max_attempts=2)
+        stores = WorkerStores(
+            QuestionBank(os.path.join(temp_dir, "bank.db")),
+            UploadCache(os.path.join(temp_dir, "cache.db")),
+        )
+        yield queue, stores
+        queue.close()
+        stores.bank.close()
+        stores.upload_cache.close()
+
+
+def run_next(bot, queue, stores) -> None:
+    asyncio.run(process_job(bot, queue, stores, queue.claim("test")))
+
+
+def test_upload_replies_with_keyboard_of_stored_bank(setup):
+    """Test that an accepted upload is stored and offered for conversion."""
+    queue, stores = setup
+    bank = stores.bank
+    bot = FakeBot(files={"f1": QUESTIONS.encode("utf-8")})
+    queue.put(
+        JOB_UPLOAD,
+        {"user_id": 7, "file_id": "f1", "file_unique_id": "u1", "file_name": "biologiya.txt"},
+    )
+    run_next(bot, queue, stores)
+
+    (text, keyboard), = bot.messages
+    data = keyboard.inline_keyboard[0][0].callback_data
+    assert data.startswith(BANK_PREFIX)
+    bank_id = int(data.split(":")[1])
+    assert bank.load_bank(bank_id, 7)[0] == "biologiya.txt"
+    assert queue.counts() == {"done": 1}
+
+
+def test_reworded_duplicates_are_warnings_shown_with_keyboard(setup):
+    """Test that same answer sets do not block an upload but are shown with it."""
+    queue, stores = setup
+    content = (
+        "1. Qaysi organoid fotosintez qiladi?\na) *Xloroplast\nb) Yadro\nc) Ribosoma\n\n"
+        "2. Fotosintez qayerda boradi?\na) Yadro\nb) Ribosoma\nc) *Xloroplast\n\n"
+        "3. Oqsil qayerda sintezlanadi?\na) Xloroplast\nb) Yadro\nc) *Ribosoma\n\n"
+        "4. 2 + 2 * 2 = ?\na) 4\nb) *6\nc) 8\nd) 10\n\n"
+        "5. 3 + 5 = ?\na) 10\nb) *8\nc) 6\nd) 4\n"
+    )
+    bot = FakeBot(files={"f1": content.encode("utf-8")})
+    queue.put(JOB_UPLOAD, {"user_id": 7, "file_id": "f1", "file_name": "biologiya.txt"})
+    run_next(bot, queue, stores)
+
+    (text, keyboard), = bot.messages
+    assert keyboard.inline_keyboard[0][0].callback_data.startswith(BANK_PREFIX)
+    assert "POSSIBLE DUPLICATE QUESTIONS FOUND" in text
+    assert "CONFLICTING ANSWER KEYS FOUND:\nQuestion 3 and Question 1" in text
+    # Numeric answers are shared by unrelated questions
+    assert "Question 5" not in text
+    assert text.endswith(FORMAT_PROMPT)
+
+
+def test_upload_with_only_similar_findings_is_accepted(setup):
+    """Test that options a few characters apart are a warning, not a rejection."""
+    queue, stores = setup
+    content = (
+        "1. Oqsillar nimadan tuzilgan?\na) *Amino acids\nb) Amino acid\nc) Lipids\n\n"
+        "2. Hujayraning energiya markazi?\na) *Mitoxondriya\nb) Ribosoma\n"
+    )
+    bot = FakeBot(files={"f1": content.encode("utf-8")})
+    queue.put(JOB_UPLOAD, {"user_id": 7, "file_id": "f1", "file_name": "biologiya.txt"})
+    run_next(bot, queue, stores)
+
+    (text, keyboard), = bot.messages
+    assert keyboard is not None
+    assert "SIMILAR OPTIONS WITHIN THE SAME QUESTION FOUND" in text
+    assert "edit distance 1, 91% similar" in text
+    assert text.endswith(FORMAT_PROMPT)
+
+
+def test_repeat_upload_is_not_downloaded_again(setup):
+    """Test that a file with a known file_unique_id is taken from the cache."""
+    queue, stores = setup
+    bot = FakeBot(files={"f1": QUESTIONS.encode("utf-8")})
+    for user_id, file_id in ((7, "f1"), (8, "forwarded")):
+        queue.put(
+            JOB_UPLOAD,
+            {"user_id": user_id, "file_id": file_id, "file_unique_id": "u1", "file_name": "b.txt"},
+        )
+        run_next(bot, queue, stores)
+
+    assert bot.downloads == ["f1"]
+    # Each user gets a keyboard of their own stored bank
+    first, second = [keyboard.inline_keyboard[0][0].callback_data for _, keyboard in bot.messages]
+    assert first != second
+
+
+def test_retried_upload_reuses_stored_bank(setup, monkeypatch):
+    """Test that a retry after a failed reply does not store the bank again."""
+    queue, stores = setup
+    stored = []
+    add_bank = stores.bank.add_bank
+
+    def counting_add_bank(*args):
+        stored.append(args[1])
+        return add_bank(*args)
+
+    monkeypatch.setattr(stores.bank, "add_bank", counting_add_bank)
+    bot = FakeBot(files={"f1": QUESTIONS.encode("utf-8")}, fail_messages=1)
+    queue.put(
+        JOB_UPLOAD,
+        {"user_id": 7, "file_id": "f1", "file_unique_id": "u1", "file_name": "biologiya.txt"},
+    )
+
+    run_next(bot, queue, stores)
+    assert queue.counts() == {"queued": 1}
+    run_next(bot, queue, stores)
+
+    assert queue.counts() == {"done": 1}
+    assert stored == ["biologiya.txt"]
+    (text, keyboard), = bot.messages
+    bank_id = int(keyboard.inline_keyboard[0][0].callback_data.split(":")[1])
+    assert stores.bank.load_bank(bank_id, 7)[0] == "biologiya.txt"
+
+
+def test_retried_conversion_does_not_send_files_twice(setup):
+    """Test that a retry only sends what the failed attempt did not."""
+    queue, stores = setup
+    bank = stores.bank
+    bank_id = bank.add_bank(parse_questions(), "biologiya.txt", 7)
+    bot = FakeBot(fail_documents={"biologiya_Yakuniy.docx"})
+    queue.put(JOB_CONVERT, {"user_id": 7, "bank_id": bank_id, "format": "all"})
+
+    run_next(bot, queue, stores)
+    assert queue.counts() == {"queued": 1}
+    assert READY_MESSAGE not in [text for text, _ in bot.messages]
+    sent_first = list(bot.documents)
+
+    run_next(bot, queue, stores)
+    assert queue.counts() == {"done": 1}
+    assert "biologiya_Yakuniy.docx" in bot.documents
+    assert sorted(bot.documents) == sorted(set(bot.documents))
+    assert bot.documents[:len(sent_first)] == sent_first
+    assert [text for text, _ in bot.messages] == [READY_MESSAGE]
+
+
+def test_archive_outputs_are_sent_in_zips_under_part_size(setup, monkeypatch):
+    """Test that the outputs of an archive upload are packed into several zips."""
+    monkeypatch.setattr(handlers, "MAX_PART_SIZE", 60_000)
+    queue, stores = setup
+    bank_id = stores.bank.add_bank(parse_questions(), "banks.zip", 7)
+    bot = FakeBot()
+    queue.put(JOB_CONVERT, {"user_id": 7, "bank_id": bank_id, "format": "all"})
+    run_next(bot, queue, stores)
+
+    assert queue.counts() == {"done": 1}
+    assert len(bot.documents) > 1
+    assert bot.documents == [f"banks_{number}.zip" for number in range(1, len(bot.documents) + 1)]
+    assert [text for text, _ in bot.messages] == [READY_MESSAGE]
+
+
+class ThreadRecordingBank:
+    """Passes calls on to a question bank and records the threads they run in."""
+
+    def __init__(self, bank) -> None:
+        self.bank = bank
+        self.threads = []
+
+    def __getattr__(self, name):
+        method = getattr(self.bank, name)
+
+        def call(*args):
+            self.threads.append(threading.get_ident())
+            return method(*args)
+
+        return call
+
+
+def test_search_and_export_query_the_bank_off_the_event_loop(setup):
+    """Test that /search and /export run their database queries in a thread."""
+    _, stores = setup
+    stores.bank.add_bank(parse_questions(), "biologiya.txt", 7)
+    bank = ThreadRecordingBank(stores.bank)
+    replies = []
+
+    async def reply_text(text, reply_markup=None):
+        replies.append(text)
+
+    async def run():
+        update = SimpleNamespace(
+            message=SimpleNamespace(reply_text=reply_text), effective_user=SimpleNamespace(id=7)
+        )
+        context = SimpleNamespace(args=["Fotosintez"], bot_data={"question_bank": bank}, user_data={})
+        await handlers.search_command(update, context)
+        await handlers.export_command(update, context)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(bank.threads) == 2
+    assert loop_thread not in bank.threads
+    assert "biologiya.txt, 1-savol" in replies[0]
+    assert replies[1].startswith("1 ta savol topildi")
+
+
+def test_job_fails_after_last_attempt(setup):
+    """Test that the user is told once a job has used up its attempts."""
+    queue, stores = setup
+    bank = stores.bank
+    bot = FakeBot(fail_documents={"biologiya_Yakuniy.docx"})
+    bank_id = bank.add_bank(parse_questions(), "biologiya.txt", 7)
+    queue.put(JOB_CONVERT, {"user_id": 7, "bank_id": bank_id, "format": "word"})
+
+    run_next(bot, queue, stores)
+    bot.fail_documents.add("biologiya_Yakuniy.docx")
+    run_next(bot, queue, stores)
+    assert queue.counts() == {"failed": 1}
+    assert [text for text, _ in bot.messages] == [FAILED_MESSAGE]
+    assert bot.documents == []
+
+
+def test_other_users_bank_is_not_converted(setup):
+    """Test that callback data naming another user's bank sends nothing."""
+    queue, stores = setup
+    bank = stores.bank
+    bot = FakeBot()
+    bank_id = bank.add_bank(parse_questions(), "biologiya.txt", 7)
+    queue.put(JOB_CONVERT, {"user_id": 8, "bank_id": bank_id, "format": "word"})
+    run_next(bot, queue, stores)
+    assert bot.documents == []
+    assert "Sessiya" in bot.messages[0][0]
+
+
+def test_answer_sheet_is_graded_against_last_bank(setup):
+    """Test that a queued answer sheet is graded with the user's last bank."""
+    pytest.importorskip("numpy")
+    queue, stores = setup
+    sheets = "Talaba,1,2\nAli,a,a\nVali,a,b\n"
+    bot = FakeBot(files={"s1": sheets.encode("utf-8")})
+    queue.put(JOB_GRADE, {"user_id": 7, "file_id": "s1", "file_name": "javoblar.csv"})
+    run_next(bot, queue, stores)
+    assert [text for text, _ in bot.messages] == [NO_BANK_MESSAGE]
+
+    stores.bank.add_bank(parse_questions(), "biologiya.txt", 7)
+    queue.put(JOB_GRADE, {"user_id": 7, "file_id": "s1", "file_name": "javoblar.csv"})
+    run_next(bot, queue, stores)
+    assert bot.documents == ["biologiya_Natijalar.csv", "biologiya_Tahlil.docx"]
+    assert "2 ta talaba" in bot.messages[-1][0]
+    assert queue.counts() == {"done": 2}
@@ -0,0 +1,197 @@
+import os
+import tempfile
+import pytest
+from src.core.formatters import QuestionSink, transform_to_program_format
+from src.core import registry
+from src.core.registry import (
+    get_default_formats,
+    get_format,
+    get_formats,
+    register_format,
+    render_formats,
+)
+
+
+@pytest.fixture
+def sample_questions():
+    """Create sample questions data structure."""
+    return {
+        "questions": [
+            {
+                "id": 1,
+                "text": "What is Python?",
+                "variants": [
+                    {"id": 1, "text": "A snake"},
+                    {"id": 2, "text": "A programming language"},
+                ],
+                "correct": 2,
+            },
+            {
+                "id": 2,
+                "text": "What does CPU stand for?",
+                "variants": [
+                    {"id": 1, "text": "Central Processing Unit"},
+                    {"id": 2, "text": "Computer Processing Unit"},
+                ],
+                "correct": 1,
+            },
+        ]
+    }
+
+
+class CountingSink(QuestionSink):
+    """Sink that records the questions it receives."""
+
+    def begin(self):
+        self.received = []
+
+    def question(self, question):
+        self.received.append(question["id"])
+
+    def end(self):
+        with open(self.output_path, "w") as f:
+            f.write(",".join(map(str, self.received)))
+
+
+class FailingSink(QuestionSink):
+    """Sink that fails on the first question."""
+
+    def question(self, question):
+        raise RuntimeError("broken")
+
+
+@pytest.fixture
+def extra_formats():
+    """Register test formats and remove them afterwards."""
+    register_format("counting", "Counting", "_count.txt", CountingSink)
+    register_format("failing", "Failing", "_fail.txt", FailingSink)
+    yield
+    registry._FORMATS.pop("counting")
+    registry._FORMATS.pop("failing")
+
+
+def test_builtin_formats_registered():
+    """Test that the bot's formats are registered in keyboard order."""
+    keys = [output_format.key for output_format in get_formats()]
+    assert keys[:4] == ["student", "student_novariant", "hemis", "word"]
+    with pytest.raises(ValueError):
+        get_format("unknown")
+
+
+def test_default_formats_are_the_original_four(extra_formats):
+    """Test that "all" keeps to the original formats and new ones are opt-in."""
+    assert [output_format.key for output_format in get_default_formats()] == [
+        "student", "student_novariant", "hemis", "word",
+    ]
+    assert not get_format("counting").default
+    assert {"gift", "qti", "counting"} <= {output_format.key for output_format in get_formats()}
+
+
+def test_render_formats_single_pass(sample_questions, extra_formats):
+    """Test that all formats are rendered from one pass over the questions."""
+    iterations = []
+
+    def questions():
+        for question in sample_questions["questions"]:
+            iterations.append(question["id"])
+            yield question
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = render_formats(
+            questions(), ["hemis", "word", "counting", "failing"], temp_dir, "test"
+        )
+
+        assert iterations == [1, 2]
+        assert [result.key for result in results] == ["hemis", "word", "counting", "failing"]
+        assert [result.error is None for result in results] == [True, True, True, False]
+
+        with open(results[0].output_path, encoding="utf-8") as f:
+            assert f.read() == transform_to_program_format(sample_questions)
+        assert os.path.basename(results[1].output_path) == "test_Yakuniy.docx"
+        with open(results[2].output_path) as f:
+            assert f.read() == "1,2"
+
+
+def make_bank(count):
+    """Create a bank of numbered two-variant questions."""
+    return [
+        {
+            "id": number,
+            "text": f"Question {number} about a topic?",
+            "variants": [
+                {"id": 1, "text": f"Answer {number}"},
+                {"id": 2, "text": f"Other answer {number}"},
+            ],
+            "correct": 1,
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+def test_split_outputs_into_parts_at_question_boundaries():
+    """Test that outputs over the part size are split and each part is reported."""
+    questions = make_bank(40)
+    finished = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = render_formats(
+            questions,
+            ["hemis"],
+            temp_dir,
+            "big",
+            max_part_size=500,
+            on_part=lambda key, path: finished.append((key, os.path.basename(path))),
+        )
+
+        parts = results[0].parts
+        assert len(parts) > 1
+        assert finished == [("hemis", f"big_Hemis_{n}.txt") for n in range(1, len(parts) + 1)]
+
+        texts = []
+        for path in parts:
+            assert os.path.getsize(path) <= 500
+            with open(path, encoding="utf-8") as f:
+                texts.append(f.read())
+
+    # The parts together hold every question once, in order
+    assert "\n++++\n".join(texts) == transform_to_program_format({"questions": questions})
+
+
+def test_output_under_part_size_keeps_plain_name(sample_questions):
+    """Test that an output that fits in one part is not numbered."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = render_formats(
+            sample_questions["questions"], ["hemis"], temp_dir, "small", max_part_size=10_000
+        )
+        assert results[0].parts == (os.path.join(temp_dir, "small_Hemis.txt"),)
+        assert os.path.exists(results[0].parts[0])
+
+
+def test_word_size_estimate_is_close(tmp_path):
+    """Test that the estimated size of a Word output is close to the saved size."""
+    sink = get_format("word").sink_factory(str(tmp_path / "estimate.docx"), None)
+    sink.track_size = True
+    sink.begin()
+    for question in make_bank(2000):
+        sink.question(question)
+    estimate = sink.size()
+    sink.end()
+
+    assert abs(estimate - os.path.getsize(tmp_path / "estimate.docx")) < 0.05 * estimate
+
+
+def test_split_word_parts_share_the_fragment_cache(tmp_path):
+    """Test that Word parts hold every question and the cache keeps all fragments."""
+    from src.core.docx_reader import parse_docx_file
+
+    questions = make_bank(300)
+    caches = {}
+    results = render_formats(
+        questions, ["word"], str(tmp_path), "bank", caches=caches, max_part_size=40_000
+    )
+
+    parts = results[0].parts
+    assert len(parts) > 1
+    texts = [q["text"] for path in parts for q in parse_docx_file(path)["questions"]]
+    assert texts == [question["text"] for question in questions]
+    assert len(caches["word"]) == 300
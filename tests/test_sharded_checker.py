@@ -0,0 +1,91 @@
+import random
+import pytest
+from src.core import duplicate_checker
+from src.core.duplicate_checker import check_for_duplicates
+from src.core.sharded_checker import check_for_duplicates_sharded, shard_positions
+
+
+def make_bank(count, seed=7):
+    """Create a bank with identical questions, reworded duplicates and conflicts."""
+    rng = random.Random(seed)
+    questions = []
+    for index in range(count):
+        topic = rng.randrange(count // 3)
+        text = f"{index + 1}. Question about topic {topic}?"
+        if rng.random() < 0.3:
+            text = f"{index + 1}. Reworded question number {index}?"
+        elif rng.random() < 0.1:
+            text = f"{index + 1}. Question abuot topic {topic}?"
+        variants = [{"id": i + 1, "text": f"Answer {topic}-{i}"} for i in range(4)]
+        if rng.random() < 0.1:
+            variants[3]["text"] = variants[0]["text"]
+        rng.shuffle(variants)
+        variants = [{"id": i + 1, "text": v["text"]} for i, v in enumerate(variants)]
+        questions.append(
+            {"id": index + 1, "text": text, "variants": variants, "correct": rng.randint(1, 4)}
+        )
+    return {"questions": questions}
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_sharded_report_matches_single_process(workers):
+    """Test that the sharded check reports exactly what the single check does."""
+    bank = make_bank(300)
+    expected = check_for_duplicates(bank)
+    assert "IDENTICAL QUESTIONS FOUND" in expected
+    assert "CONFLICTING ANSWER KEYS FOUND" in expected
+    assert "SIMILAR QUESTIONS FOUND" in expected
+    assert check_for_duplicates_sharded(bank, workers=workers) == expected
+
+
+def test_sharded_report_with_fingerprint_collisions(monkeypatch):
+    """Test that colliding fingerprints end up in one shard and are verified."""
+    monkeypatch.setattr(duplicate_checker, "question_text_key", lambda text: len(text) << 40)
+    bank = make_bank(120)
+    assert check_for_duplicates_sharded(bank, workers=1) == check_for_duplicates(bank)
+
+
+def test_shard_positions_keep_bank_order():
+    """Test that every question lands in exactly one shard, in bank order."""
+    bank = make_bank(50)
+    signatures = [duplicate_checker.question_signature(q) for q in bank["questions"]]
+    shards = shard_positions(signatures, 5)
+
+    assert len(shards) == 8
+    positions = [position for text_keys, _ in shards for position, _ in text_keys]
+    assert sorted(positions) == list(range(50))
+    for text_keys, answer_keys in shards:
+        assert text_keys == sorted(text_keys)
+        assert answer_keys == sorted(answer_keys)
+
+
+def test_empty_bank():
+    """Test that an empty bank gives the no-duplicates report."""
+    assert check_for_duplicates_sharded({"questions": []}, workers=2) == (
+        "No duplicate or similar content found."
+    )
+
+
+def test_similar_questions_by_range():
+    """Test that consecutive ranges find what the whole bank does."""
+    questions = [
+        {"id": index + 1, "text": text, "variants": [], "correct": 1}
+        for index, text in enumerate(
+            [
+                "Central Processing Unit nima?",
+                "Operativ xotira nima?",
+                "Central Procesing Unit nima?",
+                "Operativ xotra nima?",
+                "Central Processing Unitt nima?",
+            ]
+        )
+    ]
+    expected = duplicate_checker.find_similar_questions(questions)
+    assert [finding[:2] for finding in expected] == [(2, 0), (3, 1), (4, 0)]
+    ranges = [(0, 2), (2, 3), (3, 5)]
+    found = [
+        finding
+        for start, end in ranges
+        for finding in duplicate_checker.find_similar_questions(questions, start, end)
+    ]
+    assert found == expected
@@ -0,0 +1,128 @@
+import random
+from src.core.duplicate_checker import check_for_duplicates, split_duplicate_report
+from src.core.pipeline import run_pipeline, split_problems
+from src.core import similarity as similarity_module
+from src.core.similarity import SimilarTextIndex, edit_distance, similarity
+
+
+def full_distance(first, second):
+    """Plain dynamic-programming Levenshtein distance."""
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row]
+        for column, other in enumerate(second, 1):
+            current.append(
+                min(previous[column - 1] + (char != other), previous[column] + 1, current[-1] + 1)
+            )
+        previous = current
+    return previous[-1]
+
+
+def test_edit_distance_matches_full_computation():
+    """Test that the banded distance with early exit is exact within its limit."""
+    rng = random.Random(3)
+    for _ in range(3000):
+        first = "".join(rng.choice("abc") for _ in range(rng.randint(0, 8)))
+        second = "".join(rng.choice("abc") for _ in range(rng.randint(0, 8)))
+        limit = rng.randint(0, 8)
+        expected = full_distance(first, second)
+        assert edit_distance(first, second) == expected
+        assert edit_distance(first, second, limit) == (expected if expected <= limit else None)
+
+
+def test_similarity_of_typo():
+    """Test the distance and similarity of a copy-paste typo."""
+    distance = edit_distance("central processing unit", "central procesing unit")
+    assert distance == 1
+    assert round(similarity("central processing unit", "central procesing unit", distance), 3) == 0.957
+
+
+def _typo(rng, text):
+    """Apply one to three random edits to a text."""
+    chars = list(text)
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randrange(len(chars))
+        action = rng.choice("sid")
+        if action == "s":
+            chars[position] = rng.choice("abcdefgh")
+        elif action == "i":
+            chars.insert(position, rng.choice("abcdefgh"))
+        elif len(chars) > 1:
+            del chars[position]
+    return "".join(chars)
+
+
+def test_segment_index_finds_the_same_matches_as_pairwise(monkeypatch):
+    """Test that the segment index agrees with comparing every pair."""
+    rng = random.Random(5)
+    words = ["".join(rng.choice("abcdefgh") for _ in range(rng.randint(2, 7))) for _ in range(50)]
+    texts = []
+    for _ in range(400):
+        if texts and rng.random() < 0.4:
+            texts.append(_typo(rng, rng.choice(texts)))
+        else:
+            texts.append(" ".join(rng.choice(words) for _ in range(rng.randint(3, 8))))
+
+    indexed = SimilarTextIndex()
+    matches = [indexed.add(text, order) for order, text in enumerate(texts)]
+    assert indexed._segments is not None
+    assert sum(match is not None for match in matches) > 50
+
+    monkeypatch.setattr(similarity_module, "SEGMENT_INDEX_MIN_SIZE", len(texts))
+    pairwise = SimilarTextIndex()
+    assert [pairwise.add(text, order) for order, text in enumerate(texts)] == matches
+    assert pairwise._segments is None
+
+
+def test_numbers_are_not_typos():
+    """Test that texts differing in a number are not similar."""
+    index = SimilarTextIndex()
+    index.add("in which year did it happen 1991", 1)
+    assert index.add("in which year did it happen 1992", 2) is None
+
+
+def _question(id, text, options):
+    return {
+        "id": id,
+        "text": text,
+        "variants": [{"id": i, "text": option} for i, option in enumerate(options, 1)],
+        "correct": 1,
+    }
+
+
+def test_report_lists_similar_options_and_questions():
+    """Test that typo pairs are reported with distance and similarity."""
+    report = check_for_duplicates(
+        {
+            "questions": [
+                _question(1, "1. What does CPU stand for?",
+                          ["Central Processing Unit", "Central Procesing Unit", "Control Unit"]),
+                _question(2, "2. What dose CPU stand for?", ["Yes", "No"]),
+                _question(3, "3. What does GPU stand for?", ["Yes", "No"]),
+            ]
+        }
+    )
+    assert "SIMILAR OPTIONS WITHIN THE SAME QUESTION FOUND:" in report
+    assert "Options a and b - edit distance 1, 96% similar" in report
+    assert "Question 2 and Question 1 - edit distance 2, 91% similar" in report
+    assert "Question 3 and Question 1 - edit distance 1, 96% similar" in report
+    # Typos are likely, not certain: they never block an upload
+    blocking, warnings = split_duplicate_report(report)
+    assert blocking == ""
+    assert "SIMILAR QUESTIONS FOUND" in warnings
+
+
+def test_pipeline_reports_similar_content():
+    """Test that the streaming pipeline flags typos with their line."""
+    lines = [
+        "1. What does CPU stand for?\n",
+        "a)*Central Processing Unit\n",
+        "b) Central Procesing Unit\n",
+        "\n",
+        "2. What dose CPU stand for?\n",
+        "a)*Yes\n",
+        "b) No\n",
+    ]
+    codes = [(problem.line, problem.code) for problem in run_pipeline(lines).problems]
+    assert codes == [(1, "similar_option"), (5, "similar_question")]
+    assert split_problems(run_pipeline(lines).problems)[0] == []
@@ -0,0 +1,150 @@
+import csv
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.core import formatters
+from src.core.formatters import TABLE_HEADER, table_row
+from src.core.registry import get_format, render_formats
+
+NAMESPACE = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+@pytest.fixture
+def sample_questions():
+    """Create questions with repeated answers, markup and a missing key."""
+    questions = [
+        {
+            "id": number,
+            "text": f"{number}. Which is <larger> & why?\x0b",
+            "variants": [
+                {"id": 1, "text": f"Answer {number}"},
+                {"id": 2, "text": "All of the above"},
+                {"id": 3, "text": "None of the above"},
+            ],
+            "correct": 2 if number % 2 else 1,
+        }
+        for number in range(1, 6)
+    ]
+    questions[-1]["correct"] = None
+    return questions
+
+
+def read_xlsx_rows(path):
+    """Read the cell texts of the first sheet of a workbook."""
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            ET.fromstring(archive.read(name))  # Every part is well-formed XML
+        strings_root = ET.fromstring(archive.read("xl/sharedStrings.xml"))
+        sheet = ET.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+    strings = [item.find("m:t", NAMESPACE).text for item in strings_root]
+    rows = [
+        [strings[int(cell.find("m:v", NAMESPACE).text)] for cell in row]
+        for row in sheet.find("m:sheetData", NAMESPACE)
+    ]
+    return rows, strings_root.attrib
+
+
+def test_table_row_puts_correct_answer_second(sample_questions):
+    """Test the row layout shared with the Word table format."""
+    assert table_row(sample_questions[0]) == [
+        sample_questions[0]["text"],
+        "All of the above",
+        "Answer 1",
+        "None of the above",
+    ]
+    # Without a key the answers keep their order
+    assert table_row(sample_questions[-1])[1:] == [
+        "Answer 5",
+        "All of the above",
+        "None of the above",
+    ]
+
+
+def test_csv_rows(tmp_path, sample_questions):
+    """Test that the CSV file holds a header and one table row per question."""
+    results = render_formats(sample_questions, ["csv"], str(tmp_path), "bank")
+    assert os.path.basename(results[0].output_path) == "bank_Jadval.csv"
+    with open(results[0].output_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+
+    assert rows[0] == TABLE_HEADER
+    assert rows[1:] == [table_row(question) for question in sample_questions]
+
+
+def test_xlsx_rows_and_shared_strings(tmp_path, sample_questions):
+    """Test that the workbook holds the table rows with each text stored once."""
+    results = render_formats(sample_questions, ["xlsx"], str(tmp_path), "bank")
+    rows, counts = read_xlsx_rows(results[0].output_path)
+
+    assert rows[0] == TABLE_HEADER
+    expected = [table_row(question) for question in sample_questions]
+    # Characters XML cannot hold are dropped
+    assert rows[1:] == [[text.replace("\x0b", "") for text in row] for row in expected]
+    assert int(counts["count"]) == 5 + 5 * 4
+    # "All of the above" and "None of the above" are stored once each
+    assert int(counts["uniqueCount"]) == 5 + 5 * 2 + 2
+
+
+def test_xlsx_with_full_string_memory(tmp_path, monkeypatch, sample_questions):
+    """Test that forgetting shared strings only stores repeats again."""
+    monkeypatch.setattr(formatters, "SHARED_STRING_MEMORY", 2)
+    results = render_formats(sample_questions, ["xlsx"], str(tmp_path), "bank")
+    rows, _ = read_xlsx_rows(results[0].output_path)
+    assert [row[1] for row in rows[1:]] == [
+        table_row(question)[1] for question in sample_questions
+    ]
+
+
+def test_xlsx_size_estimate_and_parts(tmp_path):
+    """Test that the size estimate is close and split parts stay under the limit."""
+    questions = [
+        {
+            "id": number,
+            "text": f"{number}. Question {number} about topic {number * 7919 % 1000}?",
+            "variants": [{"id": i, "text": f"Answer {number}-{i}"} for i in range(1, 5)],
+            "correct": 1,
+        }
+        for number in range(1, 5001)
+    ]
+    sink = get_format("xlsx").sink_factory(str(tmp_path / "estimate.xlsx"), None)
+    sink.track_size = True
+    sink.begin()
+    for question in questions:
+        sink.question(question)
+    estimate = sink.size()
+    sink.end()
+    assert abs(estimate - os.path.getsize(tmp_path / "estimate.xlsx")) < 0.05 * estimate
+
+    results = render_formats(questions, ["xlsx"], str(tmp_path), "bank", max_part_size=60_000)
+    parts = results[0].parts
+    assert len(parts) > 1
+    assert all(os.path.getsize(path) <= 60_000 for path in parts)
+    texts = [row[0] for path in parts for row in read_xlsx_rows(path)[0][1:]]
+    assert texts == [question["text"] for question in questions]
+
+
+def test_xlsx_size_does_not_flush(tmp_path):
+    """Test that asking for the size leaves the buffered rows in place."""
+    sink = get_format("xlsx").sink_factory(str(tmp_path / "buffered.xlsx"), None)
+    sink.track_size = True
+    sink.begin()
+    sizes = []
+    for number in range(1, 101):
+        sink.question(
+            {
+                "id": number,
+                "text": f"{number}. Question {number}?",
+                "variants": [{"id": i, "text": f"Answer {number}-{i}"} for i in range(1, 5)],
+                "correct": 1,
+            }
+        )
+        sizes.append(sink.size())
+    # The header row and every question row are still buffered
+    buffered_rows = len(sink._rows)
+    sink.end()
+
+    assert buffered_rows == 101
+    assert sizes == sorted(sizes) and sizes[0] < sizes[-1]
@@ -0,0 +1,44 @@
+import pytest
+from src.utils.importtime import (
+    parse_importtime,
+    measure_import_time,
+    module_import_ms,
+    loaded_heavy_modules,
+    check_startup_budget,
+)
+
+
+SAMPLE_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       219 |       2391 |     docx.parts.document
+import time:       343 |      65876 |   docx
+import time:      1312 |      67813 | src.core.formatters
+"""
+
+
+def test_parse_importtime():
+    """Test parsing the stderr output of -X importtime."""
+    timings = parse_importtime(SAMPLE_OUTPUT)
+
+    assert len(timings) == 3
+    assert timings[0].module == "docx.parts.document"
+    assert timings[0].depth == 2
+    assert timings[2].module == "src.core.formatters"
+    assert timings[2].depth == 0
+    assert module_import_ms(timings, "src.core.formatters") == pytest.approx(67.813)
+    assert loaded_heavy_modules(timings) == ["docx"]
+
+
+def test_core_modules_do_not_import_heavy_dependencies():
+    """Test that importing the core modules does not load docx or telegram."""
+    for module in ["main", "src.core.formatters", "src.utils.logger"]:
+        timings = measure_import_time(module)
+        assert loaded_heavy_modules(timings) == [], module
+
+
+def test_startup_budget():
+    """Test that cold start of the entry modules stays within the budget."""
+    results = check_startup_budget()
+    assert "main" in results
+
+    with pytest.raises(AssertionError):
+        check_startup_budget(["src.core.formatters"], budget_ms=0, repeat=1)
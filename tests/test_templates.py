@@ -0,0 +1,131 @@
+import json
+
+import pytest
+
+from src.core import registry
+from src.core.formatters import transform_to_program_format, transform_to_student_format
+from src.core.registry import register_templates, render_formats
+from src.core.templates import (
+    OutputTemplate,
+    TemplateError,
+    compile_template,
+    load_templates,
+    render_questions,
+)
+
+
+@pytest.fixture
+def sample_questions():
+    """Create questions with characters that need escaping in generated code."""
+    return [
+        {
+            "id": 1,
+            "text": '1. What does "{x}" print?\\n',
+            "variants": [
+                {"id": 1, "text": "{x}"},
+                {"id": 2, "text": "C:\\temp"},
+                {"id": 3, "text": "Ўзбек"},
+            ],
+            "correct": 2,
+        },
+        {"id": 2, "text": "2. No variants", "variants": [], "correct": None},
+    ]
+
+
+def test_builtin_templates_match_the_formatters(sample_questions):
+    """Test the HEMIS and student layouts written by the built-in templates."""
+    json_data = {"questions": sample_questions}
+    assert transform_to_program_format(json_data) == (
+        '1. What does "{x}" print?\\n\n====\n{x}\n====\n#C:\\temp\n====\nЎзбек\n====\n'
+        "++++\n2. No variants\n===="
+    )
+    assert transform_to_student_format(json_data) == (
+        '1. 1. What does "{x}" print?\\n\na) {x}\nb) C:\\temp\nc) Ўзбек\n\n2. 2. No variants\n'
+    )
+    assert transform_to_student_format(json_data, include_variants=False) == (
+        '1. 1. What does "{x}" print?\\n\n\n2. 2. No variants\n'
+    )
+
+
+def test_custom_template_fields(sample_questions):
+    """Test every field, literal quotes and braces, and format specifications."""
+    template = OutputTemplate(
+        question='Q{number} "{{{id}}}" [{answer}] {text:.4}\\{variants}',
+        variant="{LETTER}/{letter}/{id}{mark}={text!r}",
+        variant_separator=";",
+        separator="|",
+        correct_mark="*",
+    )
+    assert render_questions(template, sample_questions) == (
+        "Q1 \"{1}\" [b] 1. W\\A/a/1='{x}';B/b/2*='C:\\\\temp';C/c/3='Ўзбек'"
+        '|Q2 "{2}" [] 2. N\\'
+    )
+
+
+def test_broken_templates_are_rejected():
+    """Test that unknown fields and malformed templates raise TemplateError."""
+    with pytest.raises(TemplateError, match="unknown field"):
+        compile_template(OutputTemplate(question="{title}"))
+    with pytest.raises(TemplateError, match="unknown field"):
+        compile_template(OutputTemplate(question="{variants}", variant="{answer}"))
+    with pytest.raises(TemplateError):
+        compile_template(OutputTemplate(question="{text"))
+    with pytest.raises(TemplateError):
+        compile_template(OutputTemplate(question="{text!x}"))
+    # Code in a template is never evaluated
+    with pytest.raises(TemplateError, match="unknown field"):
+        compile_template(OutputTemplate(question="{__import__('os')}"))
+
+
+def test_templates_are_compiled_once():
+    """Test that equal templates share one compiled function."""
+    compile_template.cache_clear()
+    first = compile_template(OutputTemplate(question="{id}) {text}"))
+    second = compile_template(OutputTemplate(question="{id}) {text}"))
+    assert first is second
+    info = compile_template.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_register_templates(tmp_path, sample_questions):
+    """Test that a template file adds text formats to the registry."""
+    path = tmp_path / "templates.json"
+    path.write_text(
+        json.dumps(
+            [
+                {
+                    "key": "numbered",
+                    "label": "Raqamli format",
+                    "suffix": "_Raqamli.txt",
+                    "question": "{number}) {text}\n{variants}",
+                    "variant": "  {LETTER}. {text}",
+                    "separator": "\n\n",
+                }
+            ]
+        ),
+        encoding="utf-8",
+    )
+    try:
+        assert register_templates(str(path)) == ["numbered"]
+        results = render_formats(sample_questions, ["numbered"], str(tmp_path), "bank")
+    finally:
+        registry._FORMATS.pop("numbered", None)
+
+    assert results[0].error is None
+    with open(results[0].output_path, encoding="utf-8") as f:
+        assert f.read() == (
+            '1) 1. What does "{x}" print?\\n\n  A. {x}\n  B. C:\\temp\n  C. Ўзбек'
+            "\n\n2) 2. No variants\n"
+        )
+
+
+def test_load_templates_reports_the_broken_entry(tmp_path):
+    """Test that incomplete and broken entries name the file and format."""
+    path = tmp_path / "templates.json"
+    path.write_text(json.dumps([{"key": "a", "label": "A", "question": "{id}"}]))
+    with pytest.raises(TemplateError, match="incomplete"):
+        load_templates(str(path))
+
+    path.write_text(json.dumps([{"key": "b", "label": "B", "suffix": ".txt", "question": "{x}"}]))
+    with pytest.raises(TemplateError, match="b: Question template"):
+        load_templates(str(path))
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+import pytest
+
+from src.core.parser import ValidationProblem, parse_text_content
+from src.core.upload_cache import CheckedUpload, UploadCache
+from src.utils import metrics
+
+QUESTIONS = """1. Fotosintez qayerda boradi?
+a) *Xloroplastda
+b) Yadroda
+
+2. Hujayraning energiya markazi?
+a) *Mitoxondriya
+b) Ribosoma
+"""
+
+
+def checked_upload(copies: int = 1) -> CheckedUpload:
+    questions = parse_text_content(QUESTIONS)["questions"] * copies
+    return CheckedUpload(
+        {"questions": questions},
+        "No duplicates found.",
+        [ValidationProblem(4, 1, "no_correct", "To'g'ri javob belgilanmagan")],
+    )
+
+
+@pytest.fixture
+def cache_path():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "cache.db")
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_lookups_are_counted(cache_path):
+    """Test that hits in each layer and misses are recorded in the metrics."""
+    cache = UploadCache(cache_path)
+    assert cache.get("u1") is None
+    cache.put("u1", checked_upload())
+    assert cache.get("u1") == checked_upload()
+    cache.close()
+
+    reopened = UploadCache(cache_path)
+    assert reopened.get("u1") == checked_upload()
+    assert reopened.get("u1") == checked_upload()
+    reopened.close()
+
+    assert metrics.snapshot() == {
+        "upload_cache.misses": 1,
+        "upload_cache.memory_hits": 2,
+        "upload_cache.disk_hits": 1,
+    }
+
+
+def test_problems_survive_the_disk_layer(cache_path):
+    """Test that validation problems come back as ValidationProblem tuples."""
+    cache = UploadCache(cache_path, memory_questions=0)
+    cache.put("u1", checked_upload())
+    problem = cache.get("u1").problems[0]
+    assert isinstance(problem, ValidationProblem)
+    assert problem.code == "no_correct"
+    cache.close()
+
+
+def test_memory_layer_evicts_least_recently_used(cache_path):
+    """Test that the memory layer stays within its question budget."""
+    cache = UploadCache(cache_path, memory_questions=4)
+    cache.put("a", checked_upload())
+    cache.put("b", checked_upload())
+    cache.get("a")
+    cache.put("c", checked_upload())
+
+    cache.get("a")
+    cache.get("c")
+    assert metrics.get("upload_cache.memory_hits") == 3
+    cache.get("b")
+    assert metrics.get("upload_cache.disk_hits") == 1
+    cache.close()
+
+
+def test_disk_layer_keeps_most_recently_used_entries(cache_path):
+    """Test that the disk layer drops the entries used longest ago."""
+    cache = UploadCache(cache_path, memory_questions=0, disk_entries=2)
+    cache.put("a", checked_upload())
+    cache.put("b", checked_upload())
+    assert cache.get("a") is not None
+    cache.put("c", checked_upload())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    cache.close()
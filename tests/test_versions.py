@@ -0,0 +1,96 @@
+import csv
+import os
+import tempfile
+import pytest
+from src import cli
+from src.core.versions import shuffle_bank, answer_key, generate_versions, read_answer_key_seeds
+
+
+@pytest.fixture
+def sample_questions():
+    """Create a sample bank with enough questions to shuffle."""
+    return {
+        "questions": [
+            {
+                "id": i,
+                "text": f"Question {i}?",
+                "variants": [
+                    {"id": j, "text": f"Answer {i}-{j}"} for j in range(1, 5)
+                ],
+                "correct": (i % 4) + 1,
+            }
+            for i in range(1, 11)
+        ]
+    }
+
+
+def test_shuffle_bank_keeps_correct_answers(sample_questions):
+    """Test that shuffling remaps the correct answer to the moved variant."""
+    original = {q["id"]: q for q in sample_questions["questions"]}
+    shuffled = shuffle_bank(sample_questions, seed=42)
+
+    assert [q["id"] for q in shuffled["questions"]] == list(range(1, 11))
+    assert sorted(q["source_id"] for q in shuffled["questions"]) == list(range(1, 11))
+
+    for question in shuffled["questions"]:
+        source = original[question["source_id"]]
+        correct_text = source["variants"][source["correct"] - 1]["text"]
+        assert question["variants"][question["correct"] - 1]["text"] == correct_text
+        assert [v["id"] for v in question["variants"]] == [1, 2, 3, 4]
+
+
+def test_shuffle_bank_is_deterministic(sample_questions):
+    """Test that the same seed always produces the same version."""
+    assert shuffle_bank(sample_questions, 7) == shuffle_bank(sample_questions, 7)
+    assert shuffle_bank(sample_questions, 7) != shuffle_bank(sample_questions, 8)
+
+
+def test_generate_versions_parallel_matches_serial(sample_questions):
+    """Test that parallel rendering gives the same versions as serial rendering."""
+    with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+        serial = generate_versions(
+            sample_questions, [1, 2, 3], serial_dir, "test", max_workers=1
+        )
+        parallel = generate_versions(
+            sample_questions, [1, 2, 3], parallel_dir, "test", max_workers=2
+        )
+
+        assert len(parallel["versions"]) == 3
+        for s, p in zip(serial["versions"], parallel["versions"]):
+            assert s["answer_key"] == p["answer_key"]
+            assert len(p["files"]) == 3
+            assert all(os.path.exists(path) for path in p["files"])
+
+        with open(parallel["answer_key_path"], encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["Savol", "V1 (1)", "V2 (2)", "V3 (3)"]
+        assert len(rows) == 11
+        assert rows[1][1] == answer_key(shuffle_bank(sample_questions, 1))[0]
+
+
+def test_versions_command_writes_versions_and_seeds(tmp_path):
+    """Test that the versions command writes every version and a key gradable by seed."""
+    bank_path = tmp_path / "biologiya.txt"
+    bank_path.write_text(
+        "1. Savol bir?\na) *A bir\nb) B bir\nc) C bir\n\n"
+        "2. Savol ikki?\na) A ikki\nb) *B ikki\nc) C ikki\n",
+        encoding="utf-8",
+    )
+    output_dir = tmp_path / "output"
+    status = cli.main(
+        ["versions", str(bank_path), "-s", "11", "-s", "22", "-o", str(output_dir), "-f", "hemis"]
+    )
+
+    assert status == 0
+    assert sorted(os.listdir(output_dir)) == [
+        "biologiya_Kalit.csv", "biologiya_V1_Hemis.txt", "biologiya_V2_Hemis.txt"
+    ]
+    assert read_answer_key_seeds(str(output_dir / "biologiya_Kalit.csv")) == [11, 22]
+
+
+def test_versions_command_random_seeds(tmp_path):
+    """Test that without --seed the given number of versions gets random seeds."""
+    bank_path = tmp_path / "bank.txt"
+    bank_path.write_text("1. Savol?\na) *Ha\nb) Yo'q\n", encoding="utf-8")
+    assert cli.main(["versions", str(bank_path), "-c", "3", "-o", str(tmp_path), "-f", "hemis"]) == 0
+    assert len(read_answer_key_seeds(str(tmp_path / "bank_Kalit.csv"))) == 3
@@ -0,0 +1,144 @@
+import os
+import time
+
+import pytest
+
+from src.core.watcher import (
+    STATE_FILE,
+    FolderWatcher,
+    InotifyWatcher,
+    PollingWatcher,
+    convert_file,
+    file_digest,
+)
+
+BANK = """1. What is 2 + 2?
+a) 3
+b) *4
+c) 5
+
+2. What is the capital of France?
+a) *Paris
+b) London
+"""
+
+
+def inotify_available(folder):
+    try:
+        InotifyWatcher(str(folder)).close()
+    except OSError:
+        return False
+    return True
+
+
+def run_until(watcher, condition, timeout=5.0):
+    """Step the watcher until condition() holds, collecting the results."""
+    results = []
+    deadline = time.monotonic() + timeout
+    while not condition(results):
+        assert time.monotonic() < deadline, "watcher did not finish in time"
+        results.extend(watcher.step(timeout=0.02))
+    return results
+
+
+def test_convert_file(tmp_path):
+    """Test that a file is converted into outputs named after it."""
+    input_path = tmp_path / "bank.txt"
+    input_path.write_text(BANK, encoding="utf-8")
+    result = convert_file(str(input_path), "digest", str(tmp_path), ["hemis"])
+
+    assert result.error is None
+    assert (result.question_count, result.problem_count) == (2, 0)
+    assert result.outputs == (("hemis", str(tmp_path / "bank_Hemis.txt"), None),)
+    assert "#4" in (tmp_path / "bank_Hemis.txt").read_text(encoding="utf-8")
+
+    missing = convert_file(str(tmp_path / "missing.txt"), "digest", str(tmp_path), ["hemis"])
+    assert missing.error is not None
+
+
+@pytest.mark.parametrize("mode", ["inotify", "poll"])
+def test_watcher_converts_only_changed_files(tmp_path, mode):
+    """Test debouncing, digest skips and reconversion of changed files."""
+    if mode == "inotify" and not inotify_available(tmp_path):
+        pytest.skip("inotify not available")
+    folder, output_dir = tmp_path / "in", tmp_path / "out"
+    folder.mkdir()
+    (folder / "a.txt").write_text(BANK, encoding="utf-8")
+    (folder / "b.txt").write_text(BANK, encoding="utf-8")
+    (folder / "notes.md").write_text("not a question file")
+
+    watcher = FolderWatcher(
+        str(folder),
+        str(output_dir),
+        formats=["hemis"],
+        max_workers=1,
+        debounce=0.1,
+        poll_interval=0.02 if mode == "poll" else None,
+    )
+    try:
+        first = run_until(watcher, lambda results: len(results) == 2)
+        assert sorted(os.path.basename(result.input_path) for result in first) == [
+            "a.txt",
+            "b.txt",
+        ]
+
+        # A burst of writes is converted once; saving a file without
+        # changes does not convert it
+        for number in range(5):
+            with open(folder / "a.txt", "a", encoding="utf-8") as f:
+                f.write(f"\n{number + 3}. Extra question?\na) *Yes\nb) No\n")
+            time.sleep(0.01)
+        (folder / "b.txt").write_text(BANK, encoding="utf-8")
+        changed = run_until(watcher, lambda results: len(results) == 1)
+        assert changed[0].input_path == str(folder / "a.txt")
+        assert changed[0].question_count == 7
+        assert run_until(watcher, lambda results: watcher.idle()) == []
+        time.sleep(0.2)
+        assert watcher.step(timeout=0.1) == []
+        assert watcher.skipped == 1
+        assert watcher.converted == 3
+    finally:
+        watcher.close()
+
+
+def test_restarted_watcher_skips_converted_files(tmp_path):
+    """Test that the digests kept in the output folder survive a restart."""
+    (tmp_path / "a.txt").write_text(BANK, encoding="utf-8")
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path), formats=["hemis"], max_workers=1)
+    watcher.run(until_idle=True)
+    watcher.close()
+    assert watcher.converted == 1
+    assert (tmp_path / STATE_FILE).exists()
+
+    # Outputs written next to the inputs are not taken for inputs
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path), formats=["hemis"], max_workers=1)
+    watcher.run(until_idle=True)
+    watcher.close()
+    assert (watcher.converted, watcher.skipped) == (0, 1)
+
+    # A missing output is written again
+    os.unlink(tmp_path / "a_Hemis.txt")
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path), formats=["hemis"], max_workers=1)
+    watcher.run(until_idle=True)
+    watcher.close()
+    assert watcher.converted == 1
+
+
+def test_polling_watcher_reports_removed_files(tmp_path):
+    """Test that polling notices created, changed and removed files."""
+    (tmp_path / "a.txt").write_text("a")
+    watcher = PollingWatcher(str(tmp_path), interval=0)
+    (tmp_path / "b.txt").write_text("b")
+    os.unlink(tmp_path / "a.txt")
+    assert watcher.wait(0) == {"a.txt", "b.txt"}
+    assert watcher.wait(0) == set()
+
+
+def test_file_digest_depends_on_content_only(tmp_path):
+    """Test that equal contents have equal digests whatever the file times."""
+    (tmp_path / "a.txt").write_text(BANK)
+    (tmp_path / "b.txt").write_text(BANK)
+    os.utime(tmp_path / "b.txt", (0, 0))
+    assert file_digest(str(tmp_path / "a.txt")) == file_digest(str(tmp_path / "b.txt"))
+    (tmp_path / "b.txt").write_text(BANK + "\n")
+    assert file_digest(str(tmp_path / "a.txt")) != file_digest(str(tmp_path / "b.txt"))
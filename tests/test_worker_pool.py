@@ -0,0 +1,158 @@
+import os
+import tempfile
+
+import pytest
+
+from src.core.parser import parse_text_content
+from src.core.worker_pool import WorkerError, WorkerPool, job_questions, report_progress
+
+QUESTIONS = """1. Fotosintez qayerda boradi?
+a) *Xloroplastda
+b) Yadroda
+
+2. Hujayraning energiya markazi?
+a) *Mitoxondriya
+b) Ribosoma
+"""
+
+
+def current_pid() -> int:
+    return os.getpid()
+
+
+def count_questions() -> int:
+    count = 0
+    for _ in job_questions():
+        count += 1
+        report_progress(count)
+    return count
+
+
+def crash() -> None:
+    os._exit(3)
+
+
+def spin() -> None:
+    while True:
+        pass
+
+
+def allocate(megabytes: int) -> int:
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def fail() -> None:
+    raise ValueError("bad input")
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(workers=1, max_jobs=3, memory_limit=512 * 1024 * 1024, cpu_seconds=1)
+    yield pool
+    pool.close()
+
+
+def test_worker_is_replaced_after_max_jobs(pool):
+    """Test that a worker runs max_jobs jobs before it is recycled."""
+    pids = [pool.run(current_pid) for _ in range(4)]
+    assert pids[0] == pids[1] == pids[2]
+    assert pids[3] != pids[0]
+    assert pool.recycled == 1
+
+
+def test_questions_are_streamed_and_progress_reported(pool):
+    """Test that jobs read streamed questions and report progress while running."""
+    progress = []
+    count = pool.run(count_questions, questions=iter(range(1200)), on_progress=progress.append)
+    assert count == 1200
+    assert progress == list(range(1, 1201))
+
+
+@pytest.mark.parametrize(
+    "function, args, reason",
+    [
+        (crash, (), "exited with status 3"),
+        (spin, (), "ran out of CPU time"),
+        (allocate, (1024,), "memory limit exceeded"),
+    ],
+)
+def test_failed_job_raises_and_pool_recovers(pool, function, args, reason):
+    """Test that crashes and exceeded limits surface as WorkerError only."""
+    before = pool.run(current_pid)
+    with pytest.raises(WorkerError, match=reason):
+        pool.run(function, *args)
+    after = pool.run(current_pid)
+    assert after != before
+    assert pool.run(allocate, 16) == 16 * 1024 * 1024
+
+
+def test_job_exception_keeps_worker(pool):
+    """Test that ordinary exceptions reach the caller without a new worker."""
+    pool.run(current_pid)
+    with pytest.raises(ValueError, match="bad input"):
+        pool.run(fail, questions=iter(range(10)))
+    assert pool.recycled == 0
+    # The unread questions of the failed job are not taken for the next one
+    assert pool.run(count_questions, questions=iter(range(5))) == 5
+    assert pool.recycled == 1  # max_jobs reached
+
+
+def test_render_sends_parts_as_they_finish(pool):
+    """Test that rendering in a worker writes outputs and reports every part."""
+    questions = parse_text_content(QUESTIONS)["questions"] * 50
+    parts = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = pool.render(
+            iter(questions),
+            ["hemis", "word"],
+            temp_dir,
+            "Test",
+            max_part_size=40_000,
+            on_part=lambda key, path: parts.append((key, os.path.exists(path))),
+        )
+        assert all(result.error is None for result in results)
+        assert all(os.path.exists(path) for result in results for path in result.parts)
+
+    hemis_parts = [part for part in parts if part[0] == "hemis"]
+    assert len(hemis_parts) == 1
+    assert len(parts) == sum(len(result.parts) for result in results)
+    assert all(exists for _, exists in parts)
+
+
+
+def cached_fragments(cache_key) -> dict:
+    """Identity of every Word fragment the worker keeps for a key, by question text."""
+    from src.core import worker_pool
+
+    cache = worker_pool._render_caches.get(cache_key, {}).get("word", {})
+    return {key[0]: id(fragment) for key, fragment in cache.items()}
+
+
+def test_render_reuses_fragment_caches_kept_in_worker():
+    """Test that renders with a cache key reuse the fragments kept by their worker."""
+    pool = WorkerPool(workers=2, memory_limit=None, cpu_seconds=None)
+    questions = parse_text_content(QUESTIONS)["questions"]
+    edited = [dict(questions[0], text="1. Fotosintez qaerda boradi?"), questions[1]]
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pool.render(iter(questions), ["word"], temp_dir, "First", cache_key=42)
+            first = pool.run(cached_fragments, 42, affinity=42)
+            assert len(first) == 2
+
+            # Other jobs in between do not move the key to another worker
+            for _ in range(3):
+                pool.run(current_pid)
+            pool.render(iter(edited), ["word"], temp_dir, "Second", cache_key=42)
+            second = pool.run(cached_fragments, 42, affinity=42)
+
+            # The unchanged question was copied from the cached fragment and
+            # only the edited one was built again
+            unchanged = questions[1]["text"]
+            assert second[unchanged] == first[unchanged]
+            assert set(second) == {edited[0]["text"], unchanged}
+
+            # Without a key no caches are kept
+            pool.render(iter(questions), ["word"], temp_dir, "Third")
+            assert pool.run(cached_fragments, None, affinity=42) == {}
+    finally:
+        pool.close()